@@ -8,8 +8,8 @@ Schema:
   embodybench_jobs     - the unit of work workers claim (one invocation of eval_policy.py)
   embodybench_episodes - per-rollout result records (never claimed, written by workers)
 
-Idempotent: safe to call repeatedly. Called automatically on backend boot via
-database.init_embodybench_tables().
+Idempotent: safe to call repeatedly. The backend no longer calls this; the
+same DDL now ships as migration 2 in src/schema_migrations.py.
 """
 
 import os
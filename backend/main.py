@@ -12,7 +12,7 @@ if src_path not in sys.path:
 
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
 from rate_limiter import limiter
@@ -30,16 +30,36 @@ from routers.yif_team_router import router as yif_team_router
 from routers.accounting_router import router as accounting_router
 from routers.contact_router import router as contact_router
 from routers.bench_router import router as bench_router, reclaim_stale_jobs_loop
-from database import init_yif_triggers, init_embodybench_tables
+from routers.ops_router import router as ops_router
+from database import db_pool
+from schema_migrations import run_migrations
+from async_db import open_async_pool, close_async_pool, async_pool_stats
+import metrics
+import crypto_pool
+import log_config
+import replica
+import tag_cache
+import query_guard
+import admission
+import tracing
+import sampling_profiler
+import memory_debug
+import single_flight
+from fast_json import FastJSONResponse
+from compression import CompressionMiddleware
+import slow_query_log  # registers the slow-query listener
+import prewarm
+import leader
 import uvicorn
 import logging
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+log_config.setup_logging()
+tracing.setup_tracing()
 logger = logging.getLogger(__name__)
 # Migration router added
 # Updated role support in login/verify
 
-app = FastAPI(title="Hoshipu Backend API", version="1.0.0")
+app = FastAPI(title="Hoshipu Backend API", version="1.0.0", default_response_class=FastJSONResponse)
 
 # Rate limiting setup
 app.state.limiter = limiter
@@ -50,6 +70,17 @@ allowed_origins = os.getenv(
     "http://localhost:6001,http://localhost:3000,http://10.0.0.122:6001,https://www.hoshipu.top,https://hoshipu.top"
 ).split(",")
 
+# Innermost: RSS growth per route for the memory watchdog, measured around
+# the handler only (not the admission queue).
+app.add_middleware(memory_debug.RSSWatchMiddleware)
+# Per-class concurrency limits (bulk exports/imports, worker protocol,
+# interactive); its 429s still get CORS headers.
+app.add_middleware(admission.AdmissionMiddleware)
+# Identical concurrent dashboard/IOU/run reads share one computation; outside
+# admission so the requests that wait for another one's response hold no slot.
+app.add_middleware(single_flight.SingleFlightMiddleware)
+# Profiles the one request carrying an armed X-Profile-Token (ops router).
+app.add_middleware(sampling_profiler.ProfiledRequestMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=allowed_origins,
@@ -58,6 +89,26 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# br/gzip for large JSON bodies; inside metrics so latency includes it.
+app.add_middleware(CompressionMiddleware)
+# Outermost, so latency covers CORS and error handling too. GET /metrics.
+app.add_middleware(metrics.MetricsMiddleware, fastapi_app=app)
+# Sets the read-your-writes session for replica.read_connection().
+app.add_middleware(replica.ReplicaSessionMiddleware)
+# Root span per request (TRACING_ENABLED); inside RequestIdMiddleware so it can record the id.
+app.add_middleware(tracing.TracingMiddleware)
+# Around everything else, so every log line of a request carries its id.
+app.add_middleware(log_config.RequestIdMiddleware)
+metrics.register_pool_metrics(db_pool, async_pool_stats)
+metrics.register_replica_metrics(replica.stats)
+metrics.register_crypto_metrics(crypto_pool.stats)
+metrics.register_logging_metrics(log_config.stats)
+metrics.register_tag_cache_metrics(tag_cache.stats)
+metrics.register_query_guard_metrics(query_guard.stats)
+metrics.register_admission_metrics(admission.stats)
+metrics.register_memory_metrics(memory_debug.stats)
+metrics.register_single_flight_metrics(single_flight.stats)
+
 app.include_router(pdf_router, prefix="/api/pdf", tags=["PDF Processing"])
 app.include_router(messages_router)
 app.include_router(pdf_template_router)
@@ -72,30 +123,94 @@ app.include_router(yif_team_router)
 app.include_router(accounting_router)
 app.include_router(contact_router)
 app.include_router(bench_router)
+app.include_router(ops_router)
+
+# Apply pending schema migrations (YIF status triggers, EmbodyBench tables, ...).
+# Once the database is current this is a single SELECT on schema_migrations.
+run_migrations()
+
+
+@app.on_event("startup")
+async def _prefill_db_pool():
+    """Open DB_POOL_MIN_SIZE connections without blocking the event loop."""
+    import asyncio
+    try:
+        await asyncio.to_thread(db_pool.prefill)
+    except Exception as e:
+        logger.warning(f"DB pool prefill failed: {e}")
 
-# Initialize YIF triggers (backup safety net, auto-creates if not exists)
-init_yif_triggers()
 
-# Initialize EmbodyBench tables (auto-creates if not exists)
-init_embodybench_tables()
+@app.on_event("startup")
+async def _open_async_db_pool():
+    try:
+        await open_async_pool()
+    except Exception as e:
+        logger.warning(f"Async DB pool open failed: {e}")
+
+
+@app.on_event("startup")
+async def _schedule_prewarm():
+    """Load the lazily imported heavy libraries once the server is listening."""
+    import asyncio
+    if not prewarm.enabled():
+        return
+
+    async def _run():
+        await asyncio.sleep(1)
+        try:
+            await asyncio.to_thread(prewarm.prewarm)
+        except Exception as e:
+            logger.warning(f"Prewarm failed: {e}")
+
+    app.state.prewarm_task = asyncio.create_task(_run())
 
 
 @app.on_event("startup")
 async def _start_embodybench_reclaim_loop():
-    """Start the heartbeat-reclaim background task on app boot."""
+    """Start the heartbeat-reclaim background task on app boot.
+
+    With several workers, only the advisory-lock leader runs the sweep.
+    """
     import asyncio
-    app.state.embodybench_reclaim_task = asyncio.create_task(reclaim_stale_jobs_loop())
+    app.state.embodybench_reclaim_task = asyncio.create_task(
+        leader.run_as_leader("embodybench_reclaim", reclaim_stale_jobs_loop)
+    )
+
+
+@app.on_event("startup")
+async def _start_tag_cache_listener():
+    """Apply catalog cache invalidations from the other worker processes."""
+    import asyncio
+    app.state.tag_cache_task = asyncio.create_task(tag_cache.listen_for_invalidations())
+
+
+@app.on_event("startup")
+async def _start_memory_watchdog():
+    """Log RSS growth by route (MEMORY_WATCHDOG_INTERVAL, 0 = off)."""
+    import asyncio
+    app.state.memory_watchdog_task = asyncio.create_task(memory_debug.watchdog_loop())
 
 
 @app.on_event("shutdown")
-async def _stop_embodybench_reclaim_loop():
-    task = getattr(app.state, "embodybench_reclaim_task", None)
-    if task and not task.done():
-        task.cancel()
-        try:
-            await task
-        except Exception:
-            pass
+async def _stop_background_loops():
+    import asyncio
+    for name in ("embodybench_reclaim_task", "tag_cache_task", "memory_watchdog_task"):
+        task = getattr(app.state, name, None)
+        if task and not task.done():
+            task.cancel()
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+
+
+@app.on_event("shutdown")
+async def _close_db_pool():
+    db_pool.close()
+    await close_async_pool()
+    await replica.close_replica_pool()
+    crypto_pool.shutdown()
+    tracing.shutdown()
 
 
 @app.get("/")
@@ -106,6 +221,27 @@ async def root():
 async def health():
     return {"status": "healthy"}
 
+@app.get("/health/db")
+async def health_db():
+    """Connection pool statistics (size, waits, timeouts, recycling) and crypto pool load"""
+    return {
+        "status": "healthy",
+        "pid": os.getpid(),
+        "db_pool": db_pool.stats(),
+        "async_db_pool": async_pool_stats(),
+        "replica": replica.health(),
+        "crypto_pool": crypto_pool.stats(),
+        "tag_cache": tag_cache.stats(),
+        "admission": admission.stats(),
+        "leader_for": leader.leadership(),
+    }
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Prometheus text exposition of request/DB metrics"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
+    # Development server (auto-reload, single process). Production: python serve.py
     port = int(os.getenv("PORT", 6101))
     uvicorn.run("main:app", host="0.0.0.0", port=port, reload=True)
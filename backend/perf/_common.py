@@ -0,0 +1,67 @@
+"""
+Helpers shared by the perf scripts: token minting, latency percentiles and
+before/after comparison of saved --json results.
+
+The scripts run from this directory (python perf/<script>.py), so they
+import it as a sibling module:
+
+    from _common import summary, token
+"""
+import json
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+from dotenv import load_dotenv
+from jose import jwt
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+load_dotenv(os.path.join(BACKEND_DIR, ".env"))
+
+
+def token(sub: str, hours: float = 1) -> str:
+    """HS256 access token for sub ("<yif id>" or "bench:<id>"), signed with JWT_SECRET_KEY."""
+    secret = os.getenv("JWT_SECRET_KEY")
+    if not secret:
+        sys.exit("JWT_SECRET_KEY must be set to mint benchmark tokens")
+    exp = datetime.now(timezone.utc) + timedelta(hours=hours)
+    return jwt.encode({"sub": sub, "exp": exp}, secret, algorithm="HS256")
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list (0.0 when empty)."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summary(samples):
+    """{"n", "p50", "p95", "p99", "max"} of unsorted latency samples."""
+    values = sorted(samples)
+    return {
+        "n": len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": values[-1] if values else 0.0,
+    }
+
+
+def compare(before_path, after_path, columns=("rps", "p95_ms"), width=32):
+    """Print per-endpoint columns and total throughput of two saved results."""
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+    print(f"{'endpoint':{width}} " + " ".join(f"{column + ' before/after':>21}" for column in columns))
+    for name in sorted(set(before["endpoints"]) | set(after["endpoints"])):
+        b = before["endpoints"].get(name, {})
+        a = after["endpoints"].get(name, {})
+        print(f"{name:{width}} " + " ".join(f"{b.get(column, '-'):>10} {a.get(column, '-'):>10}"
+                                            for column in columns))
+    speedup = after["total_rps"] / before["total_rps"] if before["total_rps"] else float("inf")
+    line = f"\ntotal: {before['total_rps']} -> {after['total_rps']} req/s ({speedup:.2f}x)"
+    if "p99_ms" in before and "p99_ms" in after:
+        line += f", p99 {before['p99_ms']} -> {after['p99_ms']} ms"
+    print(line)
@@ -0,0 +1,82 @@
+"""
+Measures request coalescing (single_flight.py) on bursts of identical reads.
+
+Sends --bursts bursts of --concurrency identical concurrent GETs of one path
+(default the YIF dashboard, the heaviest coalesced read) and reports burst
+latency and how the server handled them, read from the
+single_flight_requests_total counters on /metrics. With coalescing on, a
+burst should show one leader and concurrency - 1 coalesced requests, and
+burst latency close to a single request's; with SINGLE_FLIGHT_ENABLED=false
+every request runs its own queries.
+
+Uses the seeded load-test admin (perf/seed_fixture.py):
+
+    RATE_LIMIT_ENABLED=false uvicorn main:app --port 6101
+    python perf/coalesce_bench.py --concurrency 20 --bursts 10
+"""
+import argparse
+import asyncio
+import os
+import re
+import time
+from collections import Counter
+
+import httpx
+
+from _common import summary
+
+_COUNTER = re.compile(r'^single_flight_requests_total\{route="([^"]*)",role="([^"]*)"\} (\S+)$', re.M)
+
+
+async def counters(http) -> Counter:
+    resp = await http.get("/metrics")
+    return Counter({(route, role): float(n) for route, role, n in _COUNTER.findall(resp.text)})
+
+
+async def run(args):
+    limits = httpx.Limits(max_connections=args.concurrency + 2)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=120, limits=limits) as http:
+        resp = await http.post("/api/yif/login", json={"username": args.username, "password": args.password})
+        resp.raise_for_status()
+        headers = {"Authorization": f"Bearer {resp.json()['access_token']}"}
+
+        start = time.perf_counter()
+        (await http.get(args.path, headers=headers)).raise_for_status()
+        single = (time.perf_counter() - start) * 1000
+
+        before = await counters(http)
+        bursts, statuses, bodies = [], Counter(), set()
+        for _ in range(args.bursts):
+            start = time.perf_counter()
+            responses = await asyncio.gather(*(http.get(args.path, headers=headers)
+                                               for _ in range(args.concurrency)))
+            bursts.append((time.perf_counter() - start) * 1000)
+            statuses.update(r.status_code for r in responses)
+            bodies.update(r.content for r in responses)
+        after = await counters(http)
+
+    print(f"GET {args.path}: {args.bursts} bursts of {args.concurrency}, single request {single:.1f} ms")
+    s = summary(bursts)
+    print(f"burst ms: p50 {s['p50']:.1f}  p95 {s['p95']:.1f}  max {s['max']:.1f}; "
+          f"statuses {dict(statuses)}; distinct bodies {len(bodies)}")
+    roles = after - before
+    if roles:
+        for (route, role), n in sorted(roles.items()):
+            print(f"  {route:16} {role:10} {n:>6.0f}")
+    else:
+        print("  no single_flight counters moved (coalescing off or path not coalesced)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default=os.getenv("BENCH_BASE_URL", "http://127.0.0.1:6101"))
+    parser.add_argument("--path", default="/api/yif/stats/dashboard")
+    parser.add_argument("--concurrency", type=int, default=20, help="identical requests per burst")
+    parser.add_argument("--bursts", type=int, default=10)
+    parser.add_argument("--username", default="loadtest_admin")
+    parser.add_argument("--password", default="loadtest")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
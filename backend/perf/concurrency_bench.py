@@ -0,0 +1,133 @@
+"""
+Concurrency benchmark for the hot YIF / EmbodyBench read endpoints.
+
+Drives a running backend with N concurrent clients for a fixed duration and
+reports throughput and latency per endpoint. Run it once against the old
+build and once against the new one to compare:
+
+    python perf/concurrency_bench.py --label before --out before.json
+    python perf/concurrency_bench.py --label after  --out after.json
+    python perf/concurrency_bench.py --compare before.json after.json
+
+Tokens are minted locally from JWT_SECRET_KEY (same as the backend), so the
+ids passed with --yif-user-id / --bench-user-id must exist in the database.
+Add --slow to mix in an IOU export per client, which is the request that
+used to stall everything else.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+
+import httpx
+
+from _common import compare, percentile, token
+
+
+def build_targets(args):
+    yif = {"Authorization": f"Bearer {token(str(args.yif_user_id))}"}
+    targets = [
+        ("GET /api/yif/ious", "/api/yif/ious?limit=50", yif),
+        ("GET /api/yif/payments", "/api/yif/payments?limit=50", yif),
+        ("GET /api/yif/stats/dashboard", "/api/yif/stats/dashboard", yif),
+    ]
+    if args.bench_user_id:
+        bench = {"Authorization": f"Bearer {token(f'bench:{args.bench_user_id}')}"}
+        targets.append(("GET /api/bench/runs", "/api/bench/runs", bench))
+    if args.slow:
+        targets.append(("GET /api/yif/export/ious", "/api/yif/export/ious?export_type=full", yif))
+    return targets
+
+
+async def _client(http, targets, deadline, samples, offset):
+    i = offset
+    while time.perf_counter() < deadline:
+        name, path, headers = targets[i % len(targets)]
+        i += 1
+        start = time.perf_counter()
+        try:
+            resp = await http.get(path, headers=headers)
+            ok = resp.status_code < 400
+        except httpx.HTTPError:
+            ok = False
+        samples.setdefault(name, []).append(((time.perf_counter() - start) * 1000, ok))
+
+
+def summarize(samples, elapsed):
+    result = {"elapsed_s": round(elapsed, 2), "endpoints": {}}
+    total = 0
+    for name, rows in sorted(samples.items()):
+        latencies = sorted(ms for ms, _ in rows)
+        errors = sum(1 for _, ok in rows if not ok)
+        total += len(rows)
+        result["endpoints"][name] = {
+            "requests": len(rows),
+            "errors": errors,
+            "rps": round(len(rows) / elapsed, 1),
+            "p50_ms": round(statistics.median(latencies), 1),
+            "p95_ms": round(percentile(latencies, 95), 1),
+            "max_ms": round(latencies[-1], 1),
+        }
+    result["total_requests"] = total
+    result["total_rps"] = round(total / elapsed, 1)
+    return result
+
+
+def print_summary(result, label):
+    print(f"\n== {label}: {result['total_requests']} requests in {result['elapsed_s']}s "
+          f"-> {result['total_rps']} req/s")
+    print(f"{'endpoint':32} {'reqs':>6} {'err':>4} {'rps':>7} {'p50':>8} {'p95':>8} {'max':>8}")
+    for name, s in result["endpoints"].items():
+        print(f"{name:32} {s['requests']:>6} {s['errors']:>4} {s['rps']:>7} "
+              f"{s['p50_ms']:>8} {s['p95_ms']:>8} {s['max_ms']:>8}")
+
+
+async def run(args):
+    targets = build_targets(args)
+    limits = httpx.Limits(max_connections=args.clients, max_keepalive_connections=args.clients)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=args.timeout) as http:
+        # Warm-up so connection setup is not part of the measurement.
+        for _, path, headers in targets:
+            await http.get(path, headers=headers)
+
+        samples = {}
+        start = time.perf_counter()
+        deadline = start + args.duration
+        await asyncio.gather(*(
+            _client(http, targets, deadline, samples, offset)
+            for offset in range(args.clients)
+        ))
+        return summarize(samples, time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default=os.getenv("BENCH_BASE_URL", "http://127.0.0.1:6101"))
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--yif-user-id", type=int, default=1)
+    parser.add_argument("--bench-user-id", type=int, default=None)
+    parser.add_argument("--slow", action="store_true", help="include the full IOU export")
+    parser.add_argument("--label", default="run")
+    parser.add_argument("--out", help="write the summary as JSON")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"))
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    result = asyncio.run(run(args))
+    result["label"] = args.label
+    result["clients"] = args.clients
+    print_summary(result, args.label)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
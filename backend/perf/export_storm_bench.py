@@ -0,0 +1,94 @@
+"""
+Measures how an export storm affects interactive latency.
+
+Same shape as login_burst_bench.py: a probe client requests an interactive
+endpoint (default GET /api/yif/ious?limit=20) at a fixed rate, first alone
+(quiet phase), then while --exporters concurrent clients request
+GET /api/yif/export/ious?target_worker_id=all back to back (storm phase).
+Without admission control every export holds a DB connection and a core, and
+the probe's p99 follows the export time. With it, at most
+ADMISSION_BULK_CONCURRENCY exports run per process, the rest queue or get
+429, and the probe's latency should barely move.
+
+Uses the seeded load-test admin (perf/seed_fixture.py):
+
+    RATE_LIMIT_ENABLED=false uvicorn main:app --port 6101
+    python perf/export_storm_bench.py --exporters 8 --phase 10
+"""
+import argparse
+import asyncio
+import os
+import time
+from collections import Counter
+
+import httpx
+
+from _common import summary
+
+
+async def probe(http, path, headers, interval, deadline, samples):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        await http.get(path, headers=headers)
+        elapsed = time.perf_counter() - start
+        samples.append(elapsed * 1000)
+        await asyncio.sleep(max(0.0, interval - elapsed))
+
+
+async def export_loop(http, path, headers, deadline, samples, statuses):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        resp = await http.get(path, headers=headers)
+        samples.append((time.perf_counter() - start) * 1000)
+        statuses[resp.status_code] += 1
+        if resp.status_code == 429:
+            await asyncio.sleep(float(resp.headers.get("retry-after", "1")))
+
+
+async def run(args):
+    limits = httpx.Limits(max_connections=args.exporters + 4)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=120, limits=limits) as http:
+        resp = await http.post("/api/yif/login", json={"username": args.username, "password": args.password})
+        resp.raise_for_status()
+        headers = {"Authorization": f"Bearer {resp.json()['access_token']}"}
+        await http.get(args.probe_path, headers=headers)  # warm the connection
+        interval = 1 / args.probe_rate
+
+        quiet = []
+        await probe(http, args.probe_path, headers, interval, time.perf_counter() + args.phase, quiet)
+
+        storm, exports, statuses = [], [], Counter()
+        deadline = time.perf_counter() + args.phase
+        started = time.perf_counter()
+        await asyncio.gather(
+            probe(http, args.probe_path, headers, interval, deadline, storm),
+            *(export_loop(http, args.export_path, headers, deadline, exports, statuses)
+              for _ in range(args.exporters)),
+        )
+        elapsed = time.perf_counter() - started
+
+    print(f"probe GET {args.probe_path} at {args.probe_rate}/s, {args.exporters} concurrent export clients")
+    print(f"{'phase':8} {'n':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for name, samples in (("quiet", quiet), ("storm", storm)):
+        s = summary(samples)
+        print(f"{name:8} {s['n']:>6} {s['p50']:>9.1f} {s['p95']:>9.1f} {s['p99']:>9.1f} {s['max']:>9.1f}")
+    s = summary(exports)
+    print(f"exports: {s['n']} in {elapsed:.1f}s, p50 {s['p50']:.0f} ms, p95 {s['p95']:.0f} ms, "
+          f"statuses {dict(statuses)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default=os.getenv("BENCH_BASE_URL", "http://127.0.0.1:6101"))
+    parser.add_argument("--probe-path", default="/api/yif/ious?limit=20")
+    parser.add_argument("--export-path", default="/api/yif/export/ious?target_worker_id=all&export_type=detailed")
+    parser.add_argument("--probe-rate", type=float, default=20, help="probe requests per second")
+    parser.add_argument("--exporters", type=int, default=8, help="concurrent export clients in the storm")
+    parser.add_argument("--phase", type=float, default=10.0, help="seconds per phase")
+    parser.add_argument("--username", default="loadtest_admin")
+    parser.add_argument("--password", default="loadtest")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,469 @@
+"""
+Bulk synthetic data generator for benchmarking at production-like scale.
+
+Loads millions of rows with COPY, where seed_fixture.py uses batched
+INSERTs:
+
+  YIF          generated workers (gen_*, user codes Z..), each with IOUs
+               whose ious_id follows {user_code}{YYMMDD}{D|H}{NN}. Most are
+               BSP-style 'D' data imports, the rest hand entries. IOUs have
+               1-4 ticket items and payment histories: unpaid, partial,
+               paid off, overpaid, and negative (refund) IOUs. status is
+               precomputed with the same rules as the yif_payments trigger.
+  EmbodyBench  users, runs across both benchmark catalogs, their jobs
+               (chunked like submit_run) and one episode row per finished
+               episode
+  accounting   transactions (source 'generated'), plus optionally a
+               CIBC-format CSV for POST /api/accounting/import/csv
+
+Output depends only on --seed and --end-date, so two databases generated
+with the same arguments hold identical data. Existing rows are untouched;
+--reset deletes everything a previous run generated.
+
+    python perf/generate_data.py --ious 2000000 --workers 300 --runs 5000
+    python perf/generate_data.py --reset --ious 0 --runs 0 --transactions 0   # cleanup only
+    python perf/generate_data.py --ious 0 --runs 0 --transactions 0 --csv /tmp/cibc.csv --csv-rows 20000
+
+Row triggers (IOU status, data_versions) are bypassed during the load via
+session_replication_role, or by disabling them per table when the role is
+not a superuser. Disabling them locks the tables until commit. The
+data_versions rows are bumped once at the end.
+"""
+import argparse
+import csv
+import io
+import itertools
+import json
+import math
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import date, datetime, timedelta, timezone
+
+import psycopg2
+from dotenv import load_dotenv
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+load_dotenv(os.path.join(BACKEND_DIR, ".env"))
+sys.path.insert(0, os.path.join(BACKEND_DIR, "src"))
+
+import benchmarks  # noqa: E402  (catalog task names for realistic jobs)
+
+COPY_BATCH = 50_000
+
+# IATA ticket prefix -> carrier, for ticket numbers matching the flight.
+AIRLINES = [("081", "QF"), ("999", "CA"), ("781", "MU"), ("784", "CZ"), ("014", "AC"),
+            ("086", "NZ"), ("618", "SQ"), ("160", "CX"), ("180", "KE"), ("695", "BR")]
+SURNAMES = ["WANG", "LI", "ZHANG", "LIU", "CHEN", "YANG", "HUANG", "ZHAO", "WU", "ZHOU",
+            "XU", "SUN", "MA", "ZHU", "HU", "GUO", "HE", "LIN", "LUO", "GAO", "SMITH", "NGUYEN"]
+GIVEN = ["WEI", "JING", "MIN", "LEI", "YAN", "HUI", "JUN", "XIN", "TAO", "MEI", "JOHN", "ANNA"]
+MERCHANTS = [("Groceries", "LOBLAWS"), ("Groceries", "T&T SUPERMARKET"), ("Dining", "TIM HORTONS"),
+             ("Dining", "UBER EATS"), ("Transport", "PRESTO"), ("Transport", "PETRO-CANADA"),
+             ("Utilities", "ROGERS"), ("Utilities", "HYDRO ONE"), ("Travel", "AIR CANADA"),
+             ("Other", "AMAZON.CA"), ("Rent", "RENT PAYMENT"), ("Salary", "PAYROLL DEPOSIT")]
+
+# Same rules as update_iou_status_trigger (schema_migrations).
+STATUS_NONE, STATUS_PARTIAL, STATUS_PAID, STATUS_NEGATIVE, STATUS_OVERPAID = 0, 1, 2, 3, 4
+
+
+def _iou_status(total, paid_sum, n_payments):
+    if total < 0:
+        return STATUS_NEGATIVE
+    rest = round(total - paid_sum, 2)
+    if rest == 0:
+        return STATUS_PAID
+    if rest < 0:
+        return STATUS_OVERPAID
+    return STATUS_PARTIAL if n_payments else STATUS_NONE
+
+
+# ========================
+# COPY helpers
+# ========================
+
+def _copy_value(value) -> str:
+    if value is None:
+        return "\\N"
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value)
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n")
+
+
+def copy_rows(cursor, table, columns, rows) -> int:
+    """COPY an iterable of tuples into table in COPY_BATCH-sized chunks."""
+    sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN"
+    total = 0
+    buf = io.StringIO()
+    count = 0
+    for row in rows:
+        buf.write("\t".join(_copy_value(v) for v in row))
+        buf.write("\n")
+        count += 1
+        if count == COPY_BATCH:
+            buf.seek(0)
+            cursor.copy_expert(sql, buf)
+            total += count
+            buf, count = io.StringIO(), 0
+    if count:
+        buf.seek(0)
+        cursor.copy_expert(sql, buf)
+        total += count
+    return total
+
+
+def reserve_ids(cursor, table, n) -> int:
+    """Claim n consecutive serial ids for table; returns the first one."""
+    if n == 0:
+        return 0
+    cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", (table,))
+    seq = cursor.fetchone()[0]
+    cursor.execute("SELECT nextval(%s)", (seq,))
+    first = cursor.fetchone()[0]
+    cursor.execute("SELECT setval(%s, %s)", (seq, first + n - 1))
+    return first
+
+
+def _uuid(rng) -> uuid.UUID:
+    return uuid.UUID(int=rng.getrandbits(128), version=4)
+
+
+# ========================
+# YIF
+# ========================
+
+def _user_code(i: int) -> str:
+    # Z + two letters: 676 codes that real user codes are unlikely to use.
+    return "Z" + chr(65 + i // 26) + chr(65 + i % 26)
+
+
+def _worker_weights(rng, n):
+    # A few busy agents and a long tail, roughly Zipf.
+    weights = [1 / (rank + 1) ** 0.8 for rank in range(n)]
+    rng.shuffle(weights)
+    return list(itertools.accumulate(weights))
+
+
+def _business_days(end: date, days: int):
+    """Newest-first dates with cumulative weights; weekends are quieter."""
+    dates = [end - timedelta(days=offset) for offset in range(days)]
+    weights = itertools.accumulate(1.0 if d.weekday() < 5 else 0.35 for d in dates)
+    return dates, list(weights)
+
+
+def generate_yif(cursor, rng, args, end):
+    n_workers = min(args.workers, 676)
+    password_hash = args.password_hash
+    worker_first = reserve_ids(cursor, "yif_workers", n_workers)
+    workers = [(worker_first + i, _user_code(i)) for i in range(n_workers)]
+    copy_rows(cursor, "yif_workers",
+              ("id", "username", "password_hash", "display_name", "user_code", "role"),
+              ((wid, f"gen_{code.lower()}", password_hash, f"Generated {code}", code,
+                "admin" if i == 0 else "user") for i, (wid, code) in enumerate(workers)))
+
+    dates, date_weights = _business_days(end, args.days)
+    worker_weights = _worker_weights(rng, n_workers)
+
+    # Pick (worker, date, type) per IOU, keeping the NN suffix within 01-99.
+    used = {}
+    plan = []
+    for _ in range(args.ious):
+        wid, code = rng.choices(workers, cum_weights=worker_weights)[0]
+        day = rng.choices(dates, cum_weights=date_weights)[0]
+        kind = "D" if rng.random() < 0.85 else "H"
+        for _spill in range(len(dates)):
+            key = (code, day, kind)
+            seq = used.get(key, 0) + 1
+            if seq <= 99:
+                used[key] = seq
+                break
+            day -= timedelta(days=1)
+            if day < dates[-1]:
+                day = end
+        else:
+            continue
+        plan.append((wid, code, day, kind, seq))
+    plan.sort(key=lambda p: (p[2], p[1], p[3], p[4]))
+
+    iou_first = reserve_ids(cursor, "yif_ious", len(plan))
+    items, payments, ious = [], [], []
+    for n, (wid, code, day, kind, seq) in enumerate(plan):
+        iou_id = iou_first + n
+        yymmdd = day.strftime("%y%m%d")
+        created = datetime.combine(day, datetime.min.time()) + timedelta(seconds=rng.randint(8 * 3600, 20 * 3600))
+        refund = rng.random() < 0.02
+        n_items = rng.choices((1, 2, 3, 4), (55, 25, 12, 8))[0]
+        total = 0.0
+        for idx in range(n_items):
+            amount = round(math.exp(rng.gauss(6.3, 0.6)), 2)
+            if refund:
+                amount = -amount
+            total += amount
+            prefix, carrier = rng.choice(AIRLINES)
+            items.append((iou_id, idx, f"{rng.choice(SURNAMES)}/{rng.choice(GIVEN)}", amount,
+                          f"{carrier}{rng.randint(1, 999)}", f"{prefix}{rng.randint(0, 10**10 - 1):010d}",
+                          "", created, wid))
+        total = round(total, 2)
+
+        # Payment history: amounts are cents-exact so fully paid IOUs land on rest == 0.
+        r = rng.random()
+        if refund:
+            amounts = [total] if r < 0.5 else []
+        elif r < 0.35:
+            amounts = []
+        elif r < 0.65:
+            amounts = [round(total * rng.uniform(0.1, 0.45), 2) for _ in range(rng.randint(1, 2))]
+        elif r < 0.97:
+            k = rng.choices((1, 2, 3), (60, 30, 10))[0]
+            amounts = [round(total * share, 2) for share in rng.sample((0.2, 0.25, 0.3, 0.4, 0.5), k - 1)]
+            amounts.append(round(total - sum(amounts), 2))
+        else:
+            amounts = [round(total * rng.uniform(1.02, 1.2), 2)]
+
+        for amount in amounts:
+            pay_day = min(day + timedelta(days=int(rng.expovariate(1 / 12))), end)
+            payments.append((iou_id, wid, code, pay_day.strftime("%y%m%d"),
+                             f"{rng.choice(SURNAMES)}/{rng.choice(GIVEN)}", amount, "",
+                             datetime.combine(pay_day, datetime.min.time()) + timedelta(hours=12)))
+        paid_sum = round(sum(amounts), 2)
+        ious.append((iou_id, f"{code}{yymmdd}{kind}{seq:02d}", wid, code, yymmdd, total,
+                     _iou_status(total, paid_sum, len(amounts)), created, created))
+
+    copy_rows(cursor, "yif_ious",
+              ("id", "ious_id", "worker_id", "user_code", "ious_date", "total_amount", "status",
+               "created_at", "updated_at"), ious)
+    copy_rows(cursor, "yif_iou_items",
+              ("ious_id", "item_index", "client", "amount", "flight", "ticket_number", "remark",
+               "created_at", "worker_id"), items)
+    copy_rows(cursor, "yif_payments",
+              ("ious_id", "worker_id", "user_code", "payment_date", "payer_name", "amount", "remark",
+               "created_at"), payments)
+    return {"yif_workers": n_workers, "yif_ious": len(ious), "yif_iou_items": len(items),
+            "yif_payments": len(payments)}
+
+
+# ========================
+# EmbodyBench
+# ========================
+
+def generate_bench(cursor, rng, args, end):
+    users_first = reserve_ids(cursor, "embodybench_users", args.bench_users)
+    user_ids = [users_first + i for i in range(args.bench_users)]
+    copy_rows(cursor, "embodybench_users", ("id", "email", "password_hash", "display_name", "role"),
+              ((uid, f"gen{i:04d}@generated.invalid", args.password_hash, f"Generated {i}", "user")
+               for i, uid in enumerate(user_ids)))
+
+    end_ts = datetime.combine(end, datetime.min.time(), tzinfo=timezone.utc)
+    runs, jobs, episodes = [], [], []
+    for i in range(args.runs):
+        bench_name = rng.choices(("robotwin", "robopro"), (70, 30))[0]
+        bench_mod = benchmarks.get(bench_name)
+        tasks = rng.sample(bench_mod.TASKS, rng.randint(1, 10))
+        per_task = rng.choice((10, 25, 25, 50))
+        chunk = rng.choice((5, 10, 25, per_task))
+        config = {"tasks": [t["name"] for t in tasks], "episodes_per_task": per_task, "chunk_size": chunk,
+                  "task_config": None, "action_space": "xvla_ee_rot6d_20"}
+        # Spread submissions over --days; the newest few are still in flight.
+        submitted = end_ts - timedelta(seconds=(args.runs - i) * args.days * 86400 / args.runs)
+        recent = i >= args.runs - max(3, args.runs // 200)
+        if recent:
+            run_state = rng.choice(("queued", "running"))
+        else:
+            run_state = rng.choices(("completed", "failed", "cancelled"), (85, 12, 3))[0]
+        run_id = _uuid(rng)
+        started = None if run_state == "queued" else submitted + timedelta(minutes=rng.randint(1, 30))
+        finished = None if recent else started + timedelta(hours=rng.uniform(0.5, 8))
+        runs.append((run_id, rng.choice(user_ids), bench_name, bench_mod.VERSION, config, "api",
+                     "https://policy.generated.invalid/act", run_state, submitted, started, finished,
+                     "generated"))
+
+        for task in tasks:
+            # Same per-task config routing as submit_run.
+            category = task.get("category", "general")
+            if bench_name == "robopro":
+                task_config = (f"bench_demo_{category}_clean"
+                               if category in ("office", "study", "kitchens", "kitchenl") else "bench_demo_clean")
+            else:
+                task_config = bench_mod.DEFAULT_TASK_CONFIG
+            for chunk_idx, offset in enumerate(range(0, per_task, chunk)):
+                n = min(chunk, per_task - offset)
+                job_id = _uuid(rng)
+                if run_state == "queued":
+                    state = "queued"
+                elif run_state == "running":
+                    state = rng.choices(("succeeded", "running", "queued"), (50, 10, 40))[0]
+                elif run_state == "failed":
+                    state = rng.choices(("succeeded", "failed"), (70, 30))[0]
+                elif run_state == "cancelled":
+                    state = rng.choices(("succeeded", "cancelled"), (50, 50))[0]
+                else:
+                    state = "succeeded"
+                if state in ("succeeded", "failed"):
+                    done = n
+                elif state == "running":
+                    done = rng.randint(0, n)
+                else:
+                    done = 0
+                succeeded = sum(rng.random() < 0.55 for _ in range(done))
+                job_started = started if state != "queued" else None
+                job_finished = finished if state in ("succeeded", "failed", "cancelled") else None
+                jobs.append((job_id, run_id, task["name"], task_config, chunk_idx, n, state,
+                             0 if state == "queued" else 1, job_started, job_finished,
+                             {"episodes_done": done, "episodes_succeeded": succeeded} if done else None,
+                             "timeout" if state == "failed" else None, {"benchmark": bench_name}))
+                for e in range(done):
+                    episodes.append((_uuid(rng), job_id, run_id, task["name"], chunk_idx * chunk + e, e,
+                                     {"success": e < succeeded, "n_steps": rng.randint(80, 600)},
+                                     job_started + timedelta(seconds=30 * (e + 1))))
+
+    copy_rows(cursor, "embodybench_runs",
+              ("id", "user_id", "benchmark", "benchmark_version", "config", "eval_mode", "api_endpoint_url",
+               "state", "submitted_at", "started_at", "finished_at", "notes"), runs)
+    copy_rows(cursor, "embodybench_jobs",
+              ("id", "run_id", "task_name", "task_config", "seed_offset", "n_episodes", "state",
+               "attempt_count", "started_at", "finished_at", "progress", "failure_reason", "requires_caps"),
+              jobs)
+    copy_rows(cursor, "embodybench_episodes",
+              ("id", "job_id", "run_id", "task_name", "seed_used", "episode_idx", "outcome", "recorded_at"),
+              episodes)
+    return {"embodybench_users": len(user_ids), "embodybench_runs": len(runs),
+            "embodybench_jobs": len(jobs), "embodybench_episodes": len(episodes)}
+
+
+# ========================
+# Accounting
+# ========================
+
+def _transaction(rng, end, days):
+    category, merchant = rng.choice(MERCHANTS)
+    day = end - timedelta(days=rng.randint(0, days - 1))
+    if category == "Salary":
+        amount = round(rng.uniform(2000, 6000), 2)
+    elif category == "Rent":
+        amount = -round(rng.uniform(1200, 2600), 2)
+    else:
+        amount = -round(math.exp(rng.gauss(3.2, 1.0)), 2)
+    return day, category, f"Point of Sale - Interac RETAIL PURCHASE {rng.randint(10**8, 10**9 - 1)} {merchant}", amount
+
+
+def generate_accounting(cursor, rng, args, end):
+    def rows():
+        for i in range(args.transactions):
+            day, category, desc, amount = _transaction(rng, end, args.days)
+            dup_hash = uuid.UUID(int=rng.getrandbits(128)).hex
+            yield (day, f"{desc} #{i}", amount, category, "generated", "CAD", 1.0, "", desc, dup_hash)
+
+    n = copy_rows(cursor, "hoshipu_accounting_transactions",
+                  ("date", "description", "amount", "category", "source", "currency", "exchange_rate",
+                   "remark", "original_desc", "dup_hash"), rows())
+    return {"hoshipu_accounting_transactions": n}
+
+
+def write_csv(path, rng, rows, end, days):
+    """CIBC export format accepted by import_csv: date, description, debit, credit."""
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        for _ in range(rows):
+            day, _, desc, amount = _transaction(rng, end, days)
+            writer.writerow([day.isoformat(), desc, f"{-amount:.2f}" if amount < 0 else "",
+                             f"{amount:.2f}" if amount > 0 else ""])
+
+
+# ========================
+# Driver
+# ========================
+
+def reset(cursor):
+    cursor.execute("""
+        DELETE FROM yif_payments WHERE worker_id IN (SELECT id FROM yif_workers WHERE username LIKE 'gen\\_%%');
+        DELETE FROM yif_iou_items WHERE ious_id IN (
+            SELECT i.id FROM yif_ious i JOIN yif_workers w ON w.id = i.worker_id WHERE w.username LIKE 'gen\\_%%');
+        DELETE FROM yif_ious WHERE worker_id IN (SELECT id FROM yif_workers WHERE username LIKE 'gen\\_%%');
+        DELETE FROM yif_workers WHERE username LIKE 'gen\\_%%';
+        DELETE FROM embodybench_episodes WHERE run_id IN (SELECT id FROM embodybench_runs WHERE notes = 'generated');
+        DELETE FROM embodybench_jobs WHERE run_id IN (SELECT id FROM embodybench_runs WHERE notes = 'generated');
+        DELETE FROM embodybench_runs WHERE notes = 'generated';
+        DELETE FROM embodybench_users WHERE email LIKE '%%@generated.invalid';
+        DELETE FROM hoshipu_accounting_transactions WHERE source = 'generated';
+    """)
+
+
+GENERATED_TABLES = ["yif_workers", "yif_ious", "yif_iou_items", "yif_payments", "embodybench_users",
+                    "embodybench_runs", "embodybench_jobs", "embodybench_episodes",
+                    "hoshipu_accounting_transactions"]
+
+
+def bypass_triggers(conn, cursor) -> list:
+    """Turn row triggers off for this transaction; returns tables to re-enable."""
+    try:
+        cursor.execute("SET LOCAL session_replication_role = replica")
+        return []
+    except psycopg2.errors.InsufficientPrivilege:
+        conn.rollback()
+    for table in GENERATED_TABLES:
+        cursor.execute(f"ALTER TABLE {table} DISABLE TRIGGER USER")
+    return GENERATED_TABLES
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ious", type=int, default=1_000_000)
+    parser.add_argument("--workers", type=int, default=200, help="YIF workers (max 676)")
+    parser.add_argument("--days", type=int, default=730, help="history length")
+    parser.add_argument("--end-date", default="2025-12-31", help="newest date generated (YYYY-MM-DD)")
+    parser.add_argument("--bench-users", type=int, default=50)
+    parser.add_argument("--runs", type=int, default=3000)
+    parser.add_argument("--transactions", type=int, default=100_000)
+    parser.add_argument("--csv", help="also write a CIBC-format CSV here for import_csv")
+    parser.add_argument("--csv-rows", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--reset", action="store_true", help="delete previously generated rows first")
+    args = parser.parse_args()
+
+    end = date.fromisoformat(args.end_date)
+    conn = psycopg2.connect(os.environ["DATABASE_URL"])
+    cursor = conn.cursor()
+    counts = {}
+    start = time.perf_counter()
+    try:
+        # One known bcrypt hash (password: "generated") instead of hashing per user.
+        args.password_hash = "$2b$12$ieNBSsu2VLIZa3ObBZKD3.9pjEeGltQ0pn7CfO6Up4cSwsV2dfT2u"
+        reenable = bypass_triggers(conn, cursor)
+        if args.reset:
+            reset(cursor)
+        # Separate generators per domain, so changing one size keeps the others stable.
+        if args.ious:
+            counts.update(generate_yif(cursor, random.Random(f"{args.seed}:yif"), args, end))
+        if args.runs:
+            counts.update(generate_bench(cursor, random.Random(f"{args.seed}:bench"), args, end))
+        if args.transactions:
+            counts.update(generate_accounting(cursor, random.Random(f"{args.seed}:accounting"), args, end))
+        for table in reenable:
+            cursor.execute(f"ALTER TABLE {table} ENABLE TRIGGER USER")
+        cursor.execute("""
+            UPDATE data_versions SET version = version + 1, updated_at = NOW()
+             WHERE resource IN ('yif', 'embodybench_runs')
+        """)
+        conn.commit()
+        loaded = time.perf_counter()
+        conn.autocommit = True
+        for table in GENERATED_TABLES:
+            cursor.execute(f"ANALYZE {table}")
+    finally:
+        cursor.close()
+        conn.close()
+
+    if args.csv:
+        write_csv(args.csv, random.Random(f"{args.seed}:csv"), args.csv_rows, end, args.days)
+        counts["csv_rows"] = args.csv_rows
+
+    total = sum(v for k, v in counts.items() if k != "csv_rows")
+    elapsed = loaded - start
+    print(json.dumps(counts, indent=2))
+    print(f"loaded {total} rows in {elapsed:.1f}s ({total / elapsed if elapsed else 0:,.0f} rows/s), "
+          f"analyzed in {time.perf_counter() - loaded:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Serialization microbenchmark for a large IOU search response.
+
+Builds N synthetic IOU rows shaped like search_ious' DB rows (Decimal
+amounts, dates, datetimes, nested items and payments) and times three ways
+of turning them into a response body:
+
+  legacy    per-field float() loop + jsonable_encoder + JSONResponse
+  encoder   raw rows + jsonable_encoder + FastJSONResponse (the app-wide
+            default_response_class when an endpoint returns a dict)
+  fast      raw rows + json_response (orjson only)
+
+No database or server needed:
+
+    python perf/json_bench.py                 # 10k IOUs
+    python perf/json_bench.py --ious 2000 --repeat 20
+"""
+import argparse
+import copy
+import os
+import statistics
+import sys
+import time
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from fast_json import FastJSONResponse, json_response
+
+
+def make_rows(n: int):
+    base = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    ious, items, payments = [], [], []
+    for i in range(n):
+        total = Decimal(f"{1000 + i % 5000}.{i % 100:02d}")
+        paid = Decimal(f"{i % 700}.50")
+        ious.append({
+            "id": i, "ious_id": f"AB{i:08d}", "user_code": "AB", "worker_id": 1 + i % 7,
+            "ious_date": date(2025, 1, 1) + timedelta(days=i % 300), "total_amount": total,
+            "status": i % 3, "created_at": base + timedelta(minutes=i),
+            "paid": paid, "rest": total - paid,
+        })
+        for k in range(2):
+            items.append({
+                "ious_id": i, "client": f"Client {i % 300}", "amount": total / 2,
+                "flight": f"QF{i % 900}", "ticket_number": f"081{i:010d}", "remark": None,
+            })
+        payments.append({
+            "ious_id": i, "payment_date": date(2025, 2, 1) + timedelta(days=i % 200),
+            "payer_name": f"Payer {i % 50}", "amount": paid, "remark": "",
+        })
+    return ious, items, payments
+
+
+def legacy(ious, items, payments):
+    """search_ious before the fast path"""
+    items_by_iou = {}
+    for item in items:
+        items_by_iou.setdefault(item["ious_id"], []).append({
+            "client": item["client"], "amount": float(item["amount"]), "flight": item["flight"],
+            "ticket_number": item["ticket_number"], "remark": item["remark"],
+        })
+    payments_by_iou = {}
+    for payment in payments:
+        payments_by_iou.setdefault(payment["ious_id"], []).append({
+            "payment_date": payment["payment_date"], "payer_name": payment["payer_name"],
+            "amount": float(payment["amount"]), "remark": payment["remark"],
+        })
+    results = []
+    for iou in ious:
+        results.append({
+            **dict(iou),
+            "total_amount": float(iou["total_amount"]), "paid": float(iou["paid"]),
+            "rest": float(iou["rest"]),
+            "items": items_by_iou.get(iou["id"], []), "payments": payments_by_iou.get(iou["id"], []),
+        })
+    content = {"success": True, "total": len(ious), "ious": results}
+    return JSONResponse(jsonable_encoder(content)).body
+
+
+def _grouped(ious, items, payments):
+    items_by_iou = {}
+    for item in items:
+        items_by_iou.setdefault(item.pop("ious_id"), []).append(item)
+    payments_by_iou = {}
+    for payment in payments:
+        payments_by_iou.setdefault(payment.pop("ious_id"), []).append(payment)
+    for iou in ious:
+        iou["items"] = items_by_iou.get(iou["id"], [])
+        iou["payments"] = payments_by_iou.get(iou["id"], [])
+    return {"success": True, "total": len(ious), "ious": ious}
+
+
+def encoder(ious, items, payments):
+    return FastJSONResponse(jsonable_encoder(_grouped(ious, items, payments))).body
+
+
+def fast(ious, items, payments):
+    return json_response(_grouped(ious, items, payments)).body
+
+
+def bench(fn, rows, repeat):
+    samples, size = [], 0
+    for _ in range(repeat):
+        # Fresh rows each time: the grouped variants mutate them, as the
+        # router does with freshly fetched rows.
+        fresh = copy.deepcopy(rows)
+        start = time.perf_counter()
+        size = len(fn(*fresh))
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ious", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=7)
+    args = parser.parse_args()
+
+    rows = make_rows(args.ious)
+    print(f"{args.ious} IOUs, median of {args.repeat} runs")
+    print(f"{'path':10} {'ms':>10} {'bytes':>12}")
+    baseline = None
+    for name, fn in (("legacy", legacy), ("encoder", encoder), ("fast", fast)):
+        ms, size = bench(fn, rows, args.repeat)
+        baseline = baseline or ms
+        print(f"{name:10} {ms:>10.1f} {size:>12}   x{baseline / ms:.1f}")
+
+
+if __name__ == "__main__":
+    main()
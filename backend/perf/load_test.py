@@ -0,0 +1,319 @@
+"""
+Mixed-workload HTTP load test against a running backend.
+
+Replays a weighted mix of the real traffic shapes on top of the seeded
+fixture (perf/seed_fixture.py):
+
+  YIF           IOU search with varied filters, IOU detail, payment list,
+                payment creation, dashboard, full IOU export
+  EmbodyBench   run list, plus simulated workers cycling
+                claim -> progress -> episodes -> state
+  accounting    transaction list and stats
+  collection    list
+
+Each client picks the next scenario by weight, so slow requests compete
+with fast ones the way they do in production. For every endpoint the test
+reports throughput, error count, status codes and p50/p95/p99/max latency,
+and with --out it saves the result as JSON for later comparison:
+
+    python perf/load_test.py --clients 50 --duration 60 --label before --out before.json
+    python perf/load_test.py --clients 50 --duration 60 --label after --out after.json
+    python perf/load_test.py --compare before.json after.json
+
+Writes are real: payments are inserted and queued jobs are consumed, so
+reseed (seed_fixture.py --reset) between runs you want to compare. The
+server should run with RATE_LIMIT_ENABLED=false, or rate-limited writes
+show up as 429s.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from collections import Counter
+from datetime import date, timedelta
+
+import httpx
+
+from _common import BACKEND_DIR, compare, percentile, token
+
+# (scenario, weight). Weights are relative; --mix overrides them.
+DEFAULT_MIX = {
+    "yif_search": 30,
+    "yif_iou_detail": 10,
+    "yif_payments_list": 8,
+    "yif_payment_create": 6,
+    "yif_dashboard": 8,
+    "yif_export": 1,
+    "bench_runs": 8,
+    "bench_worker_cycle": 10,
+    "accounting_transactions": 6,
+    "accounting_stats": 4,
+    "collection_list": 4,
+}
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}
+
+    async def call(self, http, name, method, path, **kwargs):
+        start = time.perf_counter()
+        try:
+            resp = await http.request(method, path, **kwargs)
+            status = resp.status_code
+        except httpx.HTTPError as e:
+            # Reported next to the status codes, e.g. "ReadTimeout".
+            resp, status = None, type(e).__name__
+        self.samples.setdefault(name, []).append(((time.perf_counter() - start) * 1000, status))
+        return resp
+
+
+class Workload:
+    def __init__(self, fixture, args):
+        self.fixture = fixture
+        self.rng = random.Random(args.seed)
+        self.yif_users = fixture["yif_user_ids"]
+        self.yif_headers = {uid: {"Authorization": f"Bearer {token(str(uid), hours=6)}"} for uid in self.yif_users}
+        self.admin_headers = self.yif_headers[fixture["yif_admin_id"]]
+        bench_sub = f"bench:{fixture['bench_user_id']}"
+        self.bench_headers = {"Authorization": f"Bearer {token(bench_sub, hours=6)}"}
+        self.worker_headers = {"x-embodybench-worker-token": os.getenv("EMBODYBENCH_WORKER_SHARED_SECRET", "")}
+        self.iou_ids = fixture["iou_ids_by_user"]
+        self.workers = []
+        self.queue_empty = False
+
+    def _yif_user(self):
+        uid = self.rng.choice(self.yif_users)
+        return uid, self.yif_headers[uid]
+
+    def _own_iou(self, uid):
+        # get_iou only returns the caller's own IOUs, admins included.
+        return self.rng.choice(self.iou_ids[str(uid)])
+
+    async def register_workers(self, http, rec, n):
+        for i in range(n):
+            resp = await rec.call(http, "POST /api/bench/workers/register", "POST",
+                                  "/api/bench/workers/register", headers=self.worker_headers, json={
+                                      "hostname": f"loadtest-{os.getpid()}-{i}", "region": "loadtest",
+                                      "capabilities": {"benchmarks": ["robotwin"]},
+                                  })
+            if resp is None or resp.status_code != 200:
+                sys.exit(f"worker registration failed ({resp.status_code if resp else 'no response'}); "
+                         "is EMBODYBENCH_WORKER_SHARED_SECRET set on both sides?")
+            self.workers.append(resp.json()["worker_id"])
+
+    async def yif_search(self, http, rec):
+        _, headers = self._yif_user()
+        params = {"limit": self.rng.choice((20, 50, 100))}
+        shape = self.rng.random()
+        if shape < 0.3:
+            start = date.today() - timedelta(days=self.rng.randint(7, 90))
+            params["start_date"] = start.strftime("%y%m%d")
+        elif shape < 0.5:
+            params["client"] = self.rng.choice(("wang", "li", "zhang", "chen", "zhou"))
+        elif shape < 0.65:
+            params["status"] = self.rng.choice(("0,1", "2", "3"))
+        elif shape < 0.75:
+            params["remaining_amount"] = self.rng.randint(100, 2000)
+        await rec.call(http, "GET /api/yif/ious", "GET", "/api/yif/ious", params=params, headers=headers)
+
+    async def yif_iou_detail(self, http, rec):
+        uid, headers = self._yif_user()
+        await rec.call(http, "GET /api/yif/ious/{id}", "GET", f"/api/yif/ious/{self._own_iou(uid)}",
+                       headers=headers)
+
+    async def yif_payments_list(self, http, rec):
+        _, headers = self._yif_user()
+        await rec.call(http, "GET /api/yif/payments", "GET", "/api/yif/payments",
+                       params={"limit": 50}, headers=headers)
+
+    async def yif_payment_create(self, http, rec):
+        uid, headers = self._yif_user()
+        await rec.call(http, "POST /api/yif/payments", "POST", "/api/yif/payments", headers=headers, json={
+            "ious_db_id": self._own_iou(uid),
+            "user_code": self.fixture["user_codes"][str(uid)],
+            "payment_date": date.today().strftime("%y%m%d"),
+            "payer_name": "LOADTEST",
+            "amount": round(self.rng.uniform(1, 50), 2),
+            "remark": "loadtest",
+        })
+
+    async def yif_dashboard(self, http, rec):
+        _, headers = self._yif_user()
+        await rec.call(http, "GET /api/yif/stats/dashboard", "GET", "/api/yif/stats/dashboard", headers=headers)
+
+    async def yif_export(self, http, rec):
+        await rec.call(http, "GET /api/yif/export/ious", "GET", "/api/yif/export/ious",
+                       params={"export_type": "full"}, headers=self.admin_headers)
+
+    async def bench_runs(self, http, rec):
+        await rec.call(http, "GET /api/bench/runs", "GET", "/api/bench/runs", headers=self.bench_headers)
+
+    async def bench_worker_cycle(self, http, rec):
+        """One job's lifecycle as a worker drives it, each call timed separately."""
+        worker_id = self.rng.choice(self.workers)
+        resp = await rec.call(http, "POST /api/bench/workers/{id}/claim", "POST",
+                              f"/api/bench/workers/{worker_id}/claim", headers=self.worker_headers,
+                              json={"caps": {"benchmarks": ["robotwin"]}})
+        if resp is None or resp.status_code != 200:
+            self.queue_empty = self.queue_empty or (resp is not None and resp.status_code == 204)
+            return
+        job = resp.json()
+        job_id, n = job["job_id"], job["n_episodes"]
+        await rec.call(http, "PATCH /api/bench/jobs/{id}/progress", "PATCH",
+                       f"/api/bench/jobs/{job_id}/progress", headers=self.worker_headers,
+                       json={"worker_id": worker_id, "episodes_done": n // 2})
+        await rec.call(http, "POST /api/bench/jobs/{id}/episodes", "POST",
+                       f"/api/bench/jobs/{job_id}/episodes", headers=self.worker_headers, json={
+                           "worker_id": worker_id,
+                           "episodes": [{"seed_used": job["seed_offset"] + e, "episode_idx": e,
+                                         "outcome": {"success": self.rng.random() < 0.6, "n_steps": 120}}
+                                        for e in range(n)],
+                       })
+        await rec.call(http, "PATCH /api/bench/jobs/{id}/state", "PATCH",
+                       f"/api/bench/jobs/{job_id}/state", headers=self.worker_headers,
+                       json={"worker_id": worker_id, "state": "succeeded"})
+
+    async def accounting_transactions(self, http, rec):
+        start = date.today() - timedelta(days=self.rng.randint(30, 300))
+        await rec.call(http, "GET /api/accounting/transactions", "GET", "/api/accounting/transactions",
+                       params={"start_date": start.isoformat(), "limit": 100})
+
+    async def accounting_stats(self, http, rec):
+        start = date.today() - timedelta(days=self.rng.randint(30, 300))
+        await rec.call(http, "GET /api/accounting/stats", "GET", "/api/accounting/stats",
+                       params={"start_date": start.isoformat()})
+
+    async def collection_list(self, http, rec):
+        await rec.call(http, "GET /api/collection/", "GET", "/api/collection/",
+                       params={"limit": 20, "offset": self.rng.randint(0, 5) * 20})
+
+
+async def _client(workload, mix, http, rec, deadline, think_ms):
+    names = list(mix)
+    weights = [mix[n] for n in names]
+    while time.perf_counter() < deadline:
+        scenario = workload.rng.choices(names, weights)[0]
+        await getattr(workload, scenario)(http, rec)
+        if think_ms:
+            await asyncio.sleep(workload.rng.uniform(0, 2 * think_ms) / 1000)
+
+
+def summarize(samples, elapsed):
+    result = {"elapsed_s": round(elapsed, 2), "endpoints": {}}
+    total = errors_total = 0
+    all_latencies = []
+    for name, rows in sorted(samples.items()):
+        latencies = sorted(ms for ms, _ in rows)
+        statuses = Counter(str(status) for _, status in rows)
+        errors = sum(1 for _, status in rows if isinstance(status, str) or status >= 400)
+        total += len(rows)
+        errors_total += errors
+        all_latencies.extend(latencies)
+        result["endpoints"][name] = {
+            "requests": len(rows),
+            "errors": errors,
+            "statuses": dict(sorted(statuses.items())),
+            "rps": round(len(rows) / elapsed, 1),
+            "p50_ms": round(statistics.median(latencies), 1),
+            "p95_ms": round(percentile(latencies, 95), 1),
+            "p99_ms": round(percentile(latencies, 99), 1),
+            "max_ms": round(latencies[-1], 1),
+        }
+    all_latencies.sort()
+    result["total_requests"] = total
+    result["total_errors"] = errors_total
+    result["total_rps"] = round(total / elapsed, 1)
+    result["p50_ms"] = round(percentile(all_latencies, 50), 1)
+    result["p95_ms"] = round(percentile(all_latencies, 95), 1)
+    result["p99_ms"] = round(percentile(all_latencies, 99), 1)
+    return result
+
+
+def print_summary(result, label):
+    print(f"\n== {label}: {result['total_requests']} requests ({result['total_errors']} errors) in "
+          f"{result['elapsed_s']}s -> {result['total_rps']} req/s, "
+          f"p50 {result['p50_ms']} / p95 {result['p95_ms']} / p99 {result['p99_ms']} ms")
+    print(f"{'endpoint':40} {'reqs':>6} {'err':>5} {'rps':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}")
+    for name, s in result["endpoints"].items():
+        print(f"{name:40} {s['requests']:>6} {s['errors']:>5} {s['rps']:>7} "
+              f"{s['p50_ms']:>8} {s['p95_ms']:>8} {s['p99_ms']:>8} {s['max_ms']:>8}")
+    limited = sum(s["statuses"].get("429", 0) for s in result["endpoints"].values())
+    if limited:
+        print(f"\n{limited} requests were rate limited (429); run the server with RATE_LIMIT_ENABLED=false")
+
+
+def parse_mix(spec):
+    mix = dict(DEFAULT_MIX)
+    if spec:
+        for part in spec.split(","):
+            name, _, weight = part.partition("=")
+            if name not in DEFAULT_MIX:
+                sys.exit(f"unknown scenario {name!r}; choose from {', '.join(DEFAULT_MIX)}")
+            mix[name] = float(weight)
+    return {name: weight for name, weight in mix.items() if weight > 0}
+
+
+async def run(args):
+    with open(args.fixture) as f:
+        fixture = json.load(f)
+    mix = parse_mix(args.mix)
+    workload = Workload(fixture, args)
+    setup = Recorder()
+    limits = httpx.Limits(max_connections=args.clients, max_keepalive_connections=args.clients)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=args.timeout) as http:
+        if "bench_worker_cycle" in mix:
+            await workload.register_workers(http, setup, args.workers)
+        # One warm-up pass per scenario, not recorded.
+        for scenario in mix:
+            await getattr(workload, scenario)(http, setup)
+
+        rec = Recorder()
+        start = time.perf_counter()
+        deadline = start + args.duration
+        await asyncio.gather(*(
+            _client(workload, mix, http, rec, deadline, args.think_ms) for _ in range(args.clients)
+        ))
+        result = summarize(rec.samples, time.perf_counter() - start)
+    result["mix"] = mix
+    if workload.queue_empty:
+        print("note: the EmbodyBench job queue ran dry; reseed with more --queued-jobs")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default=os.getenv("BENCH_BASE_URL", "http://127.0.0.1:6101"))
+    parser.add_argument("--fixture", default=os.path.join(BACKEND_DIR, "perf", "loadtest_fixture.json"))
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds")
+    parser.add_argument("--think-ms", type=float, default=0, help="mean pause between a client's requests")
+    parser.add_argument("--workers", type=int, default=8, help="simulated EmbodyBench workers")
+    parser.add_argument("--mix", help="override weights, e.g. yif_export=0,yif_search=50")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--label", default="run")
+    parser.add_argument("--out", help="write the summary as JSON")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"))
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare, columns=("rps", "p95_ms", "p99_ms"), width=40)
+        return
+
+    result = asyncio.run(run(args))
+    result["label"] = args.label
+    result["clients"] = args.clients
+    result["base_url"] = args.base_url
+    print_summary(result, args.label)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
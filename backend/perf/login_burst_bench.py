@@ -0,0 +1,87 @@
+"""
+Measures how a burst of logins affects the latency of unrelated requests.
+
+A probe client requests a cheap endpoint (default GET /health) at a fixed
+rate for the whole run. The run has two phases: a quiet phase with the probe
+alone, then a burst phase in which --logins concurrent clients post to
+POST /api/yif/login back to back. While bcrypt ran on the event loop, every
+probe that arrived during a verify waited for it to finish. With crypto_pool
+the probe latency should barely move between the two phases.
+
+Uses the seeded load-test user (perf/seed_fixture.py). The server must run
+with RATE_LIMIT_ENABLED=false, or the logins hit the 5/minute limit:
+
+    RATE_LIMIT_ENABLED=false uvicorn main:app --port 6101
+    python perf/login_burst_bench.py --logins 8 --phase 10
+"""
+import argparse
+import asyncio
+import os
+import time
+from collections import Counter
+
+import httpx
+
+from _common import summary
+
+
+async def probe(http, path, interval, deadline, samples):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        await http.get(path)
+        elapsed = time.perf_counter() - start
+        samples.append(elapsed * 1000)
+        await asyncio.sleep(max(0.0, interval - elapsed))
+
+
+async def login_loop(http, username, password, deadline, samples, statuses):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        resp = await http.post("/api/yif/login", json={"username": username, "password": password})
+        samples.append((time.perf_counter() - start) * 1000)
+        statuses[resp.status_code] += 1
+
+
+async def run(args):
+    limits = httpx.Limits(max_connections=args.logins + 4)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=60, limits=limits) as http:
+        await http.get(args.probe_path)  # warm the connection
+        interval = 1 / args.probe_rate
+
+        quiet = []
+        await probe(http, args.probe_path, interval, time.perf_counter() + args.phase, quiet)
+
+        burst, logins, statuses = [], [], Counter()
+        deadline = time.perf_counter() + args.phase
+        started = time.perf_counter()
+        await asyncio.gather(
+            probe(http, args.probe_path, interval, deadline, burst),
+            *(login_loop(http, args.username, args.password, deadline, logins, statuses)
+              for _ in range(args.logins)),
+        )
+        elapsed = time.perf_counter() - started
+
+    print(f"probe GET {args.probe_path} at {args.probe_rate}/s, {args.logins} concurrent login clients")
+    print(f"{'phase':8} {'n':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for name, samples in (("quiet", quiet), ("burst", burst)):
+        s = summary(samples)
+        print(f"{name:8} {s['n']:>6} {s['p50']:>9.1f} {s['p95']:>9.1f} {s['p99']:>9.1f} {s['max']:>9.1f}")
+    s = summary(logins)
+    print(f"logins: {s['n']} in {elapsed:.1f}s ({s['n'] / elapsed:.1f}/s), "
+          f"p50 {s['p50']:.0f} ms, p95 {s['p95']:.0f} ms, statuses {dict(statuses)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default=os.getenv("BENCH_BASE_URL", "http://127.0.0.1:6101"))
+    parser.add_argument("--probe-path", default="/health")
+    parser.add_argument("--probe-rate", type=float, default=20, help="probe requests per second")
+    parser.add_argument("--logins", type=int, default=8, help="concurrent login clients in the burst")
+    parser.add_argument("--phase", type=float, default=10.0, help="seconds per phase")
+    parser.add_argument("--username", default="loadtest_admin")
+    parser.add_argument("--password", default="loadtest")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
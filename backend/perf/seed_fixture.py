@@ -0,0 +1,288 @@
+"""
+Seed a local Postgres with a reproducible load-test fixture.
+
+Creates its own users and rows next to whatever is already in the database,
+all tagged so --reset can remove them again:
+
+  - YIF: one admin and several users (username loadtest_*, user codes LTA..),
+    each with IOUs over the last months, 1-3 items per IOU, and payments
+    leaving a mix of unpaid, partial, paid and overpaid IOUs
+  - EmbodyBench: a loadtest@example.com user with finished and queued runs,
+    their jobs (queued ones feed the worker claim loop), and episodes
+  - accounting transactions (source 'loadtest') and collection items
+    (title prefix [loadtest])
+
+The same --seed always produces the same rows. Ids the load test needs are
+written to --out (default perf/loadtest_fixture.json):
+
+    python perf/seed_fixture.py --reset --ious 5000
+    python perf/load_test.py --fixture perf/loadtest_fixture.json
+
+The schema must already exist: the app's migrations run on boot, and the
+YIF / accounting / collection tables come from _archived_scripts/db_init.
+For millions of rows, use the COPY-based perf/generate_data.py instead.
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta, timezone
+
+import psycopg2
+from dotenv import load_dotenv
+from psycopg2.extras import Json, execute_values
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+load_dotenv(os.path.join(BACKEND_DIR, ".env"))
+
+REQUIRED_TABLES = [
+    "yif_workers", "yif_ious", "yif_iou_items", "yif_payments",
+    "embodybench_users", "embodybench_runs", "embodybench_jobs", "embodybench_episodes",
+    "hoshipu_accounting_transactions", "collection_items",
+]
+
+USER_CODES = ["LTA", "LTB", "LTC", "LTD", "LTE", "LTF", "LTG", "LTH"]
+PASSWORD = "loadtest"
+BENCH_EMAIL = "loadtest@example.com"
+CLIENTS = ["WANG", "LI", "ZHANG", "LIU", "CHEN", "YANG", "HUANG", "ZHAO", "WU", "ZHOU",
+           "XU", "SUN", "MA", "ZHU", "HU", "GUO", "HE", "LIN", "LUO", "GAO"]
+AIRLINES = ["QF", "CA", "MU", "CZ", "AC", "NZ", "SQ", "CX"]
+CATEGORIES = ["Groceries", "Dining", "Transport", "Rent", "Utilities", "Travel", "Salary", "Other"]
+
+
+def _check_schema(cursor):
+    cursor.execute("SELECT unnest(%s::text[]) EXCEPT SELECT tablename FROM pg_tables", (REQUIRED_TABLES,))
+    missing = sorted(r[0] for r in cursor.fetchall())
+    if missing:
+        sys.exit(f"missing tables: {', '.join(missing)} "
+                 "(boot the app once and run the _archived_scripts/db_init scripts)")
+
+
+def reset(cursor):
+    cursor.execute("SELECT id FROM yif_workers WHERE username LIKE 'loadtest\\_%%'")
+    worker_ids = [r[0] for r in cursor.fetchall()]
+    if worker_ids:
+        cursor.execute("DELETE FROM yif_payments WHERE ious_id IN "
+                       "(SELECT id FROM yif_ious WHERE worker_id = ANY(%s))", (worker_ids,))
+        cursor.execute("DELETE FROM yif_iou_items WHERE ious_id IN "
+                       "(SELECT id FROM yif_ious WHERE worker_id = ANY(%s))", (worker_ids,))
+        cursor.execute("DELETE FROM yif_ious WHERE worker_id = ANY(%s)", (worker_ids,))
+        cursor.execute("DELETE FROM yif_logs WHERE worker_id = ANY(%s)", (worker_ids,))
+        cursor.execute("DELETE FROM yif_workers WHERE id = ANY(%s)", (worker_ids,))
+    cursor.execute("SELECT id FROM embodybench_users WHERE email = %s", (BENCH_EMAIL,))
+    row = cursor.fetchone()
+    if row:
+        cursor.execute("DELETE FROM embodybench_episodes WHERE run_id IN "
+                       "(SELECT id FROM embodybench_runs WHERE user_id = %s)", (row[0],))
+        cursor.execute("DELETE FROM embodybench_jobs WHERE run_id IN "
+                       "(SELECT id FROM embodybench_runs WHERE user_id = %s)", (row[0],))
+        cursor.execute("DELETE FROM embodybench_runs WHERE user_id = %s", (row[0],))
+        cursor.execute("DELETE FROM embodybench_users WHERE id = %s", (row[0],))
+    cursor.execute("DELETE FROM embodybench_workers WHERE hostname LIKE 'loadtest-%%'")
+    cursor.execute("DELETE FROM hoshipu_accounting_transactions WHERE source = 'loadtest'")
+    cursor.execute("DELETE FROM collection_items WHERE title LIKE '[loadtest]%%'")
+
+
+def _password_hash() -> str:
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["bcrypt"]).hash(PASSWORD)
+
+
+def seed_yif(cursor, rng, n_ious, n_users, days):
+    password_hash = _password_hash()
+    users = [("loadtest_admin", "admin", USER_CODES[0])]
+    users += [(f"loadtest_user{i}", "user", USER_CODES[i]) for i in range(1, n_users + 1)]
+    worker_ids = {}
+    for username, role, code in users:
+        cursor.execute("""
+            INSERT INTO yif_workers (username, password_hash, display_name, user_code, role)
+            VALUES (%s, %s, %s, %s, %s) RETURNING id
+        """, (username, password_hash, username, code, role))
+        worker_ids[username] = (cursor.fetchone()[0], code)
+
+    today = date.today()
+    per_day = {}
+    ious = []
+    for i in range(n_ious):
+        username = users[i % len(users)][0]
+        worker_id, code = worker_ids[username]
+        day = today - timedelta(days=int(rng.triangular(0, days, 0)))
+        yymmdd = day.strftime("%y%m%d")
+        seq = per_day[(code, yymmdd)] = per_day.get((code, yymmdd), 0) + 1
+        if seq > 99:
+            continue
+        n_items = rng.choice((1, 1, 1, 2, 2, 3))
+        amounts = [round(rng.uniform(80, 2500), 2) for _ in range(n_items)]
+        ious.append((f"{code}{yymmdd}H{seq:02d}", worker_id, code, yymmdd, round(sum(amounts), 2), amounts))
+
+    iou_rows = execute_values(cursor, """
+        INSERT INTO yif_ious (ious_id, worker_id, user_code, ious_date, total_amount, status)
+        VALUES %s RETURNING id
+    """, [(iid, wid, code, d, total, 0) for iid, wid, code, d, total, _ in ious], fetch=True)
+    iou_ids = [r[0] for r in iou_rows]
+
+    items, payments = [], []
+    ids_by_user = {}
+    for iou_id, (iid, wid, code, yymmdd, total, amounts) in zip(iou_ids, ious):
+        ids_by_user.setdefault(str(wid), []).append(iou_id)
+        for idx, amount in enumerate(amounts):
+            items.append((iou_id, idx, rng.choice(CLIENTS), amount,
+                          f"{rng.choice(AIRLINES)}{rng.randint(1, 999)}",
+                          f"{rng.randint(100, 999)}{rng.randint(10**9, 10**10 - 1)}", "", wid))
+        kind = rng.random()
+        if kind < 0.35:
+            continue  # unpaid
+        if kind < 0.6:
+            paid = [round(total * rng.uniform(0.2, 0.8), 2)]  # partial
+        elif kind < 0.95:
+            first = round(total * rng.uniform(0.3, 0.7), 2)
+            paid = [first, round(total - first, 2)]  # paid off in two
+        else:
+            paid = [round(total + rng.uniform(10, 200), 2)]  # overpaid
+        for amount in paid:
+            payments.append((iou_id, wid, code, yymmdd, rng.choice(CLIENTS), amount, ""))
+
+    execute_values(cursor, """
+        INSERT INTO yif_iou_items (ious_id, item_index, client, amount, flight, ticket_number, remark, worker_id)
+        VALUES %s
+    """, items, page_size=1000)
+    execute_values(cursor, """
+        INSERT INTO yif_payments (ious_id, worker_id, user_code, payment_date, payer_name, amount, remark)
+        VALUES %s
+    """, payments, page_size=1000)
+    return {
+        "yif_user_ids": [wid for wid, _ in worker_ids.values()],
+        "yif_admin_id": worker_ids["loadtest_admin"][0],
+        "user_codes": {str(wid): code for wid, code in worker_ids.values()},
+        "iou_ids_by_user": ids_by_user,
+        "yif_counts": {"ious": len(iou_ids), "items": len(items), "payments": len(payments)},
+    }
+
+
+def seed_bench(cursor, rng, n_runs, queued_jobs):
+    cursor.execute("""
+        INSERT INTO embodybench_users (email, password_hash, display_name, role)
+        VALUES (%s, %s, 'Load Test', 'admin') RETURNING id
+    """, (BENCH_EMAIL, _password_hash()))
+    user_id = cursor.fetchone()[0]
+
+    now = datetime.now(timezone.utc)
+    runs, n_jobs, n_episodes = [], 0, 0
+    for i in range(n_runs):
+        # The newest run stays queued and carries the claimable jobs.
+        queued = i == n_runs - 1
+        submitted = now - timedelta(hours=(n_runs - i) * 3)
+        cursor.execute("""
+            INSERT INTO embodybench_runs
+                (user_id, benchmark, benchmark_version, config, eval_mode, api_endpoint_url,
+                 state, submitted_at, started_at, finished_at, notes)
+            VALUES (%s, 'robotwin', '2.0', %s, 'api', 'https://loadtest.invalid/act',
+                    %s, %s, %s, %s, 'loadtest')
+            RETURNING id
+        """, (user_id, Json({"tasks": ["place_shoe"], "episodes_per_task": 10}),
+              "queued" if queued else "succeeded", submitted,
+              None if queued else submitted + timedelta(minutes=5),
+              None if queued else submitted + timedelta(hours=1)))
+        run_id = cursor.fetchone()[0]
+        runs.append(str(run_id))
+
+        jobs = queued_jobs if queued else rng.randint(4, 12)
+        job_rows = execute_values(cursor, """
+            INSERT INTO embodybench_jobs
+                (run_id, task_name, task_config, seed_offset, n_episodes, state, progress, requires_caps)
+            VALUES %s RETURNING id
+        """, [(run_id, f"task_{j % 25}", "demo_randomized", j * 10, 10,
+               "queued" if queued else "succeeded",
+               None if queued else Json({"episodes_done": 10, "episodes_succeeded": rng.randint(0, 10)}),
+               Json({"benchmark": "robotwin"})) for j in range(jobs)], fetch=True)
+        n_jobs += len(job_rows)
+        if not queued:
+            episodes = [(job_id, run_id, f"task_{j % 25}", j * 10 + e, e,
+                         Json({"success": rng.random() < 0.6, "n_steps": rng.randint(50, 400)}))
+                        for j, (job_id,) in enumerate(job_rows) for e in range(10)]
+            execute_values(cursor, """
+                INSERT INTO embodybench_episodes (job_id, run_id, task_name, seed_used, episode_idx, outcome)
+                VALUES %s
+            """, episodes, page_size=1000)
+            n_episodes += len(episodes)
+    return {
+        "bench_user_id": user_id,
+        "bench_counts": {"runs": len(runs), "jobs": n_jobs, "episodes": n_episodes},
+    }
+
+
+def seed_accounting(cursor, rng, n, days):
+    today = date.today()
+    rows = []
+    for i in range(n):
+        day = today - timedelta(days=rng.randint(0, days))
+        category = rng.choice(CATEGORIES)
+        amount = round(rng.uniform(1500, 6000), 2) if category == "Salary" else -round(rng.uniform(3, 400), 2)
+        desc = f"{category.upper()} #{i}"
+        dup_hash = hashlib.md5(f"loadtest|{day}|{desc}|{amount}".encode()).hexdigest()
+        rows.append((day, desc, amount, category, "loadtest", "CAD", 1.0, "", desc, dup_hash))
+    execute_values(cursor, """
+        INSERT INTO hoshipu_accounting_transactions
+            (date, description, amount, category, source, currency, exchange_rate, remark, original_desc, dup_hash)
+        VALUES %s
+    """, rows, page_size=1000)
+    return {"accounting_transactions": n}
+
+
+def seed_collection(cursor, rng, n):
+    execute_values(cursor, "INSERT INTO collection_items (title, content) VALUES %s", [
+        (f"[loadtest] item {i}", " ".join(rng.choice(CLIENTS).lower() for _ in range(60)))
+        for i in range(n)
+    ])
+    return {"collection_items": n}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ious", type=int, default=5000)
+    parser.add_argument("--yif-users", type=int, default=3, help=f"besides the admin (max {len(USER_CODES) - 1})")
+    parser.add_argument("--days", type=int, default=120, help="spread IOU dates over this many days")
+    parser.add_argument("--runs", type=int, default=40)
+    parser.add_argument("--queued-jobs", type=int, default=2000, help="jobs available to the claim loop")
+    parser.add_argument("--transactions", type=int, default=5000)
+    parser.add_argument("--collection", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--reset", action="store_true", help="delete previous load-test rows first")
+    parser.add_argument("--out", default=os.path.join(BACKEND_DIR, "perf", "loadtest_fixture.json"))
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    conn = psycopg2.connect(os.environ["DATABASE_URL"])
+    cursor = conn.cursor()
+    try:
+        _check_schema(cursor)
+        # Pass the YIF row-level security policies like an admin would.
+        cursor.execute("SELECT set_config('app.user_role', 'admin', false)")
+        if args.reset:
+            reset(cursor)
+        start = time.perf_counter()
+        fixture = {"seed": args.seed, "password": PASSWORD}
+        fixture.update(seed_yif(cursor, rng, args.ious, min(args.yif_users, len(USER_CODES) - 1), args.days))
+        fixture.update(seed_bench(cursor, rng, args.runs, args.queued_jobs))
+        fixture.update(seed_accounting(cursor, rng, args.transactions, args.days * 3))
+        fixture.update(seed_collection(cursor, rng, args.collection))
+        cursor.execute("ANALYZE")
+        conn.commit()
+    except psycopg2.errors.UniqueViolation as e:
+        conn.rollback()
+        sys.exit(f"{e.diag.message_primary}; rerun with --reset")
+    finally:
+        cursor.close()
+        conn.close()
+
+    with open(args.out, "w") as f:
+        json.dump(fixture, f, indent=2)
+    print(f"seeded in {time.perf_counter() - start:.1f}s -> {args.out}")
+    print(json.dumps({k: v for k, v in fixture.items() if k.endswith("counts")}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
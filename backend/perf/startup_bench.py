@@ -0,0 +1,178 @@
+"""
+Cold-start benchmark for the backend.
+
+Reports how long `import main` takes and which modules it spends that time
+on (via python -X importtime), and optionally how long a fresh uvicorn
+process takes to answer GET /health. Each run is a new interpreter, so the
+numbers are cold-import numbers (the OS file cache is still warm).
+
+    python perf/startup_bench.py                     # per-module import times
+    python perf/startup_bench.py --serve --runs 5    # + time to first /health
+    python perf/startup_bench.py --label before --out before.json
+    python perf/startup_bench.py --compare before.json after.json
+
+Needs the same environment as the server (DATABASE_URL etc.), since
+importing main also applies pending migrations and builds the pools.
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _parse_importtime(stderr: str):
+    """-> list of (name, depth, self_us, cumulative_us) in import order"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        raw_name = parts[2][1:]
+        depth = (len(raw_name) - len(raw_name.lstrip(" "))) // 2
+        rows.append((raw_name.strip(), depth, int(parts[0]), int(parts[1])))
+    return rows
+
+
+def measure_imports(python: str):
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [python, "-X", "importtime", "-c", "import main"],
+        cwd=BACKEND_DIR, capture_output=True, text=True,
+    )
+    wall_ms = (time.perf_counter() - start) * 1000
+    if proc.returncode != 0:
+        sys.exit(f"import main failed:\n{proc.stderr[-2000:]}")
+    rows = _parse_importtime(proc.stderr)
+    main_row = next((r for r in rows if r[0] == "main" and r[1] == 0), None)
+    # Direct imports of main (depth 1, listed before main itself) are the
+    # routers and app modules; their cumulative time is what each one costs.
+    modules = {}
+    for name, depth, self_us, cumulative_us in rows:
+        if depth == 1:
+            modules[name] = round(cumulative_us / 1000, 1)
+    heaviest = sorted(rows, key=lambda r: r[3], reverse=True)
+    return {
+        "wall_ms": round(wall_ms, 1),
+        "import_main_ms": round(main_row[3] / 1000, 1) if main_row else None,
+        "main_self_ms": round(main_row[2] / 1000, 1) if main_row else None,
+        "modules_ms": modules,
+        "heaviest_ms": {name: round(cum / 1000, 1) for name, _, _, cum in heaviest[:25]},
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def measure_first_health(python: str, timeout: float = 60.0) -> float:
+    """Milliseconds from spawning uvicorn to the first 200 from /health."""
+    port = _free_port()
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [python, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port)],
+        cwd=BACKEND_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            if proc.poll() is not None:
+                sys.exit("uvicorn exited before answering /health")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1) as resp:
+                    if resp.status == 200:
+                        return (time.perf_counter() - start) * 1000
+            except OSError:
+                time.sleep(0.01)
+        sys.exit("timed out waiting for /health")
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def run(args):
+    runs = [measure_imports(args.python) for _ in range(args.runs)]
+    result = {
+        "import_main_ms": round(statistics.median(r["import_main_ms"] for r in runs), 1),
+        "main_self_ms": round(statistics.median(r["main_self_ms"] for r in runs), 1),
+        "wall_ms": round(statistics.median(r["wall_ms"] for r in runs), 1),
+        "modules_ms": {
+            name: round(statistics.median(r["modules_ms"].get(name, 0) for r in runs), 1)
+            for name in runs[-1]["modules_ms"]
+        },
+        "heaviest_ms": runs[-1]["heaviest_ms"],
+    }
+    if args.serve:
+        samples = [measure_first_health(args.python) for _ in range(args.runs)]
+        result["first_health_ms"] = round(statistics.median(samples), 1)
+    return result
+
+
+def print_summary(result, label, top):
+    print(f"\n== {label}")
+    print(f"import main:        {result['import_main_ms']} ms "
+          f"(main's own body, incl. boot-time DB work: {result['main_self_ms']} ms)")
+    print(f"interpreter wall:   {result['wall_ms']} ms")
+    if "first_health_ms" in result:
+        print(f"spawn -> /health:   {result['first_health_ms']} ms")
+    print(f"\n{'module imported by main':40} {'ms':>8}")
+    for name, ms in sorted(result["modules_ms"].items(), key=lambda kv: kv[1], reverse=True)[:top]:
+        print(f"{name:40} {ms:>8}")
+    print(f"\n{'heaviest modules (cumulative)':40} {'ms':>8}")
+    for name, ms in list(result["heaviest_ms"].items())[:top]:
+        print(f"{name:40} {ms:>8}")
+
+
+def compare(before_path, after_path):
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+    print(f"{'metric':40} {'before':>10} {'after':>10}")
+    for key in ("import_main_ms", "main_self_ms", "wall_ms", "first_health_ms"):
+        if key in before or key in after:
+            print(f"{key:40} {before.get(key, '-'):>10} {after.get(key, '-'):>10}")
+    print()
+    names = sorted(set(before["modules_ms"]) | set(after["modules_ms"]),
+                   key=lambda n: before["modules_ms"].get(n, 0), reverse=True)
+    for name in names:
+        print(f"{name:40} {before['modules_ms'].get(name, '-'):>10} {after['modules_ms'].get(name, '-'):>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--python", default=sys.executable)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--serve", action="store_true", help="also time spawn -> first /health")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--label", default="run")
+    parser.add_argument("--out", help="write the summary as JSON")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"))
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    result = run(args)
+    result["label"] = args.label
+    print_summary(result, args.label, args.top)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Production entry point: uvicorn with WEB_CONCURRENCY worker processes.
+
+    python serve.py
+
+WEB_CONCURRENCY sets the worker count (default 1; render.yaml sets it per
+instance). Unlike `python main.py` there is no auto-reload. Not
+os.cpu_count(): in a container that is the host's core count, and each
+worker is a full copy of the app with its own pools.
+
+Request state that follow-up requests depend on (the YIF data upload,
+import progress, rate-limit counters) lives in Postgres, so any worker can
+answer them. With more than one worker, keep in mind:
+  - DB_POOL_MAX_SIZE / ASYNC_DB_POOL_MAX_SIZE are per worker; the database
+    sees up to WEB_CONCURRENCY x (both) connections.
+  - Rate limits must use shared storage. With more than one worker,
+    RATE_LIMIT_STORAGE_URI defaults to dbpool:// instead of memory://.
+  - Singleton loops (EmbodyBench reclaim) run only in the advisory-lock
+    leader; see src/leader.py.
+  - Migrations run in every worker on boot, serialized by an advisory lock.
+  - The ops profiler and memory tools inspect one worker; their responses
+    carry its pid.
+"""
+import logging
+import os
+import sys
+
+from dotenv import load_dotenv
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+load_dotenv(os.path.join(BACKEND_DIR, ".env"))
+
+src_path = os.path.join(BACKEND_DIR, "src")
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+import uvicorn
+
+import log_config
+
+logger = logging.getLogger("serve")
+
+
+def main():
+    log_config.setup_logging()
+    workers = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+    if workers > 1 and not os.getenv("RATE_LIMIT_STORAGE_URI"):
+        # Workers inherit the environment, so this reaches rate_limiter.py.
+        os.environ["RATE_LIMIT_STORAGE_URI"] = "dbpool://"
+
+    logger.info("Starting %d worker(s), rate limits in %s",
+                workers, os.getenv("RATE_LIMIT_STORAGE_URI", "memory://"))
+    uvicorn.run(
+        "main:app",
+        host=os.getenv("HOST", "0.0.0.0"),
+        port=int(os.getenv("PORT", 6101)),
+        workers=workers,
+        timeout_graceful_shutdown=int(os.getenv("GRACEFUL_SHUTDOWN_SECONDS", "20")),
+        log_level=os.getenv("LOG_LEVEL", "info"),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+Admission control: per-class concurrency limits in front of the routes.
+
+Every request is assigned to a class by method and path before it reaches
+its handler:
+
+  bulk         Excel exports and imports, the pickle migration import and
+               export, PDF processing, CSV import, resync-statuses. Slow,
+               CPU- and DB-heavy, and nobody is blocked on them at a
+               millisecond scale.
+  worker       The EmbodyBench worker protocol (register, heartbeat, claim,
+               job progress/episodes/state).
+  interactive  Everything else: logins, search, dashboards, the UI's CRUD.
+
+Each class has its own cap on requests in flight and a bounded queue in
+front of it. A request over the cap waits in the queue for at most
+ADMISSION_<CLASS>_QUEUE_TIMEOUT seconds; when the queue is already full, or
+the wait runs out, it gets a 429 with Retry-After before any of its work has
+started (its body is not even read). An export storm therefore queues up
+behind a couple of bulk slots instead of taking every DB connection and
+core from logins and worker claims.
+
+Limits are per process, so with WEB_CONCURRENCY workers the totals are that
+many times larger:
+
+  ADMISSION_<CLASS>_CONCURRENCY    in flight at once (0 = no limit)
+  ADMISSION_<CLASS>_QUEUE          allowed to wait for a slot
+  ADMISSION_<CLASS>_QUEUE_TIMEOUT  seconds a queued request waits at most
+
+with <CLASS> one of BULK, WORKER, INTERACTIVE; defaults in DEFAULTS.
+ADMISSION_ENABLED=false turns the whole thing off. In-flight, queued,
+admitted and rejected counts per class are on /metrics and /health/db.
+"""
+import asyncio
+import os
+import re
+import time
+
+import orjson
+
+ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+
+# class -> (concurrency, queue, queue_timeout seconds)
+DEFAULTS = {
+    "bulk": (2, 8, 30.0),
+    "worker": (32, 128, 10.0),
+    "interactive": (64, 256, 10.0),
+}
+
+# First match wins; anything unmatched is interactive.
+ROUTE_CLASSES = [
+    ("GET", r"^/api/yif/export/(ious|payments)$", "bulk"),
+    ("POST", r"^/api/yif/ious/import-excel$", "bulk"),
+    ("POST", r"^/api/yif/admin/resync-statuses$", "bulk"),
+    ("POST", r"^/api/yif/migration/(import|import/preview|clear)$", "bulk"),
+    ("GET", r"^/api/yif/migration/export$", "bulk"),
+    ("POST", r"^/api/yif/data/upload$", "bulk"),
+    ("POST", r"^/api/pdf/(process|process-and-download)$", "bulk"),
+    ("POST", r"^/api/accounting/(preview|import)/csv$", "bulk"),
+    (None, r"^/api/bench/workers/", "worker"),
+    (None, r"^/api/bench/jobs/", "worker"),
+]
+_ROUTE_CLASSES = [(method, re.compile(pattern), name) for method, pattern, name in ROUTE_CLASSES]
+
+
+def classify(method: str, path: str) -> str:
+    for route_method, pattern, name in _ROUTE_CLASSES:
+        if (route_method is None or route_method == method) and pattern.match(path):
+            return name
+    return "interactive"
+
+
+class Rejected(Exception):
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class AdmissionClass:
+    """Concurrency cap plus bounded FIFO queue for one class of requests."""
+
+    def __init__(self, name: str, concurrency: int, queue: int, queue_timeout: float):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue = queue
+        self.queue_timeout = queue_timeout
+        self._sem = asyncio.Semaphore(concurrency) if concurrency > 0 else None
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = {"queue_full": 0, "queue_timeout": 0}
+        self.wait_seconds = 0.0
+
+    async def acquire(self):
+        if self._sem is not None:
+            if self._sem.locked() or self.waiting:
+                if self.waiting >= self.queue:
+                    self.rejected["queue_full"] += 1
+                    raise Rejected("queue_full")
+                self.waiting += 1
+                start = time.perf_counter()
+                try:
+                    await asyncio.wait_for(self._sem.acquire(), self.queue_timeout)
+                except asyncio.TimeoutError:
+                    self.rejected["queue_timeout"] += 1
+                    raise Rejected("queue_timeout")
+                finally:
+                    self.waiting -= 1
+                    self.wait_seconds += time.perf_counter() - start
+            else:
+                await self._sem.acquire()
+        self.in_flight += 1
+        self.admitted += 1
+
+    def release(self):
+        self.in_flight -= 1
+        if self._sem is not None:
+            self._sem.release()
+
+    def stats(self) -> dict:
+        return {
+            "concurrency": self.concurrency,
+            "queue": self.queue,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "wait_seconds": self.wait_seconds,
+        }
+
+
+def _build_classes() -> dict:
+    classes = {}
+    for name, (concurrency, queue, queue_timeout) in DEFAULTS.items():
+        prefix = f"ADMISSION_{name.upper()}"
+        classes[name] = AdmissionClass(
+            name,
+            int(os.getenv(f"{prefix}_CONCURRENCY", str(concurrency))),
+            int(os.getenv(f"{prefix}_QUEUE", str(queue))),
+            float(os.getenv(f"{prefix}_QUEUE_TIMEOUT", str(queue_timeout))),
+        )
+    return classes
+
+
+classes = _build_classes()
+
+
+def stats() -> dict:
+    return {"enabled": ENABLED, "classes": {name: c.stats() for name, c in classes.items()}}
+
+
+async def _reject(send, admission_class: AdmissionClass):
+    body = orjson.dumps({"detail": f"Too many {admission_class.name} requests in progress, please retry"})
+    await send({
+        "type": "http.response.start",
+        "status": 429,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, int(admission_class.queue_timeout))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class AdmissionMiddleware:
+    """Pure ASGI: holds a slot of the request's class until its response ends.
+
+    Added before CORSMiddleware (so it runs inside it) to keep the CORS
+    headers on 429s; preflights never reach it.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        admission_class = classes[classify(scope["method"], scope["path"])]
+        try:
+            await admission_class.acquire()
+        except Rejected:
+            await _reject(send, admission_class)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            admission_class.release()
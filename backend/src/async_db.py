@@ -0,0 +1,242 @@
+"""
+Async PostgreSQL access for the hot `async def` endpoints.
+
+The psycopg2 routers block the event loop for the whole duration of every
+query, so one slow export or dashboard request used to stall every other
+request in the process. Endpoints moved onto this module await their queries
+instead, and concurrent requests overlap their I/O.
+
+Uses psycopg 3's AsyncConnectionPool with dict rows, so converted code keeps
+the same %s placeholders and row['column'] access as RealDictCursor. The pool
+is separate from the psycopg2 pool in db_pool.py and is sized with the
+ASYNC_DB_POOL_* environment variables.
+
+Usage:
+    async with get_async_connection() as conn:
+        cursor = conn.cursor()
+        await cursor.execute("SELECT ...", (param,))
+        rows = await cursor.fetchall()
+
+The block runs in one transaction: it commits on normal exit and rolls back
+if an exception (including HTTPException) escapes. psycopg opens the
+transaction with a BEGIN of its own before the first query, which costs one
+round trip; pending local settings (set_local_settings) ride along with that
+first query instead of adding another.
+
+Hot statements pass prepare=True to cursor.execute() so the server keeps
+them parsed and planned per connection from the first call (psycopg would
+otherwise wait for five). DB_PREPARED_STATEMENTS=false turns server-side
+preparation off entirely, e.g. behind a transaction-mode PgBouncer.
+
+Writes that issue several statements without needing each result before
+sending the next go through pipeline(conn): everything inside the block is
+sent back to back and the whole block costs one round trip.
+
+    async with pipeline(conn):
+        await cursor.executemany("INSERT ...", rows)
+        await cursor.execute("INSERT INTO yif_logs ...", (...))
+
+Results of statements inside the block are read after it ends; fetching
+inside the block forces an extra round trip.
+"""
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+
+from psycopg import AsyncConnection, AsyncCursor, pq
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool
+
+from database import DATABASE_URL
+from db_pool import (
+    local_settings_sql, notify_query_listeners, notify_round_trips, query_listeners,
+    round_trip_listeners,
+)
+
+PREPARED_STATEMENTS = os.getenv("DB_PREPARED_STATEMENTS", "true").lower() == "true"
+
+
+def _in_pipeline(conn) -> bool:
+    return conn.pgconn.pipeline_status != pq.PipelineStatus.OFF
+
+
+def _begins(conn) -> int:
+    """1 if the next statement opens a transaction: psycopg sends that BEGIN
+    as a command of its own (in a pipeline, followed by a sync), which costs
+    a round trip."""
+    return int(not conn.autocommit and conn.info.transaction_status == pq.TransactionStatus.IDLE)
+
+
+class AppAsyncCursor(AsyncCursor):
+    """Async counterpart of db_pool.PooledCursorMixin.
+
+    Pending local settings and the next query go out in one pipeline, so the
+    set_config() call adds no round trip beyond the query's own (the BEGIN
+    before it still costs one). Statements are timed and reported to
+    db_pool.query_listeners; statements outside a pipeline() block count one
+    round trip each, plus one for the BEGIN that opens a transaction.
+    """
+
+    async def execute(self, query, params=None, **kwargs):
+        conn = self.connection
+        pipelined = _in_pipeline(conn)
+        # With settings pending, the conn.execute() below counts the BEGIN.
+        begins = 0 if conn._local_pending else _begins(conn)
+        error = None
+        start = time.perf_counter()
+        try:
+            if not conn._local_pending:
+                return await super().execute(query, params, **kwargs)
+            conn._local_pending = False
+            sql, settings_params = local_settings_sql(conn._local_settings)
+            if pipelined:
+                # Already queueing: a nested pipeline would force a sync.
+                await conn.execute(sql, settings_params)
+                return await super().execute(query, params, **kwargs)
+            async with conn.pipeline():
+                await conn.execute(sql, settings_params)
+                await super().execute(query, params, **kwargs)
+            return self
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            if round_trip_listeners and (begins or not pipelined):
+                notify_round_trips(begins + (0 if pipelined else 1))
+            if query_listeners:
+                notify_query_listeners(self, query, params, time.perf_counter() - start, error)
+
+    async def executemany(self, query, params_seq, **kwargs):
+        conn = self.connection
+        if conn._local_pending:
+            conn._local_pending = False
+            sql, settings_params = local_settings_sql(conn._local_settings)
+            await conn.execute(sql, settings_params)
+        pipelined = _in_pipeline(conn)
+        begins = _begins(conn)
+        error = None
+        start = time.perf_counter()
+        try:
+            # psycopg pipelines the parameter sets itself: one round trip.
+            return await super().executemany(query, params_seq, **kwargs)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            if round_trip_listeners and (begins or not pipelined):
+                notify_round_trips(begins + (0 if pipelined else 1))
+            if query_listeners:
+                notify_query_listeners(self, query, params_seq, time.perf_counter() - start, error)
+
+
+class AppAsyncConnection(AsyncConnection):
+    """AsyncConnection with transaction-local settings (see db_pool)."""
+
+    _local_settings = None
+    _local_pending = False
+
+    def set_local_settings(self, settings: dict):
+        self._local_settings = {**(self._local_settings or {}), **settings}
+        self._local_pending = True
+
+    async def commit(self):
+        if round_trip_listeners and self.info.transaction_status != pq.TransactionStatus.IDLE:
+            notify_round_trips(1)
+        await super().commit()
+        self._local_pending = self._local_settings is not None
+
+    async def rollback(self):
+        if round_trip_listeners and self.info.transaction_status != pq.TransactionStatus.IDLE:
+            notify_round_trips(1)
+        await super().rollback()
+        self._local_pending = self._local_settings is not None
+
+
+_pool = None
+_pool_lock = asyncio.Lock()
+
+
+def build_pool(conninfo: str = DATABASE_URL, env_prefix: str = "ASYNC_DB_POOL") -> AsyncConnectionPool:
+    """Unopened pool of AppAsyncConnections, sized by {env_prefix}_* variables."""
+    return AsyncConnectionPool(
+        conninfo,
+        connection_class=AppAsyncConnection,
+        min_size=int(os.getenv(f"{env_prefix}_MIN_SIZE", "1")),
+        max_size=int(os.getenv(f"{env_prefix}_MAX_SIZE", "10")),
+        timeout=float(os.getenv(f"{env_prefix}_TIMEOUT", "10")),
+        max_lifetime=float(os.getenv(f"{env_prefix}_RECYCLE", "1800")),
+        max_idle=float(os.getenv(f"{env_prefix}_MAX_IDLE", "300")),
+        kwargs={
+            "row_factory": dict_row,
+            "cursor_factory": AppAsyncCursor,
+            "prepare_threshold": 5 if PREPARED_STATEMENTS else None,
+        },
+        check=AsyncConnectionPool.check_connection,
+        open=False,
+    )
+
+
+async def open_async_pool() -> AsyncConnectionPool:
+    """Open the pool (idempotent). Called on startup and lazily on first use."""
+    global _pool
+    if _pool is not None:
+        return _pool
+    async with _pool_lock:
+        if _pool is None:
+            pool = build_pool()
+            await pool.open()
+            _pool = pool
+    return _pool
+
+
+async def close_async_pool():
+    global _pool
+    if _pool is not None:
+        pool, _pool = _pool, None
+        await pool.close()
+
+
+@asynccontextmanager
+async def pool_connection(pool: AsyncConnectionPool):
+    """Borrow from pool for one transaction, clearing local settings on return."""
+    async with pool.connection() as conn:
+        try:
+            yield conn
+        finally:
+            conn._local_settings = None
+            conn._local_pending = False
+
+
+@asynccontextmanager
+async def get_async_connection():
+    """Borrow a connection for one transaction; returned to the pool on exit."""
+    pool = await open_async_pool()
+    async with pool_connection(pool) as conn:
+        yield conn
+
+
+@asynccontextmanager
+async def pipeline(conn):
+    """conn.pipeline() that reports its closing sync as one round trip.
+
+    Statements inside the block only queue; the time the server takes to
+    run them is spent here, on exit, and is reported with the round trip.
+    """
+    start = None
+    try:
+        async with conn.pipeline() as p:
+            try:
+                yield p
+            finally:
+                start = time.perf_counter()
+    finally:
+        if round_trip_listeners and start is not None:
+            notify_round_trips(1, time.perf_counter() - start)
+
+
+def async_pool_stats() -> dict:
+    if _pool is None:
+        return {"open": False}
+    stats = _pool.get_stats()
+    return {"open": True, **stats}
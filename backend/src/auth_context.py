@@ -0,0 +1,206 @@
+"""
+Identity cache and RLS context shared by the YIF and EmbodyBench routers.
+
+Authenticated YIF requests used to spend two queries on bookkeeping before
+any real work: a SELECT on yif_workers for the caller's role, then
+set_yif_user_context(). Now:
+
+  - get_yif_user() / get_bench_user() serve the caller's identity row from a
+    per-process TTL cache (IDENTITY_CACHE_TTL seconds, default 60). Only
+    active users are cached. Endpoints that change a cached user's role or
+    is_active (the YIF team admin endpoints; invalidate_bench_user() for
+    EmbodyBench) invalidate the entry in every worker process: the
+    invalidation goes out on tag_cache's NOTIFY channel as an
+    "identity.yif:<id>" / "identity.bench:<id>" tag. A process whose
+    listener is down (or a direct DB edit) falls back to the TTL.
+  - set_rls_context() does not hit the database. It stores app.user_id /
+    app.user_role on the connection, and the pool sends them with the first
+    query of each transaction as set_config(..., true), i.e. SET LOCAL.
+"""
+import os
+import threading
+import time
+
+from psycopg2.extras import RealDictCursor
+
+import memory_debug
+import tag_cache
+from database import get_db_connection
+
+_YIF_USER_QUERY = """
+    SELECT id, username, user_code, role, display_name
+    FROM yif_workers
+    WHERE id = %s AND is_active = TRUE
+"""
+
+_BENCH_USER_QUERY = """
+    SELECT id, email, display_name, role, is_active
+      FROM embodybench_users
+     WHERE id = %s AND is_active = TRUE
+"""
+
+
+class IdentityCache:
+    """Thread-safe user_id -> identity row cache with TTL expiry."""
+
+    def __init__(self, ttl: float, max_entries: int = 10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, user_id: int):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] > time.monotonic():
+                self._hits += 1
+                return dict(entry[1])
+            self._entries.pop(user_id, None)
+            self._misses += 1
+            return None
+
+    def put(self, user_id: int, row):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                self._entries.clear()
+            self._entries[user_id] = (time.monotonic() + self.ttl, dict(row))
+
+    def invalidate(self, user_id: int = None):
+        """Drop one user, or everyone when user_id is None."""
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self._hits,
+                "misses": self._misses,
+                "ttl": self.ttl,
+            }
+
+
+_ttl = float(os.getenv("IDENTITY_CACHE_TTL", "60"))
+yif_identities = IdentityCache(_ttl)
+bench_identities = IdentityCache(_ttl)
+memory_debug.register_cache("auth_context.yif_identities", lambda: yif_identities._entries)
+memory_debug.register_cache("auth_context.bench_identities", lambda: bench_identities._entries)
+
+
+_IDENTITY_CACHES = {"identity.yif": yif_identities, "identity.bench": bench_identities}
+
+
+def _invalidate(kind: str, user_id, cursor):
+    _IDENTITY_CACHES[kind].invalidate(user_id)
+    tag_cache.broadcast(f"{kind}:{'' if user_id is None else user_id}", cursor=cursor)
+
+
+def _on_remote_invalidation(tags):
+    if tags is None:
+        for cache in _IDENTITY_CACHES.values():
+            cache.invalidate()
+        return
+    for tag in tags:
+        kind, _, user_id = tag.partition(":")
+        cache = _IDENTITY_CACHES.get(kind)
+        if cache is not None:
+            cache.invalidate(int(user_id) if user_id else None)
+
+
+tag_cache.subscribe(_on_remote_invalidation)
+
+
+def _fetch_with_own_connection(query: str, user_id: int):
+    conn = get_db_connection()
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        cursor.execute(query, (user_id,))
+        return cursor.fetchone()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+# ========================
+# YIF
+# ========================
+
+def get_yif_user(cursor, user_id: int):
+    """Active YIF user (id, username, user_code, role, display_name) or None.
+
+    cursor may be None, in which case a cache miss borrows its own connection.
+    """
+    user = yif_identities.get(user_id)
+    if user is not None:
+        return user
+    if cursor is None:
+        user = _fetch_with_own_connection(_YIF_USER_QUERY, user_id)
+    else:
+        cursor.execute(_YIF_USER_QUERY, (user_id,))
+        user = cursor.fetchone()
+    if user:
+        yif_identities.put(user_id, user)
+        return dict(user)
+    return None
+
+
+async def get_yif_user_async(cursor, user_id: int):
+    """get_yif_user for async_db cursors"""
+    user = yif_identities.get(user_id)
+    if user is not None:
+        return user
+    await cursor.execute(_YIF_USER_QUERY, (user_id,))
+    user = await cursor.fetchone()
+    if user:
+        yif_identities.put(user_id, user)
+    return user
+
+
+def set_rls_context(cursor, user_id: int, role: str):
+    """Set the YIF RLS context for the rest of this connection checkout.
+
+    Works with both psycopg2 (db_pool) and async_db cursors. No query is sent
+    here; the settings ride along with the next statement.
+    """
+    cursor.connection.set_local_settings({
+        "app.user_id": str(user_id),
+        "app.user_role": role,
+    })
+
+
+def invalidate_yif_user(user_id: int = None, cursor=None):
+    """Drop user_id (everyone when None) in every process. Call after commit;
+    cursor's psycopg2 connection, if given, sends the NOTIFY."""
+    _invalidate("identity.yif", user_id, cursor)
+
+
+# ========================
+# EmbodyBench
+# ========================
+
+def get_bench_user(user_id: int):
+    """Active EmbodyBench user (id, email, display_name, role) or None."""
+    user = bench_identities.get(user_id)
+    if user is not None:
+        return user
+    user = _fetch_with_own_connection(_BENCH_USER_QUERY, user_id)
+    if user:
+        bench_identities.put(user_id, user)
+        return dict(user)
+    return None
+
+
+def invalidate_bench_user(user_id: int = None, cursor=None):
+    """invalidate_yif_user() for EmbodyBench users."""
+    _invalidate("identity.bench", user_id, cursor)
+
+
+def identity_cache_stats() -> dict:
+    return {"yif": yif_identities.stats(), "bench": bench_identities.stats()}
@@ -18,6 +18,8 @@ import os
 import re
 from typing import Any
 
+import tracing
+
 
 SYSTEM_PROMPT = """\
 You are a strict but helpful validator for an embodied-AI benchmark platform.
@@ -84,12 +86,13 @@ def validate_config(bench_mod, cfg: dict) -> dict:
 
     client = Anthropic(api_key=api_key)
     try:
-        resp = client.messages.create(
-            model="claude-haiku-4-5-20251001",  # cheap + fast for validation
-            max_tokens=512,
-            system=SYSTEM_PROMPT,
-            messages=[{"role": "user", "content": _build_user_prompt(bench_mod, cfg)}],
-        )
+        with tracing.span("anthropic.messages.create"):
+            resp = client.messages.create(
+                model="claude-haiku-4-5-20251001",  # cheap + fast for validation
+                max_tokens=512,
+                system=SYSTEM_PROMPT,
+                messages=[{"role": "user", "content": _build_user_prompt(bench_mod, cfg)}],
+            )
     except Exception as e:
         return {
             "ok": True,
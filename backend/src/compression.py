@@ -0,0 +1,142 @@
+"""
+Response compression (brotli, falling back to gzip).
+
+CompressionMiddleware is a pure ASGI middleware. It compresses single-chunk
+responses with a compressible content type (JSON, text, JS, SVG/XML) once
+they reach COMPRESS_MIN_BYTES. Brotli is used when the client accepts it and
+the brotli package is installed, gzip otherwise.
+
+Passed through untouched:
+  - streaming responses (Excel/CSV exports)
+  - bodies that are already encoded
+  - 204/304 responses and HEAD requests
+
+Large JSON lists (IOU search, EmbodyBench runs, airports) shrink about
+5-10x.
+"""
+import gzip
+import os
+
+try:
+    import brotli
+except ImportError:  # optional; gzip only
+    brotli = None
+
+MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+BROTLI_QUALITY = int(os.getenv("COMPRESS_BROTLI_QUALITY", "4"))
+GZIP_LEVEL = int(os.getenv("COMPRESS_GZIP_LEVEL", "6"))
+
+_COMPRESSIBLE = ("application/json", "text/", "application/javascript",
+                 "image/svg+xml", "application/xml")
+
+
+def _accepted(header: str) -> set:
+    """Encodings in an Accept-Encoding header, minus those with q=0."""
+    accepted = set()
+    for item in header.lower().split(","):
+        name, _, params = item.strip().partition(";")
+        q = params.strip()
+        if q.startswith("q="):
+            try:
+                if float(q[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        if name:
+            accepted.add(name.strip())
+    return accepted
+
+
+def choose_encoding(accept_encoding: str):
+    accepted = _accepted(accept_encoding)
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+class CompressionMiddleware:
+    def __init__(self, app, min_bytes: int = MIN_BYTES):
+        self.app = app
+        self.min_bytes = min_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+
+        accept = ""
+        for key, value in scope["headers"]:
+            if key == b"accept-encoding":
+                accept = value.decode("latin-1")
+                break
+        encoding = choose_encoding(accept) if accept else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, passthrough
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            if start_message is not None:
+                start, start_message = start_message, None
+                body = message.get("body", b"")
+                if message.get("more_body", False) or not self._should_compress(start, body):
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+                compressed = compress(body, encoding)
+                headers = [(k, v) for k, v in start["headers"] if k != b"content-length"]
+                headers += [
+                    (b"content-encoding", encoding.encode()),
+                    (b"content-length", str(len(compressed)).encode()),
+                ]
+                headers = _add_vary(headers)
+                await send({**start, "headers": headers})
+                await send({"type": "http.response.body", "body": compressed})
+                return
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+        if start_message is not None:
+            # Response ended without a body message.
+            await send(start_message)
+
+    def _should_compress(self, start, body: bytes) -> bool:
+        if start["status"] in (204, 304) or len(body) < self.min_bytes:
+            return False
+        content_type = b""
+        for key, value in start["headers"]:
+            if key == b"content-encoding":
+                return False
+            if key == b"content-type":
+                content_type = value
+        content_type = content_type.decode("latin-1").lower()
+        return content_type.startswith(_COMPRESSIBLE)
+
+
+def _add_vary(headers):
+    for i, (key, value) in enumerate(headers):
+        if key == b"vary":
+            if b"accept-encoding" not in value.lower():
+                headers[i] = (key, value + b", Accept-Encoding")
+            return headers
+    headers.append((b"vary", b"Accept-Encoding"))
+    return headers
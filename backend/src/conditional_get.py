@@ -0,0 +1,91 @@
+"""
+ETag / 304 Not Modified support for large, mostly unchanged list endpoints.
+
+Writes to the tables behind a resource bump its row in data_versions
+(commit-time triggers, see schema_migrations). A list endpoint reads
+that one row, then builds a weak ETag from the version, the caller and the
+query string. If the client's If-None-Match matches, the endpoint returns
+304 before running its real queries or serializing anything:
+
+    version = await data_version_async(cursor, "yif")
+    etag = make_etag("yif", version, user_id, request.url.query)
+    if etag and etag_matches(request, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
+
+Resources without a data_versions row (tables missing when the migration
+ran) have version None; make_etag then returns None and the endpoint
+behaves as before.
+"""
+import hashlib
+
+from fastapi import Request, Response
+from sqlalchemy import text
+
+# Clients may keep the body but must revalidate every time.
+CACHE_CONTROL = "private, no-cache"
+
+_VERSION_QUERY = "SELECT version FROM data_versions WHERE resource = %s"
+
+
+def make_etag(resource: str, version, *parts):
+    if version is None:
+        return None
+    raw = "|".join(str(p) for p in (resource, version) + parts)
+    return f'W/"{hashlib.sha1(raw.encode()).hexdigest()[:20]}"'
+
+
+def static_etag(payload) -> str:
+    """ETag for data that only changes with a deploy (computed once)."""
+    return make_etag("static", hashlib.sha1(repr(payload).encode()).hexdigest())
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header or not etag:
+        return False
+    if header.strip() == "*":
+        return True
+    # Weak comparison: compression may have changed the bytes, not the data.
+    target = etag[2:] if etag.startswith("W/") else etag
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == target:
+            return True
+    return False
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+
+def set_etag(response: Response, etag):
+    if etag:
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = CACHE_CONTROL
+
+
+def data_version(cursor, resource: str):
+    """Current version of a resource through a psycopg2 cursor, or None."""
+    cursor.execute(_VERSION_QUERY, (resource,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    return row["version"] if isinstance(row, dict) else row[0]
+
+
+async def data_version_async(cursor, resource: str):
+    """data_version for async_db cursors"""
+    await cursor.execute(_VERSION_QUERY, (resource,))
+    row = await cursor.fetchone()
+    return row["version"] if row else None
+
+
+def data_version_session(db, resource: str):
+    """data_version for SQLAlchemy sessions"""
+    return db.execute(
+        text("SELECT version FROM data_versions WHERE resource = :resource"),
+        {"resource": resource},
+    ).scalar()
@@ -0,0 +1,90 @@
+"""
+Dedicated, bounded thread pool for password hashing and api_auth encryption.
+
+A bcrypt verify at cost 12 takes ~250 ms of CPU. Run inline in an `async def`
+handler, that froze every other request in the process for the duration, so
+a burst of logins showed up as latency spikes on unrelated endpoints. The
+bcrypt and cryptography libraries release the GIL while they work, so moving
+the call onto a thread keeps the event loop free to serve other requests.
+
+The pool is separate from asyncio's default executor, which serves
+db_pool prefill, prewarm and export building, so a login burst can neither
+starve those nor be starved by them. It is bounded twice:
+
+  CRYPTO_WORKERS      threads doing crypto at once (default 2). Each one
+                      occupies a core while hashing, so keep this below the
+                      CPU count.
+  CRYPTO_MAX_PENDING  calls allowed to wait for a thread (default 64). Past
+                      that, callers get a 503 with Retry-After instead of
+                      growing an unbounded queue.
+
+Usage:
+    ok = await verify_password(plain, hashed)
+    hashed = await hash_password(plain)
+    result = await run_crypto(fn, *args)   # any other CPU-bound crypto call
+"""
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+CRYPTO_WORKERS = max(1, int(os.getenv("CRYPTO_WORKERS", "2")))
+CRYPTO_MAX_PENDING = max(1, int(os.getenv("CRYPTO_MAX_PENDING", "64")))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+_executor = ThreadPoolExecutor(max_workers=CRYPTO_WORKERS, thread_name_prefix="crypto")
+_lock = threading.Lock()
+_stats = {"pending": 0, "completed": 0, "rejected": 0, "busy_seconds": 0.0}
+
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    try:
+        return fn(*args)
+    finally:
+        elapsed = time.perf_counter() - start
+        with _lock:
+            _stats["busy_seconds"] += elapsed
+
+
+async def run_crypto(fn, *args):
+    """Run fn(*args) on the crypto pool; raises 503 when the queue is full."""
+    with _lock:
+        if _stats["pending"] >= CRYPTO_WORKERS + CRYPTO_MAX_PENDING:
+            _stats["rejected"] += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Server busy, please retry",
+                headers={"Retry-After": "1"},
+            )
+        _stats["pending"] += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_executor, partial(_timed, fn, *args))
+    finally:
+        with _lock:
+            _stats["pending"] -= 1
+            _stats["completed"] += 1
+
+
+async def verify_password(plain: str, hashed: str) -> bool:
+    return await run_crypto(pwd_context.verify, plain, hashed)
+
+
+async def hash_password(plain: str) -> str:
+    return await run_crypto(pwd_context.hash, plain)
+
+
+def stats() -> dict:
+    with _lock:
+        return {"workers": CRYPTO_WORKERS, "max_pending": CRYPTO_MAX_PENDING, **_stats}
+
+
+def shutdown():
+    _executor.shutdown(wait=False, cancel_futures=True)
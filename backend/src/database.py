@@ -4,8 +4,12 @@ Database configuration and session management
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 from dotenv import load_dotenv
 import os
+import psycopg2
+
+from db_pool import ConnectionPool
 
 # Load environment variables
 load_dotenv()
@@ -15,10 +19,25 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL is not set in environment variables")
 
-# Create SQLAlchemy engine
+# One process-wide pool shared by the raw-psycopg2 routers and SQLAlchemy.
+db_pool = ConnectionPool(
+    DATABASE_URL,
+    min_size=int(os.getenv("DB_POOL_MIN_SIZE", "1")),
+    max_size=int(os.getenv("DB_POOL_MAX_SIZE", "10")),
+    timeout=float(os.getenv("DB_POOL_TIMEOUT", "10")),
+    recycle=float(os.getenv("DB_POOL_RECYCLE", "1800")),
+    max_idle=float(os.getenv("DB_POOL_MAX_IDLE", "300")),
+    ping_after=float(os.getenv("DB_POOL_PING_AFTER", "60")),
+    reset_on_return=os.getenv("DB_POOL_RESET_ON_RETURN", "false").lower() == "true",
+    prepared_statements=os.getenv("DB_PREPARED_STATEMENTS", "true").lower() == "true",
+)
+
+# Create SQLAlchemy engine. NullPool + creator hands pooling to db_pool:
+# every Session checkout borrows from it and conn.close() returns it.
 engine = create_engine(
     DATABASE_URL,
-    pool_pre_ping=True,  # Verify connections before using
+    creator=db_pool.getconn,
+    poolclass=NullPool,
     echo=False  # Set to True to see SQL queries in console
 )
 
@@ -37,107 +56,11 @@ def get_db():
         db.close()
 
 # For direct psycopg2 connections
-import psycopg2
 
 def get_db_connection():
-    """Get a psycopg2 connection with error handling"""
+    """Borrow a pooled psycopg2 connection; conn.close() returns it to the pool"""
     try:
-        return psycopg2.connect(DATABASE_URL)
+        return db_pool.getconn()
     except psycopg2.OperationalError as e:
         raise RuntimeError(f"Database connection failed: {str(e)}")
 
-
-def init_embodybench_tables():
-    """
-    Create embodybench_* tables on backend boot (idempotent).
-    Loads the init module by file path so we don't have to ship it under src/.
-    """
-    try:
-        import importlib.util
-        import sys
-        spec_path = os.path.join(
-            os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
-            "_archived_scripts", "db_init", "create_embodybench_tables.py",
-        )
-        if not os.path.exists(spec_path):
-            print(f"[DB] embodybench init script not found at {spec_path}; skipping")
-            return
-        spec = importlib.util.spec_from_file_location("create_embodybench_tables", spec_path)
-        module = importlib.util.module_from_spec(spec)
-        sys.modules["create_embodybench_tables"] = module
-        spec.loader.exec_module(module)
-        module.create_embodybench_tables()
-        print("[DB] embodybench tables ready")
-    except psycopg2.OperationalError as e:
-        print(f"[DB] embodybench init failed - database connection error: {e}")
-    except Exception as e:
-        print(f"[DB] embodybench init skipped: {e}")
-
-
-def init_yif_triggers():
-    """
-    Initialize YIF database triggers (backup safety net).
-    Called once on startup. If trigger exists, does nothing.
-    """
-    try:
-        conn = psycopg2.connect(DATABASE_URL)
-        cursor = conn.cursor()
-
-        # Check if trigger already exists
-        cursor.execute("""
-            SELECT EXISTS (
-                SELECT 1 FROM pg_trigger WHERE tgname = 'trigger_update_iou_status_insert'
-            )
-        """)
-        if cursor.fetchone()[0]:
-            cursor.close()
-            conn.close()
-            return  # Already exists
-
-        print("[DB] Creating YIF status triggers (backup)...")
-
-        # Create trigger function
-        cursor.execute("""
-            CREATE OR REPLACE FUNCTION update_iou_status_trigger()
-            RETURNS TRIGGER AS $$
-            DECLARE
-                target_id INTEGER;
-            BEGIN
-                target_id := COALESCE(NEW.ious_id, OLD.ious_id);
-
-                UPDATE yif_ious SET status = (
-                    SELECT CASE
-                        WHEN i.total_amount < 0 THEN 3
-                        WHEN i.total_amount - COALESCE(SUM(p.amount), 0) = 0 THEN 2
-                        WHEN i.total_amount - COALESCE(SUM(p.amount), 0) < 0 THEN 4
-                        WHEN COUNT(p.id) > 0 THEN 1
-                        ELSE 0
-                    END
-                    FROM yif_ious i
-                    LEFT JOIN yif_payments p ON p.ious_id = i.id
-                    WHERE i.id = target_id
-                    GROUP BY i.id
-                )
-                WHERE id = target_id;
-
-                RETURN COALESCE(NEW, OLD);
-            END;
-            $$ LANGUAGE plpgsql;
-        """)
-
-        # Create triggers
-        for op in ['INSERT', 'UPDATE', 'DELETE']:
-            cursor.execute(f"""
-                CREATE TRIGGER trigger_update_iou_status_{op.lower()}
-                AFTER {op} ON yif_payments
-                FOR EACH ROW EXECUTE FUNCTION update_iou_status_trigger();
-            """)
-
-        conn.commit()
-        print("[DB] YIF status triggers created")
-        cursor.close()
-        conn.close()
-    except psycopg2.OperationalError as e:
-        print(f"[DB] Trigger init failed - database connection error: {e}")
-    except Exception as e:
-        print(f"[DB] Trigger init skipped: {e}")
@@ -0,0 +1,532 @@
+"""
+Process-wide psycopg2 connection pool.
+
+Every router calls database.get_db_connection() and finishes with
+conn.close(). Connections handed out by this pool are PooledConnection
+objects whose close() puts the socket back into the pool instead of tearing
+it down, so the routers keep their existing try/finally shape unchanged.
+
+The SQLAlchemy engine in database.py draws from the same pool (via
+creator=), so one set of DB_POOL_* settings caps every connection the
+process opens.
+"""
+import re
+import threading
+import time
+from collections import deque
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.sql
+
+
+class PoolTimeout(psycopg2.OperationalError):
+    """Raised when no connection frees up within the checkout timeout."""
+
+
+def local_settings_sql(settings: dict):
+    """SELECT set_config(name, value, true) for each setting, plus params."""
+    calls = ", ".join("set_config(%s, %s, true)" for _ in settings)
+    params = []
+    for name, value in settings.items():
+        params.extend((name, value))
+    return f"SELECT {calls}", params
+
+
+# Callables run after every statement executed through a pooled cursor, as
+# listener(cursor, query, vars, elapsed_seconds, error). metrics.py uses this
+# for per-route DB time. Listeners must be cheap and must not raise.
+query_listeners = []
+
+
+def notify_query_listeners(cursor, query, vars, elapsed, error):
+    for listener in query_listeners:
+        try:
+            listener(cursor, query, vars, elapsed, error)
+        except Exception:
+            pass
+
+
+# Callables run after every network round trip to the server, as
+# listener(count, elapsed_seconds). Statements sent together (one prefixed
+# text, or an async_db pipeline) share a round trip. elapsed is only set for
+# waits that no statement reported to query_listeners, i.e. pipeline syncs.
+round_trip_listeners = []
+
+
+def notify_round_trips(count=1, elapsed=0.0):
+    for listener in round_trip_listeners:
+        try:
+            listener(count, elapsed)
+        except Exception:
+            pass
+
+
+_PLACEHOLDER = re.compile(r"%[s%]")
+
+
+class PreparedStatement:
+    """A statement PREPAREd once per pooled psycopg2 connection.
+
+    query is written with %s placeholders like any other statement. The
+    first cursor.execute_prepared() on a connection sends the PREPARE in
+    the same text as the EXECUTE, so preparing costs no extra round trip;
+    afterwards only EXECUTE name(...) goes out and the server reuses the
+    parsed statement and, once it settles on a generic one, the plan.
+    Prepared statements outlive rollbacks and go away with the connection.
+
+    Parameter types are inferred from the statement, so write casts where
+    the context does not make them clear.
+    """
+
+    def __init__(self, name: str, query: str):
+        self.name = name
+        self.query = query
+        count = 0
+
+        def number(match):
+            nonlocal count
+            if match.group() == "%%":
+                return "%"
+            count += 1
+            return f"${count}"
+
+        # Doubled %: the PREPARE text goes through psycopg2's formatting
+        # together with the EXECUTE parameters.
+        self.prepare_sql = f"PREPARE {name} AS " + _PLACEHOLDER.sub(number, query).replace("%", "%%") + "; "
+        self.execute_sql = f"EXECUTE {name}" + (f"({', '.join(['%s'] * count)})" if count else "")
+
+
+def _begins(conn) -> int:
+    """1 if the next statement opens a transaction: psycopg2 sends that BEGIN
+    on its own before the statement, which costs a round trip."""
+    return int(not conn.autocommit and conn.status == psycopg2.extensions.STATUS_READY)
+
+
+class PooledCursorMixin:
+    """Cursor behaviour for pooled connections.
+
+    - Sends the connection's pending local settings with the next query: the
+      set_config() SELECT is prepended to the statement text, so it runs in
+      the same round trip (and transaction) as the query that follows it.
+    - Times every statement and reports it to query_listeners, and its
+      round trips to round_trip_listeners.
+    - execute_prepared() runs a PreparedStatement.
+    """
+
+    def execute(self, query, vars=None):
+        sent = query
+        prefix = self.connection._take_local_settings(self)
+        if prefix:
+            if isinstance(query, psycopg2.sql.Composable):
+                query = query.as_string(self)
+            elif isinstance(query, bytes):
+                query = query.decode(psycopg2.extensions.encodings[self.connection.encoding])
+            if vars is not None:
+                prefix = prefix.replace("%", "%%")
+            sent = prefix + query
+        return self._send(sent, query, vars)
+
+    def execute_prepared(self, statement: PreparedStatement, vars=()):
+        """Run statement, PREPAREing it first if this connection has not yet.
+
+        Falls back to plain execute() on connections that do not track
+        prepared statements (outside the pool, or DB_PREPARED_STATEMENTS off).
+        """
+        conn = self.connection
+        prepared = getattr(conn, "_prepared", None)
+        if prepared is None:
+            return self.execute(statement.query, vars)
+        sent = statement.execute_sql
+        if statement.name not in prepared:
+            sent = statement.prepare_sql + sent
+        if conn._prepared_unsure:
+            # An earlier failure may or may not have left statements behind.
+            sent = "DEALLOCATE ALL; " + sent
+        prefix = conn._take_local_settings(self)
+        if prefix:
+            sent = prefix.replace("%", "%%") + sent
+        try:
+            result = self._send(sent, statement.query, vars)
+        except Exception:
+            # The PREPARE (or DEALLOCATE) may have run before the error.
+            prepared.clear()
+            conn._prepared_unsure = True
+            raise
+        if conn._prepared_unsure:
+            prepared.clear()
+            conn._prepared_unsure = False
+        prepared.add(statement.name)
+        return result
+
+    def _send(self, sent, query, vars):
+        if round_trip_listeners:
+            notify_round_trips(1 + _begins(self.connection))
+        if not query_listeners:
+            return super().execute(sent, vars)
+        error = None
+        start = time.perf_counter()
+        try:
+            return super().execute(sent, vars)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            notify_query_listeners(self, query, vars, time.perf_counter() - start, error)
+
+    def executemany(self, query, vars_list):
+        begins = _begins(self.connection)
+        prefix = self.connection._take_local_settings(self)
+        if prefix:
+            super().execute(prefix)
+        if round_trip_listeners:
+            # psycopg2 sends each parameter set as its own statement.
+            vars_list = list(vars_list)
+            notify_round_trips(len(vars_list) + (1 if prefix else 0) + begins)
+        if not query_listeners:
+            return super().executemany(query, vars_list)
+        error = None
+        start = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            notify_query_listeners(self, query, vars_list, time.perf_counter() - start, error)
+
+
+_cursor_classes = {}
+
+
+def _pooled_cursor(base):
+    cls = _cursor_classes.get(base)
+    if cls is None:
+        cls = type(base.__name__, (PooledCursorMixin, base), {})
+        _cursor_classes[base] = cls
+    return cls
+
+
+class PooledConnection(psycopg2.extensions.connection):
+    """psycopg2 connection that returns itself to its pool on close().
+
+    Also supports transaction-local settings (set_local_settings), used for
+    the YIF RLS context: they are sent together with the first query of every
+    transaction instead of costing a round trip of their own (psycopg2's
+    BEGIN before that query still does).
+    """
+
+    _local_settings = None
+    _local_pending = False
+    # Names of the PreparedStatements on this connection; None when the pool
+    # does not use prepared statements.
+    _prepared = None
+    _prepared_unsure = False
+
+    def cursor(self, *args, **kwargs):
+        base = kwargs.get("cursor_factory") or self.cursor_factory or psycopg2.extensions.cursor
+        kwargs["cursor_factory"] = _pooled_cursor(base)
+        return super().cursor(*args, **kwargs)
+
+    def set_local_settings(self, settings: dict):
+        """Apply settings (e.g. app.user_id) to every transaction on this
+        connection until it goes back to the pool, like SET LOCAL. Merges
+        with settings applied earlier in the same checkout."""
+        self._local_settings = {**(self._local_settings or {}), **settings}
+        self._local_pending = True
+
+    def _take_local_settings(self, cursor):
+        if not self._local_pending:
+            return None
+        if not self.autocommit:
+            # Inside a transaction the settings stick until commit/rollback.
+            self._local_pending = False
+        sql, params = local_settings_sql(self._local_settings)
+        prefix = cursor.mogrify(sql, params)
+        return prefix.decode(psycopg2.extensions.encodings[self.encoding]) + "; "
+
+    def commit(self):
+        if round_trip_listeners and self.status != psycopg2.extensions.STATUS_READY:
+            notify_round_trips(1)
+        super().commit()
+        self._local_pending = self._local_settings is not None
+
+    def rollback(self):
+        if round_trip_listeners and self.status != psycopg2.extensions.STATUS_READY:
+            notify_round_trips(1)
+        super().rollback()
+        self._local_pending = self._local_settings is not None
+
+    def close(self):
+        pool = getattr(self, "_pool", None)
+        if pool is None:
+            return super().close()
+        pool.putconn(self)
+
+    def discard(self):
+        """Really close the underlying socket (used by the pool itself)."""
+        super().close()
+
+
+class ConnectionPool:
+    """Thread-safe bounded pool with checkout timeouts and recycling.
+
+    - min_size:   connections kept open even when idle
+    - max_size:   hard cap on open connections (idle + checked out)
+    - timeout:    seconds getconn() waits for a free slot before PoolTimeout
+    - recycle:    max lifetime of a connection in seconds (0 = forever)
+    - max_idle:   idle connections above min_size are closed after this long
+    - ping_after: idle connections older than this are pinged on checkout
+    - reset_on_return: run RESET ALL when a connection comes back
+    - prepared_statements: let cursors keep PreparedStatements on the
+      connection (turn off behind a transaction-mode PgBouncer)
+    """
+
+    def __init__(self, dsn, min_size=1, max_size=10, timeout=10.0,
+                 recycle=1800.0, max_idle=300.0, ping_after=60.0,
+                 reset_on_return=False, prepared_statements=True):
+        if max_size < 1:
+            raise ValueError("max_size must be >= 1")
+        self.dsn = dsn
+        self.min_size = max(0, min(min_size, max_size))
+        self.max_size = max_size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.max_idle = max_idle
+        self.ping_after = ping_after
+        self.reset_on_return = reset_on_return
+        self.prepared_statements = prepared_statements
+
+        self._cond = threading.Condition()
+        self._idle = deque()
+        self._size = 0
+        self._in_use = 0
+        self._closed = False
+        self._stats = {
+            "checkouts": 0,
+            "waits": 0,
+            "wait_time_total_ms": 0.0,
+            "timeouts": 0,
+            "connections_created": 0,
+            "connections_closed": 0,
+            "recycled": 0,
+            "failed_pings": 0,
+        }
+
+    # ------------------------------------------------------------------
+    # Checkout / return
+    # ------------------------------------------------------------------
+
+    def getconn(self):
+        """Check out a connection, opening a new one if below max_size."""
+        start = time.monotonic()
+        deadline = start + self.timeout
+        waited = False
+        while True:
+            stale = []
+            conn = None
+            reserved = False
+            timed_out = False
+            with self._cond:
+                if self._closed:
+                    raise PoolTimeout("connection pool is closed")
+                while self._idle:
+                    candidate = self._idle.pop()  # LIFO keeps warm sockets in use
+                    if self._is_expired(candidate):
+                        self._size -= 1
+                        self._stats["recycled"] += 1
+                        stale.append(candidate)
+                        continue
+                    conn = candidate
+                    break
+                if conn is None:
+                    if self._size < self.max_size:
+                        self._size += 1  # reserve the slot; connect outside the lock
+                        reserved = True
+                    else:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._stats["timeouts"] += 1
+                            timed_out = True
+                        else:
+                            if not waited:
+                                self._stats["waits"] += 1
+                                waited = True
+                            self._cond.wait(remaining)
+            self._discard_all(stale)
+
+            if timed_out:
+                raise PoolTimeout(
+                    f"no connection available within {self.timeout:g}s "
+                    f"(max_size={self.max_size})"
+                )
+            if conn is None and not reserved:
+                continue  # woke up from wait(); look again
+
+            if conn is not None and not self._ping_if_idle(conn):
+                with self._cond:
+                    self._size -= 1
+                    self._stats["failed_pings"] += 1
+                    self._cond.notify()
+                self._discard(conn)
+                continue
+
+            if conn is None:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+
+            with self._cond:
+                self._in_use += 1
+                self._stats["checkouts"] += 1
+                if waited:
+                    self._stats["wait_time_total_ms"] += (time.monotonic() - start) * 1000
+            conn._checked_out = True
+            return conn
+
+    def putconn(self, conn):
+        """Return a connection. Rolls back any open transaction first."""
+        if not getattr(conn, "_checked_out", False):
+            return
+        conn._checked_out = False
+        conn._local_settings = None
+        conn._local_pending = False
+        healthy = self._reset(conn)
+        conn._last_used = time.monotonic()
+        with self._cond:
+            self._in_use -= 1
+            if healthy and not self._closed and not self._is_expired(conn):
+                self._idle.append(conn)
+                conn = None
+            else:
+                self._size -= 1
+                if healthy:
+                    self._stats["recycled"] += 1
+            self._cond.notify()
+        if conn is not None:
+            self._discard(conn)
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+
+    def prefill(self):
+        """Open connections up to min_size. Errors are left to the caller."""
+        while True:
+            with self._cond:
+                if self._closed or self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                raise
+            with self._cond:
+                conn._last_used = time.monotonic()
+                self._idle.append(conn)
+                self._cond.notify()
+
+    def close(self):
+        """Close idle connections and refuse further checkouts."""
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        self._discard_all(idle)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._in_use,
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                **self._stats,
+                "wait_time_total_ms": round(self._stats["wait_time_total_ms"], 2),
+            }
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+
+    def _connect(self):
+        conn = psycopg2.connect(self.dsn, connection_factory=PooledConnection)
+        now = time.monotonic()
+        conn._pool = self
+        conn._created_at = now
+        conn._last_used = now
+        conn._checked_out = False
+        if self.prepared_statements:
+            conn._prepared = set()
+        with self._cond:
+            self._stats["connections_created"] += 1
+        return conn
+
+    def _is_expired(self, conn, now=None):
+        if conn.closed:
+            return True
+        now = now or time.monotonic()
+        if self.recycle and now - conn._created_at > self.recycle:
+            return True
+        # Trim idle connections above the floor (caller holds the lock).
+        if (self.max_idle and now - conn._last_used > self.max_idle
+                and self._size > self.min_size):
+            return True
+        return False
+
+    def _ping_if_idle(self, conn) -> bool:
+        if not self.ping_after or time.monotonic() - conn._last_used < self.ping_after:
+            return True
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.autocommit = False
+            return True
+        except Exception:
+            return False
+
+    def _reset(self, conn) -> bool:
+        """Bring a returned connection back to a clean idle state."""
+        if conn.closed:
+            return False
+        try:
+            status = conn.info.transaction_status
+            if status in (psycopg2.extensions.TRANSACTION_STATUS_INTRANS,
+                          psycopg2.extensions.TRANSACTION_STATUS_INERROR):
+                conn.rollback()
+            elif status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                return False
+            if self.reset_on_return:
+                # Clear any session-level settings (e.g. a direct
+                # set_yif_user_context() call) so the next borrower never
+                # inherits them. The routers use set_local_settings(), which
+                # is transaction-scoped and does not need this.
+                conn.autocommit = True
+                with conn.cursor() as cursor:
+                    cursor.execute("RESET ALL")
+            conn.autocommit = False
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.discard()
+        except Exception:
+            pass
+        with self._cond:
+            self._stats["connections_closed"] += 1
+
+    def _discard_all(self, conns):
+        for conn in conns:
+            self._discard(conn)
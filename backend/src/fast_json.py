@@ -0,0 +1,51 @@
+"""
+orjson-backed JSON responses.
+
+FastJSONResponse is the app's default_response_class (main.py), so every
+endpoint's final dump goes through orjson. FastAPI still runs
+jsonable_encoder over a returned dict first, and that per-value walk is
+what dominates large list responses. Hot list endpoints therefore return
+json_response(...) directly: it skips jsonable_encoder, and the raw DB rows
+go straight to orjson. That works because orjson handles the row types
+itself:
+
+  - datetime / date / time -> ISO 8601, same format as jsonable_encoder
+  - UUID -> str
+  - Decimal -> float (via _default), the conversion the routers used to
+    do per field
+"""
+from decimal import Decimal
+
+import orjson
+from fastapi import Response
+from fastapi.responses import JSONResponse
+
+_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+
+def _default(obj):
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(content) -> bytes:
+    return orjson.dumps(content, default=_default, option=_OPTIONS)
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def json_response(content, response: Response = None, status_code: int = 200) -> FastJSONResponse:
+    """Serialize content as-is, bypassing jsonable_encoder.
+
+    Pass the endpoint's injected Response to keep headers set on it (ETag,
+    Cache-Control); FastAPI drops them when an endpoint returns its own
+    Response object.
+    """
+    headers = None
+    if response is not None:
+        headers = {k: v for k, v in response.headers.items() if k != "content-length"}
+    return FastJSONResponse(content, status_code=status_code, headers=headers)
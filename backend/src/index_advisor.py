@@ -0,0 +1,576 @@
+"""
+Index advisor: checks the indexes against the statements that actually run.
+
+report() reads the cumulative statistics views and returns
+
+  statements          The heaviest statements by total time, from
+                      pg_stat_statements when the extension is installed in
+                      this database, otherwise from slow_query_log (only
+                      statements over SLOW_QUERY_MS end up there).
+  seq_scan_tables     Tables of at least min_rows rows that are read by
+                      sequential scans, most rows scanned first.
+  unused_indexes      Non-unique indexes never scanned since the statistics
+                      were last reset (stats_reset), largest first.
+  duplicate_indexes   Indexes with the same table, keys, expressions and
+                      predicate as another one.
+  candidates          Proposed CREATE INDEX statements, with the statements
+                      each one would serve and its estimated benefit.
+
+Candidates come from the WHERE clauses of the heavy statements
+(comparisons with a parameter on a column no index starts with, and LIKE /
+ILIKE, which only a pg_trgm GIN index can serve with a leading wildcard),
+plus KNOWN_CANDIDATES for predicates whose constant pg_stat_statements
+normalizes away, such as a jsonb key. Only tables with at least min_rows
+rows are considered.
+
+The benefit is the planner's cost for each matching statement without and
+with the index, using EXPLAIN (GENERIC_PLAN) on PostgreSQL 16+, since
+pg_stat_statements texts carry $n placeholders. Nothing is executed. The index
+comes from one of two places:
+
+  hypopg  A hypothetical index when the extension is installed. It costs
+          nothing, but it cannot simulate GIN indexes.
+  build   With build=true, the index is really created inside a transaction
+          that is rolled back. That holds a SHARE lock on the table (writes
+          wait) for the build, so it is limited to tables of at most
+          INDEX_ADVISOR_MAX_BUILD_ROWS rows and gives up after a short
+          lock_timeout.
+
+estimated_saved_ms scales each statement's measured total time by the
+relative cost reduction, for the statements whose plan actually uses the
+index. It is a ranking aid, not a forecast. Check table_writes too: every
+index slows down writes to its table.
+"""
+import json
+import logging
+import os
+import re
+
+logger = logging.getLogger(__name__)
+
+EXPLAIN_TIMEOUT_MS = int(os.getenv("INDEX_ADVISOR_EXPLAIN_TIMEOUT_MS", "5000"))
+MAX_BUILD_ROWS = int(os.getenv("INDEX_ADVISOR_MAX_BUILD_ROWS", "200000"))
+
+_MAX_CANDIDATES = 30
+_BUILD_LOCK_TIMEOUT_MS = 2000
+
+# Predicates the text of a normalized statement cannot reveal:
+# (table, index name, USING clause, statement regex, reason, rewrites).
+# The rewrites put the normalized-away constants back before EXPLAIN, so
+# the planner can match an expression or partial index.
+KNOWN_CANDIDATES = [
+    ("embodybench_jobs", "idx_embodybench_jobs_queued_benchmark",
+     "btree ((requires_caps->>'benchmark')) WHERE state = 'queued'",
+     r"requires_caps\s*->>",
+     "worker claim filters queued jobs by requires_caps->>'benchmark'",
+     [(r"requires_caps\s*->>\s*(\$\d+|\?|%s)", "requires_caps->>'benchmark'"),
+      (r"\bj\.state\s*=\s*(\$\d+|\?|%s)", "j.state = 'queued'")]),
+]
+
+_IDENT = r"[a-z_][a-z0-9_]*"
+_TABLE_REF = re.compile(
+    rf"\b(?:from|join|update)\s+(?:only\s+)?(?:{_IDENT}\.)?({_IDENT})\b(?!\s*\()(?:\s+(?:as\s+)?({_IDENT}))?",
+    re.IGNORECASE,
+)
+_NOT_ALIASES = {
+    "where", "on", "join", "left", "right", "inner", "outer", "cross", "full", "natural",
+    "group", "order", "limit", "offset", "using", "lateral", "union", "except", "intersect",
+    "having", "window", "for", "set", "returning", "and", "or",
+}
+_LIKE = re.compile(
+    rf"(lower\s*\(\s*)?(?<![\w.])(?:({_IDENT})\.)?({_IDENT})\s*\)?\s+(?:not\s+)?i?like\b",
+    re.IGNORECASE,
+)
+_COMPARE = re.compile(
+    rf"(?<![\w.>])(?:({_IDENT})\.)?({_IDENT})\s*(?:=|<=|>=|<|>|\bin\b|\bbetween\b)\s*"
+    rf"(?:any\s*\(\s*)?(?:\(\s*)?(?:\$\d+|\?|%s|%\(\w+\)s|-?\d|')",
+    re.IGNORECASE,
+)
+_CLAUSE_END = re.compile(
+    r"\b(group\s+by|order\s+by|limit|offset|returning|having|window|for\s+update|for\s+share"
+    r"|union|except|intersect)\b",
+    re.IGNORECASE,
+)
+_WHERE = re.compile(r"\bwhere\b", re.IGNORECASE)
+# ? from normalize_query (slow_query_log), %s / %(name)s from psycopg2 templates.
+_PLACEHOLDER = re.compile(r"\?(?![|&])|%s|%\(\w+\)s")
+_TEXT_TYPES = {"text", "character varying", "character"}
+_KEYWORDS = {"and", "or", "not", "null", "true", "false", "case", "when", "then", "else", "end"}
+
+
+# ------------------------------------------------------------------
+# Statistics
+# ------------------------------------------------------------------
+
+def features(cursor) -> dict:
+    """Which extensions and planner options this database offers."""
+    cursor.execute("""
+        SELECT current_setting('server_version_num')::int AS version,
+               to_regclass('pg_stat_statements') IS NOT NULL AS pg_stat_statements,
+               EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'hypopg') AS hypopg,
+               EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm') AS pg_trgm,
+               EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm') AS pg_trgm_available,
+               (SELECT stats_reset FROM pg_stat_database WHERE datname = current_database()) AS stats_reset
+    """)
+    row = cursor.fetchone()
+    return {
+        "server_version_num": row[0],
+        "pg_stat_statements": row[1],
+        "hypopg": row[2],
+        "pg_trgm": row[3],
+        "pg_trgm_available": row[4],
+        "generic_plan": row[0] >= 160000,
+        "stats_reset": row[5].isoformat() if row[5] else None,
+    }
+
+
+def heaviest_statements(cursor, limit: int, feature_flags: dict) -> list:
+    if feature_flags["pg_stat_statements"]:
+        try:
+            cursor.execute("""
+                SELECT query, calls, total_exec_time, mean_exec_time, rows,
+                       shared_blks_hit, shared_blks_read
+                  FROM pg_stat_statements
+                 WHERE dbid = (SELECT oid FROM pg_database WHERE datname = current_database())
+                   AND query !~* '^\\s*(explain|begin|commit|rollback|savepoint|release|set|show)\\b'
+                 ORDER BY total_exec_time DESC
+                 LIMIT %s
+            """, (limit,))
+            return [
+                {"query": query, "calls": calls, "total_ms": round(total, 1), "mean_ms": round(mean, 2),
+                 "rows": rows, "shared_blks_hit": hit, "shared_blks_read": read,
+                 "source": "pg_stat_statements"}
+                for query, calls, total, mean, rows, hit, read in cursor.fetchall()
+            ]
+        except Exception as e:
+            # Installed but not in shared_preload_libraries.
+            cursor.connection.rollback()
+            logger.warning(f"pg_stat_statements is not readable: {e}")
+            feature_flags["pg_stat_statements"] = False
+
+    cursor.execute("SELECT to_regclass('slow_query_log') IS NOT NULL")
+    if not cursor.fetchone()[0]:
+        return []
+    cursor.execute("""
+        SELECT query, COUNT(*), SUM(duration_ms), AVG(duration_ms)
+          FROM slow_query_log
+         WHERE error IS NULL
+         GROUP BY query
+         ORDER BY SUM(duration_ms) DESC
+         LIMIT %s
+    """, (limit,))
+    return [
+        {"query": query, "calls": calls, "total_ms": round(total, 1), "mean_ms": round(mean, 2),
+         "source": "slow_query_log"}
+        for query, calls, total, mean in cursor.fetchall()
+    ]
+
+
+def _table_stats(cursor) -> dict:
+    cursor.execute("""
+        SELECT relname, n_live_tup, seq_scan, seq_tup_read, COALESCE(idx_scan, 0),
+               n_tup_ins + n_tup_upd + n_tup_del, pg_total_relation_size(relid)
+          FROM pg_stat_user_tables
+         WHERE schemaname = 'public'
+    """)
+    return {
+        name: {"rows": rows, "seq_scan": seq_scan, "seq_tup_read": seq_read, "idx_scan": idx_scan,
+               "writes": writes, "total_bytes": size}
+        for name, rows, seq_scan, seq_read, idx_scan, writes, size in cursor.fetchall()
+    }
+
+
+def seq_scan_tables(tables: dict, min_rows: int) -> list:
+    flagged = [
+        {"table": name, **t,
+         "seq_scan_share": round(t["seq_scan"] / (t["seq_scan"] + t["idx_scan"]), 3)}
+        for name, t in tables.items()
+        if t["rows"] >= min_rows and t["seq_scan"]
+    ]
+    return sorted(flagged, key=lambda t: t["seq_tup_read"], reverse=True)
+
+
+def unused_indexes(cursor) -> list:
+    cursor.execute("""
+        SELECT s.relname, s.indexrelname, pg_relation_size(s.indexrelid), pg_get_indexdef(s.indexrelid)
+          FROM pg_stat_user_indexes s
+          JOIN pg_index i ON i.indexrelid = s.indexrelid
+         WHERE s.schemaname = 'public'
+           AND s.idx_scan = 0
+           AND NOT i.indisunique
+           AND NOT i.indisprimary
+           AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = s.indexrelid)
+         ORDER BY pg_relation_size(s.indexrelid) DESC
+    """)
+    return [
+        {"table": table, "index": name, "bytes": size, "definition": definition}
+        for table, name, size, definition in cursor.fetchall()
+    ]
+
+
+def duplicate_indexes(cursor) -> list:
+    cursor.execute("""
+        SELECT t.relname, array_agg(c.relname ORDER BY i.indisprimary DESC, i.indisunique DESC, c.relname)
+          FROM pg_index i
+          JOIN pg_class c ON c.oid = i.indexrelid
+          JOIN pg_class t ON t.oid = i.indrelid
+          JOIN pg_namespace n ON n.oid = t.relnamespace
+         WHERE n.nspname = 'public'
+         GROUP BY t.relname, i.indkey::text, i.indclass::text, i.indcollation::text,
+                  COALESCE(pg_get_expr(i.indexprs, i.indrelid), ''),
+                  COALESCE(pg_get_expr(i.indpred, i.indrelid), ''),
+                  c.relam
+        HAVING COUNT(*) > 1
+         ORDER BY t.relname
+    """)
+    # The first name is the one to keep (primary key, then unique).
+    return [{"table": table, "keep": names[0], "redundant": names[1:]} for table, names in cursor.fetchall()]
+
+
+# ------------------------------------------------------------------
+# Candidates
+# ------------------------------------------------------------------
+
+def _columns(cursor) -> dict:
+    cursor.execute("""
+        SELECT table_name, column_name, data_type
+          FROM information_schema.columns
+         WHERE table_schema = 'public'
+    """)
+    columns = {}
+    for table, column, data_type in cursor.fetchall():
+        columns.setdefault(table, {})[column] = data_type
+    return columns
+
+
+def _existing_indexes(cursor) -> dict:
+    """table -> [(key columns, None for expressions; partial?; unique?; pg_get_indexdef; name)]"""
+    cursor.execute("""
+        SELECT t.relname,
+               ARRAY(SELECT a.attname
+                       FROM unnest(i.indkey::int2[]) WITH ORDINALITY AS k(attnum, ord)
+                       LEFT JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = k.attnum
+                      WHERE k.ord <= i.indnkeyatts
+                      ORDER BY k.ord),
+               i.indpred IS NOT NULL, i.indisunique, pg_get_indexdef(i.indexrelid), c.relname
+          FROM pg_index i
+          JOIN pg_class t ON t.oid = i.indrelid
+          JOIN pg_class c ON c.oid = i.indexrelid
+          JOIN pg_namespace n ON n.oid = t.relnamespace
+         WHERE n.nspname = 'public' AND i.indisvalid
+    """)
+    existing = {}
+    for table, keys, partial, unique, definition, name in cursor.fetchall():
+        existing.setdefault(table, []).append((keys, partial, unique, definition, name))
+    return existing
+
+
+def _where_clauses(text: str) -> list:
+    """Text of every WHERE clause, each up to its end at the same paren depth."""
+    clauses = []
+    for match in _WHERE.finditer(text):
+        depth, start = 0, match.end()
+        end = len(text)
+        for i in range(start, len(text)):
+            ch = text[i]
+            if ch == "(":
+                depth += 1
+            elif ch == ")":
+                depth -= 1
+                if depth < 0:
+                    end = i
+                    break
+            elif depth == 0 and not (text[i - 1].isalnum() or text[i - 1] == "_") and _CLAUSE_END.match(text, i):
+                end = i
+                break
+        clauses.append(text[start:end])
+    return clauses
+
+
+def _tables_in(text: str, columns: dict) -> dict:
+    """alias (or table name) -> table, for tables that exist."""
+    aliases = {}
+    for table, alias in _TABLE_REF.findall(text):
+        table = table.lower()
+        if table not in columns:
+            continue
+        aliases[table] = table
+        if alias and alias.lower() not in _NOT_ALIASES:
+            aliases[alias.lower()] = table
+    return aliases
+
+
+def _resolve(alias, column, aliases: dict, columns: dict):
+    column = column.lower()
+    if column in _KEYWORDS:
+        return None
+    if alias:
+        table = aliases.get(alias.lower())
+        return table if table and column in columns[table] else None
+    owners = {t for t in aliases.values() if column in columns[t]}
+    return owners.pop() if len(owners) == 1 else None
+
+
+def _covered(kind: str, table: str, cols: tuple, existing: dict) -> bool:
+    for keys, partial, unique, definition, _ in existing.get(table, ()):
+        if kind == "btree" and not partial and " USING btree " in definition:
+            # A full index leading with the same columns, in any order, or a
+            # unique one on any single column of a composite.
+            if set(keys[:len(cols)]) == set(cols):
+                return True
+            if unique and len(keys) == 1 and keys[0] in cols:
+                return True
+        elif "gin_trgm_ops" in definition:
+            col = cols[0]
+            if kind == "trgm_lower" and re.search(rf"lower\(\(?{col}\)?", definition):
+                return True
+            if kind == "trgm" and re.search(rf"[(,]\s*\(?{col}\)?(?:::\w+)?\s+gin_trgm_ops", definition):
+                return True
+    return False
+
+
+def _candidate(kind: str, table: str, cols: tuple) -> dict:
+    if kind == "btree":
+        name = f"idx_{table}_{'_'.join(cols)}"
+        using = f"btree ({', '.join(cols)})"
+    elif kind == "trgm_lower":
+        name = f"idx_{table}_{cols[0]}_lower_trgm"
+        using = f"gin (lower({cols[0]}) gin_trgm_ops)"
+    else:
+        name = f"idx_{table}_{cols[0]}_trgm"
+        using = f"gin ({cols[0]} gin_trgm_ops)"
+    return {"table": table, "name": name, "using": using, "needs_pg_trgm": kind != "btree",
+            "reason": None, "statements": []}
+
+
+def propose(cursor, statements: list, min_rows: int, tables: dict) -> list:
+    """Candidate indexes for the WHERE clauses of statements, most used first."""
+    columns = _columns(cursor)
+    existing = _existing_indexes(cursor)
+    found = {}
+
+    def add(kind, table, cols, index, reason):
+        if tables.get(table, {}).get("rows", 0) < min_rows or _covered(kind, table, cols, existing):
+            return
+        candidate = found.get((kind, table, cols))
+        if candidate is None:
+            candidate = found[(kind, table, cols)] = _candidate(kind, table, cols)
+            candidate["reason"] = reason
+        if index not in candidate["statements"]:
+            candidate["statements"].append(index)
+
+    for index, statement in enumerate(statements):
+        text = statement["query"]
+        aliases = _tables_in(text, columns)
+        if not aliases:
+            continue
+        for clause in _where_clauses(text):
+            equalities = {}
+            for lower, alias, column in _LIKE.findall(clause):
+                table = _resolve(alias, column, aliases, columns)
+                if table and columns[table][column.lower()] in _TEXT_TYPES:
+                    kind = "trgm_lower" if lower else "trgm"
+                    add(kind, table, (column.lower(),), index, "LIKE/ILIKE with a pattern (btree cannot serve '%x%')")
+            for alias, column in _COMPARE.findall(clause):
+                table = _resolve(alias, column, aliases, columns)
+                if table:
+                    cols = equalities.setdefault(table, [])
+                    if column.lower() not in cols:
+                        cols.append(column.lower())
+            for table, cols in equalities.items():
+                for column in cols:
+                    add("btree", table, (column,), index, "comparison with a parameter on an unindexed column")
+                if 1 < len(cols) <= 3:
+                    add("btree", table, tuple(cols), index, "several comparisons on the same table")
+
+    for table, name, using, pattern, reason, rewrites in KNOWN_CANDIDATES:
+        if tables.get(table, {}).get("rows", 0) < min_rows:
+            continue
+        if any(index[4] == name for index in existing.get(table, ())):
+            continue
+        matching = [i for i, s in enumerate(statements) if re.search(pattern, s["query"], re.IGNORECASE)]
+        if matching:
+            found[("known", table, name)] = {"table": table, "name": name, "using": using,
+                                             "needs_pg_trgm": "gin_trgm_ops" in using,
+                                             "reason": reason, "statements": matching,
+                                             "rewrites": rewrites}
+
+    ranked = sorted(found.values(), key=lambda c: sum(statements[i]["total_ms"] for i in c["statements"]),
+                    reverse=True)
+    for candidate in ranked[:_MAX_CANDIDATES]:
+        candidate["ddl"] = f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {candidate['name']} " \
+                           f"ON {candidate['table']} USING {candidate['using']};"
+        candidate["table_rows"] = tables[candidate["table"]]["rows"]
+        candidate["table_writes"] = tables[candidate["table"]]["writes"]
+    return ranked[:_MAX_CANDIDATES]
+
+
+# ------------------------------------------------------------------
+# Benefit estimation
+# ------------------------------------------------------------------
+
+def _explainable_text(text: str, feature_flags: dict):
+    """The statement as EXPLAIN can take it, or None."""
+    head = text.lstrip().lower()
+    if not head.startswith(("select", "with", "update", "delete")):
+        return None
+    if "?" in text or "%" in text:
+        counter = iter(range(1, 10_000))
+        text = _PLACEHOLDER.sub(lambda _: f"${next(counter)}", text)
+    if re.search(r"\$\d", text):
+        return text if feature_flags["generic_plan"] else None
+    return text
+
+
+def _index_names(plan: dict, names: set):
+    if "Index Name" in plan:
+        names.add(plan["Index Name"])
+    for child in plan.get("Plans", ()):
+        _index_names(child, names)
+
+
+def _explain(cursor, text: str, generic: bool):
+    cursor.execute(f"EXPLAIN ({'GENERIC_PLAN, ' if generic else ''}FORMAT JSON) {text}")
+    raw = cursor.fetchone()[0]
+    plan = (json.loads(raw) if isinstance(raw, str) else raw)[0]["Plan"]
+    names = set()
+    _index_names(plan, names)
+    return plan["Total Cost"], names
+
+
+def _costs(conn, texts: dict, feature_flags: dict, setup=None):
+    """{statement index: (cost, index names) or error} in one rolled-back transaction."""
+    results = {}
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SET LOCAL statement_timeout = %s", (EXPLAIN_TIMEOUT_MS,))
+        marker = setup(cursor) if setup else None
+        for index, text in texts.items():
+            cursor.execute("SAVEPOINT advisor_explain")
+            try:
+                results[index] = _explain(cursor, text, "$" in text)
+            except Exception as e:
+                cursor.execute("ROLLBACK TO SAVEPOINT advisor_explain")
+                results[index] = f"EXPLAIN failed: {str(e).strip()}"
+        return results, marker
+    finally:
+        cursor.close()
+        conn.rollback()
+
+
+def estimate(conn, candidates: list, statements: list, feature_flags: dict, build: bool = False):
+    """Fill in each candidate's per-statement costs and estimated_saved_ms."""
+    texts = {}
+    for i, statement in enumerate(statements):
+        text = _explainable_text(statement["query"], feature_flags)
+        if text is not None:
+            texts[i] = text
+    if not texts:
+        for candidate in candidates:
+            candidate["estimate"] = "no statement could be explained"
+        return
+    baseline, _ = _costs(conn, texts, feature_flags)
+
+    for candidate in candidates:
+        before = baseline
+        mine = {i: texts[i] for i in candidate["statements"] if i in texts}
+        rewrites = candidate.pop("rewrites", None)
+        if rewrites:
+            for i, text in mine.items():
+                for pattern, replacement in rewrites:
+                    text = re.sub(pattern, replacement, text, flags=re.IGNORECASE)
+                mine[i] = text
+            before, _ = _costs(conn, mine, feature_flags)
+        mine = {i: text for i, text in mine.items() if isinstance(before.get(i), tuple)}
+        if not mine:
+            candidate["estimate"] = "no matching statement could be explained"
+            continue
+        gin = candidate["using"].startswith("gin")
+        if feature_flags["hypopg"] and not gin:
+            method = "hypopg"
+
+            def setup(cursor, candidate=candidate):
+                cursor.execute("SELECT indexrelid::text FROM hypopg_create_index(%s)",
+                               (f"CREATE INDEX ON {candidate['table']} USING {candidate['using']}",))
+                return cursor.fetchone()[0]
+        elif build:
+            if candidate["table_rows"] > MAX_BUILD_ROWS:
+                candidate["estimate"] = f"table has more than INDEX_ADVISOR_MAX_BUILD_ROWS={MAX_BUILD_ROWS} rows"
+                continue
+            if candidate["needs_pg_trgm"] and not (feature_flags["pg_trgm"] or feature_flags["pg_trgm_available"]):
+                candidate["estimate"] = "pg_trgm is not available on this server"
+                continue
+            method = "build"
+
+            def setup(cursor, candidate=candidate):
+                cursor.execute("SET LOCAL lock_timeout = %s", (_BUILD_LOCK_TIMEOUT_MS,))
+                if candidate["needs_pg_trgm"] and not feature_flags["pg_trgm"]:
+                    cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+                cursor.execute(f"CREATE INDEX {candidate['name']} ON {candidate['table']} USING {candidate['using']}")
+                return candidate["name"]
+        else:
+            candidate["estimate"] = ("hypopg cannot simulate GIN indexes; pass build=true" if feature_flags["hypopg"]
+                                     else "install hypopg or pass build=true to estimate")
+            continue
+
+        try:
+            with_index, marker = _costs(conn, mine, feature_flags, setup)
+        except Exception as e:
+            candidate["estimate"] = f"{method} failed: {str(e).strip()}"
+            continue
+        finally:
+            if method == "hypopg":
+                reset = conn.cursor()
+                try:
+                    reset.execute("SELECT hypopg_reset()")
+                finally:
+                    reset.close()
+                    conn.rollback()
+
+        saved = 0.0
+        details = []
+        for i in mine:
+            before_cost, _ = before[i]
+            after = with_index[i]
+            if not isinstance(after, tuple):
+                details.append({"statement": i, "error": after})
+                continue
+            after_cost, used = after
+            uses = any(marker in name for name in used)
+            if uses and before_cost > 0 and after_cost < before_cost:
+                saved += statements[i]["total_ms"] * (1 - after_cost / before_cost)
+            details.append({"statement": i, "cost_before": before_cost, "cost_after": after_cost,
+                            "uses_index": uses})
+        candidate["estimate"] = method
+        candidate["costs"] = details
+        candidate["estimated_saved_ms"] = round(saved, 1)
+
+
+def report(conn, limit: int = 20, min_rows: int = 10_000, run_estimate: bool = True, build: bool = False) -> dict:
+    """Everything in the module docstring, for the database conn points at."""
+    cursor = conn.cursor()
+    try:
+        feature_flags = features(cursor)
+        statements = heaviest_statements(cursor, limit, feature_flags)
+        tables = _table_stats(cursor)
+        result = {
+            "features": feature_flags,
+            "statements": [{"statement": i, **s} for i, s in enumerate(statements)],
+            "seq_scan_tables": seq_scan_tables(tables, min_rows),
+            "unused_indexes": unused_indexes(cursor),
+            "duplicate_indexes": duplicate_indexes(cursor),
+        }
+        candidates = propose(cursor, statements, min_rows, tables)
+    finally:
+        cursor.close()
+        conn.rollback()
+
+    if run_estimate and candidates:
+        estimate(conn, candidates, statements, feature_flags, build)
+        candidates.sort(key=lambda c: c.get("estimated_saved_ms", -1), reverse=True)
+        # Drop candidates that were estimated and no plan picked up.
+        candidates = [c for c in candidates
+                      if c.get("estimated_saved_ms") is None
+                      or any(d.get("uses_index") for d in c.get("costs", ()))]
+    result["candidates"] = candidates
+    return result
@@ -0,0 +1,111 @@
+"""
+Single-leader background loops for multi-worker deployments.
+
+Every worker process boots the whole app, so a plain asyncio.create_task()
+on startup runs a singleton loop (e.g. the EmbodyBench reclaim sweep) once
+per worker. run_as_leader() wraps such a loop: each process keeps a
+dedicated connection and tries pg_try_advisory_lock() on it, and only the
+process that holds the lock runs the loop.
+
+Failover: the lock is tied to the leader's session. If that process exits
+or its connection drops, Postgres releases the lock and another worker
+takes over within LEADER_RETRY_INTERVAL seconds. The leader pings its
+connection every LEADER_RETRY_INTERVAL seconds and stops the loop as soon
+as the ping fails, so two leaders cannot keep running side by side.
+"""
+import asyncio
+import logging
+import os
+import zlib
+
+from psycopg import AsyncConnection
+
+from database import DATABASE_URL
+
+logger = logging.getLogger(__name__)
+
+RETRY_INTERVAL = float(os.getenv("LEADER_RETRY_INTERVAL", "15"))
+
+# First half of the two-int advisory lock key; keeps these locks apart from
+# single-bigint locks such as the schema migration lock.
+_LOCK_CLASS = 7_420_002
+
+_leadership = {}
+
+
+def _lock_id(name: str) -> int:
+    value = zlib.crc32(name.encode())
+    return value - (1 << 32) if value >= (1 << 31) else value
+
+
+async def _connect():
+    return await AsyncConnection.connect(
+        DATABASE_URL,
+        autocommit=True,
+        application_name=f"leader-{os.getpid()}",
+        keepalives=1,
+        keepalives_idle=30,
+        keepalives_interval=10,
+        keepalives_count=3,
+    )
+
+
+async def _lead(conn, loop_factory):
+    """Run loop_factory() while conn stays healthy; return when it does not."""
+    task = asyncio.create_task(loop_factory())
+    try:
+        while not task.done():
+            await asyncio.sleep(RETRY_INTERVAL)
+            await conn.execute("SELECT 1")
+        # The loop itself returned or crashed; surface it and re-elect.
+        task.result()
+    finally:
+        if not task.done():
+            task.cancel()
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+
+
+async def run_as_leader(name: str, loop_factory):
+    """Run loop_factory() (an async function, called with no arguments) in
+    exactly one process at a time. Runs until cancelled."""
+    lock_id = _lock_id(name)
+    _leadership[name] = False
+    while True:
+        conn = None
+        try:
+            conn = await _connect()
+            while True:
+                cur = await conn.execute(
+                    "SELECT pg_try_advisory_lock(%s, %s)", (_LOCK_CLASS, lock_id)
+                )
+                if (await cur.fetchone())[0]:
+                    break
+                await asyncio.sleep(RETRY_INTERVAL)
+
+            _leadership[name] = True
+            logger.info(f"Process {os.getpid()} is now leader for {name}")
+            await _lead(conn, loop_factory)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if _leadership[name]:
+                logger.warning(f"Lost leadership for {name}: {e}")
+            else:
+                logger.warning(f"Leader election for {name} failed: {e}")
+        finally:
+            _leadership[name] = False
+            if conn is not None:
+                # Closing the session releases the advisory lock.
+                try:
+                    await conn.close()
+                except Exception:
+                    pass
+        await asyncio.sleep(RETRY_INTERVAL)
+
+
+def leadership() -> dict:
+    """{loop name: whether this process currently runs it}"""
+    return dict(_leadership)
@@ -0,0 +1,233 @@
+"""
+Structured, non-blocking logging.
+
+setup_logging() (called once from main.py) puts a single QueueHandler on the
+root logger. The thread that logs only renders the message and enqueues the
+record; a QueueListener thread formats it and writes it to stdout. A request
+therefore never waits on terminal or pipe I/O, even when stdout is slow
+(Render's log drain, a paused terminal). The queue is bounded: when it is
+full, records are dropped and counted (log_records_dropped_total on
+/metrics) instead of blocking the caller.
+
+uvicorn's own loggers (startup, errors, access log) are routed through the
+same queue once the app is imported.
+
+Each record carries the id of the request that produced it.
+RequestIdMiddleware takes the id from an incoming X-Request-ID header or
+generates one, keeps it in a contextvar for the request, and echoes it in
+the response header. Work handed to asyncio.to_thread inherits the id;
+background loops log with request_id "-".
+
+Environment:
+  LOG_LEVEL       root level (default info; serve.py passes it to uvicorn too)
+  LOG_FORMAT      json (default) or text
+  LOG_QUEUE_SIZE  records buffered before dropping (default 10000)
+  LOG_SAMPLE      logger=rate pairs that keep only that fraction of the
+                  logger's (and its children's) records below WARNING, for
+                  chatty loops. Defaults to DEFAULT_SAMPLE.
+"""
+import atexit
+import contextvars
+import copy
+import logging
+import os
+import queue
+import re
+import sys
+import threading
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+import orjson
+
+# Per-batch progress of the pickle import: one line per 50 IOUs otherwise.
+DEFAULT_SAMPLE = "routers.yif_migration_router.progress=0.1"
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s"
+
+request_id_var = contextvars.ContextVar("request_id", default="-")
+
+_VALID_REQUEST_ID = re.compile(r"^[A-Za-z0-9._:-]{1,128}$")
+
+# Attributes every LogRecord has; anything else was passed via extra=.
+# color_message is uvicorn's ANSI-coloured duplicate of msg.
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {
+    "message", "request_id", "color_message",
+}
+
+_listener = None
+_handler = None
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg, request_id, extras, exc."""
+
+    def format(self, record) -> str:
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", "-")
+        if request_id != "-":
+            payload["request_id"] = request_id
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                payload[key] = value
+        if record.exc_text:
+            payload["exc"] = record.exc_text
+        return orjson.dumps(payload, default=str).decode()
+
+
+class RequestIdFilter(logging.Filter):
+    """Stamps the current request id; runs in the logging thread, before enqueue."""
+
+    def filter(self, record) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps every Nth record below WARNING for the configured loggers."""
+
+    def __init__(self, rates: dict):
+        super().__init__()
+        self._every = {name: (0 if rate <= 0 else max(1, round(1 / rate))) for name, rate in rates.items()}
+        self._counters = {name: 0 for name in rates}
+        self._resolved = {}
+        self._lock = threading.Lock()
+
+    def _rule_for(self, name):
+        if name not in self._resolved:
+            match = None
+            for prefix in self._every:
+                if (name == prefix or name.startswith(prefix + ".")) and (match is None or len(prefix) > len(match)):
+                    match = prefix
+            self._resolved[name] = match
+        return self._resolved[name]
+
+    def filter(self, record) -> bool:
+        if record.levelno >= logging.WARNING or not self._every:
+            return True
+        rule = self._rule_for(record.name)
+        if rule is None:
+            return True
+        every = self._every[rule]
+        if every == 0:
+            return False
+        with self._lock:
+            count = self._counters[rule]
+            self._counters[rule] = count + 1
+        return count % every == 0
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler that drops (and counts) records instead of blocking."""
+
+    def __init__(self, q):
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Render args and the traceback here, while they are still live
+        # objects; the listener formats the copy later on its own thread.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def parse_sample_rates(spec: str) -> dict:
+    rates = {}
+    for part in (spec or "").split(","):
+        name, sep, rate = part.strip().partition("=")
+        if sep and name:
+            rates[name.strip()] = float(rate)
+    return rates
+
+
+def setup_logging():
+    """Install the queue handler on the root logger (idempotent)."""
+    global _listener, _handler
+    if _listener is not None:
+        return
+
+    level = os.getenv("LOG_LEVEL", "info").upper()
+    if os.getenv("LOG_FORMAT", "json").lower() == "text":
+        formatter = logging.Formatter(TEXT_FORMAT)
+    else:
+        formatter = JSONFormatter()
+
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(formatter)
+
+    _handler = NonBlockingQueueHandler(queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_SIZE", "10000"))))
+    _handler.addFilter(RequestIdFilter())
+    _handler.addFilter(SamplingFilter(parse_sample_rates(os.getenv("LOG_SAMPLE", DEFAULT_SAMPLE))))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(_handler)
+    root.setLevel(level)
+
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        uv_logger = logging.getLogger(name)
+        uv_logger.handlers.clear()
+        uv_logger.propagate = True
+
+    _listener = QueueListener(_handler.queue, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+def stats() -> dict:
+    return {
+        "queued": _handler.queue.qsize() if _handler else 0,
+        "dropped": _handler.dropped if _handler else 0,
+    }
+
+
+class RequestIdMiddleware:
+    """Pure ASGI: sets request_id_var per request and returns X-Request-ID."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope.get("headers", ()):
+            if name == b"x-request-id":
+                candidate = value.decode("latin-1")
+                if _VALID_REQUEST_ID.match(candidate):
+                    request_id = candidate
+                break
+        if request_id is None:
+            request_id = uuid.uuid4().hex
+        header = (b"x-request-id", request_id.encode("latin-1"))
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", ()), header]}
+            await send(message)
+
+        token = request_id_var.set(request_id)
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            request_id_var.reset(token)
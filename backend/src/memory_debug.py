@@ -0,0 +1,307 @@
+"""
+Memory introspection: tracemalloc snapshots, registered cache sizes and a
+per-route RSS watchdog.
+
+Three tools for finding what makes a worker grow until the instance OOMs,
+all read through routers/ops_router.py (YIF admin only):
+
+  tracemalloc  Started at boot with MEMORY_TRACEMALLOC=true, or on demand
+               from the ops router (only allocations made after it starts
+               are seen). snapshot() returns the largest allocation sites
+               and, from the second call on, what grew or shrank since the
+               previous one, so "snapshot, exercise the suspect endpoint,
+               snapshot" points at the lines holding on to memory. Tracing
+               costs CPU and memory per allocation in proportion to
+               MEMORY_TRACEMALLOC_FRAMES; stop it when done.
+  caches       Module-level dicts and caches register themselves with
+
+                   memory_debug.register_cache("sampling_profiler.tokens",
+                                               lambda: _tokens)
+
+               and caches() reports their entry counts and, on request, an
+               approximate deep size in bytes.
+  watchdog     RSSWatchMiddleware reads the process RSS before and after
+               each request and adds any growth to the request's route
+               template. Every MEMORY_WATCHDOG_INTERVAL seconds
+               watchdog_loop() logs a warning with the routes that grew the
+               most when RSS rose by MEMORY_WATCHDOG_GROWTH_MB or more since
+               the previous check, or is above MEMORY_RSS_WARN_MB.
+               Concurrent requests share one RSS, so the attribution is
+               approximate: look for routes that keep coming back, not for
+               exact byte counts.
+
+RSS, per-route growth and cache entry counts are also on /metrics.
+
+All of this is per process. With several uvicorn workers each /api/ops/memory*
+call is answered by whichever worker gets it, and tracing and the previous
+snapshot live only in the worker that started them. Every response carries
+that worker's pid: repeat a call until it reports the pid you started
+tracing in, or run with WEB_CONCURRENCY=1 while debugging.
+"""
+import asyncio
+import gc
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+import types
+
+logger = logging.getLogger(__name__)
+
+TRACEMALLOC_AT_START = os.getenv("MEMORY_TRACEMALLOC", "false").lower() == "true"
+TRACEMALLOC_FRAMES = int(os.getenv("MEMORY_TRACEMALLOC_FRAMES", "5"))
+WATCHDOG_INTERVAL = float(os.getenv("MEMORY_WATCHDOG_INTERVAL", "60"))
+WATCHDOG_GROWTH_MB = float(os.getenv("MEMORY_WATCHDOG_GROWTH_MB", "16"))
+RSS_WARN_MB = float(os.getenv("MEMORY_RSS_WARN_MB", "0"))
+
+_MB = 1024 * 1024
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+_DEEP_SIZE_MAX_OBJECTS = 500_000
+
+# Allocations made by the introspection itself.
+_SNAPSHOT_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+]
+
+
+def rss_bytes() -> int:
+    """Current resident set size (peak RSS where /proc is unavailable)."""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+# ------------------------------------------------------------------
+# Registered caches
+# ------------------------------------------------------------------
+
+_caches = {}  # name -> callable returning the container
+_caches_lock = threading.Lock()
+
+
+def register_cache(name: str, get_container):
+    """Report the container get_container() returns under name in caches()."""
+    with _caches_lock:
+        _caches[name] = get_container
+
+
+def deep_size(obj, max_objects: int = _DEEP_SIZE_MAX_OBJECTS):
+    """(bytes, complete) for obj and everything it references.
+
+    Modules, classes and functions are not followed, and objects shared with
+    other containers are counted here too. Stops after max_objects objects,
+    returning complete=False.
+    """
+    seen = set()
+    pending = [obj]
+    total = 0
+    while pending:
+        if len(seen) >= max_objects:
+            return total, False
+        item = pending.pop()
+        if id(item) in seen or isinstance(item, (type, types.ModuleType, types.FunctionType)):
+            continue
+        seen.add(id(item))
+        total += sys.getsizeof(item, 0)
+        pending.extend(gc.get_referents(item))
+    return total, True
+
+
+def caches(with_bytes: bool = False) -> dict:
+    """{name: {"entries", ["bytes", "bytes_complete"]}} for every registered cache."""
+    with _caches_lock:
+        registered = list(_caches.items())
+    report = {}
+    for name, get_container in sorted(registered):
+        try:
+            container = get_container()
+            entry = {"entries": len(container)}
+            if with_bytes:
+                entry["bytes"], entry["bytes_complete"] = deep_size(container)
+        except Exception as e:
+            entry = {"error": str(e)}
+        report[name] = entry
+    return report
+
+
+# ------------------------------------------------------------------
+# tracemalloc
+# ------------------------------------------------------------------
+
+_previous_snapshot = None
+_snapshot_lock = threading.Lock()
+
+
+def start_tracing(frames: int = TRACEMALLOC_FRAMES) -> bool:
+    """Start tracemalloc; False if it was already running."""
+    if tracemalloc.is_tracing():
+        return False
+    tracemalloc.start(frames)
+    return True
+
+
+def stop_tracing():
+    """Stop tracemalloc and drop the stored snapshot."""
+    global _previous_snapshot
+    with _snapshot_lock:
+        _previous_snapshot = None
+    tracemalloc.stop()
+
+
+def tracing_status() -> dict:
+    if not tracemalloc.is_tracing():
+        return {"tracing": False}
+    current, peak = tracemalloc.get_traced_memory()
+    return {
+        "tracing": True,
+        "frames": tracemalloc.get_traceback_limit(),
+        "traced_bytes": current,
+        "traced_peak_bytes": peak,
+        "overhead_bytes": tracemalloc.get_tracemalloc_memory(),
+    }
+
+
+def _site(traceback, key_type: str):
+    if key_type == "filename":
+        return traceback[0].filename
+    if key_type == "traceback":
+        return [f"{frame.filename}:{frame.lineno}" for frame in traceback]
+    return f"{traceback[0].filename}:{traceback[0].lineno}"
+
+
+def snapshot(limit: int = 25, key_type: str = "lineno") -> dict:
+    """Largest allocation sites now, and the change since the previous call.
+
+    Runs a full gc first. key_type groups by "lineno", "filename" or
+    "traceback". The new snapshot replaces the stored one, so each call
+    diffs against the last. Raises RuntimeError if tracemalloc is not running.
+    """
+    global _previous_snapshot
+    if not tracemalloc.is_tracing():
+        raise RuntimeError("tracemalloc is not running")
+    with _snapshot_lock:
+        started = time.perf_counter()
+        # Unreachable cycles (e.g. a finished openpyxl workbook) are not held
+        # by anything; collect them so they do not show up as growth.
+        gc.collect()
+        current = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+        stats = current.statistics(key_type)
+        report = {
+            **tracing_status(),
+            "total_bytes": sum(stat.size for stat in stats),
+            "top": [
+                {"site": _site(stat.traceback, key_type), "bytes": stat.size, "count": stat.count}
+                for stat in stats[:limit]
+            ],
+            "diff": None,
+        }
+        if _previous_snapshot is not None:
+            changes = current.compare_to(_previous_snapshot, key_type)
+            report["diff"] = {
+                "since_seconds": round(time.time() - _previous_snapshot.taken_at, 1),
+                "total_change_bytes": sum(stat.size_diff for stat in changes),
+                "top": [
+                    {"site": _site(stat.traceback, key_type), "bytes": stat.size,
+                     "change_bytes": stat.size_diff, "count": stat.count, "change_count": stat.count_diff}
+                    for stat in changes[:limit] if stat.size_diff
+                ],
+            }
+        current.taken_at = time.time()
+        _previous_snapshot = current
+        report["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return report
+
+
+# ------------------------------------------------------------------
+# Per-route RSS watchdog
+# ------------------------------------------------------------------
+
+_route_growth = {}  # route -> [requests, grown bytes, largest single growth]
+_window_growth = {}  # route -> grown bytes since the last watchdog check
+_growth_lock = threading.Lock()
+
+
+def _record(route: str, delta: int):
+    with _growth_lock:
+        totals = _route_growth.get(route)
+        if totals is None:
+            totals = _route_growth[route] = [0, 0, 0]
+        totals[0] += 1
+        if delta > 0:
+            totals[1] += delta
+            totals[2] = max(totals[2], delta)
+            _window_growth[route] = _window_growth.get(route, 0) + delta
+
+
+def route_growth() -> dict:
+    """{route: {"requests", "grown_bytes", "max_grown_bytes"}} since start."""
+    with _growth_lock:
+        return {
+            route: {"requests": n, "grown_bytes": grown, "max_grown_bytes": largest}
+            for route, (n, grown, largest) in _route_growth.items()
+        }
+
+
+class RSSWatchMiddleware:
+    """Pure ASGI: attributes RSS growth during a request to its route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or WATCHDOG_INTERVAL <= 0:
+            await self.app(scope, receive, send)
+            return
+        before = rss_bytes()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            # The router stores the matched route in scope.
+            route = getattr(scope.get("route"), "path", None) or "<unmatched>"
+            _record(f"{scope['method']} {route}", rss_bytes() - before)
+
+
+async def watchdog_loop():
+    """Log RSS growth and the routes behind it every WATCHDOG_INTERVAL seconds."""
+    if WATCHDOG_INTERVAL <= 0:
+        return
+    last = rss_bytes()
+    while True:
+        await asyncio.sleep(WATCHDOG_INTERVAL)
+        now = rss_bytes()
+        with _growth_lock:
+            window = sorted(_window_growth.items(), key=lambda item: item[1], reverse=True)
+            _window_growth.clear()
+        grown = now - last
+        last = now
+        over_limit = RSS_WARN_MB > 0 and now >= RSS_WARN_MB * _MB
+        if grown < WATCHDOG_GROWTH_MB * _MB and not over_limit:
+            continue
+        routes = ", ".join(f"{route} +{delta / _MB:.1f}MB" for route, delta in window[:5]) or "none"
+        logger.warning(
+            f"RSS {now / _MB:.0f}MB ({grown / _MB:+.1f}MB in {WATCHDOG_INTERVAL:g}s"
+            f"{f', over MEMORY_RSS_WARN_MB={RSS_WARN_MB:g}' if over_limit else ''}); "
+            f"growth by route: {routes}"
+        )
+
+
+def stats() -> dict:
+    return {
+        "rss_bytes": rss_bytes(),
+        "tracemalloc": tracing_status(),
+        "caches": caches(),
+        "routes": route_growth(),
+    }
+
+
+if TRACEMALLOC_AT_START:
+    start_tracing()
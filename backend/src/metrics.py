@@ -0,0 +1,489 @@
+"""
+Prometheus text-format metrics for the backend.
+
+MetricsMiddleware records, per route template (e.g. /api/yif/ious/{iou_db_id}):
+  - http_requests_total{method,route,status}
+  - http_request_duration_seconds (histogram){method,route}
+  - http_requests_in_progress{method,route}
+  - http_request_db_queries_total / http_request_db_seconds_total{method,route}
+  - http_request_db_seconds (histogram, DB time per request){method,route}
+  - http_request_db_round_trips_total / http_request_db_round_trips
+    (histogram, round trips per request){method,route}
+
+DB time comes from db_pool.query_listeners, which both the psycopg2 pool
+cursors (raw routers and the SQLAlchemy engine) and async_db cursors report
+to; round trips come from db_pool.round_trip_listeners. A round trip is one
+wait on the server: pipelined statements share one, the BEGIN that opens
+each transaction is one of its own, and the one-off Parse of a newly
+prepared async statement is not counted. Each request gets its
+own counters through a contextvar, so concurrent requests never mix their
+numbers.
+
+Everything lives in this process's memory; render() is served at GET /metrics.
+Recording a request costs a few dict lookups and a bisect, cheap enough to
+leave on in production.
+"""
+import bisect
+import contextvars
+import threading
+import time
+
+from starlette.routing import Match
+
+import db_pool
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+DB_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 10.0)
+ROUND_TRIP_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+def _format_labels(names, values) -> str:
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_value(value) -> str:
+    if isinstance(value, float):
+        if value == float("inf"):
+            return "+Inf"
+        return repr(value)
+    return str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = self._header()
+        with self._lock:
+            items = list(self._values.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, labels=(), amount=1):
+        self.inc(labels, -amount)
+
+    def set(self, labels=(), value=0):
+        with self._lock:
+            self._values[labels] = value
+
+    render = Counter.render
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, labels=(), value=0.0):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        lines = self._header()
+        with self._lock:
+            items = [(labels, (list(s[0]), s[1], s[2])) for labels, s in self._values.items()]
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                label_str = _format_labels(self.label_names + ("le",), labels + (_format_value(float(bound)),))
+                lines.append(f"{self.name}_bucket{label_str} {cumulative}")
+            label_str = _format_labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{label_str} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_str} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        """collector() -> iterable of (name, kind, help, {labels_tuple: value}, label_names),
+        called on every scrape for point-in-time values such as pool sizes."""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            try:
+                families = list(collector())
+            except Exception:
+                continue
+            for name, kind, help_text, values, label_names in families:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in values.items():
+                    lines.append(f"{name}{_format_labels(label_names, labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+REQUESTS = registry.register(Counter(
+    "http_requests_total", "HTTP requests by route template and status.",
+    ("method", "route", "status")))
+LATENCY = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency.", ("method", "route")))
+class _InProgressGauge(Gauge):
+    """Counted at scrape time from the requests being served: a request's
+    route is only known once the router has matched it."""
+
+    def render(self):
+        counts = {}
+        for stats in list(_active):
+            labels = (stats.method, stats.route)
+            counts[labels] = counts.get(labels, 0) + 1
+        with self._lock:
+            for labels in self._values:
+                self._values[labels] = 0
+            self._values.update(counts)
+        return super().render()
+
+
+IN_PROGRESS = registry.register(_InProgressGauge(
+    "http_requests_in_progress", "HTTP requests currently being served.", ("method", "route")))
+DB_QUERIES = registry.register(Counter(
+    "http_request_db_queries_total", "SQL statements executed while serving requests.",
+    ("method", "route")))
+DB_SECONDS = registry.register(Counter(
+    "http_request_db_seconds_total", "Cumulative time spent in SQL statements.",
+    ("method", "route")))
+DB_LATENCY = registry.register(Histogram(
+    "http_request_db_seconds", "DB time per request.", ("method", "route"), buckets=DB_BUCKETS))
+DB_ROUND_TRIPS = registry.register(Counter(
+    "http_request_db_round_trips_total", "Round trips to the database while serving requests.",
+    ("method", "route")))
+DB_ROUND_TRIPS_PER_REQUEST = registry.register(Histogram(
+    "http_request_db_round_trips", "Database round trips per request.", ("method", "route"),
+    buckets=ROUND_TRIP_BUCKETS))
+DB_ERRORS = registry.register(Counter(
+    "db_query_errors_total", "SQL statements that raised.", ("route",)))
+
+
+# ------------------------------------------------------------------
+# Per-request DB accounting
+# ------------------------------------------------------------------
+
+class _RequestDBStats:
+    __slots__ = ("queries", "seconds", "round_trips", "method", "_app", "_scope", "_route")
+
+    def __init__(self, app, scope):
+        self.queries = 0
+        self.seconds = 0.0
+        self.round_trips = 0
+        self.method = scope["method"]
+        self._app = app
+        self._scope = scope
+        self._route = None
+
+    @property
+    def route(self) -> str:
+        if self._route is None:
+            self._route = _route_template(self._app, self._scope)
+        return self._route
+
+
+_current = contextvars.ContextVar("metrics_request_db", default=None)
+# Stats of the requests being served, for http_requests_in_progress.
+_active = set()
+
+
+def _on_query(cursor, query, vars, elapsed, error):
+    stats = _current.get()
+    if stats is None:
+        return
+    stats.queries += 1
+    stats.seconds += elapsed
+    if error is not None:
+        DB_ERRORS.inc((stats.route,))
+
+
+def _on_round_trips(count, elapsed):
+    stats = _current.get()
+    if stats is None:
+        return
+    stats.round_trips += count
+    stats.seconds += elapsed
+
+
+db_pool.query_listeners.append(_on_query)
+db_pool.round_trip_listeners.append(_on_round_trips)
+
+
+def current_route():
+    """Route template of the request being served, or None outside a request."""
+    stats = _current.get()
+    return stats.route if stats is not None else None
+
+
+# ------------------------------------------------------------------
+# ASGI middleware
+# ------------------------------------------------------------------
+
+def _route_template(app, scope) -> str:
+    """Template of the route that matched scope. The router leaves it in
+    scope["route"]; the routes are only scanned when it has not (before
+    routing, unmatched paths, routes that do not set it)."""
+    route = scope.get("route")
+    if route is not None:
+        return getattr(route, "path", UNMATCHED_ROUTE)
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", UNMATCHED_ROUTE)
+    return UNMATCHED_ROUTE
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware (no BaseHTTPMiddleware overhead or body buffering)."""
+
+    def __init__(self, app, fastapi_app=None):
+        self.app = app
+        self.fastapi_app = fastapi_app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status_holder = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_holder[0] = message["status"]
+            await send(message)
+
+        # The route template is resolved after the app ran, from the
+        # scope["route"] the router stored, instead of matching up front.
+        stats = _RequestDBStats(self.fastapi_app, scope)
+        token = _current.set(stats)
+        _active.add(stats)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            _current.reset(token)
+            _active.discard(stats)
+            labels = (stats.method, stats.route)
+            REQUESTS.inc((*labels, str(status_holder[0])))
+            LATENCY.observe(labels, elapsed)
+            if stats.queries:
+                DB_QUERIES.inc(labels, stats.queries)
+                DB_SECONDS.inc(labels, stats.seconds)
+                DB_LATENCY.observe(labels, stats.seconds)
+            if stats.round_trips:
+                DB_ROUND_TRIPS.inc(labels, stats.round_trips)
+                DB_ROUND_TRIPS_PER_REQUEST.observe(labels, stats.round_trips)
+
+
+# ------------------------------------------------------------------
+# Scrape-time collectors
+# ------------------------------------------------------------------
+
+def register_pool_metrics(sync_pool, async_stats=None):
+    """Expose db_pool.ConnectionPool (and async_db) stats on every scrape."""
+
+    def collect():
+        stats = sync_pool.stats()
+        yield ("db_pool_connections", "gauge", "psycopg2 pool connections by state.",
+               {("idle",): stats["idle"], ("in_use",): stats["in_use"]}, ("state",))
+        yield ("db_pool_max_connections", "gauge", "psycopg2 pool max_size.",
+               {(): stats["max_size"]}, ())
+        for key in ("checkouts", "waits", "timeouts", "connections_created",
+                    "connections_closed", "recycled", "failed_pings"):
+            yield (f"db_pool_{key}_total", "counter", f"psycopg2 pool {key.replace('_', ' ')}.",
+                   {(): stats[key]}, ())
+        yield ("db_pool_wait_seconds_total", "counter", "Time spent waiting for a pooled connection.",
+               {(): stats["wait_time_total_ms"] / 1000.0}, ())
+        if async_stats is not None:
+            a = async_stats()
+            if a.get("open"):
+                yield ("async_db_pool_connections", "gauge", "Async pool connections by state.",
+                       {("idle",): a.get("pool_available", 0),
+                        ("in_use",): a.get("pool_size", 0) - a.get("pool_available", 0)}, ("state",))
+                yield ("async_db_pool_requests_waiting", "gauge", "Requests waiting for an async connection.",
+                       {(): a.get("requests_waiting", 0)}, ())
+
+    registry.add_collector(collect)
+
+
+def register_crypto_metrics(crypto_stats):
+    """Expose crypto_pool (bcrypt / Fernet executor) stats on every scrape."""
+
+    def collect():
+        stats = crypto_stats()
+        yield ("crypto_pool_workers", "gauge", "Crypto executor threads.", {(): stats["workers"]}, ())
+        yield ("crypto_pool_pending", "gauge", "Crypto calls running or queued.", {(): stats["pending"]}, ())
+        yield ("crypto_pool_completed_total", "counter", "Crypto calls finished.", {(): stats["completed"]}, ())
+        yield ("crypto_pool_rejected_total", "counter", "Crypto calls refused with 503 (queue full).",
+               {(): stats["rejected"]}, ())
+        yield ("crypto_pool_busy_seconds_total", "counter", "Thread time spent hashing/encrypting.",
+               {(): stats["busy_seconds"]}, ())
+
+    registry.add_collector(collect)
+
+
+def register_replica_metrics(replica_stats):
+    """Expose replica.py lag and read routing decisions on every scrape."""
+
+    def collect():
+        stats = replica_stats()
+        if not stats["enabled"]:
+            return
+        yield ("db_replica_healthy", "gauge", "1 if the last replica lag check succeeded.",
+               {(): int(stats["healthy"])}, ())
+        if stats["lag"] is not None:
+            yield ("db_replica_lag_seconds", "gauge", "Replica lag at the last check.", {(): stats["lag"]}, ())
+        yield ("db_read_route_total", "counter", "Read-only blocks by endpoint, target and reason.",
+               stats["routes"], ("endpoint", "target", "reason"))
+
+    registry.add_collector(collect)
+
+
+def register_logging_metrics(log_stats):
+    """Expose the log_config queue depth and drop count on every scrape."""
+
+    def collect():
+        stats = log_stats()
+        yield ("log_queue_records", "gauge", "Log records waiting for the writer thread.",
+               {(): stats["queued"]}, ())
+        yield ("log_records_dropped_total", "counter", "Log records dropped because the queue was full.",
+               {(): stats["dropped"]}, ())
+
+    registry.add_collector(collect)
+
+
+def register_query_guard_metrics(cancel_stats):
+    """Expose query_guard cancellations per endpoint on every scrape."""
+
+    def collect():
+        yield ("db_statements_cancelled_total", "counter",
+               "Statements cancelled by their endpoint's statement timeout or a client disconnect.",
+               cancel_stats(), ("endpoint", "reason"))
+
+    registry.add_collector(collect)
+
+
+def register_admission_metrics(admission_stats):
+    """Expose admission class occupancy and rejections on every scrape."""
+
+    def collect():
+        stats = admission_stats()
+        if not stats["enabled"]:
+            return
+        classes = stats["classes"]
+        yield ("admission_in_flight", "gauge", "Requests holding an admission slot, by class.",
+               {(name,): c["in_flight"] for name, c in classes.items()}, ("class",))
+        yield ("admission_queued", "gauge", "Requests waiting for an admission slot, by class.",
+               {(name,): c["waiting"] for name, c in classes.items()}, ("class",))
+        yield ("admission_admitted_total", "counter", "Requests admitted, by class.",
+               {(name,): c["admitted"] for name, c in classes.items()}, ("class",))
+        yield ("admission_rejected_total", "counter", "Requests turned away with 429, by class and reason.",
+               {(name, reason): n for name, c in classes.items() for reason, n in c["rejected"].items()},
+               ("class", "reason"))
+        yield ("admission_queue_wait_seconds_total", "counter", "Time spent queued for a slot, by class.",
+               {(name,): c["wait_seconds"] for name, c in classes.items()}, ("class",))
+
+    registry.add_collector(collect)
+
+
+def register_tag_cache_metrics(cache_stats):
+    """Expose tag_cache hit/miss/invalidation counts on every scrape."""
+
+    def collect():
+        stats = cache_stats()
+        yield ("tag_cache_entries", "gauge", "Entries in the in-process catalog cache.",
+               {(): stats["entries"]}, ())
+        yield ("tag_cache_lookups_total", "counter", "Catalog cache lookups by result.",
+               {("hit",): stats["hits"], ("miss",): stats["misses"]}, ("result",))
+        yield ("tag_cache_invalidations_total", "counter", "Catalog cache invalidations applied (local and remote).",
+               {(): stats["invalidations"]}, ())
+
+    registry.add_collector(collect)
+
+
+def register_memory_metrics(memory_stats):
+    """Expose RSS, per-route RSS growth and registered cache sizes on every scrape."""
+
+    def collect():
+        stats = memory_stats()
+        yield ("process_resident_memory_bytes", "gauge", "Resident set size of this worker process.",
+               {(): stats["rss_bytes"]}, ())
+        yield ("memory_route_rss_growth_bytes_total", "counter",
+               "RSS growth seen while requests of a route were running (approximate under concurrency).",
+               {tuple(key.split(" ", 1)): r["grown_bytes"] for key, r in stats["routes"].items()},
+               ("method", "route"))
+        yield ("memory_cache_entries", "gauge", "Entries in registered module-level caches.",
+               {(name,): c["entries"] for name, c in stats["caches"].items() if "entries" in c}, ("cache",))
+        if stats["tracemalloc"]["tracing"]:
+            yield ("tracemalloc_traced_bytes", "gauge", "Memory traced by tracemalloc.",
+                   {(): stats["tracemalloc"]["traced_bytes"]}, ())
+
+    registry.add_collector(collect)
+
+
+def register_single_flight_metrics(single_flight_stats):
+    """Expose coalesced-request counts per route on every scrape."""
+
+    def collect():
+        yield ("single_flight_requests_total", "counter",
+               "Coalescable GETs by route and role (leader ran it, coalesced shared a leader's "
+               "response, fallback ran it after the leader failed).",
+               single_flight_stats(), ("route", "role"))
+
+    registry.add_collector(collect)
+
+
+def render() -> str:
+    return registry.render()
@@ -1,8 +1,9 @@
-import pdfplumber
 import re
 import os
 from typing import Optional, Dict, Any
 
+import tracing
+
 
 def extract_info(text: str) -> Dict[str, Optional[str]]:
     name_match = re.search(r"旅客姓名.*?\n\s*([\S]+)", text)
@@ -26,13 +27,15 @@ def extract_info(text: str) -> Dict[str, Optional[str]]:
 
 def extract_text_from_pdf(pdf_bytes: bytes) -> str:
     import io
+    import pdfplumber
     full_text = ""
     
-    with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
-        for page in pdf.pages:
-            page_text = page.extract_text()
-            if page_text:
-                full_text += page_text + "\n"
+    with tracing.span("cpu.pdfplumber_extract", bytes=len(pdf_bytes)):
+        with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
+            for page in pdf.pages:
+                page_text = page.extract_text()
+                if page_text:
+                    full_text += page_text + "\n"
     
     return full_text
 
@@ -0,0 +1,53 @@
+"""
+Background prewarm of the heavy, lazily imported dependencies.
+
+openpyxl, xlrd, pdfplumber, boto3 (plus the R2 client) and resend are only
+imported inside the functions that use them, so a cold start can answer
+/health without paying for them. Once the server is up, prewarm() loads them
+on a worker thread so the first export / PDF / upload request does not pay
+either. Set PREWARM_IMPORTS=false to skip it (e.g. on tiny instances where
+memory matters more than first-request latency).
+"""
+import importlib
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+PREWARM_MODULES = [
+    "openpyxl",
+    "xlrd",
+    "pdfplumber",
+    "resend",
+    "boto3",
+    "botocore.client",
+    "passlib.handlers.bcrypt",
+]
+
+
+def enabled() -> bool:
+    return os.getenv("PREWARM_IMPORTS", "true").lower() == "true"
+
+
+def prewarm():
+    """Import PREWARM_MODULES and build the R2 client. Blocking; run it in a thread."""
+    start = time.perf_counter()
+    timings = {}
+    for name in PREWARM_MODULES:
+        t0 = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            logger.warning(f"Prewarm import of {name} failed: {e}")
+            continue
+        timings[name] = round((time.perf_counter() - t0) * 1000)
+
+    try:
+        from r2_storage import r2_storage
+        r2_storage.s3_client
+    except Exception as e:
+        logger.warning(f"Prewarm of R2 client failed: {e}")
+
+    logger.info(f"Prewarmed {len(timings)} modules in "
+                f"{(time.perf_counter() - start) * 1000:.0f}ms: {timings}")
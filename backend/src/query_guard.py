@@ -0,0 +1,155 @@
+"""
+Per-endpoint statement timeouts, and query cancellation when the client
+goes away.
+
+Heavy read endpoints (IOU/payment search and export, dashboard) wrap their
+async_db connection block in
+
+    async with (
+        read_connection("yif.export_ious", max_lag=10) as conn,
+        query_guard(conn, request, "yif.export_ious", timeout=120) as guard,
+    ):
+        ...
+
+which does two things for the rest of the checkout:
+
+  timeout     Every statement runs with statement_timeout set to the
+              endpoint's budget (seconds; STATEMENT_TIMEOUTS="name=seconds,..."
+              overrides per endpoint, 0 means no limit). The setting rides
+              along with the next query like the RLS context, so it costs no
+              round trip. A statement that runs out of budget is cancelled by
+              the server and the request gets a 503.
+  disconnect  A watcher task checks every DISCONNECT_POLL_INTERVAL seconds
+              whether the HTTP client has disconnected (closed tab, proxy
+              timeout). Once it has, any statement running on conn is
+              cancelled through the driver (psycopg's cancel_safe(), the
+              equivalent of pg_cancel_backend for that one backend), and the
+              request ends with 499 instead of finishing work nobody will
+              read. Long CPU steps after the queries (workbook building) can
+              call guard.check() first to stop early too.
+
+Handlers that wrap any exception in HTTPException(500) keep working: the
+guard recognises the QueryCanceled behind it.
+
+Cancellations are counted per endpoint and reason on /metrics
+(db_statements_cancelled_total).
+"""
+import asyncio
+import logging
+import os
+import threading
+from collections import Counter
+from contextlib import asynccontextmanager
+
+from fastapi import HTTPException, Request
+from psycopg import errors, pq
+
+logger = logging.getLogger(__name__)
+
+DISCONNECT_POLL_INTERVAL = float(os.getenv("DISCONNECT_POLL_INTERVAL", "0.5"))
+
+# nginx's "client closed request"; nobody receives it, but it shows up in
+# the access log and metrics instead of a 500.
+CLIENT_CLOSED_REQUEST = 499
+
+
+def _parse_budgets(spec: str) -> dict:
+    budgets = {}
+    for part in (spec or "").split(","):
+        name, sep, seconds = part.strip().partition("=")
+        if sep and name:
+            budgets[name.strip()] = float(seconds)
+    return budgets
+
+
+_budget_overrides = _parse_budgets(os.getenv("STATEMENT_TIMEOUTS", ""))
+
+_cancelled = Counter()
+_cancelled_lock = threading.Lock()
+
+
+def _count(name: str, reason: str):
+    with _cancelled_lock:
+        _cancelled[(name, reason)] += 1
+
+
+def _query_canceled(exc):
+    """The QueryCanceled behind exc (itself, or what it was raised from)."""
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        if isinstance(exc, errors.QueryCanceled):
+            return exc
+        seen.add(id(exc))
+        exc = exc.__cause__ or exc.__context__
+    return None
+
+
+class QueryGuard:
+    def __init__(self, conn, request: Request, name: str):
+        self.conn = conn
+        self.request = request
+        self.name = name
+        self.disconnected = False
+
+    def check(self):
+        """Raise 499 if the client has already gone (seen by the watcher)."""
+        if self.disconnected:
+            _count(self.name, "disconnect")
+            raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail="Client closed request")
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(DISCONNECT_POLL_INTERVAL)
+            if not self.disconnected:
+                if not await self.request.is_disconnected():
+                    continue
+                self.disconnected = True
+            # Keep watching: a statement started after the disconnect is
+            # cancelled on the next poll.
+            if self.conn.pgconn.transaction_status == pq.TransactionStatus.ACTIVE:
+                try:
+                    await self.conn.cancel_safe(timeout=5)
+                except Exception as e:
+                    logger.warning(f"Could not cancel query after client disconnect: {e}")
+
+
+@asynccontextmanager
+async def query_guard(conn, request: Request, name: str, timeout: float):
+    """Statement budget and disconnect cancellation for an async_db connection.
+
+    name identifies the endpoint for STATEMENT_TIMEOUTS and metrics; timeout
+    is its default budget in seconds.
+    """
+    budget = _budget_overrides.get(name, timeout)
+    if budget and budget > 0:
+        conn.set_local_settings({"statement_timeout": str(int(budget * 1000))})
+
+    guard = QueryGuard(conn, request, name)
+    watcher = asyncio.create_task(guard._watch()) if request is not None else None
+    try:
+        yield guard
+    except Exception as e:
+        if _query_canceled(e) is None:
+            raise
+        if guard.disconnected:
+            _count(name, "disconnect")
+            raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail="Client closed request") from None
+        _count(name, "timeout")
+        logger.warning(f"{name}: statement exceeded its {budget:g}s budget")
+        raise HTTPException(
+            status_code=503,
+            detail=f"Query took longer than {budget:g}s; narrow the filters and try again",
+        ) from None
+    finally:
+        if watcher is not None:
+            watcher.cancel()
+            try:
+                await watcher
+            except asyncio.CancelledError:
+                pass
+
+
+def stats() -> dict:
+    """Cancelled statements keyed by (endpoint, reason)."""
+    with _cancelled_lock:
+        return dict(_cancelled)
@@ -2,26 +2,45 @@
 Cloudflare R2 存储工具
 """
 
-import boto3
+import logging
 import os
-from botocore.client import Config
+import threading
 from dotenv import load_dotenv
 
+import tracing
+
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 class R2Storage:
     def __init__(self):
-        self.s3_client = boto3.client(
-            's3',
-            endpoint_url=os.getenv('R2_ENDPOINT'),
-            aws_access_key_id=os.getenv('R2_ACCESS_KEY_ID'),
-            aws_secret_access_key=os.getenv('R2_SECRET_ACCESS_KEY'),
-            config=Config(signature_version='s3v4'),
-            region_name='auto'
-        )
+        self._s3_client = None
+        self._client_lock = threading.Lock()
         self.bucket_name = os.getenv('R2_BUCKET_NAME')
         self.public_url = os.getenv('R2_PUBLIC_URL')
+
+    @property
+    def s3_client(self):
+        """boto3 client, built on first use (importing boto3 and building the
+        client takes a few hundred ms, too much to pay on every cold start)"""
+        if self._s3_client is None:
+            with self._client_lock:
+                if self._s3_client is None:
+                    import boto3
+                    from botocore.client import Config
+
+                    self._s3_client = boto3.client(
+                        's3',
+                        endpoint_url=os.getenv('R2_ENDPOINT'),
+                        aws_access_key_id=os.getenv('R2_ACCESS_KEY_ID'),
+                        aws_secret_access_key=os.getenv('R2_SECRET_ACCESS_KEY'),
+                        config=Config(signature_version='s3v4'),
+                        region_name='auto'
+                    )
+        return self._s3_client
     
+    @tracing.traced("r2.put_object")
     def upload_file(self, file_content: bytes, file_name: str, content_type: str = 'application/octet-stream'):
         """
         上传文件到 R2
@@ -46,9 +65,10 @@ class R2Storage:
             return public_url
             
         except Exception as e:
-            print(f"R2 上传失败: {e}")
+            logger.error(f"R2 上传失败: {e}")
             raise
     
+    @tracing.traced("r2.delete_object")
     def delete_file(self, file_name: str):
         """删除文件"""
         try:
@@ -58,9 +78,10 @@ class R2Storage:
             )
             return True
         except Exception as e:
-            print(f"R2 删除失败: {e}")
+            logger.error(f"R2 删除失败: {e}")
             return False
     
+    @tracing.traced("r2.list_objects")
     def list_files(self, prefix: str = ""):
         """列出文件"""
         try:
@@ -70,7 +91,7 @@ class R2Storage:
             )
             return response.get('Contents', [])
         except Exception as e:
-            print(f"R2 列出文件失败: {e}")
+            logger.error(f"R2 列出文件失败: {e}")
             return []
 
 r2_storage = R2Storage()
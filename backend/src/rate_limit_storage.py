@@ -0,0 +1,183 @@
+"""
+Postgres-backed storage for the slowapi / limits rate limiter.
+
+slowapi's default memory:// storage keeps counters inside each process, so
+with N uvicorn workers every limit is effectively N times looser. This
+storage keeps the counters in an UNLOGGED table (rate_limit_counters, see
+schema_migrations) reached through the shared db_pool, so every worker
+sees the same numbers.
+
+Registered with limits under the dbpool:// scheme. Supports the fixed-window
+and sliding-window-counter strategies. Every check or hit is one
+autocommit statement, and each sliding-window hit is a single conditional
+upsert. Row locking on the current window's counter makes it atomic across
+processes.
+
+Counters are stored with absolute expiry timestamps (epoch seconds).
+Expired rows are removed opportunistically every PURGE_EVERY writes.
+
+Cost: slowapi calls its storage synchronously, from inside the async
+endpoint wrapper, so it cannot use the async pool and every rate-limited
+request blocks the event loop for one database round trip (about 0.3 ms
+against a local Postgres, the network RTT against a hosted one). That is
+only worth paying when counters must be shared; a single worker should
+keep memory://, which is the default (serve.py switches to dbpool:// only
+when WEB_CONCURRENCY > 1).
+"""
+import threading
+import time
+from math import floor
+
+import psycopg2
+from limits.storage import SlidingWindowCounterSupport, Storage
+from limits.storage.base import TimestampedSlidingWindow
+
+from database import get_db_connection
+
+PURGE_EVERY = 1000
+
+
+class PostgresPoolStorage(Storage, SlidingWindowCounterSupport, TimestampedSlidingWindow):
+    """limits storage on top of the app's psycopg2 connection pool."""
+
+    STORAGE_SCHEME = ["dbpool"]
+
+    def __init__(self, uri: str = None, wrap_exceptions: bool = False, **options):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        self._writes = 0
+        self._writes_lock = threading.Lock()
+
+    @property
+    def base_exceptions(self):
+        return (psycopg2.Error, RuntimeError)
+
+    def _run(self, sql: str, params=(), fetch: bool = True):
+        # Blocking, on the event loop thread (see the module docstring).
+        conn = get_db_connection()
+        conn.autocommit = True
+        cursor = conn.cursor()
+        try:
+            cursor.execute(sql, params)
+            if fetch:
+                return cursor.fetchone()
+            return cursor.rowcount
+        finally:
+            cursor.close()
+            conn.autocommit = False
+            conn.close()
+
+    def _after_write(self):
+        with self._writes_lock:
+            self._writes += 1
+            purge = self._writes % PURGE_EVERY == 0
+        if purge:
+            self._run("DELETE FROM rate_limit_counters WHERE expires_at <= %s",
+                      (time.time(),), fetch=False)
+
+    # ------------------------------------------------------------------
+    # Fixed window
+    # ------------------------------------------------------------------
+
+    def incr(self, key: str, expiry: int, amount: int = 1) -> int:
+        now = time.time()
+        row = self._run("""
+            INSERT INTO rate_limit_counters AS c (key, count, expires_at)
+            VALUES (%(key)s, %(amount)s, %(expires_at)s)
+            ON CONFLICT (key) DO UPDATE SET
+                count = CASE WHEN c.expires_at <= %(now)s THEN EXCLUDED.count
+                             ELSE c.count + EXCLUDED.count END,
+                expires_at = CASE WHEN c.expires_at <= %(now)s THEN EXCLUDED.expires_at
+                                  ELSE c.expires_at END
+            RETURNING count
+        """, {"key": key, "amount": amount, "expires_at": now + expiry, "now": now})
+        self._after_write()
+        return row[0]
+
+    def get(self, key: str) -> int:
+        row = self._run(
+            "SELECT count FROM rate_limit_counters WHERE key = %s AND expires_at > %s",
+            (key, time.time()),
+        )
+        return row[0] if row else 0
+
+    def get_expiry(self, key: str) -> float:
+        now = time.time()
+        row = self._run(
+            "SELECT expires_at FROM rate_limit_counters WHERE key = %s AND expires_at > %s",
+            (key, now),
+        )
+        return row[0] if row else now
+
+    def check(self) -> bool:
+        try:
+            return self._run("SELECT 1")[0] == 1
+        except Exception:
+            return False
+
+    def reset(self) -> int:
+        return self._run("DELETE FROM rate_limit_counters", fetch=False)
+
+    def clear(self, key: str) -> None:
+        self._run("DELETE FROM rate_limit_counters WHERE key = %s", (key,), fetch=False)
+
+    # ------------------------------------------------------------------
+    # Sliding window counter
+    # ------------------------------------------------------------------
+
+    def acquire_sliding_window_entry(self, key: str, limit: int, expiry: int, amount: int = 1) -> bool:
+        if amount > limit:
+            return False
+        now = time.time()
+        previous_key, current_key = self.sliding_window_keys(key, expiry, now)
+        previous_weight = 1 - (((now - expiry) / expiry) % 1)
+        # The current window's row lives for two windows so it can serve as
+        # the previous window afterwards. The previous window no longer
+        # receives hits, so reading it without a lock is safe; the current
+        # counter is only bumped if the weighted total stays within limit.
+        row = self._run("""
+            WITH prev AS (
+                SELECT COALESCE((
+                    SELECT count FROM rate_limit_counters
+                     WHERE key = %(previous_key)s AND expires_at > %(now)s
+                ), 0) * %(previous_weight)s AS weighted
+            )
+            INSERT INTO rate_limit_counters AS c (key, count, expires_at)
+            SELECT %(current_key)s, %(amount)s, %(expires_at)s
+              FROM prev
+             WHERE floor(prev.weighted) + %(amount)s <= %(limit)s
+            ON CONFLICT (key) DO UPDATE SET count = c.count + EXCLUDED.count
+             WHERE floor((SELECT weighted FROM prev) + c.count) + EXCLUDED.count <= %(limit)s
+            RETURNING count
+        """, {
+            "previous_key": previous_key,
+            "current_key": current_key,
+            "previous_weight": previous_weight,
+            "amount": amount,
+            "limit": limit,
+            "now": now,
+            "expires_at": (floor(now / expiry) + 2) * expiry,
+        })
+        self._after_write()
+        return row is not None
+
+    def get_sliding_window(self, key: str, expiry: int):
+        now = time.time()
+        previous_key, current_key = self.sliding_window_keys(key, expiry, now)
+        row = self._run("""
+            SELECT COALESCE(MAX(count) FILTER (WHERE key = %(previous_key)s), 0),
+                   COALESCE(MAX(count) FILTER (WHERE key = %(current_key)s), 0)
+              FROM rate_limit_counters
+             WHERE key IN (%(previous_key)s, %(current_key)s) AND expires_at > %(now)s
+        """, {"previous_key": previous_key, "current_key": current_key, "now": now})
+        previous_count, current_count = row
+        if previous_count == 0:
+            previous_ttl = 0.0
+        else:
+            previous_ttl = (1 - (((now - expiry) / expiry) % 1)) * expiry
+        current_ttl = (1 - ((now / expiry) % 1)) * expiry + expiry
+        return previous_count, previous_ttl, current_count, current_ttl
+
+    def clear_sliding_window(self, key: str, expiry: int) -> None:
+        previous_key, current_key = self.sliding_window_keys(key, expiry, time.time())
+        self._run("DELETE FROM rate_limit_counters WHERE key IN (%s, %s)",
+                  (previous_key, current_key), fetch=False)
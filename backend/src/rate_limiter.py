@@ -1,8 +1,33 @@
 """
 Rate limiting configuration for the API
+
+RATE_LIMIT_STORAGE_URI picks where the counters live:
+  memory://            per process (default; only correct with a single worker)
+  dbpool://            Postgres via the shared db_pool (rate_limit_storage.py);
+                       one blocking round trip per limited request, so only
+                       for multiple workers
+  redis://host:6379    Redis or any Redis-compatible server (needs `redis`)
+Anything other than memory:// falls back to in-memory counters if the
+storage becomes unreachable, rather than failing the request.
+
+RATE_LIMIT_ENABLED=false turns every limit off (load tests only).
 """
+import os
+
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 
+import rate_limit_storage  # noqa: F401  registers the dbpool:// scheme
+
+RATE_LIMIT_STORAGE_URI = os.getenv("RATE_LIMIT_STORAGE_URI", "memory://")
+RATE_LIMIT_STRATEGY = os.getenv("RATE_LIMIT_STRATEGY", "sliding-window-counter")
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() != "false"
+
 # Shared rate limiter instance
-limiter = Limiter(key_func=get_remote_address)
+limiter = Limiter(
+    key_func=get_remote_address,
+    storage_uri=RATE_LIMIT_STORAGE_URI,
+    strategy=RATE_LIMIT_STRATEGY,
+    in_memory_fallback_enabled=not RATE_LIMIT_STORAGE_URI.startswith("memory://"),
+    enabled=RATE_LIMIT_ENABLED,
+)
@@ -0,0 +1,280 @@
+"""
+Read-replica routing for read-only endpoints.
+
+With DATABASE_REPLICA_URL set, endpoints that only read open their
+connection with
+
+    async with read_connection("yif.ious", max_lag=2) as conn:
+        ...
+
+and get a connection to the replica when it is safe to serve from it, or to
+the primary otherwise. Without DATABASE_REPLICA_URL every call goes straight
+to async_db.get_async_connection(), so nothing changes.
+
+A read stays on the primary when any of these holds:
+
+  lag          The replica is further behind than the endpoint's staleness
+               budget (max_lag seconds; REPLICA_STALENESS="name=seconds,..."
+               overrides per endpoint). Lag is measured on the replica at
+               most every REPLICA_LAG_CHECK_INTERVAL seconds and shared by
+               all requests in the process.
+  session      The requesting session wrote something the replica has not
+               replayed yet (read-your-writes, below).
+  unavailable  The replica is unreachable, or has not been checked yet. Lag
+               checks run in the background and never delay a request; a
+               read that finds the replica gone falls back to the primary
+               after at most REPLICA_DB_POOL_TIMEOUT.
+
+Read-your-writes: ReplicaSessionMiddleware keys a session on its
+Authorization header (hashed). After any POST/PUT/PATCH/DELETE by a session,
+and before the response goes out, it stores the primary's current WAL
+position for that session in db_session_writes on the primary. A later read
+by the same session, in any worker process, looks that position up. It uses
+the replica only if the replica has replayed past it. Positions older than
+REPLICA_SESSION_TTL seconds are ignored; by then the lag check alone covers
+them.
+
+Routing decisions are counted per endpoint on /metrics
+(db_read_route_total), next to the last measured lag (db_replica_lag_seconds).
+"""
+import asyncio
+import contextvars
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import asynccontextmanager
+
+import psycopg
+
+from async_db import build_pool, get_async_connection, pool_connection
+
+logger = logging.getLogger(__name__)
+
+REPLICA_URL = os.getenv("DATABASE_REPLICA_URL") or None
+LAG_CHECK_INTERVAL = float(os.getenv("REPLICA_LAG_CHECK_INTERVAL", "1"))
+SESSION_TTL = float(os.getenv("REPLICA_SESSION_TTL", "300"))
+
+_WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+_PRUNE_EVERY = 500  # session writes between prunes of db_session_writes
+
+session_var = contextvars.ContextVar("db_session", default=None)
+
+
+def _parse_budgets(spec: str) -> dict:
+    budgets = {}
+    for part in (spec or "").split(","):
+        name, sep, seconds = part.strip().partition("=")
+        if sep and name:
+            budgets[name.strip()] = float(seconds)
+    return budgets
+
+
+_budget_overrides = _parse_budgets(os.getenv("REPLICA_STALENESS", ""))
+
+_pool = None
+_pool_lock = asyncio.Lock()
+_lag_task = None
+_status = {"lag": None, "healthy": False, "checked_at": 0.0}
+_routes = Counter()
+_routes_lock = threading.Lock()
+_session_writes = 0
+
+
+def enabled() -> bool:
+    return REPLICA_URL is not None
+
+
+async def _replica_pool():
+    global _pool
+    if _pool is None:
+        async with _pool_lock:
+            if _pool is None:
+                pool = build_pool(REPLICA_URL, "REPLICA_DB_POOL")
+                await pool.open()
+                _pool = pool
+    return _pool
+
+
+async def close_replica_pool():
+    global _pool
+    if _pool is not None:
+        pool, _pool = _pool, None
+        await pool.close()
+
+
+async def _check_lag():
+    try:
+        pool = await _replica_pool()
+        async with pool_connection(pool) as conn:
+            cursor = conn.cursor()
+            # Fully replayed (or not a standby at all) counts as no lag;
+            # otherwise the age of the last replayed transaction.
+            await cursor.execute("""
+                SELECT CASE
+                    WHEN NOT pg_is_in_recovery()
+                      OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                    ELSE COALESCE(EXTRACT(EPOCH FROM NOW() - pg_last_xact_replay_timestamp()), 0)
+                END::float8 AS lag
+            """)
+            row = await cursor.fetchone()
+        if not _status["healthy"]:
+            logger.info(f"Replica available, lag {row['lag']:.2f}s")
+        _status.update(lag=row["lag"], healthy=True)
+    except Exception as e:
+        if _status["healthy"] or _status["checked_at"] == 0.0:
+            logger.warning(f"Replica unavailable, reading from primary: {e}")
+        _status.update(lag=None, healthy=False)
+    finally:
+        _status["checked_at"] = time.monotonic()
+
+
+def _refresh_lag():
+    """Start a background lag check when the last one is older than
+    LAG_CHECK_INTERVAL. Requests never wait for it; until the first check
+    finishes, reads go to the primary."""
+    global _lag_task
+    if time.monotonic() - _status["checked_at"] < LAG_CHECK_INTERVAL:
+        return
+    if _lag_task is None or _lag_task.done():
+        _lag_task = asyncio.create_task(_check_lag())
+
+
+async def _session_write_lsn(session: str):
+    async with get_async_connection() as conn:
+        cursor = conn.cursor()
+        await cursor.execute(
+            "SELECT lsn::text AS lsn FROM db_session_writes "
+            "WHERE session = %s AND written_at > NOW() - make_interval(secs => %s)",
+            (session, SESSION_TTL),
+        )
+        row = await cursor.fetchone()
+    return row["lsn"] if row else None
+
+
+async def _replayed(conn, lsn: str) -> bool:
+    cursor = conn.cursor()
+    await cursor.execute(
+        "SELECT COALESCE(pg_last_wal_replay_lsn() >= %s::pg_lsn, TRUE) AS ok", (lsn,)
+    )
+    return (await cursor.fetchone())["ok"]
+
+
+def _count(name: str, target: str, reason: str):
+    with _routes_lock:
+        _routes[(name, target, reason)] += 1
+
+
+@asynccontextmanager
+async def read_connection(name: str, max_lag: float):
+    """Connection for a read-only block: replica when fresh enough, else primary.
+
+    name identifies the endpoint for REPLICA_STALENESS and metrics; max_lag is
+    its default staleness budget in seconds.
+    """
+    if REPLICA_URL is None:
+        async with get_async_connection() as conn:
+            yield conn
+        return
+
+    _refresh_lag()
+    budget = _budget_overrides.get(name, max_lag)
+    if not _status["healthy"]:
+        reason = "unavailable"
+    elif _status["lag"] > budget:
+        reason = "lag"
+    else:
+        session = session_var.get()
+        lsn = await _session_write_lsn(session) if session else None
+        entered = False
+        try:
+            pool = await _replica_pool()
+            async with pool_connection(pool) as conn:
+                if lsn is None or await _replayed(conn, lsn):
+                    _count(name, "replica", "ok")
+                    entered = True
+                    yield conn
+                    return
+            reason = "session"
+        except psycopg.OperationalError:
+            if entered:
+                raise
+            # Failed before the block ran: mark the replica down until the
+            # next lag check and serve this read from the primary.
+            _status.update(healthy=False)
+            reason = "unavailable"
+
+    _count(name, "primary", reason)
+    async with get_async_connection() as conn:
+        yield conn
+
+
+async def record_write(session: str):
+    """Store the primary's current WAL position as session's latest write."""
+    global _session_writes
+    _session_writes += 1
+    async with get_async_connection() as conn:
+        cursor = conn.cursor()
+        await cursor.execute("""
+            INSERT INTO db_session_writes (session, lsn, written_at)
+            VALUES (%s, pg_current_wal_lsn(), NOW())
+            ON CONFLICT (session) DO UPDATE
+               SET lsn = EXCLUDED.lsn, written_at = EXCLUDED.written_at
+        """, (session,))
+        if _session_writes % _PRUNE_EVERY == 0:
+            await cursor.execute(
+                "DELETE FROM db_session_writes WHERE written_at < NOW() - make_interval(secs => %s)",
+                (SESSION_TTL,),
+            )
+
+
+def health() -> dict:
+    return {"enabled": enabled(), "healthy": _status["healthy"], "lag": _status["lag"]}
+
+
+def stats() -> dict:
+    """health() plus routing counts keyed by (endpoint, target, reason)."""
+    with _routes_lock:
+        routes = dict(_routes)
+    return {**health(), "routes": routes}
+
+
+class ReplicaSessionMiddleware:
+    """Pure ASGI: identifies the session and records its writes (see module doc)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or REPLICA_URL is None:
+            await self.app(scope, receive, send)
+            return
+
+        session = None
+        for name, value in scope.get("headers", ()):
+            if name == b"authorization":
+                session = hashlib.sha256(value).hexdigest()[:32]
+                break
+        if session is None:
+            await self.app(scope, receive, send)
+            return
+
+        send_wrapped = send
+        if scope["method"] in _WRITE_METHODS:
+            async def send_wrapped(message):
+                # The handler has committed by the time its response starts;
+                # record before the client can see the response and read again.
+                if message["type"] == "http.response.start":
+                    try:
+                        await record_write(session)
+                    except Exception as e:
+                        logger.warning(f"Could not record session write: {e}")
+                await send(message)
+
+        token = session_var.set(session)
+        try:
+            await self.app(scope, receive, send_wrapped)
+        finally:
+            session_var.reset(token)
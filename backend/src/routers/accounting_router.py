@@ -10,20 +10,23 @@ from decimal import Decimal
 from typing import List, Optional
 from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Header
 from pydantic import BaseModel
-import psycopg2
+import psycopg
 from psycopg2.extras import RealDictCursor
 
+from database import get_db_connection
+from async_db import get_async_connection
+from db_pool import PreparedStatement
+from fast_json import json_response
+from replica import read_connection
+import tag_cache
+from tag_cache import catalog_cache
+
 router = APIRouter(prefix="/api/accounting", tags=["accounting"])
 
 ACCOUNTING_PASSWORD = os.getenv("ACCOUNTING_PASSWORD", "")
 LIFE_MGMT_SECRET = os.getenv("LIFE_MGMT_SECRET_KEY", os.getenv("JWT_SECRET_KEY", "fallback-life-mgmt-secret"))
 TOKEN_EXPIRE_DAYS = 30  # 记住设备时的有效期
 TOKEN_EXPIRE_HOURS_SHORT = 8  # 不记住时的有效期
-DATABASE_URL = os.getenv("DATABASE_URL")
-
-
-def get_db_connection():
-    return psycopg2.connect(DATABASE_URL)
 
 
 def generate_dup_hash(date: str, description: str, amount: float) -> str:
@@ -32,6 +35,13 @@ def generate_dup_hash(date: str, description: str, amount: float) -> str:
     return hashlib.md5(content.encode()).hexdigest()
 
 
+# Runs once per CSV line during preview and import.
+_FIND_DUPLICATE = PreparedStatement(
+    "accounting_find_duplicate",
+    "SELECT id, date, description, amount FROM hoshipu_accounting_transactions WHERE dup_hash = %s",
+)
+
+
 # ========== Schemas ==========
 
 class VerifyRequest(BaseModel):
@@ -137,77 +147,95 @@ async def verify_token(authorization: Optional[str] = Header(None)):
 
 # ========== Categories ==========
 
+def _load_categories(cursor=None) -> list:
+    if cursor is None:
+        conn = get_db_connection()
+        try:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                return _load_categories(cur)
+        finally:
+            conn.close()
+    cursor.execute("SELECT * FROM hoshipu_accounting_categories ORDER BY id")
+    return [dict(row) for row in cursor.fetchall()]
+
+
+def _cached_categories(cursor=None) -> list:
+    """All categories via the catalog cache (shared, treat as read-only).
+    Loads with cursor on a miss, or with a connection of its own."""
+    return catalog_cache.get_or_load(
+        "accounting.categories", ("accounting.categories",), lambda: _load_categories(cursor)
+    )
+
+
+async def _load_categories_async() -> list:
+    async with get_async_connection() as conn:
+        cursor = conn.cursor()
+        await cursor.execute("SELECT * FROM hoshipu_accounting_categories ORDER BY id")
+        return await cursor.fetchall()
+
+
+async def _cached_categories_async() -> list:
+    """_cached_categories() for async handlers: a miss loads through async_db
+    instead of blocking the event loop on psycopg2."""
+    return await catalog_cache.get_or_load_async(
+        "accounting.categories", ("accounting.categories",), _load_categories_async
+    )
+
+
 @router.get("/categories")
 async def get_categories():
     """Get all categories with keywords"""
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    try:
-        cursor.execute("SELECT * FROM hoshipu_accounting_categories ORDER BY id")
-        categories = cursor.fetchall()
-        return {"success": True, "categories": categories}
-    finally:
-        cursor.close()
-        conn.close()
+    return {"success": True, "categories": await _cached_categories_async()}
 
 
 @router.post("/categories")
 async def create_category(data: CategoryCreate):
     """Create a new category"""
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
     try:
-        cursor.execute(
-            """INSERT INTO hoshipu_accounting_categories (category, keywords)
-               VALUES (%s, %s) RETURNING *""",
-            (data.category, json.dumps(data.keywords))
-        )
-        category = cursor.fetchone()
-        conn.commit()
-        return {"success": True, "category": category}
-    except psycopg2.errors.UniqueViolation:
-        conn.rollback()
+        async with get_async_connection() as conn:
+            cursor = conn.cursor()
+            await cursor.execute(
+                """INSERT INTO hoshipu_accounting_categories (category, keywords)
+                   VALUES (%s, %s) RETURNING *""",
+                (data.category, json.dumps(data.keywords))
+            )
+            category = await cursor.fetchone()
+            await tag_cache.notify_async(cursor, "accounting.categories")
+    except psycopg.errors.UniqueViolation:
         raise HTTPException(status_code=400, detail="Category already exists")
-    finally:
-        cursor.close()
-        conn.close()
+    tag_cache.invalidate_local("accounting.categories")
+    return {"success": True, "category": category}
 
 
 @router.put("/categories/{category_id}")
 async def update_category(category_id: int, data: CategoryUpdate):
     """Update category keywords"""
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    try:
-        cursor.execute(
+    async with get_async_connection() as conn:
+        cursor = conn.cursor()
+        await cursor.execute(
             """UPDATE hoshipu_accounting_categories
                SET keywords = %s WHERE id = %s RETURNING *""",
             (json.dumps(data.keywords), category_id)
         )
-        category = cursor.fetchone()
+        category = await cursor.fetchone()
         if not category:
             raise HTTPException(status_code=404, detail="Category not found")
-        conn.commit()
-        return {"success": True, "category": category}
-    finally:
-        cursor.close()
-        conn.close()
+        await tag_cache.notify_async(cursor, "accounting.categories")
+    tag_cache.invalidate_local("accounting.categories")
+    return {"success": True, "category": category}
 
 
 @router.delete("/categories/{category_id}")
 async def delete_category(category_id: int):
     """Delete a category"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    try:
-        cursor.execute("DELETE FROM hoshipu_accounting_categories WHERE id = %s", (category_id,))
+    async with get_async_connection() as conn:
+        cursor = conn.cursor()
+        await cursor.execute("DELETE FROM hoshipu_accounting_categories WHERE id = %s", (category_id,))
         if cursor.rowcount == 0:
             raise HTTPException(status_code=404, detail="Category not found")
-        conn.commit()
-        return {"success": True, "message": "Category deleted"}
-    finally:
-        cursor.close()
-        conn.close()
+        await tag_cache.notify_async(cursor, "accounting.categories")
+    tag_cache.invalidate_local("accounting.categories")
+    return {"success": True, "message": "Category deleted"}
 
 
 # ========== Transactions ==========
@@ -259,13 +287,7 @@ async def get_transactions(
         cursor.execute(query, params)
         transactions = cursor.fetchall()
 
-        # Convert Decimal to float for JSON serialization
-        for t in transactions:
-            t['amount'] = float(t['amount'])
-            t['exchange_rate'] = float(t['exchange_rate'])
-            t['date'] = t['date'].isoformat() if t['date'] else None
-
-        return {"success": True, "transactions": transactions, "total": total}
+        return json_response({"success": True, "transactions": transactions, "total": total})
     finally:
         cursor.close()
         conn.close()
@@ -280,10 +302,7 @@ async def create_transaction(data: TransactionCreate):
         dup_hash = generate_dup_hash(data.date, data.description, data.amount)
 
         # Check for duplicates
-        cursor.execute(
-            "SELECT id, date, description, amount FROM hoshipu_accounting_transactions WHERE dup_hash = %s",
-            (dup_hash,)
-        )
+        cursor.execute_prepared(_FIND_DUPLICATE, (dup_hash,))
         duplicate = cursor.fetchone()
 
         cursor.execute(
@@ -440,8 +459,7 @@ async def preview_csv(
         csv_reader = csv.reader(io.StringIO(text_content))
         rows = list(csv_reader)
 
-        cursor.execute("SELECT * FROM hoshipu_accounting_categories")
-        categories = cursor.fetchall()
+        categories = _cached_categories(cursor)
 
         preview_items = []
         errors = []
@@ -469,10 +487,7 @@ async def preview_csv(
                 dup_hash = generate_dup_hash(date_str, cleaned_desc, amount)
 
                 # Check for duplicates
-                cursor.execute(
-                    "SELECT id FROM hoshipu_accounting_transactions WHERE dup_hash = %s",
-                    (dup_hash,)
-                )
+                cursor.execute_prepared(_FIND_DUPLICATE, (dup_hash,))
                 is_duplicate = cursor.fetchone() is not None
 
                 # Auto-categorize
@@ -525,8 +540,7 @@ async def import_csv(
         rows = list(csv_reader)
 
         # Get categories for auto-categorization
-        cursor.execute("SELECT * FROM hoshipu_accounting_categories")
-        categories = cursor.fetchall()
+        categories = _cached_categories(cursor)
 
         imported = 0
         duplicates = []
@@ -560,10 +574,7 @@ async def import_csv(
                 dup_hash = generate_dup_hash(date_str, cleaned_desc, amount)
 
                 # Check for duplicates
-                cursor.execute(
-                    "SELECT id, date, description, amount FROM hoshipu_accounting_transactions WHERE dup_hash = %s",
-                    (dup_hash,)
-                )
+                cursor.execute_prepared(_FIND_DUPLICATE, (dup_hash,))
                 existing = cursor.fetchone()
 
                 if existing:
@@ -618,9 +629,8 @@ async def get_stats(
     end_date: Optional[str] = None
 ):
     """Get spending statistics"""
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    try:
+    async with read_connection("accounting.stats", max_lag=30) as conn:
+        cursor = conn.cursor()
         params = []
         date_filter = ""
 
@@ -632,54 +642,48 @@ async def get_stats(
             params.append(end_date)
 
         # Total income and expense
-        cursor.execute(f"""
+        await cursor.execute(f"""
             SELECT
-                SUM(CASE WHEN amount > 0 THEN amount ELSE 0 END) as total_income,
-                SUM(CASE WHEN amount < 0 THEN amount ELSE 0 END) as total_expense,
+                COALESCE(SUM(CASE WHEN amount > 0 THEN amount ELSE 0 END), 0)::float8 as total_income,
+                COALESCE(SUM(CASE WHEN amount < 0 THEN amount ELSE 0 END), 0)::float8 as total_expense,
+                COALESCE(SUM(amount), 0)::float8 as net,
                 COUNT(*) as total_count
             FROM hoshipu_accounting_transactions
             WHERE 1=1 {date_filter}
         """, params)
-        totals = cursor.fetchone()
+        totals = await cursor.fetchone()
 
         # By category
-        cursor.execute(f"""
-            SELECT category, SUM(amount) as total, COUNT(*) as count
+        await cursor.execute(f"""
+            SELECT category, COALESCE(SUM(amount), 0)::float8 as total, COUNT(*) as count
             FROM hoshipu_accounting_transactions
             WHERE 1=1 {date_filter}
             GROUP BY category
             ORDER BY total ASC
         """, params)
-        by_category = cursor.fetchall()
+        by_category = await cursor.fetchall()
 
         # By source
-        cursor.execute(f"""
-            SELECT source, SUM(amount) as total, COUNT(*) as count
+        await cursor.execute(f"""
+            SELECT source, COALESCE(SUM(amount), 0)::float8 as total, COUNT(*) as count
             FROM hoshipu_accounting_transactions
             WHERE 1=1 {date_filter}
             GROUP BY source
             ORDER BY total ASC
         """, params)
-        by_source = cursor.fetchall()
-
-        # Convert Decimals
-        for item in by_category + by_source:
-            item['total'] = float(item['total']) if item['total'] else 0
+        by_source = await cursor.fetchall()
 
-        return {
-            "success": True,
-            "totals": {
-                "income": float(totals['total_income'] or 0),
-                "expense": float(totals['total_expense'] or 0),
-                "net": float((totals['total_income'] or 0) + (totals['total_expense'] or 0)),
-                "count": totals['total_count']
-            },
-            "by_category": by_category,
-            "by_source": by_source
-        }
-    finally:
-        cursor.close()
-        conn.close()
+    return json_response({
+        "success": True,
+        "totals": {
+            "income": totals['total_income'],
+            "expense": totals['total_expense'],
+            "net": totals['net'],
+            "count": totals['total_count']
+        },
+        "by_category": by_category,
+        "by_source": by_source
+    })
 
 
 # ========== Notes (备忘录) ==========
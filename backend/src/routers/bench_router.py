@@ -5,7 +5,9 @@ Mirrors the conventions of yif_router.py:
   - bcrypt + JWT (HS256) for human users
   - shared-secret header for workers (x-embodybench-worker-token)
   - rate-limited /login
-  - psycopg2 + RealDictCursor (matches the rest of the project's DB pattern)
+  - psycopg2 + RealDictCursor (matches the rest of the project's DB pattern);
+    the worker hot path, run submission and run views use async_db instead
+    so they don't block the event loop
   - Reuses get_db_connection from database and limiter from rate_limiter
 
 This file is intentionally a single home for the embodybench module so the
@@ -16,11 +18,11 @@ data-flow stays easy to follow:
              episodes/state) + admin GET /workers + heartbeat reclaim
 """
 
-from fastapi import APIRouter, HTTPException, Depends, Header, Request, Path
+from fastapi import APIRouter, HTTPException, Depends, Header, Request, Response, Path
 from pydantic import BaseModel, EmailStr, Field, HttpUrl
 import psycopg2
 from psycopg2.extras import RealDictCursor, Json
-from passlib.context import CryptContext
+from psycopg.types.json import Jsonb
 from jose import JWTError, jwt
 from datetime import datetime, timedelta, timezone
 from typing import Optional, Literal, Any
@@ -31,6 +33,14 @@ import os
 from cryptography.fernet import Fernet, InvalidToken
 
 from database import get_db_connection
+from async_db import get_async_connection
+from replica import read_connection
+from auth_context import get_bench_user
+from crypto_pool import hash_password, run_crypto, verify_password
+from fast_json import dumps as _fast_json_dumps, json_response
+from conditional_get import (
+    data_version_async, etag_matches, make_etag, not_modified, set_etag, static_etag,
+)
 from rate_limiter import limiter
 
 # Local imports for benchmark catalogs — sibling to routers/
@@ -44,7 +54,6 @@ import benchmarks as _benchmarks
 
 router = APIRouter(prefix="/api/bench", tags=["embodybench"])
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 480  # 8h, same as YIF — used when remember=False
 REMEMBER_TOKEN_EXPIRE_MINUTES = 60 * 24 * 30  # 30 days — used when remember=True
@@ -111,14 +120,6 @@ def _get_secret_key() -> str:
     return key
 
 
-def _verify_password(plain: str, hashed: str) -> bool:
-    return pwd_context.verify(plain, hashed)
-
-
-def _hash_password(plain: str) -> str:
-    return pwd_context.hash(plain)
-
-
 def _create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + (expires_delta or timedelta(minutes=15))
@@ -149,22 +150,12 @@ def verify_bench_user(authorization: Optional[str] = Header(None)) -> int:
 
 def require_admin(user_id: int = Depends(verify_bench_user)) -> int:
     """Dependency layered on top of verify_bench_user that also checks role=admin."""
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    try:
-        cursor.execute(
-            "SELECT role, is_active FROM embodybench_users WHERE id = %s",
-            (user_id,),
-        )
-        row = cursor.fetchone()
-        if not row or not row["is_active"]:
-            raise HTTPException(status_code=401, detail="User not found or inactive")
-        if row["role"] != "admin":
-            raise HTTPException(status_code=403, detail="Admin role required")
-        return user_id
-    finally:
-        cursor.close()
-        conn.close()
+    user = get_bench_user(user_id)
+    if not user:
+        raise HTTPException(status_code=401, detail="User not found or inactive")
+    if user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admin role required")
+    return user_id
 
 
 # ---------------------------------------------------------------------------
@@ -226,7 +217,7 @@ async def login(request: Request, body: LoginRequest):
         # Constant-time: always run bcrypt even on user-not-found.
         dummy_hash = "$2b$12$KKKKKKKKKKKKKKKKKKKKK.uJQ.8YcvGJYY5Y5Y5Y5Y5Y5Y5Y5Y5Y5K"
         hash_to_verify = user["password_hash"] if user else dummy_hash
-        password_valid = _verify_password(body.password, hash_to_verify)
+        password_valid = await verify_password(body.password, hash_to_verify)
 
         if not user or not password_valid:
             raise HTTPException(status_code=401, detail="Invalid email or password")
@@ -256,29 +247,15 @@ async def login(request: Request, body: LoginRequest):
 @router.get("/auth/me", response_model=UserOut)
 async def me(user_id: int = Depends(verify_bench_user)):
     """Return the current user — used by the frontend's BenchAuthProvider to verify on mount."""
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    try:
-        cursor.execute(
-            """
-            SELECT id, email, display_name, role, is_active
-              FROM embodybench_users
-             WHERE id = %s AND is_active = TRUE
-            """,
-            (user_id,),
-        )
-        user = cursor.fetchone()
-        if not user:
-            raise HTTPException(status_code=401, detail="User not found or inactive")
-        return {
-            "id": user["id"],
-            "email": user["email"],
-            "display_name": user["display_name"],
-            "role": user["role"],
-        }
-    finally:
-        cursor.close()
-        conn.close()
+    user = get_bench_user(user_id)
+    if not user:
+        raise HTTPException(status_code=401, detail="User not found or inactive")
+    return {
+        "id": user["id"],
+        "email": user["email"],
+        "display_name": user["display_name"],
+        "role": user["role"],
+    }
 
 
 @router.post("/auth/change-password")
@@ -300,12 +277,12 @@ async def change_password(
             (user_id,),
         )
         row = cursor.fetchone()
-        if not row or not _verify_password(body.current_password, row["password_hash"]):
+        if not row or not await verify_password(body.current_password, row["password_hash"]):
             raise HTTPException(status_code=401, detail="Current password incorrect")
 
         cursor.execute(
             "UPDATE embodybench_users SET password_hash = %s, updated_at = NOW() WHERE id = %s",
-            (_hash_password(body.new_password), user_id),
+            (await hash_password(body.new_password), user_id),
         )
         conn.commit()
         return {"ok": True}
@@ -329,6 +306,8 @@ async def admin_create_user(
     if len(body.password) < 8:
         raise HTTPException(status_code=400, detail="password must be >=8 characters")
 
+    # Hash before taking a pooled connection so it isn't held during bcrypt.
+    password_hash = await hash_password(body.password)
     conn = get_db_connection()
     cursor = conn.cursor(cursor_factory=RealDictCursor)
     try:
@@ -338,7 +317,7 @@ async def admin_create_user(
             VALUES (%s, %s, %s, %s)
             RETURNING id, email, display_name, role
             """,
-            (body.email, _hash_password(body.password), body.display_name, body.role),
+            (body.email, password_hash, body.display_name, body.role),
         )
         new_user = cursor.fetchone()
         conn.commit()
@@ -422,10 +401,18 @@ class RunSummary(BaseModel):
     episodes_done: int
 
 
+_BENCHMARKS_ETAG = static_etag(_benchmarks.all_as_list())
+# The catalog only changes with a deploy: serialize it once.
+_BENCHMARKS_BODY = _fast_json_dumps({"benchmarks": _benchmarks.all_as_list()})
+
+
 @router.get("/benchmarks")
-async def list_benchmarks():
+async def list_benchmarks(request: Request, response: Response):
     """Static catalog of benchmarks the platform supports (no auth needed)."""
-    return {"benchmarks": _benchmarks.all_as_list()}
+    if etag_matches(request, _BENCHMARKS_ETAG):
+        return not_modified(_BENCHMARKS_ETAG)
+    set_etag(response, _BENCHMARKS_ETAG)
+    return Response(_BENCHMARKS_BODY, media_type="application/json", headers=dict(response.headers))
 
 
 @router.post("/runs", response_model=SubmitRunResponse)
@@ -475,76 +462,73 @@ async def submit_run(body: SubmitRunRequest, user_id: int = Depends(verify_bench
     # Encrypt the user-supplied bearer token before persisting.
     api_auth_stored: Optional[dict] = None
     if body.api_auth and body.api_auth.scheme != "none" and body.api_auth.token:
-        api_auth_stored = _encrypt_api_auth(body.api_auth.model_dump())
+        api_auth_stored = await run_crypto(_encrypt_api_auth, body.api_auth.model_dump())
 
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    try:
-        # 1. Insert the run row.
-        cursor.execute(
-            """
-            INSERT INTO embodybench_runs
-                (user_id, benchmark, benchmark_version, config, eval_mode,
-                 api_endpoint_url, api_auth, state, notes)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, 'queued', %s)
-            RETURNING id;
-            """,
-            (
-                user_id,
-                body.benchmark,
-                bench_mod.VERSION,
-                Json(body.config.model_dump()),
-                body.eval_mode,
-                str(body.api_endpoint_url),
-                Json(api_auth_stored) if api_auth_stored else None,
-                body.notes,
-            ),
-        )
-        run_id = cursor.fetchone()["id"]
-
-        # 2. Partition into jobs.
-        jobs_queued = 0
-        episodes_total = 0
-        for task_name in body.config.tasks:
-            tc_for_task = _task_config_for(task_name)
-            n = body.config.episodes_per_task
-            num_chunks = ceil(n / chunk_size)
-            for i in range(num_chunks):
-                ep_in_chunk = chunk_size if (i + 1) * chunk_size <= n else (n - i * chunk_size)
-                cursor.execute(
-                    """
-                    INSERT INTO embodybench_jobs
-                        (run_id, task_name, task_config, seed_offset, n_episodes,
-                         state, requires_caps)
-                    VALUES (%s, %s, %s, %s, %s, 'queued', %s);
-                    """,
-                    (
+    async with get_async_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            # 1. Insert the run row.
+            await cursor.execute(
+                """
+                INSERT INTO embodybench_runs
+                    (user_id, benchmark, benchmark_version, config, eval_mode,
+                     api_endpoint_url, api_auth, state, notes)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, 'queued', %s)
+                RETURNING id;
+                """,
+                (
+                    user_id,
+                    body.benchmark,
+                    bench_mod.VERSION,
+                    Jsonb(body.config.model_dump()),
+                    body.eval_mode,
+                    str(body.api_endpoint_url),
+                    Jsonb(api_auth_stored) if api_auth_stored else None,
+                    body.notes,
+                ),
+            )
+            run_id = (await cursor.fetchone())["id"]
+
+            # 2. Partition into jobs.
+            jobs = []
+            episodes_total = 0
+            for task_name in body.config.tasks:
+                tc_for_task = _task_config_for(task_name)
+                n = body.config.episodes_per_task
+                num_chunks = ceil(n / chunk_size)
+                for i in range(num_chunks):
+                    ep_in_chunk = chunk_size if (i + 1) * chunk_size <= n else (n - i * chunk_size)
+                    jobs.append((
                         run_id,
                         task_name,
                         tc_for_task,
                         i,
                         ep_in_chunk,
-                        Json({"benchmark": body.benchmark}),
-                    ),
-                )
-                jobs_queued += 1
-                episodes_total += ep_in_chunk
+                        Jsonb({"benchmark": body.benchmark}),
+                    ))
+                    episodes_total += ep_in_chunk
 
-        conn.commit()
-        return {
-            "run_id": str(run_id),
-            "jobs_queued": jobs_queued,
-            "episodes_total": episodes_total,
-        }
-    except HTTPException:
-        conn.rollback()
-        raise
-    except Exception as e:
-        conn.rollback()
-        raise HTTPException(status_code=500, detail=f"Failed to create run: {e}")
-    finally:
-        cursor.close()
-        conn.close()
+            # executemany pipelines the rows: one round trip however many
+            # chunks there are, instead of one per job.
+            await cursor.executemany(
+                """
+                INSERT INTO embodybench_jobs
+                    (run_id, task_name, task_config, seed_offset, n_episodes,
+                     state, requires_caps)
+                VALUES (%s, %s, %s, %s, %s, 'queued', %s);
+                """,
+                jobs,
+            )
+
+            return {
+                "run_id": str(run_id),
+                "jobs_queued": len(jobs),
+                "episodes_total": episodes_total,
+            }
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to create run: {e}")
 
 
 def _run_row_to_summary(row: dict, jobs_total: int, jobs_done: int,
@@ -567,12 +551,17 @@ def _run_row_to_summary(row: dict, jobs_total: int, jobs_done: int,
 
 
 @router.get("/runs")
-async def list_runs(user_id: int = Depends(verify_bench_user)):
+async def list_runs(request: Request, response: Response,
+                    user_id: int = Depends(verify_bench_user)):
     """User's runs, most recent first, with aggregate job/episode counts."""
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    try:
-        cursor.execute(
+    async with read_connection("bench.runs", max_lag=5) as conn:
+        cursor = conn.cursor()
+        version = await data_version_async(cursor, "embodybench_runs")
+        etag = make_etag("embodybench.runs", version, user_id)
+        if etag and etag_matches(request, etag):
+            return not_modified(etag)
+        set_etag(response, etag)
+        await cursor.execute(
             """
             SELECT r.*,
               COUNT(j.id) AS jobs_total,
@@ -600,29 +589,25 @@ async def list_runs(user_id: int = Depends(verify_bench_user)):
                     r, r["jobs_total"], r["jobs_done"], int(r["episodes_total"]),
                     int(r["episodes_done"]),
                 )
-                for r in cursor.fetchall()
+                for r in await cursor.fetchall()
             ]
         }
-    finally:
-        cursor.close()
-        conn.close()
 
 
 @router.get("/runs/{run_id}")
 async def get_run(run_id: str = Path(...), user_id: int = Depends(verify_bench_user)):
     """Full run detail + per-task success-rate aggregate."""
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    try:
-        cursor.execute(
+    async with read_connection("bench.run", max_lag=5) as conn:
+        cursor = conn.cursor()
+        await cursor.execute(
             "SELECT * FROM embodybench_runs WHERE id = %s AND user_id = %s",
             (run_id, user_id),
         )
-        run = cursor.fetchone()
+        run = await cursor.fetchone()
         if not run:
             raise HTTPException(status_code=404, detail="Run not found")
 
-        cursor.execute(
+        await cursor.execute(
             """
             SELECT
               COUNT(*) AS jobs_total,
@@ -636,9 +621,9 @@ async def get_run(run_id: str = Path(...), user_id: int = Depends(verify_bench_u
             """,
             (run_id,),
         )
-        agg = cursor.fetchone()
+        agg = await cursor.fetchone()
 
-        cursor.execute(
+        await cursor.execute(
             """
             SELECT task_name,
               COUNT(*) AS attempted,
@@ -650,7 +635,7 @@ async def get_run(run_id: str = Path(...), user_id: int = Depends(verify_bench_u
             """,
             (run_id,),
         )
-        per_task = cursor.fetchall()
+        per_task = await cursor.fetchall()
 
         summary = _run_row_to_summary(
             run, int(agg["jobs_total"]), int(agg["jobs_done"]),
@@ -668,9 +653,6 @@ async def get_run(run_id: str = Path(...), user_id: int = Depends(verify_bench_u
             for pt in per_task
         ]
         return summary
-    finally:
-        cursor.close()
-        conn.close()
 
 
 @router.get("/runs/{run_id}/jobs")
@@ -933,20 +915,15 @@ async def register_worker(
 @router.post("/workers/{worker_id}/heartbeat")
 async def heartbeat(worker_id: str = Path(...), _: bool = Depends(verify_worker_token)):
     """Refresh last_heartbeat. 404 if the worker was already reclaimed/deleted."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    try:
-        cursor.execute(
+    async with get_async_connection() as conn:
+        cursor = conn.cursor()
+        await cursor.execute(
             "UPDATE embodybench_workers SET last_heartbeat = NOW() WHERE id = %s",
             (worker_id,),
         )
         if cursor.rowcount == 0:
             raise HTTPException(status_code=404, detail="Worker not registered")
-        conn.commit()
         return {"ok": True}
-    finally:
-        cursor.close()
-        conn.close()
 
 
 @router.post("/workers/{worker_id}/claim")
@@ -966,19 +943,21 @@ async def claim_job(
         from fastapi import Response
         return Response(status_code=204)
 
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    try:
+    async with get_async_connection() as conn:
+        cursor = conn.cursor()
         # Refresh heartbeat opportunistically — claim implies the worker is alive.
-        cursor.execute(
+        await cursor.execute(
             "UPDATE embodybench_workers SET last_heartbeat = NOW() WHERE id = %s "
             "RETURNING id",
             (worker_id,),
+            prepare=True,
         )
-        if cursor.fetchone() is None:
+        if await cursor.fetchone() is None:
             raise HTTPException(status_code=404, detail="Worker not registered")
 
-        cursor.execute(
+        # Every worker polls this; prepared, it is parsed and planned once
+        # per pooled connection instead of on every poll.
+        await cursor.execute(
             """
             WITH next AS (
               SELECT j.id FROM embodybench_jobs j
@@ -999,33 +978,33 @@ async def claim_job(
                       j.n_episodes, j.attempt_count;
             """,
             (body.caps.benchmarks, worker_id),
+            prepare=True,
         )
-        job_row = cursor.fetchone()
+        job_row = await cursor.fetchone()
         if not job_row:
             # Also promote the run from queued → running on the first claim.
             from fastapi import Response
-            conn.commit()
             return Response(status_code=204)
 
         # Pull the run for benchmark, version, endpoint, api_auth, and config.
-        cursor.execute(
+        await cursor.execute(
             """
             SELECT benchmark, benchmark_version, api_endpoint_url, api_auth, state, config
               FROM embodybench_runs WHERE id = %s;
             """,
             (job_row["run_id"],),
+            prepare=True,
         )
-        run_row = cursor.fetchone()
+        run_row = await cursor.fetchone()
         if run_row["state"] == "queued":
-            cursor.execute(
+            await cursor.execute(
                 "UPDATE embodybench_runs SET state = 'running', started_at = NOW() "
                 "WHERE id = %s AND state = 'queued';",
                 (job_row["run_id"],),
             )
-        conn.commit()
 
         api_auth_decrypted = (
-            _decrypt_api_auth(run_row["api_auth"]) if run_row["api_auth"] else None
+            await run_crypto(_decrypt_api_auth, run_row["api_auth"]) if run_row["api_auth"] else None
         )
 
         # The worker needs the action_space (and a few other run-level fields)
@@ -1047,19 +1026,16 @@ async def claim_job(
             "action_space": action_space,
             "attempt_count": job_row["attempt_count"],
         }
-    finally:
-        cursor.close()
-        conn.close()
 
 
-def _check_worker_owns_job(cursor, job_id: str, worker_id: str) -> dict:
+async def _check_worker_owns_job(cursor, job_id: str, worker_id: str) -> dict:
     """Returns the job row if worker_id matches, else raises 409."""
-    cursor.execute(
+    await cursor.execute(
         "SELECT id, run_id, worker_id, state, n_episodes "
         "FROM embodybench_jobs WHERE id = %s",
         (job_id,),
     )
-    row = cursor.fetchone()
+    row = await cursor.fetchone()
     if not row:
         raise HTTPException(status_code=404, detail="Job not found")
     if str(row["worker_id"]) != str(worker_id):
@@ -1076,13 +1052,12 @@ async def job_progress(
     _: bool = Depends(verify_worker_token),
 ):
     """Worker reports mid-job progress. Bumps state to 'running' on first call."""
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    try:
-        row = _check_worker_owns_job(cursor, job_id, body.worker_id)
+    async with get_async_connection() as conn:
+        cursor = conn.cursor()
+        row = await _check_worker_owns_job(cursor, job_id, body.worker_id)
         if row["state"] not in ("claimed", "running"):
             raise HTTPException(status_code=409, detail=f"Job is {row['state']}, not claimed/running")
-        cursor.execute(
+        await cursor.execute(
             """
             UPDATE embodybench_jobs
                SET state = CASE WHEN state = 'claimed' THEN 'running' ELSE state END,
@@ -1091,18 +1066,14 @@ async def job_progress(
              WHERE id = %s;
             """,
             (
-                Json({
+                Jsonb({
                     "episodes_done": body.episodes_done,
                     "episodes_succeeded": body.episodes_succeeded,
                 }),
                 job_id,
             ),
         )
-        conn.commit()
         return {"ok": True}
-    finally:
-        cursor.close()
-        conn.close()
 
 
 @router.post("/jobs/{job_id}/episodes")
@@ -1115,45 +1086,42 @@ async def job_episodes_batch(
     if not body.episodes:
         return {"inserted": 0}
 
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    try:
-        row = _check_worker_owns_job(cursor, job_id, body.worker_id)
+    async with get_async_connection() as conn:
+        cursor = conn.cursor()
+        row = await _check_worker_owns_job(cursor, job_id, body.worker_id)
 
         # Lookup task_name + run_id once.
-        cursor.execute(
+        await cursor.execute(
             "SELECT task_name, run_id FROM embodybench_jobs WHERE id = %s",
             (job_id,),
         )
-        meta = cursor.fetchone()
+        meta = await cursor.fetchone()
         task_name = meta["task_name"]
         run_id = meta["run_id"]
 
-        inserted = 0
-        for ep in body.episodes:
-            cursor.execute(
-                """
-                INSERT INTO embodybench_episodes
-                    (job_id, run_id, task_name, seed_used, episode_idx,
-                     outcome, trajectory_pointer)
-                VALUES (%s, %s, %s, %s, %s, %s, %s);
-                """,
+        # executemany pipelines the whole batch in one round trip.
+        await cursor.executemany(
+            """
+            INSERT INTO embodybench_episodes
+                (job_id, run_id, task_name, seed_used, episode_idx,
+                 outcome, trajectory_pointer)
+            VALUES (%s, %s, %s, %s, %s, %s, %s);
+            """,
+            [
                 (
                     job_id,
                     run_id,
                     task_name,
                     ep.seed_used,
                     ep.episode_idx,
-                    Json(ep.outcome),
+                    Jsonb(ep.outcome),
                     ep.trajectory_pointer,
-                ),
-            )
-            inserted += 1
-        conn.commit()
+                )
+                for ep in body.episodes
+            ],
+        )
+        inserted = len(body.episodes)
         return {"inserted": inserted}
-    finally:
-        cursor.close()
-        conn.close()
 
 
 # Failure reasons we auto-retry on (transient / environment-level).
@@ -1184,24 +1152,23 @@ async def job_state(
     the same one later) picks it up. attempt_count was already incremented
     by the claim, so this just resets the job-level state.
     """
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    try:
-        row = _check_worker_owns_job(cursor, job_id, body.worker_id)
+    async with get_async_connection() as conn:
+        cursor = conn.cursor()
+        row = await _check_worker_owns_job(cursor, job_id, body.worker_id)
         if row["state"] not in ("claimed", "running"):
             raise HTTPException(status_code=409, detail=f"Job is {row['state']}")
 
         # Decide: terminal-failed, or requeue?
         requeued = False
         if body.state == "failed":
-            cursor.execute(
+            await cursor.execute(
                 "SELECT attempt_count FROM embodybench_jobs WHERE id = %s",
                 (job_id,),
             )
-            attempt_count = cursor.fetchone()["attempt_count"]
+            attempt_count = (await cursor.fetchone())["attempt_count"]
             reason = (body.failure_reason or "").strip().lower()
             if reason in _RETRIABLE_FAILURE_REASONS and attempt_count < _MAX_JOB_ATTEMPTS:
-                cursor.execute(
+                await cursor.execute(
                     """
                     UPDATE embodybench_jobs
                        SET state = 'queued',
@@ -1217,7 +1184,7 @@ async def job_state(
                 requeued = True
 
         if not requeued:
-            cursor.execute(
+            await cursor.execute(
                 """
                 UPDATE embodybench_jobs
                    SET state = %s,
@@ -1231,7 +1198,7 @@ async def job_state(
         # Check if run can be closed (only if we didn't requeue).
         run_id = row["run_id"]
         if not requeued:
-            cursor.execute(
+            await cursor.execute(
                 """
                 SELECT
                   COUNT(*) FILTER (WHERE state NOT IN ('succeeded','failed','cancelled'))
@@ -1242,21 +1209,17 @@ async def job_state(
                 """,
                 (run_id,),
             )
-            agg = cursor.fetchone()
+            agg = await cursor.fetchone()
             if agg["non_terminal"] == 0:
                 # Run done. Mark failed if any job failed, else completed.
                 final = "failed" if agg["failed"] > 0 else "completed"
-                cursor.execute(
+                await cursor.execute(
                     "UPDATE embodybench_runs SET state = %s, finished_at = NOW() "
                     "WHERE id = %s AND state IN ('queued','running');",
                     (final, run_id),
                 )
 
-        conn.commit()
         return {"ok": True, "requeued": requeued}
-    finally:
-        cursor.close()
-        conn.close()
 
 
 # ---------------------------------------------------------------------------
@@ -1282,7 +1245,8 @@ async def admin_list_workers(_: int = Depends(require_admin)):
             SELECT
               w.id, w.hostname, w.region, w.cluster_kind, w.capabilities,
               w.state, w.max_concurrent, w.registered_at, w.last_heartbeat,
-              EXTRACT(EPOCH FROM (NOW() - w.last_heartbeat)) AS heartbeat_age_sec,
+              COALESCE(FLOOR(EXTRACT(EPOCH FROM (NOW() - w.last_heartbeat))), 0)::int
+                  AS heartbeat_age_sec,
               (
                 SELECT j.id FROM embodybench_jobs j
                  WHERE j.worker_id = w.id
@@ -1296,7 +1260,7 @@ async def admin_list_workers(_: int = Depends(require_admin)):
                  LIMIT 1
               ) AS running_task_name,
               (
-                SELECT COUNT(*) FROM embodybench_jobs j
+                SELECT COUNT(*)::int FROM embodybench_jobs j
                  WHERE j.worker_id = w.id
                    AND j.state = 'failed'
                    AND j.finished_at > NOW() - INTERVAL '10 minutes'
@@ -1306,28 +1270,18 @@ async def admin_list_workers(_: int = Depends(require_admin)):
             LIMIT 200;
             """,
         )
-        results = []
-        for r in cursor.fetchall():
-            heartbeat_age = int(r["heartbeat_age_sec"] or 0)
-            recent_failures = int(r["recent_failures_10min"] or 0)
-            running = r["running_job_id"] is not None
-            if heartbeat_age > _RECLAIM_AFTER_SEC:
-                derived = "offline"
-            elif recent_failures >= 3:
-                derived = "stressed"
-            elif running:
-                derived = "busy"
+        workers = cursor.fetchall()
+        for r in workers:
+            if r["heartbeat_age_sec"] > _RECLAIM_AFTER_SEC:
+                r["derived_status"] = "offline"
+            elif r["recent_failures_10min"] >= 3:
+                r["derived_status"] = "stressed"
+            elif r["running_job_id"] is not None:
+                r["derived_status"] = "busy"
             else:
-                derived = "idle"
-            results.append({
-                **r,
-                "id": str(r["id"]),
-                "running_job_id": str(r["running_job_id"]) if r["running_job_id"] else None,
-                "heartbeat_age_sec": heartbeat_age,
-                "recent_failures_10min": recent_failures,
-                "derived_status": derived,
-            })
-        return {"workers": results}
+                r["derived_status"] = "idle"
+        # UUIDs and timestamps are serialized by json_response as-is.
+        return json_response({"workers": workers})
     finally:
         cursor.close()
         conn.close()
@@ -1340,16 +1294,18 @@ async def admin_list_workers(_: int = Depends(require_admin)):
 async def reclaim_stale_jobs_loop():
     """Periodically re-queue jobs whose worker has gone silent for >5 min.
 
-    Started by main.py on app startup. Cancelled cleanly on shutdown.
+    Started by main.py on app startup (in the leader process only, see
+    leader.py). Cancelled cleanly on shutdown. Uses the async pool: a sync
+    query here would hold up the event loop while waiting on row locks
+    held by request transactions that need that loop to commit.
     """
     import asyncio
     INTERVAL_SEC = 30
     while True:
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            try:
-                cursor.execute(
+            async with get_async_connection() as conn:
+                cursor = conn.cursor()
+                await cursor.execute(
                     f"""
                     UPDATE embodybench_jobs
                        SET state = 'queued',
@@ -1368,7 +1324,7 @@ async def reclaim_stale_jobs_loop():
                         "Reclaimed %d stale job(s)", cursor.rowcount
                     )
                 # Also mark workers offline that haven't heartbeat in 5x the threshold.
-                cursor.execute(
+                await cursor.execute(
                     f"""
                     UPDATE embodybench_workers
                        SET state = 'offline'
@@ -1376,10 +1332,6 @@ async def reclaim_stale_jobs_loop():
                        AND last_heartbeat < NOW() - INTERVAL '{5 * _RECLAIM_AFTER_SEC} seconds';
                     """
                 )
-                conn.commit()
-            finally:
-                cursor.close()
-                conn.close()
         except Exception:
             # Log but don't crash the loop — DB hiccup, network blip, whatever.
             import logging, traceback
@@ -3,13 +3,14 @@ Collection API Router
 支持上传多个图片和音频文件
 """
 
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Request, Response
 from typing import List, Optional
 from datetime import datetime
 import uuid
 import psycopg2
 from psycopg2.extras import RealDictCursor
 from database import get_db_connection
+from conditional_get import data_version, etag_matches, make_etag, not_modified, set_etag
 from r2_storage import r2_storage
 
 router = APIRouter(prefix="/api/collection", tags=["collection"])
@@ -63,12 +64,12 @@ async def create_collection(
             
             folder, max_mb, default_ext = ALLOWED_TYPES[file.content_type]
             
-            # 读取文件
-            file_content = await file.read()
+            # 读取文件（最多读到上限+1字节，超大文件不整个读入内存）
+            max_size = max_mb * 1024 * 1024
+            file_content = await file.read(max_size + 1)
             file_size = len(file_content)
             
             # 验证大小
-            max_size = max_mb * 1024 * 1024
             if file_size > max_size:
                 raise HTTPException(400, f"{file.filename} 大小超过 {max_mb}MB")
             
@@ -118,14 +119,22 @@ async def create_collection(
 
 
 @router.get("/")
-async def get_collections(limit: int = 20, offset: int = 0):
+async def get_collections(request: Request, response: Response, limit: int = 20, offset: int = 0):
     """
     获取 collection 列表（包含媒体）
+
+    带 ETag，数据未变化时返回 304
     """
     conn = get_db_connection()
     cursor = conn.cursor(cursor_factory=RealDictCursor)
     
     try:
+        version = data_version(cursor, "collection")
+        etag = make_etag("collection.list", version, limit, offset)
+        if etag and etag_matches(request, etag):
+            return not_modified(etag)
+        set_etag(response, etag)
+
         # 获取 collection 列表
         cursor.execute("""
             SELECT id, title, author, content, created_at, updated_at
@@ -255,7 +264,7 @@ async def test_upload(file: UploadFile = File(...)):
     
     folder, max_mb, default_ext = ALLOWED_TYPES[file.content_type]
     
-    file_content = await file.read()
+    file_content = await file.read(max_mb * 1024 * 1024 + 1)
     file_size = len(file_content)
     
     if file_size > max_mb * 1024 * 1024:
@@ -2,12 +2,13 @@
 API router for contact form email
 """
 import os
-import resend
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel, EmailStr
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 
+import tracing
+
 limiter = Limiter(key_func=get_remote_address)
 
 RESEND_API_KEY = os.getenv("RESEND_API_KEY", "")
@@ -42,26 +43,28 @@ async def send_contact_email(form: ContactForm):
     if not CONTACT_EMAIL:
         raise HTTPException(status_code=500, detail="Contact email not configured")
 
+    import resend
     resend.api_key = RESEND_API_KEY
 
     try:
         # Send email to site owner
-        resend.Emails.send({
-            "from": "Hoshipu Contact Form <onboarding@resend.dev>",
-            "to": [CONTACT_EMAIL],
-            "subject": f"New Contact Form Message from {form.name}",
-            "html": f"""
-            <h2>New Contact Form Submission</h2>
-            <p><strong>Name:</strong> {form.name}</p>
-            <p><strong>Email:</strong> {form.email}</p>
-            <p><strong>Message:</strong></p>
-            <p>{form.message.replace(chr(10), '<br>')}</p>
-            <hr>
-            <p style="color: #666; font-size: 12px;">
-                This email was sent from the contact form on hoshipu.top
-            </p>
-            """
-        })
+        with tracing.span("resend.emails.send"):
+            resend.Emails.send({
+                "from": "Hoshipu Contact Form <onboarding@resend.dev>",
+                "to": [CONTACT_EMAIL],
+                "subject": f"New Contact Form Message from {form.name}",
+                "html": f"""
+                <h2>New Contact Form Submission</h2>
+                <p><strong>Name:</strong> {form.name}</p>
+                <p><strong>Email:</strong> {form.email}</p>
+                <p><strong>Message:</strong></p>
+                <p>{form.message.replace(chr(10), '<br>')}</p>
+                <hr>
+                <p style="color: #666; font-size: 12px;">
+                    This email was sent from the contact form on hoshipu.top
+                </p>
+                """
+            })
 
         return ContactResponse(success=True, message="Message sent successfully")
 
@@ -0,0 +1,332 @@
+"""
+Operations API Router
+Slow-query log (see slow_query_log.py), the index advisor
+(see index_advisor.py), the sampling profiler (see sampling_profiler.py)
+and memory introspection (see memory_debug.py) - YIF admin only
+"""
+
+import asyncio
+import os
+from datetime import datetime
+from typing import Literal, Optional
+
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
+from psycopg2.extras import RealDictCursor
+
+from database import get_db_connection
+from auth_context import get_yif_user
+from routers.yif_router import verify_token
+import index_advisor
+import sampling_profiler
+import memory_debug
+
+router = APIRouter(prefix="/api/ops", tags=["ops"])
+
+
+def require_admin(cursor, user_id: int):
+    """Check if user is a YIF admin, raise exception if not"""
+    user = get_yif_user(cursor, user_id)
+    if not user:
+        raise HTTPException(401, "User not found")
+    if user['role'] != 'admin':
+        raise HTTPException(403, "Admin access required")
+    return user
+
+
+def _slow_query_log_exists(cursor) -> bool:
+    cursor.execute("SELECT to_regclass('slow_query_log') IS NOT NULL AS present")
+    return cursor.fetchone()['present']
+
+
+@router.get("/slow-queries")
+async def list_slow_queries(
+    limit: int = Query(50, ge=1, le=500),
+    min_ms: float = Query(0, ge=0),
+    route: Optional[str] = None,
+    with_plan: bool = False,
+    user_id: int = Depends(verify_token),
+):
+    """Most recent slow statements, newest first. with_plan=true returns only
+    the sampled ones that have an EXPLAIN (ANALYZE, BUFFERS) plan."""
+    conn = get_db_connection()
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+
+    try:
+        require_admin(cursor, user_id)
+        if not _slow_query_log_exists(cursor):
+            return {"items": []}
+
+        conditions = ["duration_ms >= %s"]
+        params = [min_ms]
+        if route:
+            conditions.append("route = %s")
+            params.append(route)
+        if with_plan:
+            conditions.append("plan IS NOT NULL")
+
+        cursor.execute(f"""
+            SELECT id, captured_at, route, duration_ms, query, params, error,
+                   plan IS NOT NULL AS has_plan
+              FROM slow_query_log
+             WHERE {' AND '.join(conditions)}
+             ORDER BY id DESC
+             LIMIT %s
+        """, params + [limit])
+        return {"items": cursor.fetchall()}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(500, f"Failed to load slow queries: {str(e)}")
+    finally:
+        cursor.close()
+        conn.close()
+
+
+@router.get("/slow-queries/summary")
+async def slow_query_summary(
+    limit: int = Query(20, ge=1, le=200),
+    user_id: int = Depends(verify_token),
+):
+    """Slow statements grouped by normalized text, worst total time first"""
+    conn = get_db_connection()
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+
+    try:
+        require_admin(cursor, user_id)
+        if not _slow_query_log_exists(cursor):
+            return {"items": []}
+
+        cursor.execute("""
+            SELECT query,
+                   COUNT(*) AS occurrences,
+                   ROUND(SUM(duration_ms)::numeric, 1) AS total_ms,
+                   ROUND(AVG(duration_ms)::numeric, 1) AS avg_ms,
+                   ROUND(MAX(duration_ms)::numeric, 1) AS max_ms,
+                   MAX(captured_at) AS last_seen,
+                   array_remove(array_agg(DISTINCT route), NULL) AS routes,
+                   MAX(id) FILTER (WHERE plan IS NOT NULL) AS latest_plan_id
+              FROM slow_query_log
+             GROUP BY query
+             ORDER BY SUM(duration_ms) DESC
+             LIMIT %s
+        """, (limit,))
+        return {"items": cursor.fetchall()}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(500, f"Failed to summarize slow queries: {str(e)}")
+    finally:
+        cursor.close()
+        conn.close()
+
+
+@router.get("/slow-queries/{entry_id}")
+async def get_slow_query(entry_id: int, user_id: int = Depends(verify_token)):
+    """One slow statement with its captured plan, if it was sampled"""
+    conn = get_db_connection()
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+
+    try:
+        require_admin(cursor, user_id)
+        if not _slow_query_log_exists(cursor):
+            raise HTTPException(404, "Slow query not found")
+
+        cursor.execute("""
+            SELECT id, captured_at, route, duration_ms, query, params, error, plan
+              FROM slow_query_log
+             WHERE id = %s
+        """, (entry_id,))
+        row = cursor.fetchone()
+        if not row:
+            raise HTTPException(404, "Slow query not found")
+        return row
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(500, f"Failed to load slow query: {str(e)}")
+    finally:
+        cursor.close()
+        conn.close()
+
+
+# ========== Index advisor ==========
+
+def _run_index_advisor(limit: int, min_rows: int, estimate: bool, build: bool) -> dict:
+    conn = get_db_connection()
+    try:
+        return index_advisor.report(conn, limit, min_rows, estimate, build)
+    finally:
+        conn.close()
+
+
+@router.get("/index-advisor")
+async def index_advisor_report(
+    limit: int = Query(20, ge=1, le=100),
+    min_rows: int = Query(10000, ge=0),
+    estimate: bool = True,
+    build: bool = False,
+    user_id: int = Depends(verify_token),
+):
+    """Heaviest statements, sequential scans on large tables, unused and
+    duplicate indexes, and candidate CREATE INDEX statements with their
+    estimated benefit.
+
+    build=true estimates indexes hypopg cannot simulate by building them in a
+    rolled-back transaction, which blocks writes to the table meanwhile.
+    """
+    _require_admin_user(user_id)
+    try:
+        return await asyncio.to_thread(_run_index_advisor, limit, min_rows, estimate, build)
+    except Exception as e:
+        raise HTTPException(500, f"Index advisor failed: {str(e)}")
+
+
+# ========== Sampling profiler ==========
+
+def _require_admin_user(user_id: int):
+    conn = get_db_connection()
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        require_admin(cursor, user_id)
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def _profile_response(profile, fmt: str, name: str) -> Response:
+    stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    headers = {f"X-Profile-{key.replace('_', '-').title()}": str(value)
+               for key, value in profile.summary().items()}
+    headers["X-Profile-Pid"] = str(os.getpid())
+    if fmt == "speedscope":
+        headers["Content-Disposition"] = f"attachment; filename=profile_{stamp}.speedscope.json"
+        return Response(profile.speedscope(name), media_type="application/json", headers=headers)
+    headers["Content-Disposition"] = f"attachment; filename=profile_{stamp}.collapsed.txt"
+    return Response(profile.collapsed(), media_type="text/plain", headers=headers)
+
+
+@router.post("/profile")
+async def profile_process(
+    seconds: float = Query(10, gt=0, le=60),
+    interval_ms: float = Query(10, ge=1, le=100),
+    format: Literal["collapsed", "speedscope"] = "collapsed",
+    include_idle: bool = False,
+    user_id: int = Depends(verify_token),
+):
+    """Sample every thread of this worker process for `seconds`.
+
+    Returns collapsed stacks (flamegraph.pl / speedscope) or speedscope JSON.
+    With several workers, only the one that serves this request is profiled.
+    """
+    _require_admin_user(user_id)
+    try:
+        profile = await sampling_profiler.profile_process(seconds, interval_ms / 1000, include_idle)
+    except sampling_profiler.ProfilerBusy:
+        raise HTTPException(409, "A profile is already running")
+    return _profile_response(profile, format, f"process {seconds:g}s")
+
+
+@router.post("/profile/requests")
+async def arm_request_profile(
+    interval_ms: float = Query(5, ge=1, le=100),
+    include_idle: bool = False,
+    user_id: int = Depends(verify_token),
+):
+    """Arm a one-time token: the next request sent with an X-Profile-Token
+    header carrying it is profiled end to end (fetch the result below).
+
+    The token only exists in this worker (see pid): with several workers the
+    profiled request and the fetch must reach the same process."""
+    _require_admin_user(user_id)
+    try:
+        token = sampling_profiler.arm_request(interval_ms / 1000, include_idle)
+    except sampling_profiler.ProfilerBusy:
+        raise HTTPException(409, "Too many armed profile tokens")
+    return {"token": token, "header": "X-Profile-Token", "expires_in": sampling_profiler.TOKEN_TTL,
+            "pid": os.getpid()}
+
+
+@router.get("/profile/requests/{token}")
+async def get_request_profile(
+    token: str,
+    format: Literal["collapsed", "speedscope"] = "collapsed",
+    user_id: int = Depends(verify_token),
+):
+    """Profile captured for an armed token"""
+    _require_admin_user(user_id)
+    entry = sampling_profiler.request_result(token)
+    if entry is None:
+        raise HTTPException(404, f"Unknown or expired profile token in worker {os.getpid()}")
+    if entry["error"]:
+        raise HTTPException(409, f"Request was not profiled: {entry['error']}")
+    if entry["profile"] is None:
+        raise HTTPException(409, f"No request with this token has finished yet in worker {os.getpid()}")
+    return _profile_response(entry["profile"], format, entry["path"])
+
+
+# ========== Memory ==========
+
+@router.get("/memory")
+async def memory_overview(
+    with_bytes: bool = False,
+    user_id: int = Depends(verify_token),
+):
+    """RSS, tracemalloc status, registered cache sizes and RSS growth per
+    route for this worker. with_bytes=true adds an approximate deep size per cache
+    (walks every object, so it takes a while on large caches)."""
+    _require_admin_user(user_id)
+    caches = await asyncio.to_thread(memory_debug.caches, with_bytes)
+    routes = sorted(memory_debug.route_growth().items(), key=lambda item: item[1]["grown_bytes"], reverse=True)
+    return {
+        "pid": os.getpid(),
+        "rss_bytes": memory_debug.rss_bytes(),
+        "tracemalloc": memory_debug.tracing_status(),
+        "caches": caches,
+        "routes": dict(routes),
+    }
+
+
+@router.post("/memory/tracemalloc")
+async def start_tracemalloc(
+    frames: int = Query(memory_debug.TRACEMALLOC_FRAMES, ge=1, le=50),
+    user_id: int = Depends(verify_token),
+):
+    """Start tracing allocations in this worker (no-op if already running).
+
+    Tracing is per worker: later snapshots must reach the same pid.
+    """
+    _require_admin_user(user_id)
+    started = memory_debug.start_tracing(frames)
+    return {"pid": os.getpid(), "started": started, **memory_debug.tracing_status()}
+
+
+@router.delete("/memory/tracemalloc")
+async def stop_tracemalloc(user_id: int = Depends(verify_token)):
+    """Stop tracing allocations and drop the stored snapshot"""
+    _require_admin_user(user_id)
+    memory_debug.stop_tracing()
+    return {"pid": os.getpid(), "tracing": False}
+
+
+@router.post("/memory/snapshot")
+async def memory_snapshot(
+    limit: int = Query(25, ge=1, le=500),
+    group_by: Literal["lineno", "filename", "traceback"] = "lineno",
+    user_id: int = Depends(verify_token),
+):
+    """Largest allocation sites, plus what changed since the previous snapshot.
+
+    Take one, exercise the suspect endpoint, take another: the diff lists the
+    lines still holding the memory. Both snapshots must come from the pid
+    that started tracing; repeat the call until they do.
+    """
+    _require_admin_user(user_id)
+    try:
+        report = await asyncio.to_thread(memory_debug.snapshot, limit, group_by)
+    except RuntimeError:
+        raise HTTPException(409, f"tracemalloc is not running in worker {os.getpid()}; "
+                                 "POST /api/ops/memory/tracemalloc first")
+    return {"pid": os.getpid(), **report}
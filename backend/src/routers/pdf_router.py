@@ -14,6 +14,7 @@ from pdf_processor import (
 )
 from database import get_db
 from models import PdfTemplate
+from tag_cache import catalog_cache
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -89,10 +90,12 @@ async def process_and_download(
     )
 
 
+def _load_templates(db: Session) -> dict:
+    templates_dict = {t.name: t.template_string for t in db.query(PdfTemplate).all()}
+    return templates_dict or DEFAULT_TEMPLATES
+
+
 @router.get("/templates")
 async def get_templates(db: Session = Depends(get_db)):
-    db_templates = db.query(PdfTemplate).all()
-    templates_dict = {t.name: t.template_string for t in db_templates}
-    if not templates_dict:
-        templates_dict = DEFAULT_TEMPLATES
+    templates_dict = catalog_cache.get_or_load("pdf.templates", ("pdf.templates",), lambda: _load_templates(db))
     return {"templates": templates_dict}
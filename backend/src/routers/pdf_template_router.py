@@ -7,6 +7,7 @@ from typing import List
 from database import get_db
 from models import PdfTemplate
 from schemas import PdfTemplateCreate, PdfTemplateUpdate, PdfTemplateResponse, PdfTemplateDelete
+import tag_cache
 
 router = APIRouter(prefix="/api/pdf-templates", tags=["pdf-templates"])
 
@@ -52,6 +53,7 @@ def create_template(template_data: PdfTemplateCreate, db: Session = Depends(get_
     )
     db.add(new_template)
     db.commit()
+    tag_cache.invalidate("pdf.templates")
     db.refresh(new_template)
     return new_template
 
@@ -92,6 +94,7 @@ def update_template(
         template.template_string = template_data.template_string
     
     db.commit()
+    tag_cache.invalidate("pdf.templates")
     db.refresh(template)
     return template
 
@@ -114,4 +117,5 @@ def delete_template(template_id: int, delete_data: PdfTemplateDelete, db: Sessio
     
     db.delete(template)
     db.commit()
+    tag_cache.invalidate("pdf.templates")
     return None
@@ -1,12 +1,13 @@
 """
 Router for QFF Travel management - templates, airlines, airports
 """
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from sqlalchemy.orm import Session
 from typing import List
 from pydantic import BaseModel
 import json
 from database import get_db
+from conditional_get import data_version_session, etag_matches, make_etag, not_modified, set_etag
 from models import TravelOutputTemplate, TravelAirline, TravelAirport
 from schemas import (
     TravelTemplateCreate, TravelTemplateUpdate, TravelTemplateDelete, TravelTemplateResponse,
@@ -14,6 +15,8 @@ from schemas import (
     TravelAirportCreate, TravelAirportUpdate, TravelAirportDelete, TravelAirportResponse
 )
 from travel_translator import translate_itinerary
+import tag_cache
+from tag_cache import catalog_cache
 
 router = APIRouter(prefix="/api/qff-travel", tags=["qff-travel"])
 
@@ -71,6 +74,7 @@ def create_template(template_data: TravelTemplateCreate, db: Session = Depends(g
     )
     db.add(new_template)
     db.commit()
+    tag_cache.invalidate("qff.templates")
     db.refresh(new_template)
     return new_template
 
@@ -117,6 +121,7 @@ def update_template(
         template.is_active = template_data.is_active
     
     db.commit()
+    tag_cache.invalidate("qff.templates")
     db.refresh(template)
     return template
 
@@ -139,12 +144,17 @@ def delete_template(template_id: int, delete_data: TravelTemplateDelete, db: Ses
     
     db.delete(template)
     db.commit()
+    tag_cache.invalidate("qff.templates")
     return None
 
 
 @router.get("/airlines", response_model=List[TravelAirlineResponse])
-def get_all_airlines(db: Session = Depends(get_db)):
-    """Get all airlines"""
+def get_all_airlines(request: Request, response: Response, db: Session = Depends(get_db)):
+    """Get all airlines (ETag / 304 when unchanged)"""
+    etag = make_etag("qff.airlines", data_version_session(db, "qff_airlines"))
+    if etag and etag_matches(request, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
     airlines = db.query(TravelAirline).order_by(TravelAirline.code).all()
     return airlines
 
@@ -183,6 +193,7 @@ def create_airline(airline_data: TravelAirlineCreate, db: Session = Depends(get_
     )
     db.add(new_airline)
     db.commit()
+    tag_cache.invalidate("qff.airlines")
     db.refresh(new_airline)
     return new_airline
 
@@ -226,6 +237,7 @@ def update_airline(
         airline.is_active = airline_data.is_active
     
     db.commit()
+    tag_cache.invalidate("qff.airlines")
     db.refresh(airline)
     return airline
 
@@ -248,12 +260,17 @@ def delete_airline(airline_id: int, delete_data: TravelAirlineDelete, db: Sessio
     
     db.delete(airline)
     db.commit()
+    tag_cache.invalidate("qff.airlines")
     return None
 
 
 @router.get("/airports", response_model=List[TravelAirportResponse])
-def get_all_airports(db: Session = Depends(get_db)):
-    """Get all airports"""
+def get_all_airports(request: Request, response: Response, db: Session = Depends(get_db)):
+    """Get all airports (ETag / 304 when unchanged)"""
+    etag = make_etag("qff.airports", data_version_session(db, "qff_airports"))
+    if etag and etag_matches(request, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
     airports = db.query(TravelAirport).order_by(TravelAirport.code).all()
     return airports
 
@@ -292,6 +309,7 @@ def create_airport(airport_data: TravelAirportCreate, db: Session = Depends(get_
     )
     db.add(new_airport)
     db.commit()
+    tag_cache.invalidate("qff.airports")
     db.refresh(new_airport)
     return new_airport
 
@@ -335,6 +353,7 @@ def update_airport(
         airport.is_active = airport_data.is_active
     
     db.commit()
+    tag_cache.invalidate("qff.airports")
     db.refresh(airport)
     return airport
 
@@ -357,26 +376,39 @@ def delete_airport(airport_id: int, delete_data: TravelAirportDelete, db: Sessio
     
     db.delete(airport)
     db.commit()
+    tag_cache.invalidate("qff.airports")
     return None
 
 
+def _load_template_config(db: Session, template_id: int):
+    template = db.query(TravelOutputTemplate).filter(TravelOutputTemplate.id == template_id).first()
+    return json.loads(template.config_json) if template else None
+
+
+def _load_active_names(db: Session, model):
+    """code -> name for the active rows of TravelAirline / TravelAirport"""
+    return {row.code: row.name for row in db.query(model).filter(model.is_active == True).all()}
+
+
 @router.post("/translate", response_model=TranslateResponse)
 def translate_travel_itinerary(request: TranslateRequest, db: Session = Depends(get_db)):
     """Translate travel itinerary using selected template"""
-    template = db.query(TravelOutputTemplate).filter(TravelOutputTemplate.id == request.template_id).first()
-    if not template:
+    template_config = catalog_cache.get_or_load(
+        f"qff.template.{request.template_id}", ("qff.templates",),
+        lambda: _load_template_config(db, request.template_id),
+    )
+    if template_config is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Template with id {request.template_id} not found"
         )
     
-    airlines_query = db.query(TravelAirline).filter(TravelAirline.is_active == True).all()
-    airlines_dict = {airline.code: airline.name for airline in airlines_query}
-    
-    airports_query = db.query(TravelAirport).filter(TravelAirport.is_active == True).all()
-    airports_dict = {airport.code: airport.name for airport in airports_query}
-    
-    template_config = json.loads(template.config_json)
+    airlines_dict = catalog_cache.get_or_load(
+        "qff.airlines.active", ("qff.airlines",), lambda: _load_active_names(db, TravelAirline)
+    )
+    airports_dict = catalog_cache.get_or_load(
+        "qff.airports.active", ("qff.airports",), lambda: _load_active_names(db, TravelAirport)
+    )
     
     try:
         output_text = translate_itinerary(
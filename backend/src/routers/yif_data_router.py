@@ -3,34 +3,28 @@ YIF Data Analysis API Router
 处理business_data.txt文件上传和数据分析
 """
 
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
-from psycopg2.extras import RealDictCursor
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Query
+from fastapi.encoders import jsonable_encoder
+from psycopg.types.json import Json
 from routers.yif_router import verify_token
-from database import get_db_connection
+from auth_context import get_yif_user
+from async_db import get_async_connection, pipeline
 import pickle
-from typing import List, Dict, Any
 from datetime import datetime
+import logging
 import sys
 import os
 
+logger = logging.getLogger(__name__)
+
 
 def verify_admin(user_id: int):
     """Verify user is an admin, raise HTTPException if not"""
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    try:
-        cursor.execute("""
-            SELECT role FROM yif_workers
-            WHERE id = %s AND is_active = TRUE
-        """, (user_id,))
-        user = cursor.fetchone()
-        if not user:
-            raise HTTPException(401, "User not found")
-        if user['role'] != 'admin':
-            raise HTTPException(403, "Admin access required")
-    finally:
-        cursor.close()
-        conn.close()
+    user = get_yif_user(None, user_id)
+    if not user:
+        raise HTTPException(401, "User not found")
+    if user['role'] != 'admin':
+        raise HTTPException(403, "Admin access required")
 
 # 添加src目录到Python路径，以便导入business模块
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
@@ -57,8 +51,26 @@ except ImportError:
 
 router = APIRouter(prefix="/api/yif/data", tags=["yif-data"])
 
-# 临时存储解析后的数据（生产环境应使用数据库）
-_parsed_data: Dict[str, Any] = {}
+# 解析后的数据存放在数据库中（yif_data_upload / yif_data_businesses，见
+# schema_migrations），任何worker都能回答后续请求。
+# One row per parsed business, in file order (seq), with its payments; the
+# unpickled file itself is dropped once the upload has been parsed. A new
+# upload replaces the previous one in a single transaction.
+
+_INSERT_BUSINESS_SQL = """
+    INSERT INTO yif_data_businesses
+        (seq, ious_id, client, status, total_money, paid, rest, business, payments)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+"""
+
+_UPLOADED_SQL = "SELECT EXISTS (SELECT 1 FROM yif_data_upload) AS uploaded"
+
+_STATS_SQL = """
+    SELECT {key} AS key, COUNT(*) AS count, SUM(total_money) AS amount,
+           SUM(paid) AS paid, SUM(rest) AS rest
+    FROM yif_data_businesses
+    GROUP BY {key}
+"""
 
 class IOUSData:
     """欠条数据类"""
@@ -173,7 +185,7 @@ async def upload_business_data(file: UploadFile = File(...), user_id: int = Depe
             raise Exception(error_detail)
         
         # 解析数据结构
-        parsed_businesses = []
+        rows = []
         total_ious = 0
         total_amount = 0
         total_paid = 0
@@ -185,7 +197,7 @@ async def upload_business_data(file: UploadFile = File(...), user_id: int = Depe
                     biz = BusinessData(business_obj)
                     
                     if biz.ious:
-                        parsed_businesses.append({
+                        business = jsonable_encoder({
                             'date': date_key,
                             'ious_id': biz.ious.id,
                             'user': biz.ious.user,
@@ -196,30 +208,52 @@ async def upload_business_data(file: UploadFile = File(...), user_id: int = Depe
                             'status': biz.type,
                             'payments_count': len(biz.list_payment)
                         })
+                        payments = jsonable_encoder([
+                            {
+                                'date': payment.date,
+                                'client': payment.client,
+                                'amount': payment.amount,
+                                'remark': payment.remark
+                            }
+                            for payment in biz.list_payment
+                        ])
+                        rows.append((len(rows), business['ious_id'], business['client'], business['status'],
+                                     biz.ious.total_money, biz.paid, biz.rest, Json(business), Json(payments)))
                         
                         total_ious += 1
                         total_amount += biz.ious.total_money
                         total_paid += biz.paid
                         total_rest += biz.rest
                 except Exception as e:
-                    print(f"Error parsing business object: {e}")
+                    logger.warning(f"Error parsing business object: {e}")
                     continue
         
-        # 存储解析后的数据
-        _parsed_data['businesses'] = parsed_businesses
-        _parsed_data['summary'] = {
+        summary = {
             'total_ious': total_ious,
             'total_amount': total_amount,
             'total_paid': total_paid,
             'total_rest': total_rest,
             'upload_time': datetime.now().isoformat()
         }
-        _parsed_data['raw_data'] = data  # 保存原始数据用于详细查询
+
+        # 存储解析后的数据，替换上一次上传
+        async with get_async_connection() as conn:
+            cursor = conn.cursor()
+            async with pipeline(conn):
+                await cursor.execute("TRUNCATE yif_data_businesses")
+                if rows:
+                    await cursor.executemany(_INSERT_BUSINESS_SQL, rows)
+                await cursor.execute("""
+                    INSERT INTO yif_data_upload (id, summary, uploaded_at)
+                    VALUES (TRUE, %s, NOW())
+                    ON CONFLICT (id) DO UPDATE
+                    SET summary = EXCLUDED.summary, uploaded_at = EXCLUDED.uploaded_at
+                """, (Json(summary),))
         
         return {
             "success": True,
             "message": f"Successfully parsed {total_ious} ious records",
-            "summary": _parsed_data['summary']
+            "summary": summary
         }
         
     except Exception as e:
@@ -232,42 +266,42 @@ async def get_summary(user_id: int = Depends(verify_token)):
     """
     verify_admin(user_id)
 
-    if 'summary' not in _parsed_data:
-        return {
-            "success": True,
-            "summary": None
-        }
+    async with get_async_connection() as conn:
+        cursor = conn.cursor()
+        await cursor.execute("SELECT summary FROM yif_data_upload")
+        row = await cursor.fetchone()
 
     return {
         "success": True,
-        "summary": _parsed_data['summary']
+        "summary": row['summary'] if row else None
     }
 
 @router.get("/businesses")
-async def get_businesses(skip: int = 0, limit: int = 100, status: str = None, user_id: int = Depends(verify_token)):
+async def get_businesses(skip: int = Query(0, ge=0), limit: int = Query(100, ge=0), status: str = None,
+                         user_id: int = Depends(verify_token)):
     """
     获取业务列表 (Admin only)
     """
     verify_admin(user_id)
 
-    if 'businesses' not in _parsed_data:
-        return {
-            "success": True,
-            "total": 0,
-            "skip": skip,
-            "limit": limit,
-            "businesses": []
-        }
-
-    businesses = _parsed_data['businesses']
-
-    # 过滤状态
-    if status:
-        businesses = [b for b in businesses if b['status'] == status]
-
-    # 分页
-    total = len(businesses)
-    businesses = businesses[skip:skip + limit]
+    # 过滤状态 + 分页
+    params = {"status": status or None, "skip": skip, "limit": limit}
+    async with get_async_connection() as conn:
+        cursor = conn.cursor()
+        page_cursor = conn.cursor()
+        async with pipeline(conn):
+            await cursor.execute("""
+                SELECT COUNT(*) AS total FROM yif_data_businesses
+                WHERE %(status)s::text IS NULL OR status = %(status)s
+            """, params)
+            await page_cursor.execute("""
+                SELECT business FROM yif_data_businesses
+                WHERE %(status)s::text IS NULL OR status = %(status)s
+                ORDER BY seq
+                OFFSET %(skip)s LIMIT %(limit)s
+            """, params)
+        total = (await cursor.fetchone())['total']
+        businesses = [row['business'] for row in await page_cursor.fetchall()]
 
     return {
         "success": True,
@@ -277,6 +311,10 @@ async def get_businesses(skip: int = 0, limit: int = 100, status: str = None, us
         "businesses": businesses
     }
 
+def _stats_dict(rows) -> dict:
+    return {row['key']: {'count': row['count'], 'amount': row['amount'], 'paid': row['paid'], 'rest': row['rest']}
+            for row in rows}
+
 @router.get("/stats")
 async def get_statistics(user_id: int = Depends(verify_token)):
     """
@@ -284,37 +322,28 @@ async def get_statistics(user_id: int = Depends(verify_token)):
     """
     verify_admin(user_id)
 
-    if 'businesses' not in _parsed_data:
+    async with get_async_connection() as conn:
+        cursor = conn.cursor()
+        status_cursor = conn.cursor()
+        client_cursor = conn.cursor()
+        async with pipeline(conn):
+            await cursor.execute(_UPLOADED_SQL)
+            # 按状态分组统计（按首次出现顺序）
+            await status_cursor.execute(_STATS_SQL.format(key="status") + " ORDER BY MIN(seq)")
+            # 按客户统计，前20客户
+            await client_cursor.execute(
+                _STATS_SQL.format(key="client") + " ORDER BY SUM(total_money) DESC, MIN(seq) LIMIT 20")
+        uploaded = (await cursor.fetchone())['uploaded']
+        status_stats = _stats_dict(await status_cursor.fetchall())
+        client_stats = _stats_dict(await client_cursor.fetchall())
+
+    if not uploaded:
         raise HTTPException(404, "No data uploaded yet")
-    
-    businesses = _parsed_data['businesses']
-    
-    # 按状态分组统计
-    status_stats = {}
-    for biz in businesses:
-        status = biz['status']
-        if status not in status_stats:
-            status_stats[status] = {'count': 0, 'amount': 0, 'paid': 0, 'rest': 0}
-        status_stats[status]['count'] += 1
-        status_stats[status]['amount'] += biz['total_money']
-        status_stats[status]['paid'] += biz['paid']
-        status_stats[status]['rest'] += biz['rest']
-    
-    # 按客户统计
-    client_stats = {}
-    for biz in businesses:
-        client = biz['client']
-        if client not in client_stats:
-            client_stats[client] = {'count': 0, 'amount': 0, 'paid': 0, 'rest': 0}
-        client_stats[client]['count'] += 1
-        client_stats[client]['amount'] += biz['total_money']
-        client_stats[client]['paid'] += biz['paid']
-        client_stats[client]['rest'] += biz['rest']
-    
+
     return {
         "success": True,
         "status_stats": status_stats,
-        "client_stats": dict(sorted(client_stats.items(), key=lambda x: x[1]['amount'], reverse=True)[:20])  # 前20客户
+        "client_stats": client_stats
     }
 
 @router.get("/payments/{ious_id}")
@@ -324,35 +353,31 @@ async def get_payment_details(ious_id: str, user_id: int = Depends(verify_token)
     """
     verify_admin(user_id)
 
-    if 'raw_data' not in _parsed_data:
+    async with get_async_connection() as conn:
+        cursor = conn.cursor()
+        entry_cursor = conn.cursor()
+        async with pipeline(conn):
+            await cursor.execute(_UPLOADED_SQL)
+            # First occurrence wins, as the old raw_data scan did
+            await entry_cursor.execute("""
+                SELECT payments, paid FROM yif_data_businesses
+                WHERE ious_id = %s
+                ORDER BY seq
+                LIMIT 1
+            """, (ious_id,))
+        uploaded = (await cursor.fetchone())['uploaded']
+        entry = await entry_cursor.fetchone()
+
+    if not uploaded:
         raise HTTPException(404, "No data uploaded yet")
 
-    raw_data = _parsed_data['raw_data']
-
-    # 遍历所有日期的业务数据，查找匹配的欠条ID
-    for date_key, business_list in raw_data.items():
-        for business_obj in business_list:
-            try:
-                biz = BusinessData(business_obj)
-                if biz.ious and biz.ious.id == ious_id:
-                    # 提取付款明细
-                    payments = []
-                    for payment in biz.list_payment:
-                        payments.append({
-                            'date': payment.date,
-                            'client': payment.client,
-                            'amount': payment.amount,
-                            'remark': payment.remark
-                        })
-
-                    return {
-                        "success": True,
-                        "ious_id": ious_id,
-                        "payments": payments,
-                        "total_payments": len(payments),
-                        "total_paid": biz.paid
-                    }
-            except Exception as e:
-                continue
+    if entry is not None:
+        return {
+            "success": True,
+            "ious_id": ious_id,
+            "payments": entry['payments'],
+            "total_payments": len(entry['payments']),
+            "total_paid": entry['paid']
+        }
 
     raise HTTPException(404, f"No payment details found for IOU ID: {ious_id}")
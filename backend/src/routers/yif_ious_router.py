@@ -4,20 +4,26 @@ Handles IOU and payment CRUD operations with PostgreSQL
 Updated: 2025-12-23 - Fixed IOUItemCreate model
 """
 
-from fastapi import APIRouter, HTTPException, Depends, Query, UploadFile, File
+from fastapi import APIRouter, HTTPException, Depends, Query, UploadFile, File, Response
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
 from decimal import Decimal
 import psycopg2
-from psycopg2.extras import RealDictCursor
 from datetime import datetime
+import asyncio
 import io
-import openpyxl
 
-from database import get_db_connection
+from async_db import get_async_connection, pipeline
+from replica import read_connection
+from query_guard import query_guard
+from auth_context import get_yif_user_async, set_rls_context
+from crypto_pool import verify_password
+from conditional_get import data_version_async, etag_matches, make_etag, not_modified, set_etag
+from fast_json import json_response
 from routers.yif_router import verify_token
 from rate_limiter import limiter
+import tracing
 from fastapi import Request
 
 router = APIRouter(prefix="/api/yif", tags=["yif-ious"])
@@ -107,22 +113,36 @@ class PaymentSearchParams(BaseModel):
 # Helper Functions
 # ========================
 
-def get_user_info(cursor, user_id: int):
-    """Get user info including role for RLS"""
-    cursor.execute("""
-        SELECT id, username, user_code, role
-        FROM yif_workers
-        WHERE id = %s AND is_active = TRUE
-    """, (user_id,))
-    return cursor.fetchone()
+_UPDATE_IOU_STATUS_SQL = """
+    UPDATE yif_ious SET status = (
+        SELECT CASE
+            WHEN i.total_amount < 0 THEN 3
+            WHEN i.total_amount - COALESCE(SUM(p.amount), 0) = 0 THEN 2
+            WHEN i.total_amount - COALESCE(SUM(p.amount), 0) < 0 THEN 4
+            WHEN COUNT(p.id) > 0 THEN 1
+            ELSE 0
+        END
+        FROM yif_ious i
+        LEFT JOIN yif_payments p ON p.ious_id = i.id
+        WHERE i.id = %s
+        GROUP BY i.id, i.total_amount
+    )
+    WHERE id = %s
+"""
 
+_INSERT_PAYMENT_SQL = """
+    INSERT INTO yif_payments (ious_id, worker_id, user_code, payment_date, payer_name, amount, remark)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+    RETURNING id
+"""
 
-def set_rls_context(cursor, user_id: int, role: str):
-    """Set RLS context for the current session"""
-    cursor.execute("SELECT set_yif_user_context(%s, %s)", (user_id, role))
+_INSERT_LOG_SQL = """
+    INSERT INTO yif_logs (worker_id, action, target_type, target_id, details)
+    VALUES (%s, %s, %s, %s, %s)
+"""
 
 
-def update_iou_status(cursor, ious_db_id: int):
+async def update_iou_status_async(cursor, ious_db_id: int):
     """
     Update IOU status based on payments.
     Call this after any payment operation.
@@ -134,26 +154,10 @@ def update_iou_status(cursor, ious_db_id: int):
     - 3: Negative (initial amount < 0)
     - 4: Overpaid (remaining < 0, but initial >= 0)
     """
-    cursor.execute("""
-        UPDATE yif_ious SET status = (
-            SELECT CASE
-                WHEN i.total_amount < 0 THEN 3
-                WHEN i.total_amount - COALESCE(SUM(p.amount), 0) = 0 THEN 2
-                WHEN i.total_amount - COALESCE(SUM(p.amount), 0) < 0 THEN 4
-                WHEN COUNT(p.id) > 0 THEN 1
-                ELSE 0
-            END
-            FROM yif_ious i
-            LEFT JOIN yif_payments p ON p.ious_id = i.id
-            WHERE i.id = %s
-            GROUP BY i.id, i.total_amount
-        )
-        WHERE id = %s
-    """, (ious_db_id, ious_db_id))
-
-
-def generate_ious_id(cursor, user_code: str, date: str, is_hand_entry: bool = True):
-    """Generate next available IOU ID"""
+    await cursor.execute(_UPDATE_IOU_STATUS_SQL, (ious_db_id, ious_db_id), prepare=True)
+
+
+def _ious_id_prefix(user_code: str, date: str, is_hand_entry: bool) -> str:
     user_code = user_code.upper()
     while len(user_code) < 3:
         user_code = 'A' + user_code
@@ -161,17 +165,18 @@ def generate_ious_id(cursor, user_code: str, date: str, is_hand_entry: bool = Tr
         user_code = user_code[:3]
 
     type_char = 'H' if is_hand_entry else 'D'
-    prefix = f"{user_code}{date}{type_char}"
+    return f"{user_code}{date}{type_char}"
+
+
+_LAST_IOUS_ID_SQL = """
+    SELECT ious_id FROM yif_ious
+    WHERE ious_id LIKE %s
+    ORDER BY ious_id DESC
+    LIMIT 1
+"""
 
-    # Find next available number
-    cursor.execute("""
-        SELECT ious_id FROM yif_ious
-        WHERE ious_id LIKE %s
-        ORDER BY ious_id DESC
-        LIMIT 1
-    """, (f"{prefix}%",))
 
-    result = cursor.fetchone()
+def _next_ious_id(prefix: str, result) -> str:
     if result:
         last_num = int(result['ious_id'][-2:])
         next_num = last_num + 1
@@ -184,21 +189,11 @@ def generate_ious_id(cursor, user_code: str, date: str, is_hand_entry: bool = Tr
     return f"{prefix}{next_num:02d}"
 
 
-def calculate_iou_rest(cursor, iou_db_id: int) -> float:
-    """Calculate remaining amount for an IOU"""
-    cursor.execute("""
-        SELECT
-            i.total_amount,
-            COALESCE(SUM(p.amount), 0) as paid
-        FROM yif_ious i
-        LEFT JOIN yif_payments p ON p.ious_id = i.id
-        WHERE i.id = %s
-        GROUP BY i.id
-    """, (iou_db_id,))
-    result = cursor.fetchone()
-    if result:
-        return float(result['total_amount']) - float(result['paid'])
-    return 0
+async def generate_ious_id_async(cursor, user_code: str, date: str, is_hand_entry: bool = True):
+    """Generate next available IOU ID"""
+    prefix = _ious_id_prefix(user_code, date, is_hand_entry)
+    await cursor.execute(_LAST_IOUS_ID_SQL, (f"{prefix}%",))
+    return _next_ious_id(prefix, await cursor.fetchone())
 
 
 # ========================
@@ -208,95 +203,92 @@ def calculate_iou_rest(cursor, iou_db_id: int) -> float:
 @router.post("/ious")
 @limiter.limit("30/minute")
 async def create_iou(request: Request, iou_data: IOUCreate, user_id: int = Depends(verify_token)):
-    """Create a new IOU with items"""
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    """Create a new IOU with items
 
-    try:
-        # Get user info
-        user = get_user_info(cursor, user_id)
-        if not user:
-            raise HTTPException(401, "User not found")
-
-        set_rls_context(cursor, user_id, user['role'] or 'user')
-
-        # Validate date format
-        if len(iou_data.ious_date) != 6 or not iou_data.ious_date.isdigit():
-            raise HTTPException(400, "Date must be in YYMMDD format")
-
-        # Validate user_code
-        user_code = iou_data.user_code.upper()
-        if not user_code.isalpha() or len(user_code) > 3:
-            raise HTTPException(400, "User code must be 2-3 letters")
-
-        while len(user_code) < 3:
-            user_code = 'A' + user_code
-
-        # Generate IOU ID if not provided
-        ious_id = iou_data.ious_id
-        if not ious_id:
-            ious_id = generate_ious_id(cursor, user_code, iou_data.ious_date)
-
-        # Check for duplicate
-        cursor.execute("SELECT id FROM yif_ious WHERE ious_id = %s", (ious_id,))
-        if cursor.fetchone():
-            raise HTTPException(400, f"IOU ID {ious_id} already exists")
-
-        # Calculate total amount
-        total_amount = sum(item.amount for item in iou_data.items)
-
-        # Determine initial status
-        status = 3 if total_amount < 0 else 0
-
-        # Insert IOU
-        cursor.execute("""
-            INSERT INTO yif_ious (ious_id, worker_id, user_code, ious_date, total_amount, status)
-            VALUES (%s, %s, %s, %s, %s, %s)
-            RETURNING id
-        """, (ious_id, user_id, user_code, iou_data.ious_date, total_amount, status))
-
-        iou_db_id = cursor.fetchone()['id']
-
-        # Insert items
-        for idx, item in enumerate(iou_data.items):
-            cursor.execute("""
-                INSERT INTO yif_iou_items (ious_id, worker_id, item_index, client, amount, flight, ticket_number, remark)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-            """, (iou_db_id, user_id, idx, item.client, item.amount,
-                  item.flight or "", item.ticket_number or "", item.remark or ""))
-
-        # Log the action
-        cursor.execute("""
-            INSERT INTO yif_logs (worker_id, action, target_type, target_id, details)
-            VALUES (%s, %s, %s, %s, %s)
-        """, (user_id, 'create_iou', 'iou', ious_id, f"Created IOU with {len(iou_data.items)} items, total: {total_amount}"))
-
-        conn.commit()
-
-        return {
-            "success": True,
-            "message": f"IOU {ious_id} created successfully",
-            "iou": {
-                "id": iou_db_id,
-                "ious_id": ious_id,
-                "total_amount": total_amount,
-                "items_count": len(iou_data.items)
+    The items and the log entry go out in one pipeline after the IOU row.
+    """
+    async with get_async_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            # Get user info
+            user = await get_yif_user_async(cursor, user_id)
+            if not user:
+                raise HTTPException(401, "User not found")
+
+            set_rls_context(cursor, user_id, user['role'] or 'user')
+
+            # Validate date format
+            if len(iou_data.ious_date) != 6 or not iou_data.ious_date.isdigit():
+                raise HTTPException(400, "Date must be in YYMMDD format")
+
+            # Validate user_code
+            user_code = iou_data.user_code.upper()
+            if not user_code.isalpha() or len(user_code) > 3:
+                raise HTTPException(400, "User code must be 2-3 letters")
+
+            while len(user_code) < 3:
+                user_code = 'A' + user_code
+
+            # Generate IOU ID if not provided
+            ious_id = iou_data.ious_id
+            if not ious_id:
+                ious_id = await generate_ious_id_async(cursor, user_code, iou_data.ious_date)
+
+            # Check for duplicate
+            await cursor.execute("SELECT id FROM yif_ious WHERE ious_id = %s", (ious_id,))
+            if await cursor.fetchone():
+                raise HTTPException(400, f"IOU ID {ious_id} already exists")
+
+            # Calculate total amount
+            total_amount = sum(item.amount for item in iou_data.items)
+
+            # Determine initial status
+            status = 3 if total_amount < 0 else 0
+
+            # Insert IOU
+            await cursor.execute("""
+                INSERT INTO yif_ious (ious_id, worker_id, user_code, ious_date, total_amount, status)
+                VALUES (%s, %s, %s, %s, %s, %s)
+                RETURNING id
+            """, (ious_id, user_id, user_code, iou_data.ious_date, total_amount, status), prepare=True)
+
+            iou_db_id = (await cursor.fetchone())['id']
+
+            async with pipeline(conn):
+                # Insert items
+                await cursor.executemany("""
+                    INSERT INTO yif_iou_items (ious_id, worker_id, item_index, client, amount, flight, ticket_number, remark)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                """, [(iou_db_id, user_id, idx, item.client, item.amount,
+                       item.flight or "", item.ticket_number or "", item.remark or "")
+                      for idx, item in enumerate(iou_data.items)])
+
+                # Log the action
+                await cursor.execute(_INSERT_LOG_SQL, (
+                    user_id, 'create_iou', 'iou', ious_id,
+                    f"Created IOU with {len(iou_data.items)} items, total: {total_amount}"), prepare=True)
+
+            return {
+                "success": True,
+                "message": f"IOU {ious_id} created successfully",
+                "iou": {
+                    "id": iou_db_id,
+                    "ious_id": ious_id,
+                    "total_amount": total_amount,
+                    "items_count": len(iou_data.items)
+                }
             }
-        }
 
-    except HTTPException:
-        conn.rollback()
-        raise
-    except Exception as e:
-        conn.rollback()
-        raise HTTPException(500, f"Failed to create IOU: {str(e)}")
-    finally:
-        cursor.close()
-        conn.close()
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(500, f"Failed to create IOU: {str(e)}")
 
 
 @router.get("/ious")
 async def search_ious(
+    request: Request,
+    response: Response,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
     client: Optional[str] = None,
@@ -314,300 +306,267 @@ async def search_ious(
     limit: int = 100,
     user_id: int = Depends(verify_token)
 ):
-    """Search IOUs with various filters"""
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    """Search IOUs with various filters
 
-    try:
-        user = get_user_info(cursor, user_id)
-        if not user:
-            raise HTTPException(401, "User not found")
-
-        set_rls_context(cursor, user_id, user['role'] or 'user')
-
-        # Build query
-        query = """
-            SELECT
-                i.id,
-                i.ious_id,
-                i.user_code,
-                i.worker_id,
-                i.ious_date,
-                i.total_amount,
-                i.status,
-                i.created_at,
-                COALESCE(SUM(p.amount), 0) as paid,
-                i.total_amount - COALESCE(SUM(p.amount), 0) as rest
-            FROM yif_ious i
-            LEFT JOIN yif_payments p ON p.ious_id = i.id
-            WHERE 1=1
-        """
-        params = []
-
-        if start_date:
-            query += " AND i.ious_date >= %s"
-            params.append(start_date)
-
-        if end_date:
-            query += " AND i.ious_date <= %s"
-            params.append(end_date)
-
-        if ious_id:
-            query += " AND i.ious_id LIKE %s"
-            params.append(f"%{ious_id}%")
-
-        if status:
-            status_list = [int(s) for s in status.split(',') if s.isdigit()]
-            if status_list:
-                query += f" AND i.status IN ({','.join(['%s'] * len(status_list))})"
-                params.extend(status_list)
-
-        # worker_id filter logic:
-        # - By default, everyone only sees their own IOUs (by worker_id)
-        # - Admin/manager can pass target_worker_id="all" to see all, or target_worker_id=X to see specific user
-        if target_worker_id and user['role'] in ('admin', 'manager'):
-            # Admin/manager with explicit target_worker_id parameter
-            if target_worker_id.lower() != 'all':
-                query += " AND i.worker_id = %s"
-                params.append(int(target_worker_id))
-            # If target_worker_id="all", no filter - see all users
-        else:
-            # Default: filter by current user's worker_id
-            query += " AND i.worker_id = %s"
-            params.append(user_id)
-
-        query += " GROUP BY i.id"
-
-        # Amount filters (applied after grouping)
-        having_clauses = []
-
-        if remaining_amount is not None:
-            having_clauses.append("(i.total_amount - COALESCE(SUM(p.amount), 0)) BETWEEN %s AND %s")
-            params.append(remaining_amount - amount_margin)
-            params.append(remaining_amount + amount_margin)
-
-        if initial_amount is not None:
-            having_clauses.append("i.total_amount BETWEEN %s AND %s")
-            params.append(initial_amount - initial_margin)
-            params.append(initial_amount + initial_margin)
-
-        if having_clauses:
-            query += " HAVING " + " AND ".join(having_clauses)
-
-        # If text filters are used, we need to filter via subquery with items
-        if client or ticket_number or flight or remark:
-            # Build item filter subquery
-            item_conditions = []
-            item_params = []
-            if client:
-                item_conditions.append("LOWER(it.client) LIKE %s")
-                item_params.append(f"%{client.lower()}%")
-            if ticket_number:
-                item_conditions.append("it.ticket_number LIKE %s")
-                item_params.append(f"%{ticket_number}%")
-            if flight:
-                item_conditions.append("LOWER(it.flight) LIKE %s")
-                item_params.append(f"%{flight.lower()}%")
-            if remark:
-                item_conditions.append("LOWER(it.remark) LIKE %s")
-                item_params.append(f"%{remark.lower()}%")
-
-            # Wrap original query and filter by items
-            query = f"""
-                SELECT * FROM ({query}) AS filtered_ious
-                WHERE filtered_ious.id IN (
-                    SELECT DISTINCT it.ious_id FROM yif_iou_items it
-                    WHERE {" AND ".join(item_conditions)}
-                )
-            """
-            params = params + item_params
+    Sends a weak ETag; a matching If-None-Match gets 304 without running the search.
+    """
+    async with (
+        read_connection("yif.ious", max_lag=2) as conn,
+        query_guard(conn, request, "yif.ious", timeout=30),
+    ):
+        cursor = conn.cursor()
+        try:
+            user = await get_yif_user_async(cursor, user_id)
+            if not user:
+                raise HTTPException(401, "User not found")
 
-        # Always add ORDER BY at the end (after any wrapping)
-        query += " ORDER BY ious_date DESC, ious_id DESC"
+            version = await data_version_async(cursor, "yif")
+            etag = make_etag("yif.ious", version, user_id, user['role'], request.url.query)
+            if etag and etag_matches(request, etag):
+                return not_modified(etag)
+            set_etag(response, etag)
 
-        # Get total count
-        count_query = f"SELECT COUNT(*) FROM ({query}) as subquery"
-        cursor.execute(count_query, params)
-        total = cursor.fetchone()['count']
+            set_rls_context(cursor, user_id, user['role'] or 'user')
 
-        # Add pagination (limit=0 means no limit)
-        if limit > 0:
-            query += " LIMIT %s OFFSET %s"
-            params.extend([limit, skip])
+            # Build query
+            query = """
+                SELECT
+                    i.id,
+                    i.ious_id,
+                    i.user_code,
+                    i.worker_id,
+                    i.ious_date,
+                    i.total_amount,
+                    i.status,
+                    i.created_at,
+                    COALESCE(SUM(p.amount), 0) as paid,
+                    i.total_amount - COALESCE(SUM(p.amount), 0) as rest
+                FROM yif_ious i
+                LEFT JOIN yif_payments p ON p.ious_id = i.id
+                WHERE 1=1
+            """
+            params = []
+
+            if start_date:
+                query += " AND i.ious_date >= %s"
+                params.append(start_date)
+
+            if end_date:
+                query += " AND i.ious_date <= %s"
+                params.append(end_date)
+
+            if ious_id:
+                query += " AND i.ious_id LIKE %s"
+                params.append(f"%{ious_id}%")
+
+            if status:
+                status_list = [int(s) for s in status.split(',') if s.isdigit()]
+                if status_list:
+                    query += f" AND i.status IN ({','.join(['%s'] * len(status_list))})"
+                    params.extend(status_list)
+
+            # worker_id filter logic:
+            # - By default, everyone only sees their own IOUs (by worker_id)
+            # - Admin/manager can pass target_worker_id="all" to see all, or target_worker_id=X to see specific user
+            if target_worker_id and user['role'] in ('admin', 'manager'):
+                # Admin/manager with explicit target_worker_id parameter
+                if target_worker_id.lower() != 'all':
+                    query += " AND i.worker_id = %s"
+                    params.append(int(target_worker_id))
+                # If target_worker_id="all", no filter - see all users
+            else:
+                # Default: filter by current user's worker_id
+                query += " AND i.worker_id = %s"
+                params.append(user_id)
+
+            query += " GROUP BY i.id"
+
+            # Amount filters (applied after grouping)
+            having_clauses = []
+
+            if remaining_amount is not None:
+                having_clauses.append("(i.total_amount - COALESCE(SUM(p.amount), 0)) BETWEEN %s AND %s")
+                params.append(remaining_amount - amount_margin)
+                params.append(remaining_amount + amount_margin)
+
+            if initial_amount is not None:
+                having_clauses.append("i.total_amount BETWEEN %s AND %s")
+                params.append(initial_amount - initial_margin)
+                params.append(initial_amount + initial_margin)
+
+            if having_clauses:
+                query += " HAVING " + " AND ".join(having_clauses)
+
+            # If text filters are used, we need to filter via subquery with items
+            if client or ticket_number or flight or remark:
+                # Build item filter subquery
+                item_conditions = []
+                item_params = []
+                if client:
+                    item_conditions.append("LOWER(it.client) LIKE %s")
+                    item_params.append(f"%{client.lower()}%")
+                if ticket_number:
+                    item_conditions.append("it.ticket_number LIKE %s")
+                    item_params.append(f"%{ticket_number}%")
+                if flight:
+                    item_conditions.append("LOWER(it.flight) LIKE %s")
+                    item_params.append(f"%{flight.lower()}%")
+                if remark:
+                    item_conditions.append("LOWER(it.remark) LIKE %s")
+                    item_params.append(f"%{remark.lower()}%")
+
+                # Wrap original query and filter by items
+                query = f"""
+                    SELECT * FROM ({query}) AS filtered_ious
+                    WHERE filtered_ious.id IN (
+                        SELECT DISTINCT it.ious_id FROM yif_iou_items it
+                        WHERE {" AND ".join(item_conditions)}
+                    )
+                """
+                params = params + item_params
+
+            # Always add ORDER BY at the end (after any wrapping)
+            query += " ORDER BY ious_date DESC, ious_id DESC"
+
+            # Get total count
+            count_query = f"SELECT COUNT(*) FROM ({query}) as subquery"
+            await cursor.execute(count_query, params)
+            total = (await cursor.fetchone())['count']
+
+            # Add pagination (limit=0 means no limit)
+            if limit > 0:
+                query += " LIMIT %s OFFSET %s"
+                params.extend([limit, skip])
+
+            await cursor.execute(query, params)
+            ious_list = await cursor.fetchall()
+
+            if not ious_list:
+                return {
+                    "success": True,
+                    "total": 0,
+                    "skip": skip,
+                    "limit": limit,
+                    "ious": []
+                }
+
+            # ===== BATCH QUERY OPTIMIZATION =====
+            # Get all IOU IDs for batch queries
+            iou_ids = [iou['id'] for iou in ious_list]
+
+            # Batch queries: ALL items and ALL payments for these IOUs, sent
+            # together in one round trip and read once both are back.
+            payments_cursor = conn.cursor()
+            async with pipeline(conn):
+                await cursor.execute("""
+                    SELECT ious_id, client, amount, flight, ticket_number, remark
+                    FROM yif_iou_items
+                    WHERE ious_id = ANY(%s)
+                    ORDER BY ious_id, item_index
+                """, (iou_ids,), prepare=True)
+                await payments_cursor.execute("""
+                    SELECT ious_id, payment_date, payer_name, amount, remark
+                    FROM yif_payments
+                    WHERE ious_id = ANY(%s)
+                    ORDER BY ious_id, created_at
+                """, (iou_ids,), prepare=True)
+            all_items = await cursor.fetchall()
+            all_payments = await payments_cursor.fetchall()
+
+            # Group items/payments by IOU ID (O(1) lookup). Rows are sent as-is;
+            # json_response serializes Decimal/datetime without per-field conversion.
+            items_by_iou = {}
+            for item in all_items:
+                items_by_iou.setdefault(item.pop('ious_id'), []).append(item)
+
+            payments_by_iou = {}
+            for payment in all_payments:
+                payments_by_iou.setdefault(payment.pop('ious_id'), []).append(payment)
 
-        cursor.execute(query, params)
-        ious_list = cursor.fetchall()
+            for iou in ious_list:
+                iou['items'] = items_by_iou.get(iou['id'], [])
+                iou['payments'] = payments_by_iou.get(iou['id'], [])
 
-        if not ious_list:
-            return {
+            return json_response({
                 "success": True,
-                "total": 0,
+                "total": total,
                 "skip": skip,
                 "limit": limit,
-                "ious": []
-            }
+                "ious": ious_list
+            }, response)
 
-        # ===== BATCH QUERY OPTIMIZATION =====
-        # Get all IOU IDs for batch queries
-        iou_ids = [iou['id'] for iou in ious_list]
-
-        # Batch query: Get ALL items for these IOUs in ONE query
-        cursor.execute("""
-            SELECT ious_id, client, amount, flight, ticket_number, remark, item_index
-            FROM yif_iou_items
-            WHERE ious_id = ANY(%s)
-            ORDER BY ious_id, item_index
-        """, (iou_ids,))
-        all_items = cursor.fetchall()
-
-        # Batch query: Get ALL payments for these IOUs in ONE query
-        cursor.execute("""
-            SELECT ious_id, payment_date, payer_name, amount, remark
-            FROM yif_payments
-            WHERE ious_id = ANY(%s)
-            ORDER BY ious_id, created_at
-        """, (iou_ids,))
-        all_payments = cursor.fetchall()
-
-        # Group items by IOU ID using dictionary (O(1) lookup)
-        items_by_iou = {}
-        for item in all_items:
-            iou_id = item['ious_id']
-            if iou_id not in items_by_iou:
-                items_by_iou[iou_id] = []
-            items_by_iou[iou_id].append({
-                'client': item['client'],
-                'amount': float(item['amount']),
-                'flight': item['flight'],
-                'ticket_number': item['ticket_number'],
-                'remark': item['remark']
-            })
-
-        # Group payments by IOU ID using dictionary (O(1) lookup)
-        payments_by_iou = {}
-        for payment in all_payments:
-            iou_id = payment['ious_id']
-            if iou_id not in payments_by_iou:
-                payments_by_iou[iou_id] = []
-            payments_by_iou[iou_id].append({
-                'payment_date': payment['payment_date'],
-                'payer_name': payment['payer_name'],
-                'amount': float(payment['amount']),
-                'remark': payment['remark']
-            })
-
-        # Build results using dictionary lookups (fast!)
-        results = []
-        for iou in ious_list:
-            iou_id = iou['id']
-            results.append({
-                **dict(iou),
-                'total_amount': float(iou['total_amount']),
-                'paid': float(iou['paid']),
-                'rest': float(iou['rest']),
-                'items': items_by_iou.get(iou_id, []),
-                'payments': payments_by_iou.get(iou_id, [])
-            })
-
-        return {
-            "success": True,
-            "total": total,
-            "skip": skip,
-            "limit": limit,
-            "ious": results
-        }
-
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(500, f"Search failed: {str(e)}")
-    finally:
-        cursor.close()
-        conn.close()
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(500, f"Search failed: {str(e)}")
 
 
 @router.get("/ious/{iou_db_id}")
 async def get_iou(iou_db_id: int, user_id: int = Depends(verify_token)):
     """Get a single IOU with full details"""
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    async with get_async_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            user = await get_yif_user_async(cursor, user_id)
+            if not user:
+                raise HTTPException(401, "User not found")
 
-    try:
-        user = get_user_info(cursor, user_id)
-        if not user:
-            raise HTTPException(401, "User not found")
-
-        set_rls_context(cursor, user_id, user['role'] or 'user')
-
-        # Users can only view their own IOUs (by worker_id)
-        cursor.execute("""
-            SELECT
-                i.*,
-                COALESCE(SUM(p.amount), 0) as paid,
-                i.total_amount - COALESCE(SUM(p.amount), 0) as rest
-            FROM yif_ious i
-            LEFT JOIN yif_payments p ON p.ious_id = i.id
-            WHERE i.id = %s AND i.worker_id = %s
-            GROUP BY i.id
-        """, (iou_db_id, user_id))
-
-        iou = cursor.fetchone()
-        if not iou:
-            raise HTTPException(404, "IOU not found or access denied")
-
-        # Get items
-        cursor.execute("""
-            SELECT * FROM yif_iou_items
-            WHERE ious_id = %s
-            ORDER BY item_index
-        """, (iou_db_id,))
-        items = cursor.fetchall()
-
-        # Get payments
-        cursor.execute("""
-            SELECT * FROM yif_payments
-            WHERE ious_id = %s
-            ORDER BY created_at
-        """, (iou_db_id,))
-        payments = cursor.fetchall()
-
-        return {
-            "success": True,
-            "iou": {
-                **dict(iou),
-                'total_amount': float(iou['total_amount']),
-                'paid': float(iou['paid']),
-                'rest': float(iou['rest']),
-                'items': [dict(item) for item in items],
-                'payments': [dict(p) for p in payments]
-            }
-        }
+            set_rls_context(cursor, user_id, user['role'] or 'user')
 
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(500, f"Failed to get IOU: {str(e)}")
-    finally:
-        cursor.close()
-        conn.close()
+            # Users can only view their own IOUs (by worker_id)
+            await cursor.execute("""
+                SELECT
+                    i.*,
+                    COALESCE(SUM(p.amount), 0) as paid,
+                    i.total_amount - COALESCE(SUM(p.amount), 0) as rest
+                FROM yif_ious i
+                LEFT JOIN yif_payments p ON p.ious_id = i.id
+                WHERE i.id = %s AND i.worker_id = %s
+                GROUP BY i.id
+            """, (iou_db_id, user_id))
+
+            iou = await cursor.fetchone()
+            if not iou:
+                raise HTTPException(404, "IOU not found or access denied")
+
+            # Get items
+            await cursor.execute("""
+                SELECT * FROM yif_iou_items
+                WHERE ious_id = %s
+                ORDER BY item_index
+            """, (iou_db_id,))
+            items = await cursor.fetchall()
+
+            # Get payments
+            await cursor.execute("""
+                SELECT * FROM yif_payments
+                WHERE ious_id = %s
+                ORDER BY created_at
+            """, (iou_db_id,))
+            payments = await cursor.fetchall()
+
+            iou['items'] = items
+            iou['payments'] = payments
+            return json_response({"success": True, "iou": iou})
+
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(500, f"Failed to get IOU: {str(e)}")
 
 
 @router.get("/ious/next-id/{user_code}/{date}")
 async def get_next_iou_id(user_code: str, date: str, user_id: int = Depends(verify_token)):
     """Get the next available IOU ID for hand entry"""
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-
-    try:
-        next_id = generate_ious_id(cursor, user_code, date, is_hand_entry=True)
-        return {"success": True, "next_id": next_id}
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(500, f"Failed to generate ID: {str(e)}")
-    finally:
-        cursor.close()
-        conn.close()
+    async with get_async_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            next_id = await generate_ious_id_async(cursor, user_code, date, is_hand_entry=True)
+            return {"success": True, "next_id": next_id}
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(500, f"Failed to generate ID: {str(e)}")
 
 
 # ========================
@@ -617,328 +576,268 @@ async def get_next_iou_id(user_code: str, date: str, user_id: int = Depends(veri
 @router.post("/payments")
 @limiter.limit("60/minute")
 async def create_payment(request: Request, payment_data: PaymentCreate, user_id: int = Depends(verify_token)):
-    """Create a single payment"""
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    """Create a single payment
 
-    try:
-        user = get_user_info(cursor, user_id)
-        if not user:
-            raise HTTPException(401, "User not found")
+    The status refresh, log entry and new remaining amount go out in one
+    pipeline after the payment row.
+    """
+    async with get_async_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            user = await get_yif_user_async(cursor, user_id)
+            if not user:
+                raise HTTPException(401, "User not found")
 
-        set_rls_context(cursor, user_id, user['role'] or 'user')
+            set_rls_context(cursor, user_id, user['role'] or 'user')
 
-        # Validate date
-        if len(payment_data.payment_date) != 6 or not payment_data.payment_date.isdigit():
-            raise HTTPException(400, "Date must be in YYMMDD format")
+            # Validate date
+            if len(payment_data.payment_date) != 6 or not payment_data.payment_date.isdigit():
+                raise HTTPException(400, "Date must be in YYMMDD format")
 
-        # Validate user_code
-        user_code = payment_data.user_code.upper()
-        if not user_code.isalpha():
-            raise HTTPException(400, "User code must be letters only")
+            # Validate user_code
+            user_code = payment_data.user_code.upper()
+            if not user_code.isalpha():
+                raise HTTPException(400, "User code must be letters only")
 
-        while len(user_code) < 3:
-            user_code = 'A' + user_code
-        if len(user_code) > 3:
-            user_code = user_code[:3]
+            while len(user_code) < 3:
+                user_code = 'A' + user_code
+            if len(user_code) > 3:
+                user_code = user_code[:3]
 
-        # Check if IOU exists
-        cursor.execute("SELECT id, ious_id FROM yif_ious WHERE id = %s", (payment_data.ious_db_id,))
-        iou = cursor.fetchone()
-        if not iou:
-            raise HTTPException(404, "IOU not found")
+            # Check if IOU exists
+            await cursor.execute("SELECT id, ious_id FROM yif_ious WHERE id = %s", (payment_data.ious_db_id,))
+            iou = await cursor.fetchone()
+            if not iou:
+                raise HTTPException(404, "IOU not found")
 
-        # Insert payment
-        cursor.execute("""
-            INSERT INTO yif_payments (ious_id, worker_id, user_code, payment_date, payer_name, amount, remark)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-            RETURNING id
-        """, (payment_data.ious_db_id, user_id, user_code, payment_data.payment_date,
-              payment_data.payer_name, payment_data.amount, payment_data.remark or ""))
+            # Insert payment
+            await cursor.execute(_INSERT_PAYMENT_SQL, (
+                payment_data.ious_db_id, user_id, user_code, payment_data.payment_date,
+                payment_data.payer_name, payment_data.amount, payment_data.remark or ""), prepare=True)
 
-        payment_id = cursor.fetchone()['id']
+            payment_id = (await cursor.fetchone())['id']
 
-        # Update IOU status
-        update_iou_status(cursor, payment_data.ious_db_id)
+            async with pipeline(conn):
+                # Update IOU status
+                await update_iou_status_async(cursor, payment_data.ious_db_id)
 
-        # Log
-        cursor.execute("""
-            INSERT INTO yif_logs (worker_id, action, target_type, target_id, details)
-            VALUES (%s, %s, %s, %s, %s)
-        """, (user_id, 'create_payment', 'payment', str(payment_id),
-              f"Payment of {payment_data.amount} to IOU {iou['ious_id']}"))
-
-        conn.commit()
-
-        # Get updated IOU rest
-        rest = calculate_iou_rest(cursor, payment_data.ious_db_id)
-
-        return {
-            "success": True,
-            "message": f"Payment created successfully",
-            "payment": {
-                "id": payment_id,
-                "ious_id": iou['ious_id'],
-                "amount": payment_data.amount,
-                "new_rest": rest
+                # Log
+                await cursor.execute(_INSERT_LOG_SQL, (
+                    user_id, 'create_payment', 'payment', str(payment_id),
+                    f"Payment of {payment_data.amount} to IOU {iou['ious_id']}"), prepare=True)
+
+                # Get updated IOU rest
+                ious_rest = await _fetch_ious_rest(cursor, [payment_data.ious_db_id])
+
+            rest = float(ious_rest[0]['rest']) if ious_rest else 0
+
+            return {
+                "success": True,
+                "message": f"Payment created successfully",
+                "payment": {
+                    "id": payment_id,
+                    "ious_id": iou['ious_id'],
+                    "amount": payment_data.amount,
+                    "new_rest": rest
+                }
             }
-        }
 
-    except HTTPException:
-        conn.rollback()
-        raise
-    except Exception as e:
-        conn.rollback()
-        raise HTTPException(500, f"Failed to create payment: {str(e)}")
-    finally:
-        cursor.close()
-        conn.close()
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(500, f"Failed to create payment: {str(e)}")
+
+
+async def _fetch_ious_rest(cursor, ious_db_ids: List[int]):
+    """IOUs with their remaining amounts in ious_db_ids order, in one query."""
+    await cursor.execute("""
+        SELECT
+            i.id, i.ious_id, i.total_amount,
+            i.total_amount - COALESCE(SUM(p.amount), 0) as rest
+        FROM yif_ious i
+        LEFT JOIN yif_payments p ON p.ious_id = i.id
+        WHERE i.id = ANY(%s)
+        GROUP BY i.id
+    """, (list(ious_db_ids),), prepare=True)
+    by_id = {iou['id']: iou for iou in await cursor.fetchall()}
+    return [by_id[iou_id] for iou_id in ious_db_ids if iou_id in by_id]
+
+
+async def _insert_payments(conn, cursor, user_id: int, user_code: str, batch_data: BatchPaymentCreate,
+                           allocations, action: str, target_id: str, details: str):
+    """Insert one payment per (iou, amount) allocation, refresh each IOU's
+    status and log the batch, all in one pipeline. Returns the payments."""
+    inserts = []
+    async with pipeline(conn):
+        for iou, payment_amount in allocations:
+            # Own cursor per INSERT so each RETURNING id is still there afterwards.
+            insert = conn.cursor()
+            await insert.execute(_INSERT_PAYMENT_SQL, (
+                iou['id'], user_id, user_code, batch_data.payment_date,
+                batch_data.payer_name, payment_amount, batch_data.remark or ""), prepare=True)
+            inserts.append((insert, iou, payment_amount))
+
+            # Update IOU status
+            await update_iou_status_async(cursor, iou['id'])
+
+        # Log
+        await cursor.execute(_INSERT_LOG_SQL, (user_id, action, 'payment', target_id, details), prepare=True)
+
+    created_payments = []
+    for insert, iou, payment_amount in inserts:
+        created_payments.append({
+            "id": (await insert.fetchone())['id'],
+            "ious_id": iou['ious_id'],
+            "amount": payment_amount
+        })
+    return created_payments
 
 
 @router.post("/payments/batch")
 @limiter.limit("20/minute")
 async def create_batch_payment(request: Request, batch_data: BatchPaymentCreate, user_id: int = Depends(verify_token)):
     """Create batch payments - distribute amount across multiple IOUs in order"""
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    async with get_async_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            user = await get_yif_user_async(cursor, user_id)
+            if not user:
+                raise HTTPException(401, "User not found")
 
-    try:
-        user = get_user_info(cursor, user_id)
-        if not user:
-            raise HTTPException(401, "User not found")
-
-        set_rls_context(cursor, user_id, user['role'] or 'user')
-
-        # Validate
-        if len(batch_data.payment_date) != 6 or not batch_data.payment_date.isdigit():
-            raise HTTPException(400, "Date must be in YYMMDD format")
-
-        user_code = batch_data.user_code.upper()
-        while len(user_code) < 3:
-            user_code = 'A' + user_code
-        if len(user_code) > 3:
-            user_code = user_code[:3]
-
-        if batch_data.total_amount <= 0:
-            raise HTTPException(400, "Amount must be positive")
-
-        # Get IOUs with their remaining amounts
-        ious_info = []
-        total_rest = 0
-        for iou_id in batch_data.ious_db_ids:
-            cursor.execute("""
-                SELECT
-                    i.id, i.ious_id, i.total_amount,
-                    i.total_amount - COALESCE(SUM(p.amount), 0) as rest
-                FROM yif_ious i
-                LEFT JOIN yif_payments p ON p.ious_id = i.id
-                WHERE i.id = %s
-                GROUP BY i.id
-            """, (iou_id,))
-            iou = cursor.fetchone()
-            if iou:
-                ious_info.append(iou)
-                total_rest += float(iou['rest'])
+            set_rls_context(cursor, user_id, user['role'] or 'user')
 
-        if not ious_info:
-            raise HTTPException(404, "No valid IOUs found")
+            # Validate
+            if len(batch_data.payment_date) != 6 or not batch_data.payment_date.isdigit():
+                raise HTTPException(400, "Date must be in YYMMDD format")
 
-        if batch_data.total_amount > total_rest:
-            raise HTTPException(400, f"Payment amount ({batch_data.total_amount}) exceeds total remaining ({total_rest})")
+            user_code = batch_data.user_code.upper()
+            while len(user_code) < 3:
+                user_code = 'A' + user_code
+            if len(user_code) > 3:
+                user_code = user_code[:3]
 
-        # Distribute payments
-        remaining_amount = batch_data.total_amount
-        created_payments = []
+            if batch_data.total_amount <= 0:
+                raise HTTPException(400, "Amount must be positive")
 
-        for iou in ious_info:
-            if remaining_amount <= 0:
-                break
+            # Get IOUs with their remaining amounts
+            ious_info = await _fetch_ious_rest(cursor, batch_data.ious_db_ids)
+            total_rest = sum(float(iou['rest']) for iou in ious_info)
 
-            rest = float(iou['rest'])
-            if rest <= 0:
-                continue
+            if not ious_info:
+                raise HTTPException(404, "No valid IOUs found")
 
-            payment_amount = min(rest, remaining_amount)
-            remaining_amount -= payment_amount
+            if batch_data.total_amount > total_rest:
+                raise HTTPException(400, f"Payment amount ({batch_data.total_amount}) exceeds total remaining ({total_rest})")
 
-            cursor.execute("""
-                INSERT INTO yif_payments (ious_id, worker_id, user_code, payment_date, payer_name, amount, remark)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-                RETURNING id
-            """, (iou['id'], user_id, user_code, batch_data.payment_date,
-                  batch_data.payer_name, payment_amount, batch_data.remark or ""))
+            # Distribute payments
+            remaining_amount = batch_data.total_amount
+            allocations = []
 
-            payment_id = cursor.fetchone()['id']
+            for iou in ious_info:
+                if remaining_amount <= 0:
+                    break
 
-            # Update IOU status
-            update_iou_status(cursor, iou['id'])
+                rest = float(iou['rest'])
+                if rest <= 0:
+                    continue
 
-            created_payments.append({
-                "id": payment_id,
-                "ious_id": iou['ious_id'],
-                "amount": payment_amount
-            })
+                payment_amount = min(rest, remaining_amount)
+                remaining_amount -= payment_amount
+                allocations.append((iou, payment_amount))
 
-        # Log
-        cursor.execute("""
-            INSERT INTO yif_logs (worker_id, action, target_type, target_id, details)
-            VALUES (%s, %s, %s, %s, %s)
-        """, (user_id, 'batch_payment', 'payment', 'batch',
-              f"Batch payment of {batch_data.total_amount} across {len(created_payments)} IOUs"))
-
-        conn.commit()
-
-        return {
-            "success": True,
-            "message": f"Created {len(created_payments)} payments",
-            "payments": created_payments
-        }
-
-    except HTTPException:
-        conn.rollback()
-        raise
-    except Exception as e:
-        conn.rollback()
-        raise HTTPException(500, f"Failed to create batch payments: {str(e)}")
-    finally:
-        cursor.close()
-        conn.close()
+            created_payments = await _insert_payments(
+                conn, cursor, user_id, user_code, batch_data, allocations, 'batch_payment', 'batch',
+                f"Batch payment of {batch_data.total_amount} across {len(allocations)} IOUs")
+
+            return {
+                "success": True,
+                "message": f"Created {len(created_payments)} payments",
+                "payments": created_payments
+            }
+
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(500, f"Failed to create batch payments: {str(e)}")
 
 
 @router.post("/payments/selective")
 async def create_selective_payment(batch_data: BatchPaymentCreate, user_id: int = Depends(verify_token)):
     """Create selective payments - prioritize negative IOUs first"""
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    async with get_async_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            user = await get_yif_user_async(cursor, user_id)
+            if not user:
+                raise HTTPException(401, "User not found")
 
-    try:
-        user = get_user_info(cursor, user_id)
-        if not user:
-            raise HTTPException(401, "User not found")
-
-        set_rls_context(cursor, user_id, user['role'] or 'user')
-
-        # Validate
-        if len(batch_data.payment_date) != 6 or not batch_data.payment_date.isdigit():
-            raise HTTPException(400, "Date must be in YYMMDD format")
-
-        user_code = batch_data.user_code.upper()
-        while len(user_code) < 3:
-            user_code = 'A' + user_code
-        if len(user_code) > 3:
-            user_code = user_code[:3]
-
-        # Get IOUs with their remaining amounts
-        ious_info = []
-        for iou_id in batch_data.ious_db_ids:
-            cursor.execute("""
-                SELECT
-                    i.id, i.ious_id, i.total_amount,
-                    i.total_amount - COALESCE(SUM(p.amount), 0) as rest
-                FROM yif_ious i
-                LEFT JOIN yif_payments p ON p.ious_id = i.id
-                WHERE i.id = %s
-                GROUP BY i.id
-            """, (iou_id,))
-            iou = cursor.fetchone()
-            if iou:
-                ious_info.append(iou)
+            set_rls_context(cursor, user_id, user['role'] or 'user')
 
-        if not ious_info:
-            raise HTTPException(404, "No valid IOUs found")
+            # Validate
+            if len(batch_data.payment_date) != 6 or not batch_data.payment_date.isdigit():
+                raise HTTPException(400, "Date must be in YYMMDD format")
 
-        # Separate negative and positive IOUs
-        negative_ious = [i for i in ious_info if float(i['rest']) < 0]
-        positive_ious = [i for i in ious_info if float(i['rest']) > 0]
+            user_code = batch_data.user_code.upper()
+            while len(user_code) < 3:
+                user_code = 'A' + user_code
+            if len(user_code) > 3:
+                user_code = user_code[:3]
 
-        # Calculate totals
-        total_rest = sum(float(i['rest']) for i in ious_info)
+            # Get IOUs with their remaining amounts
+            ious_info = await _fetch_ious_rest(cursor, batch_data.ious_db_ids)
 
-        if batch_data.total_amount > total_rest:
-            raise HTTPException(400, f"Payment amount ({batch_data.total_amount}) exceeds total remaining ({total_rest})")
+            if not ious_info:
+                raise HTTPException(404, "No valid IOUs found")
 
-        remaining_amount = batch_data.total_amount
-        created_payments = []
+            # Separate negative and positive IOUs
+            negative_ious = [i for i in ious_info if float(i['rest']) < 0]
+            positive_ious = [i for i in ious_info if float(i['rest']) > 0]
 
-        # First, clear negative IOUs (pay their absolute value to bring to 0)
-        for iou in negative_ious:
-            rest = float(iou['rest'])  # This is negative
-            payment_amount = rest  # Negative payment to bring to 0
-            remaining_amount -= rest  # Subtracting negative = adding
+            # Calculate totals
+            total_rest = sum(float(i['rest']) for i in ious_info)
 
-            cursor.execute("""
-                INSERT INTO yif_payments (ious_id, worker_id, user_code, payment_date, payer_name, amount, remark)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-                RETURNING id
-            """, (iou['id'], user_id, user_code, batch_data.payment_date,
-                  batch_data.payer_name, payment_amount, batch_data.remark or ""))
+            if batch_data.total_amount > total_rest:
+                raise HTTPException(400, f"Payment amount ({batch_data.total_amount}) exceeds total remaining ({total_rest})")
 
-            payment_id = cursor.fetchone()['id']
+            remaining_amount = batch_data.total_amount
+            allocations = []
 
-            # Update IOU status
-            update_iou_status(cursor, iou['id'])
-
-            created_payments.append({
-                "id": payment_id,
-                "ious_id": iou['ious_id'],
-                "amount": payment_amount
-            })
-
-        # Then distribute to positive IOUs
-        for iou in positive_ious:
-            if remaining_amount <= 0:
-                break
-
-            rest = float(iou['rest'])
-            payment_amount = min(rest, remaining_amount)
-            remaining_amount -= payment_amount
-
-            cursor.execute("""
-                INSERT INTO yif_payments (ious_id, worker_id, user_code, payment_date, payer_name, amount, remark)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-                RETURNING id
-            """, (iou['id'], user_id, user_code, batch_data.payment_date,
-                  batch_data.payer_name, payment_amount, batch_data.remark or ""))
+            # First, clear negative IOUs (pay their absolute value to bring to 0)
+            for iou in negative_ious:
+                rest = float(iou['rest'])  # This is negative
+                payment_amount = rest  # Negative payment to bring to 0
+                remaining_amount -= rest  # Subtracting negative = adding
+                allocations.append((iou, payment_amount))
 
-            payment_id = cursor.fetchone()['id']
+            # Then distribute to positive IOUs
+            for iou in positive_ious:
+                if remaining_amount <= 0:
+                    break
 
-            # Update IOU status
-            update_iou_status(cursor, iou['id'])
+                rest = float(iou['rest'])
+                payment_amount = min(rest, remaining_amount)
+                remaining_amount -= payment_amount
+                allocations.append((iou, payment_amount))
 
-            created_payments.append({
-                "id": payment_id,
-                "ious_id": iou['ious_id'],
-                "amount": payment_amount
-            })
+            created_payments = await _insert_payments(
+                conn, cursor, user_id, user_code, batch_data, allocations, 'selective_payment', 'selective',
+                f"Selective payment of {batch_data.total_amount} across {len(allocations)} IOUs")
 
-        # Log
-        cursor.execute("""
-            INSERT INTO yif_logs (worker_id, action, target_type, target_id, details)
-            VALUES (%s, %s, %s, %s, %s)
-        """, (user_id, 'selective_payment', 'payment', 'selective',
-              f"Selective payment of {batch_data.total_amount} across {len(created_payments)} IOUs"))
-
-        conn.commit()
-
-        return {
-            "success": True,
-            "message": f"Created {len(created_payments)} payments",
-            "payments": created_payments
-        }
-
-    except HTTPException:
-        conn.rollback()
-        raise
-    except Exception as e:
-        conn.rollback()
-        raise HTTPException(500, f"Failed to create selective payments: {str(e)}")
-    finally:
-        cursor.close()
-        conn.close()
+            return {
+                "success": True,
+                "message": f"Created {len(created_payments)} payments",
+                "payments": created_payments
+            }
+
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(500, f"Failed to create selective payments: {str(e)}")
 
 
 @router.get("/payments")
 async def search_payments(
+    request: Request,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
     payer_name: Optional[str] = None,
@@ -949,86 +848,194 @@ async def search_payments(
     user_id: int = Depends(verify_token)
 ):
     """Search payments"""
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    async with (
+        read_connection("yif.payments", max_lag=2) as conn,
+        query_guard(conn, request, "yif.payments", timeout=30),
+    ):
+        cursor = conn.cursor()
+        try:
+            user = await get_yif_user_async(cursor, user_id)
+            if not user:
+                raise HTTPException(401, "User not found")
 
-    try:
-        user = get_user_info(cursor, user_id)
-        if not user:
-            raise HTTPException(401, "User not found")
-
-        set_rls_context(cursor, user_id, user['role'] or 'user')
-
-        query = """
-            SELECT
-                p.*,
-                i.ious_id as iou_ious_id
-            FROM yif_payments p
-            JOIN yif_ious i ON i.id = p.ious_id
-            WHERE 1=1
-        """
-        params = []
-
-        if start_date:
-            query += " AND p.payment_date >= %s"
-            params.append(start_date)
-
-        if end_date:
-            query += " AND p.payment_date <= %s"
-            params.append(end_date)
-
-        if payer_name:
-            query += " AND p.payer_name LIKE %s"
-            params.append(f"%{payer_name}%")
-
-        if remark:
-            query += " AND p.remark LIKE %s"
-            params.append(f"%{remark}%")
-
-        # worker_id filter: everyone sees their own payments by default
-        # Admin/manager can pass target_worker_id="all" to see all
-        if target_worker_id and user['role'] in ('admin', 'manager'):
-            if target_worker_id.lower() != 'all':
+            set_rls_context(cursor, user_id, user['role'] or 'user')
+
+            query = """
+                SELECT
+                    p.*,
+                    i.ious_id as iou_ious_id
+                FROM yif_payments p
+                JOIN yif_ious i ON i.id = p.ious_id
+                WHERE 1=1
+            """
+            params = []
+
+            if start_date:
+                query += " AND p.payment_date >= %s"
+                params.append(start_date)
+
+            if end_date:
+                query += " AND p.payment_date <= %s"
+                params.append(end_date)
+
+            if payer_name:
+                query += " AND p.payer_name LIKE %s"
+                params.append(f"%{payer_name}%")
+
+            if remark:
+                query += " AND p.remark LIKE %s"
+                params.append(f"%{remark}%")
+
+            # worker_id filter: everyone sees their own payments by default
+            # Admin/manager can pass target_worker_id="all" to see all
+            if target_worker_id and user['role'] in ('admin', 'manager'):
+                if target_worker_id.lower() != 'all':
+                    query += " AND p.worker_id = %s"
+                    params.append(int(target_worker_id))
+            else:
                 query += " AND p.worker_id = %s"
-                params.append(int(target_worker_id))
-        else:
-            query += " AND p.worker_id = %s"
-            params.append(user_id)
-
-        # Count
-        count_query = f"SELECT COUNT(*) FROM ({query}) as subquery"
-        cursor.execute(count_query, params)
-        total = cursor.fetchone()['count']
-
-        query += " ORDER BY p.payment_date DESC, p.created_at DESC LIMIT %s OFFSET %s"
-        params.extend([limit, skip])
-
-        cursor.execute(query, params)
-        payments = cursor.fetchall()
-
-        return {
-            "success": True,
-            "total": total,
-            "skip": skip,
-            "limit": limit,
-            "payments": [dict(p) for p in payments]
-        }
-
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(500, f"Search failed: {str(e)}")
-    finally:
-        cursor.close()
-        conn.close()
+                params.append(user_id)
+
+            # Count
+            count_query = f"SELECT COUNT(*) FROM ({query}) as subquery"
+            await cursor.execute(count_query, params)
+            total = (await cursor.fetchone())['count']
+
+            query += " ORDER BY p.payment_date DESC, p.created_at DESC LIMIT %s OFFSET %s"
+            params.extend([limit, skip])
+
+            await cursor.execute(query, params)
+            payments = await cursor.fetchall()
+
+            return {
+                "success": True,
+                "total": total,
+                "skip": skip,
+                "limit": limit,
+                "payments": [dict(p) for p in payments]
+            }
+
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(500, f"Search failed: {str(e)}")
 
 
 # ========================
 # Export Endpoints
 # ========================
 
+@tracing.traced("cpu.build_ious_workbook")
+def _build_ious_workbook(ious_list, items_by_iou, payments_by_iou, export_type: str) -> io.BytesIO:
+    """Render the IOU export (summary, detailed or full) to an in-memory .xlsx"""
+    import openpyxl
+
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = "IOUs"
+
+    if export_type == "summary":
+        # Summary: one row per IOU
+        ws.append(['Date', 'Initial Amount', 'Remaining', 'Client', 'User', 'IOU ID', 'Remark'])
+        for iou in ious_list:
+            items = items_by_iou.get(iou['id'], [])
+            item = items[0] if items else None
+            ws.append([
+                iou['ious_date'],
+                float(iou['total_amount']),
+                float(iou['rest']),
+                item['client'] if item else '',
+                iou['user_code'],
+                iou['ious_id'],
+                item['remark'] if item else ''
+            ])
+
+    elif export_type == "detailed":
+        # Detailed: show all items
+        ws.append(['Date', 'Total Amount', 'Remaining', 'Client', 'User', 'IOU ID',
+                  'Ticket', 'Flight', 'Item Amount', 'Remark'])
+        for iou in ious_list:
+            items = items_by_iou.get(iou['id'], [])
+            for idx, item in enumerate(items):
+                ws.append([
+                    iou['ious_date'] if idx == 0 else '',
+                    float(iou['total_amount']) if idx == 0 else '',
+                    float(iou['rest']) if idx == 0 else '',
+                    item['client'],
+                    iou['user_code'] if idx == 0 else '',
+                    iou['ious_id'] if idx == 0 else '',
+                    item['ticket_number'],
+                    item['flight'],
+                    float(item['amount']),
+                    item['remark']
+                ])
+
+    else:  # full - include payments
+        ws.append(['Date', 'Total Amount', 'Remaining', 'Client', 'User', 'IOU ID',
+                  'Ticket', 'Flight', 'Item Amount', 'IOU Remark',
+                  'Payment Date', 'Payment Amount', 'Payer', 'Payment Remark'])
+        for iou in ious_list:
+            items = items_by_iou.get(iou['id'], [])
+            payments = payments_by_iou.get(iou['id'], [])
+
+            max_rows = max(len(items), len(payments), 1)
+            for idx in range(max_rows):
+                row = [
+                    iou['ious_date'] if idx == 0 else '',
+                    float(iou['total_amount']) if idx == 0 else '',
+                    float(iou['rest']) if idx == 0 else '',
+                    items[idx]['client'] if idx < len(items) else '',
+                    iou['user_code'] if idx == 0 else '',
+                    iou['ious_id'] if idx == 0 else '',
+                    items[idx]['ticket_number'] if idx < len(items) else '',
+                    items[idx]['flight'] if idx < len(items) else '',
+                    float(items[idx]['amount']) if idx < len(items) else '',
+                    items[idx]['remark'] if idx < len(items) else '',
+                    payments[idx]['payment_date'] if idx < len(payments) else '',
+                    float(payments[idx]['amount']) if idx < len(payments) else '',
+                    payments[idx]['payer_name'] if idx < len(payments) else '',
+                    payments[idx]['remark'] if idx < len(payments) else ''
+                ]
+                ws.append(row)
+
+    # Save to bytes
+    output = io.BytesIO()
+    with tracing.span("cpu.openpyxl_save"):
+        wb.save(output)
+    output.seek(0)
+    return output
+
+
+@tracing.traced("cpu.build_payments_workbook")
+def _build_payments_workbook(payments) -> io.BytesIO:
+    """Render the payments export to an in-memory .xlsx"""
+    import openpyxl
+
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = "Payments"
+
+    ws.append(['Date', 'Amount', 'Payer', 'User', 'IOU ID', 'Remark'])
+    for p in payments:
+        ws.append([
+            p['payment_date'],
+            float(p['amount']),
+            p['payer_name'],
+            p['user_code'],
+            p['ious_id'],
+            p['remark']
+        ])
+
+    output = io.BytesIO()
+    with tracing.span("cpu.openpyxl_save"):
+        wb.save(output)
+    output.seek(0)
+    return output
+
+
 @router.get("/export/ious")
 async def export_ious(
+    request: Request,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
     status: Optional[str] = None,
@@ -1038,171 +1045,122 @@ async def export_ious(
     user_id: int = Depends(verify_token)
 ):
     """Export IOUs to Excel"""
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-
-    try:
-        user = get_user_info(cursor, user_id)
-        if not user:
-            raise HTTPException(401, "User not found")
-
-        set_rls_context(cursor, user_id, user['role'] or 'user')
-
-        # Build query
-        query = """
-            SELECT
-                i.*,
-                COALESCE(SUM(p.amount), 0) as paid,
-                i.total_amount - COALESCE(SUM(p.amount), 0) as rest
-            FROM yif_ious i
-            LEFT JOIN yif_payments p ON p.ious_id = i.id
-            WHERE 1=1
-        """
-        params = []
-
-        if start_date:
-            query += " AND i.ious_date >= %s"
-            params.append(start_date)
-
-        if end_date:
-            query += " AND i.ious_date <= %s"
-            params.append(end_date)
-
-        if status:
-            status_list = [int(s) for s in status.split(',') if s.isdigit()]
-            if status_list:
-                query += f" AND i.status IN ({','.join(['%s'] * len(status_list))})"
-                params.extend(status_list)
-
-        # worker_id filter: everyone exports their own IOUs by default
-        # Admin/manager can pass target_worker_id="all" to export all
-        if target_worker_id and user['role'] in ('admin', 'manager'):
-            if target_worker_id.lower() != 'all':
-                query += " AND i.worker_id = %s"
-                params.append(int(target_worker_id))
-        else:
-            query += " AND i.worker_id = %s"
-            params.append(user_id)
-
-        query += " GROUP BY i.id"
-
-        # Exclude zero-rest IOUs unless status=2 (fully paid) is explicitly requested.
-        # Guards against stale status values where rest=0 but status != 2.
-        status_list_for_check = [s.strip() for s in status.split(',')] if status else []
-        if '2' not in status_list_for_check:
-            query += " HAVING (i.total_amount - COALESCE(SUM(p.amount), 0)) <> 0"
-
-        if client:
-            query = f"""
-                SELECT * FROM ({query}) AS filtered_ious
-                WHERE filtered_ious.id IN (
-                    SELECT DISTINCT it.ious_id FROM yif_iou_items it
-                    WHERE LOWER(it.client) LIKE %s
-                )
-            """
-            params.append(f"%{client.lower()}%")
-
-        query += " ORDER BY ious_date ASC, ious_id ASC"
-
-        cursor.execute(query, params)
-        ious_list = cursor.fetchall()
+    async with (
+        read_connection("yif.export_ious", max_lag=10) as conn,
+        query_guard(conn, request, "yif.export_ious", timeout=120) as guard,
+    ):
+        cursor = conn.cursor()
+        try:
+            user = await get_yif_user_async(cursor, user_id)
+            if not user:
+                raise HTTPException(401, "User not found")
 
-        # Create Excel workbook
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = "IOUs"
+            set_rls_context(cursor, user_id, user['role'] or 'user')
 
-        if export_type == "summary":
-            # Summary: one row per IOU
-            ws.append(['Date', 'Initial Amount', 'Remaining', 'Client', 'User', 'IOU ID', 'Remark'])
-            for iou in ious_list:
-                cursor.execute("SELECT client, remark FROM yif_iou_items WHERE ious_id = %s LIMIT 1", (iou['id'],))
-                item = cursor.fetchone()
-                ws.append([
-                    iou['ious_date'],
-                    float(iou['total_amount']),
-                    float(iou['rest']),
-                    item['client'] if item else '',
-                    iou['user_code'],
-                    iou['ious_id'],
-                    item['remark'] if item else ''
-                ])
-
-        elif export_type == "detailed":
-            # Detailed: show all items
-            ws.append(['Date', 'Total Amount', 'Remaining', 'Client', 'User', 'IOU ID',
-                      'Ticket', 'Flight', 'Item Amount', 'Remark'])
-            for iou in ious_list:
-                cursor.execute("SELECT * FROM yif_iou_items WHERE ious_id = %s ORDER BY item_index", (iou['id'],))
-                items = cursor.fetchall()
-                for idx, item in enumerate(items):
-                    ws.append([
-                        iou['ious_date'] if idx == 0 else '',
-                        float(iou['total_amount']) if idx == 0 else '',
-                        float(iou['rest']) if idx == 0 else '',
-                        item['client'],
-                        iou['user_code'] if idx == 0 else '',
-                        iou['ious_id'] if idx == 0 else '',
-                        item['ticket_number'],
-                        item['flight'],
-                        float(item['amount']),
-                        item['remark']
-                    ])
-
-        else:  # full - include payments
-            ws.append(['Date', 'Total Amount', 'Remaining', 'Client', 'User', 'IOU ID',
-                      'Ticket', 'Flight', 'Item Amount', 'IOU Remark',
-                      'Payment Date', 'Payment Amount', 'Payer', 'Payment Remark'])
-            for iou in ious_list:
-                cursor.execute("SELECT * FROM yif_iou_items WHERE ious_id = %s ORDER BY item_index", (iou['id'],))
-                items = cursor.fetchall()
-                cursor.execute("SELECT * FROM yif_payments WHERE ious_id = %s ORDER BY created_at", (iou['id'],))
-                payments = cursor.fetchall()
-
-                max_rows = max(len(items), len(payments), 1)
-                for idx in range(max_rows):
-                    row = [
-                        iou['ious_date'] if idx == 0 else '',
-                        float(iou['total_amount']) if idx == 0 else '',
-                        float(iou['rest']) if idx == 0 else '',
-                        items[idx]['client'] if idx < len(items) else '',
-                        iou['user_code'] if idx == 0 else '',
-                        iou['ious_id'] if idx == 0 else '',
-                        items[idx]['ticket_number'] if idx < len(items) else '',
-                        items[idx]['flight'] if idx < len(items) else '',
-                        float(items[idx]['amount']) if idx < len(items) else '',
-                        items[idx]['remark'] if idx < len(items) else '',
-                        payments[idx]['payment_date'] if idx < len(payments) else '',
-                        float(payments[idx]['amount']) if idx < len(payments) else '',
-                        payments[idx]['payer_name'] if idx < len(payments) else '',
-                        payments[idx]['remark'] if idx < len(payments) else ''
-                    ]
-                    ws.append(row)
-
-        # Save to bytes
-        output = io.BytesIO()
-        wb.save(output)
-        output.seek(0)
+            # Build query
+            query = """
+                SELECT
+                    i.*,
+                    COALESCE(SUM(p.amount), 0) as paid,
+                    i.total_amount - COALESCE(SUM(p.amount), 0) as rest
+                FROM yif_ious i
+                LEFT JOIN yif_payments p ON p.ious_id = i.id
+                WHERE 1=1
+            """
+            params = []
+
+            if start_date:
+                query += " AND i.ious_date >= %s"
+                params.append(start_date)
+
+            if end_date:
+                query += " AND i.ious_date <= %s"
+                params.append(end_date)
+
+            if status:
+                status_list = [int(s) for s in status.split(',') if s.isdigit()]
+                if status_list:
+                    query += f" AND i.status IN ({','.join(['%s'] * len(status_list))})"
+                    params.extend(status_list)
+
+            # worker_id filter: everyone exports their own IOUs by default
+            # Admin/manager can pass target_worker_id="all" to export all
+            if target_worker_id and user['role'] in ('admin', 'manager'):
+                if target_worker_id.lower() != 'all':
+                    query += " AND i.worker_id = %s"
+                    params.append(int(target_worker_id))
+            else:
+                query += " AND i.worker_id = %s"
+                params.append(user_id)
 
-        filename = f"ious_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+            query += " GROUP BY i.id"
 
-        return StreamingResponse(
-            output,
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers={"Content-Disposition": f"attachment; filename={filename}"}
-        )
+            # Exclude zero-rest IOUs unless status=2 (fully paid) is explicitly requested.
+            # Guards against stale status values where rest=0 but status != 2.
+            status_list_for_check = [s.strip() for s in status.split(',')] if status else []
+            if '2' not in status_list_for_check:
+                query += " HAVING (i.total_amount - COALESCE(SUM(p.amount), 0)) <> 0"
 
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(500, f"Export failed: {str(e)}")
-    finally:
-        cursor.close()
-        conn.close()
+            if client:
+                query = f"""
+                    SELECT * FROM ({query}) AS filtered_ious
+                    WHERE filtered_ious.id IN (
+                        SELECT DISTINCT it.ious_id FROM yif_iou_items it
+                        WHERE LOWER(it.client) LIKE %s
+                    )
+                """
+                params.append(f"%{client.lower()}%")
+
+            query += " ORDER BY ious_date ASC, ious_id ASC"
+
+            await cursor.execute(query, params)
+            ious_list = await cursor.fetchall()
+
+            # Batch-load items (and payments for "full") for all IOUs in one query each
+            iou_ids = [iou['id'] for iou in ious_list]
+            items_by_iou = {}
+            payments_by_iou = {}
+            if iou_ids:
+                await cursor.execute("""
+                    SELECT * FROM yif_iou_items
+                    WHERE ious_id = ANY(%s)
+                    ORDER BY ious_id, item_index
+                """, (iou_ids,))
+                for item in await cursor.fetchall():
+                    items_by_iou.setdefault(item['ious_id'], []).append(item)
+
+                if export_type not in ("summary", "detailed"):
+                    await cursor.execute("""
+                        SELECT * FROM yif_payments
+                        WHERE ious_id = ANY(%s)
+                        ORDER BY ious_id, created_at
+                    """, (iou_ids,))
+                    for payment in await cursor.fetchall():
+                        payments_by_iou.setdefault(payment['ious_id'], []).append(payment)
+
+            # openpyxl is CPU-bound; build the file off the event loop
+            guard.check()
+            output = await asyncio.to_thread(
+                _build_ious_workbook, ious_list, items_by_iou, payments_by_iou, export_type
+            )
+
+            filename = f"ious_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+
+            return StreamingResponse(
+                output,
+                media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                headers={"Content-Disposition": f"attachment; filename={filename}"}
+            )
+
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(500, f"Export failed: {str(e)}")
 
 
 @router.get("/export/payments")
 async def export_payments(
+    request: Request,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
     payer_name: Optional[str] = None,
@@ -1210,92 +1168,74 @@ async def export_payments(
     user_id: int = Depends(verify_token)
 ):
     """Export payments to Excel"""
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    async with (
+        read_connection("yif.export_payments", max_lag=10) as conn,
+        query_guard(conn, request, "yif.export_payments", timeout=120) as guard,
+    ):
+        cursor = conn.cursor()
+        try:
+            user = await get_yif_user_async(cursor, user_id)
+            if not user:
+                raise HTTPException(401, "User not found")
 
-    try:
-        user = get_user_info(cursor, user_id)
-        if not user:
-            raise HTTPException(401, "User not found")
-
-        set_rls_context(cursor, user_id, user['role'] or 'user')
-
-        query = """
-            SELECT
-                p.payment_date,
-                p.amount,
-                p.payer_name,
-                p.user_code,
-                i.ious_id,
-                p.remark
-            FROM yif_payments p
-            JOIN yif_ious i ON i.id = p.ious_id
-            WHERE 1=1
-        """
-        params = []
-
-        if start_date:
-            query += " AND p.payment_date >= %s"
-            params.append(start_date)
-
-        if end_date:
-            query += " AND p.payment_date <= %s"
-            params.append(end_date)
-
-        if payer_name:
-            query += " AND p.payer_name LIKE %s"
-            params.append(f"%{payer_name}%")
-
-        # worker_id filter: everyone exports their own payments by default
-        # Admin/manager can pass target_worker_id="all" to export all
-        if target_worker_id and user['role'] in ('admin', 'manager'):
-            if target_worker_id.lower() != 'all':
-                query += " AND p.worker_id = %s"
-                params.append(int(target_worker_id))
-        else:
-            query += " AND p.worker_id = %s"
-            params.append(user_id)
+            set_rls_context(cursor, user_id, user['role'] or 'user')
 
-        query += " ORDER BY p.payment_date DESC, p.created_at DESC"
+            query = """
+                SELECT
+                    p.payment_date,
+                    p.amount,
+                    p.payer_name,
+                    p.user_code,
+                    i.ious_id,
+                    p.remark
+                FROM yif_payments p
+                JOIN yif_ious i ON i.id = p.ious_id
+                WHERE 1=1
+            """
+            params = []
+
+            if start_date:
+                query += " AND p.payment_date >= %s"
+                params.append(start_date)
+
+            if end_date:
+                query += " AND p.payment_date <= %s"
+                params.append(end_date)
+
+            if payer_name:
+                query += " AND p.payer_name LIKE %s"
+                params.append(f"%{payer_name}%")
+
+            # worker_id filter: everyone exports their own payments by default
+            # Admin/manager can pass target_worker_id="all" to export all
+            if target_worker_id and user['role'] in ('admin', 'manager'):
+                if target_worker_id.lower() != 'all':
+                    query += " AND p.worker_id = %s"
+                    params.append(int(target_worker_id))
+            else:
+                query += " AND p.worker_id = %s"
+                params.append(user_id)
 
-        cursor.execute(query, params)
-        payments = cursor.fetchall()
+            query += " ORDER BY p.payment_date DESC, p.created_at DESC"
 
-        # Create Excel
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = "Payments"
+            await cursor.execute(query, params)
+            payments = await cursor.fetchall()
 
-        ws.append(['Date', 'Amount', 'Payer', 'User', 'IOU ID', 'Remark'])
-        for p in payments:
-            ws.append([
-                p['payment_date'],
-                float(p['amount']),
-                p['payer_name'],
-                p['user_code'],
-                p['ious_id'],
-                p['remark']
-            ])
+            guard.check()
+            output = await asyncio.to_thread(_build_payments_workbook, payments)
 
-        output = io.BytesIO()
-        wb.save(output)
-        output.seek(0)
+            filename = f"payments_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
 
-        filename = f"payments_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+            return StreamingResponse(
+                output,
+                media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                headers={"Content-Disposition": f"attachment; filename={filename}"}
+            )
 
-        return StreamingResponse(
-            output,
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers={"Content-Disposition": f"attachment; filename={filename}"}
-        )
-
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(500, f"Export failed: {str(e)}")
-    finally:
-        cursor.close()
-        conn.close()
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(500, f"Export failed: {str(e)}")
 
 
 # ========================
@@ -1305,42 +1245,38 @@ async def export_payments(
 @router.get("/admin/paid-off")
 async def get_paid_off_ious(user_id: int = Depends(verify_token)):
     """Get all fully paid IOUs (for cleanup)"""
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    async with get_async_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            user = await get_yif_user_async(cursor, user_id)
+            if not user or user['role'] not in ['admin', 'manager']:
+                raise HTTPException(403, "Admin access required")
 
-    try:
-        user = get_user_info(cursor, user_id)
-        if not user or user['role'] not in ['admin', 'manager']:
-            raise HTTPException(403, "Admin access required")
-
-        set_rls_context(cursor, user_id, user['role'])
-
-        cursor.execute("""
-            SELECT
-                i.*,
-                COALESCE(SUM(p.amount), 0) as paid
-            FROM yif_ious i
-            LEFT JOIN yif_payments p ON p.ious_id = i.id
-            WHERE i.status = 2
-            GROUP BY i.id
-            ORDER BY i.ious_date
-        """)
-
-        ious = cursor.fetchall()
-
-        return {
-            "success": True,
-            "count": len(ious),
-            "ious": [dict(i) for i in ious]
-        }
-
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(500, f"Query failed: {str(e)}")
-    finally:
-        cursor.close()
-        conn.close()
+            set_rls_context(cursor, user_id, user['role'])
+
+            await cursor.execute("""
+                SELECT
+                    i.*,
+                    COALESCE(SUM(p.amount), 0) as paid
+                FROM yif_ious i
+                LEFT JOIN yif_payments p ON p.ious_id = i.id
+                WHERE i.status = 2
+                GROUP BY i.id
+                ORDER BY i.ious_date
+            """)
+
+            ious = await cursor.fetchall()
+
+            return {
+                "success": True,
+                "count": len(ious),
+                "ious": [dict(i) for i in ious]
+            }
+
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(500, f"Query failed: {str(e)}")
 
 
 class ClearPaidRequest(BaseModel):
@@ -1351,55 +1287,39 @@ class ClearPaidRequest(BaseModel):
 @limiter.limit("3/minute")
 async def clear_paid_ious(http_request: Request, request: ClearPaidRequest, user_id: int = Depends(verify_token)):
     """Clear all fully paid IOUs (requires admin password)"""
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-
-    try:
-        user = get_user_info(cursor, user_id)
-        if not user or user['role'] != 'admin':
-            raise HTTPException(403, "Admin access required")
-
-        # Verify admin password
-        from passlib.context import CryptContext
-        pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-        cursor.execute("SELECT password_hash FROM yif_workers WHERE id = %s", (user_id,))
-        result = cursor.fetchone()
-
-        if not result or not pwd_context.verify(request.admin_password, result['password_hash']):
-            raise HTTPException(401, "Invalid admin password")
+    async with get_async_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            user = await get_yif_user_async(cursor, user_id)
+            if not user or user['role'] != 'admin':
+                raise HTTPException(403, "Admin access required")
 
-        set_rls_context(cursor, user_id, user['role'])
+            # Verify admin password
+            await cursor.execute("SELECT password_hash FROM yif_workers WHERE id = %s", (user_id,))
+            result = await cursor.fetchone()
 
-        # Get count before delete
-        cursor.execute("SELECT COUNT(*) FROM yif_ious WHERE status = 2")
-        count = cursor.fetchone()['count']
+            if not result or not await verify_password(request.admin_password, result['password_hash']):
+                raise HTTPException(401, "Invalid admin password")
 
-        # Delete paid IOUs (cascade will delete items and payments)
-        cursor.execute("DELETE FROM yif_ious WHERE status = 2")
+            set_rls_context(cursor, user_id, user['role'])
 
-        # Log
-        cursor.execute("""
-            INSERT INTO yif_logs (worker_id, action, target_type, target_id, details)
-            VALUES (%s, %s, %s, %s, %s)
-        """, (user_id, 'clear_paid', 'admin', 'batch', f"Cleared {count} paid IOUs"))
+            # Delete paid IOUs (cascade will delete items and payments)
+            await cursor.execute("DELETE FROM yif_ious WHERE status = 2")
+            count = cursor.rowcount
 
-        conn.commit()
+            # Log
+            await cursor.execute(_INSERT_LOG_SQL, (
+                user_id, 'clear_paid', 'admin', 'batch', f"Cleared {count} paid IOUs"), prepare=True)
 
-        return {
-            "success": True,
-            "message": f"Cleared {count} fully paid IOUs"
-        }
+            return {
+                "success": True,
+                "message": f"Cleared {count} fully paid IOUs"
+            }
 
-    except HTTPException:
-        conn.rollback()
-        raise
-    except Exception as e:
-        conn.rollback()
-        raise HTTPException(500, f"Clear failed: {str(e)}")
-    finally:
-        cursor.close()
-        conn.close()
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(500, f"Clear failed: {str(e)}")
 
 
 # ========================
@@ -1409,33 +1329,27 @@ async def clear_paid_ious(http_request: Request, request: ClearPaidRequest, user
 @router.post("/admin/resync-statuses")
 async def resync_iou_statuses(user_id: int = Depends(verify_token)):
     """Recompute and fix status for every IOU based on actual payment totals."""
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    try:
-        user = get_user_info(cursor, user_id)
-        if not user or user['role'] not in ('admin', 'manager'):
-            raise HTTPException(403, "Admin/manager access required")
+    async with get_async_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            user = await get_yif_user_async(cursor, user_id)
+            if not user or user['role'] not in ('admin', 'manager'):
+                raise HTTPException(403, "Admin/manager access required")
 
-        set_rls_context(cursor, user_id, user['role'])
+            set_rls_context(cursor, user_id, user['role'])
 
-        cursor.execute("SELECT id FROM yif_ious")
-        all_ids = [row['id'] for row in cursor.fetchall()]
+            await cursor.execute("SELECT id FROM yif_ious")
+            all_ids = [row['id'] for row in await cursor.fetchall()]
 
-        for iou_id in all_ids:
-            update_iou_status(cursor, iou_id)
+            # executemany pipelines the updates: one round trip for all of them.
+            await cursor.executemany(_UPDATE_IOU_STATUS_SQL, [(iou_id, iou_id) for iou_id in all_ids])
 
-        conn.commit()
-        return {"success": True, "updated": len(all_ids)}
+            return {"success": True, "updated": len(all_ids)}
 
-    except HTTPException:
-        conn.rollback()
-        raise
-    except Exception as e:
-        conn.rollback()
-        raise HTTPException(500, f"Resync failed: {str(e)}")
-    finally:
-        cursor.close()
-        conn.close()
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(500, f"Resync failed: {str(e)}")
 
 
 # ========================
@@ -1496,172 +1410,163 @@ async def import_excel_ious(
     """
     import xlrd
 
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-
-    try:
-        user = get_user_info(cursor, user_id)
-        if not user:
-            raise HTTPException(401, "User not found")
-
-        set_rls_context(cursor, user_id, user['role'] or 'user')
-
-        # Validate user_code
-        user_code = user_code.upper()
-        if not user_code.isalpha():
-            raise HTTPException(400, "User code must be letters only")
-        while len(user_code) < 3:
-            user_code = 'A' + user_code
-        if len(user_code) > 3:
-            user_code = user_code[:3]
-
-        # Read Excel file
-        content = await file.read()
+    async with get_async_connection() as conn:
+        cursor = conn.cursor()
         try:
-            book = xlrd.open_workbook(file_contents=content)
-        except Exception as e:
-            raise HTTPException(400, f"Failed to read Excel file: {str(e)}")
-
-        if sheet_name not in book.sheet_names():
-            raise HTTPException(400, f"Sheet '{sheet_name}' not found. Available: {book.sheet_names()}")
-
-        sheet = book.sheet_by_name(sheet_name)
-
-        # Get sheet type from title
-        title = str(sheet.cell_value(rowx=0, colx=0))
-        sheet_type = classify_sheet_type(title)
-        if sheet_type == 'N':
-            raise HTTPException(400, f"Unknown sheet type. Title: {title}")
-
-        # Get date from cell A5 (row 4, col 0)
-        date_val = str(sheet.cell_value(4, 0)).strip()
-        if not is_number(date_val):
-            raise HTTPException(400, f"Invalid date format in A5: {date_val}")
-        date = str(int(float(date_val)))
-        if len(date) != 6:
-            raise HTTPException(400, f"Date must be 6 digits (YYMMDD): {date}")
-
-        # Get number of tickets
-        num_tickets_val = str(sheet.cell_value(1, 1)).strip()
-        if not is_number(num_tickets_val):
-            raise HTTPException(400, f"Invalid ticket count in B2: {num_tickets_val}")
-        num_tickets = int(float(num_tickets_val))
-
-        if num_tickets == 0:
-            return {"success": True, "message": "No tickets to import", "ious_created": 0}
-
-        # Check if this type already imported for this user/date
-        ious_id_prefix = f"{user_code}{date}{sheet_type}"
-        cursor.execute("""
-            SELECT COUNT(*) FROM yif_ious WHERE ious_id LIKE %s
-        """, (f"{ious_id_prefix}%",))
-        if cursor.fetchone()['count'] > 0:
-            raise HTTPException(400, f"Already imported: {ious_id_prefix}xx. Delete existing IOUs first or use different user/date.")
-
-        # Read data columns (starting from row 5, index 4)
-        list_flight = sheet.col_values(colx=1)[4:4+num_tickets]
-        list_ticket = sheet.col_values(colx=2)[4:4+num_tickets]
-        list_amount = sheet.col_values(colx=3)[4:4+num_tickets]
-        list_client = sheet.col_values(colx=15)[4:4+num_tickets]  # Column P
-        list_iou_idx = sheet.col_values(colx=16)[4:4+num_tickets]  # Column Q
-        list_remark = sheet.col_values(colx=17)[4:4+num_tickets]  # Column R
-
-        # Pad lists to num_tickets
-        def pad_list(lst, length):
-            result = [str(x) if x is not None else '' for x in lst]
-            while len(result) < length:
-                result.append('')
-            return result[:length]
-
-        list_flight = pad_list(list_flight, num_tickets)
-        list_ticket = pad_list(list_ticket, num_tickets)
-        list_client = pad_list(list_client, num_tickets)
-        list_remark = pad_list(list_remark, num_tickets)
-
-        # Group items by IOU index
-        ious_data = {}  # {iou_id: [items]}
-
-        for i in range(num_tickets):
-            idx_val = list_iou_idx[i]
-            if idx_val == '' or idx_val is None:
-                continue
-
-            if not is_number(idx_val):
-                raise HTTPException(400, f"Invalid IOU index at row {i+5}: {idx_val}")
-
-            idx = int(float(str(idx_val)))
-            if idx < 1 or idx > 99:
-                raise HTTPException(400, f"IOU index must be 1-99: {idx}")
-
-            iou_id = f"{ious_id_prefix}{idx:02d}"
-
-            if iou_id not in ious_data:
-                ious_data[iou_id] = []
-
-            amount = list_amount[i]
-            if not is_number(amount):
-                raise HTTPException(400, f"Invalid amount at row {i+5}: {amount}")
-
-            ious_data[iou_id].append({
-                'client': list_client[i],
-                'amount': float(amount),
-                'flight': list_flight[i],
-                'ticket_number': list_ticket[i],
-                'remark': list_remark[i]
-            })
-
-        # Create IOUs
-        created_ious = []
-        for iou_id, items in ious_data.items():
-            total_amount = sum(item['amount'] for item in items)
-            status = 3 if total_amount < 0 else 0
-
-            cursor.execute("""
-                INSERT INTO yif_ious (ious_id, worker_id, user_code, ious_date, total_amount, status)
-                VALUES (%s, %s, %s, %s, %s, %s)
-                RETURNING id
-            """, (iou_id, user_id, user_code, date, total_amount, status))
-
-            iou_db_id = cursor.fetchone()['id']
-
-            for idx, item in enumerate(items):
-                cursor.execute("""
+            user = await get_yif_user_async(cursor, user_id)
+            if not user:
+                raise HTTPException(401, "User not found")
+
+            set_rls_context(cursor, user_id, user['role'] or 'user')
+
+            # Validate user_code
+            user_code = user_code.upper()
+            if not user_code.isalpha():
+                raise HTTPException(400, "User code must be letters only")
+            while len(user_code) < 3:
+                user_code = 'A' + user_code
+            if len(user_code) > 3:
+                user_code = user_code[:3]
+
+            # Read Excel file
+            content = await file.read()
+            try:
+                with tracing.span("cpu.xlrd_open", bytes=len(content)):
+                    book = xlrd.open_workbook(file_contents=content)
+            except Exception as e:
+                raise HTTPException(400, f"Failed to read Excel file: {str(e)}")
+
+            if sheet_name not in book.sheet_names():
+                raise HTTPException(400, f"Sheet '{sheet_name}' not found. Available: {book.sheet_names()}")
+
+            sheet = book.sheet_by_name(sheet_name)
+
+            # Get sheet type from title
+            title = str(sheet.cell_value(rowx=0, colx=0))
+            sheet_type = classify_sheet_type(title)
+            if sheet_type == 'N':
+                raise HTTPException(400, f"Unknown sheet type. Title: {title}")
+
+            # Get date from cell A5 (row 4, col 0)
+            date_val = str(sheet.cell_value(4, 0)).strip()
+            if not is_number(date_val):
+                raise HTTPException(400, f"Invalid date format in A5: {date_val}")
+            date = str(int(float(date_val)))
+            if len(date) != 6:
+                raise HTTPException(400, f"Date must be 6 digits (YYMMDD): {date}")
+
+            # Get number of tickets
+            num_tickets_val = str(sheet.cell_value(1, 1)).strip()
+            if not is_number(num_tickets_val):
+                raise HTTPException(400, f"Invalid ticket count in B2: {num_tickets_val}")
+            num_tickets = int(float(num_tickets_val))
+
+            if num_tickets == 0:
+                return {"success": True, "message": "No tickets to import", "ious_created": 0}
+
+            # Check if this type already imported for this user/date
+            ious_id_prefix = f"{user_code}{date}{sheet_type}"
+            await cursor.execute("""
+                SELECT COUNT(*) FROM yif_ious WHERE ious_id LIKE %s
+            """, (f"{ious_id_prefix}%",))
+            if (await cursor.fetchone())['count'] > 0:
+                raise HTTPException(400, f"Already imported: {ious_id_prefix}xx. Delete existing IOUs first or use different user/date.")
+
+            # Read data columns (starting from row 5, index 4)
+            list_flight = sheet.col_values(colx=1)[4:4+num_tickets]
+            list_ticket = sheet.col_values(colx=2)[4:4+num_tickets]
+            list_amount = sheet.col_values(colx=3)[4:4+num_tickets]
+            list_client = sheet.col_values(colx=15)[4:4+num_tickets]  # Column P
+            list_iou_idx = sheet.col_values(colx=16)[4:4+num_tickets]  # Column Q
+            list_remark = sheet.col_values(colx=17)[4:4+num_tickets]  # Column R
+
+            # Pad lists to num_tickets
+            def pad_list(lst, length):
+                result = [str(x) if x is not None else '' for x in lst]
+                while len(result) < length:
+                    result.append('')
+                return result[:length]
+
+            list_flight = pad_list(list_flight, num_tickets)
+            list_ticket = pad_list(list_ticket, num_tickets)
+            list_client = pad_list(list_client, num_tickets)
+            list_remark = pad_list(list_remark, num_tickets)
+
+            # Group items by IOU index
+            ious_data = {}  # {iou_id: [items]}
+
+            for i in range(num_tickets):
+                idx_val = list_iou_idx[i]
+                if idx_val == '' or idx_val is None:
+                    continue
+
+                if not is_number(idx_val):
+                    raise HTTPException(400, f"Invalid IOU index at row {i+5}: {idx_val}")
+
+                idx = int(float(str(idx_val)))
+                if idx < 1 or idx > 99:
+                    raise HTTPException(400, f"IOU index must be 1-99: {idx}")
+
+                iou_id = f"{ious_id_prefix}{idx:02d}"
+
+                if iou_id not in ious_data:
+                    ious_data[iou_id] = []
+
+                amount = list_amount[i]
+                if not is_number(amount):
+                    raise HTTPException(400, f"Invalid amount at row {i+5}: {amount}")
+
+                ious_data[iou_id].append({
+                    'client': list_client[i],
+                    'amount': float(amount),
+                    'flight': list_flight[i],
+                    'ticket_number': list_ticket[i],
+                    'remark': list_remark[i]
+                })
+
+            # Create IOUs
+            created_ious = []
+            for iou_id, items in ious_data.items():
+                total_amount = sum(item['amount'] for item in items)
+                status = 3 if total_amount < 0 else 0
+
+                await cursor.execute("""
+                    INSERT INTO yif_ious (ious_id, worker_id, user_code, ious_date, total_amount, status)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                    RETURNING id
+                """, (iou_id, user_id, user_code, date, total_amount, status), prepare=True)
+
+                iou_db_id = (await cursor.fetchone())['id']
+
+                await cursor.executemany("""
                     INSERT INTO yif_iou_items (ious_id, worker_id, item_index, client, amount, flight, ticket_number, remark)
                     VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                """, (iou_db_id, user_id, idx, item['client'], item['amount'],
-                      item['flight'], item['ticket_number'], item['remark']))
+                """, [(iou_db_id, user_id, idx, item['client'], item['amount'],
+                       item['flight'], item['ticket_number'], item['remark'])
+                      for idx, item in enumerate(items)])
+
+                created_ious.append({
+                    'id': iou_db_id,
+                    'ious_id': iou_id,
+                    'total_amount': total_amount,
+                    'items_count': len(items)
+                })
+
+            # Log
+            await cursor.execute(_INSERT_LOG_SQL, (
+                user_id, 'import_excel', 'iou', sheet_name,
+                f"Imported {len(created_ious)} IOUs from {file.filename}, sheet: {sheet_name}"), prepare=True)
 
-            created_ious.append({
-                'id': iou_db_id,
-                'ious_id': iou_id,
-                'total_amount': total_amount,
-                'items_count': len(items)
-            })
+            return {
+                "success": True,
+                "message": f"Imported {len(created_ious)} IOUs from sheet '{sheet_name}'",
+                "sheet_type": sheet_type,
+                "date": date,
+                "ious_created": len(created_ious),
+                "ious": created_ious
+            }
 
-        # Log
-        cursor.execute("""
-            INSERT INTO yif_logs (worker_id, action, target_type, target_id, details)
-            VALUES (%s, %s, %s, %s, %s)
-        """, (user_id, 'import_excel', 'iou', sheet_name,
-              f"Imported {len(created_ious)} IOUs from {file.filename}, sheet: {sheet_name}"))
-
-        conn.commit()
-
-        return {
-            "success": True,
-            "message": f"Imported {len(created_ious)} IOUs from sheet '{sheet_name}'",
-            "sheet_type": sheet_type,
-            "date": date,
-            "ious_created": len(created_ious),
-            "ious": created_ious
-        }
-
-    except HTTPException:
-        conn.rollback()
-        raise
-    except Exception as e:
-        conn.rollback()
-        raise HTTPException(500, f"Import failed: {str(e)}")
-    finally:
-        cursor.close()
-        conn.close()
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(500, f"Import failed: {str(e)}")
@@ -17,24 +17,53 @@ from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
 from fastapi.responses import StreamingResponse
 import json
 import uuid
-from threading import Lock
 from pydantic import BaseModel
 from typing import Optional
 import psycopg2
-from psycopg2.extras import RealDictCursor, execute_values
+from psycopg2.extras import Json, RealDictCursor, execute_values
 
 logger = logging.getLogger(__name__)
+# Per-batch import progress; sampled by default (log_config.DEFAULT_SAMPLE).
+progress_logger = logging.getLogger(f"{__name__}.progress")
 
 # Add parent path for imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 from database import get_db_connection
+from async_db import get_async_connection
+from crypto_pool import verify_password
 from routers.yif_router import verify_token
 
 router = APIRouter(prefix="/api/yif/migration", tags=["YIF Migration"])
 
-# Progress tracking for imports
-_import_progress = {}
-_import_progress_lock = Lock()
+# Progress tracking for imports, in yif_import_progress (see schema_migrations)
+# so a poll answered by any worker sees it. An entry is dropped
+# IMPORT_PROGRESS_TTL seconds after its last update, which leaves the UI time
+# for its final poll; expired entries are pruned when a new import starts.
+IMPORT_PROGRESS_TTL = 300
+
+
+def _update_progress(task_id: str, fields: dict, prune: bool = False):
+    """Merge fields into the task's progress. Autocommit on a connection of
+    its own, so a poll sees it before the import's own batch commits."""
+    conn = get_db_connection()
+    conn.autocommit = True
+    cursor = conn.cursor()
+    try:
+        if prune:
+            cursor.execute(
+                "DELETE FROM yif_import_progress WHERE updated_at < NOW() - make_interval(secs => %s)",
+                (IMPORT_PROGRESS_TTL,),
+            )
+        cursor.execute("""
+            INSERT INTO yif_import_progress AS p (task_id, progress, updated_at)
+            VALUES (%s, %s, NOW())
+            ON CONFLICT (task_id) DO UPDATE
+            SET progress = p.progress || EXCLUDED.progress, updated_at = EXCLUDED.updated_at
+        """, (task_id, Json(fields)))
+    finally:
+        cursor.close()
+        conn.autocommit = False
+        conn.close()
 
 
 # ============ Pickle Data Classes (matching ious_system1.3) ============
@@ -212,13 +241,18 @@ async def preview_import(
 @router.get("/import/progress/{task_id}")
 async def get_import_progress(task_id: str):
     """Get import progress for a task"""
-    with _import_progress_lock:
-        progress = _import_progress.get(task_id)
-
-    if not progress:
+    async with get_async_connection() as conn:
+        cursor = conn.cursor()
+        await cursor.execute("""
+            SELECT progress FROM yif_import_progress
+            WHERE task_id = %s AND updated_at >= NOW() - make_interval(secs => %s)
+        """, (task_id, IMPORT_PROGRESS_TTL))
+        row = await cursor.fetchone()
+
+    if not row:
         raise HTTPException(404, "Task not found")
 
-    return progress
+    return row['progress']
 
 
 @router.post("/import")
@@ -240,44 +274,40 @@ async def import_pickle_data(
     logger.info(f"Starting import for worker {worker_id}, task {task_id}")
 
     # Initialize progress
-    with _import_progress_lock:
-        _import_progress[task_id] = {
-            "status": "parsing",
-            "total_ious": 0,
-            "current": 0,
-            "percent": 0,
-            "message": "正在解析文件..."
-        }
+    _update_progress(task_id, {
+        "status": "parsing",
+        "total_ious": 0,
+        "current": 0,
+        "percent": 0,
+        "message": "正在解析文件..."
+    }, prune=True)
 
     try:
         content = await file.read()
         logger.info(f"File read, size: {len(content)} bytes")
 
         # Update progress
-        with _import_progress_lock:
-            _import_progress[task_id]["message"] = "正在解析数据..."
+        _update_progress(task_id, {"message": "正在解析数据..."})
 
         _, iou_list, total_items, total_payments = _parse_pickle_data(content)
         total_ious = len(iou_list)
         logger.info(f"Parsed {total_ious} IOUs, {total_items} items, {total_payments} payments")
 
         # Update progress
-        with _import_progress_lock:
-            _import_progress[task_id].update({
-                "status": "importing",
-                "total_ious": total_ious,
-                "total_items": total_items,
-                "total_payments": total_payments,
-                "message": f"开始导入 {total_ious} 条欠条..."
-            })
+        _update_progress(task_id, {
+            "status": "importing",
+            "total_ious": total_ious,
+            "total_items": total_items,
+            "total_payments": total_payments,
+            "message": f"开始导入 {total_ious} 条欠条..."
+        })
 
     except Exception as e:
         logger.error(f"Failed to parse pickle: {e}")
-        with _import_progress_lock:
-            _import_progress[task_id].update({
-                "status": "error",
-                "message": f"解析失败: {str(e)}"
-            })
+        _update_progress(task_id, {
+            "status": "error",
+            "message": f"解析失败: {str(e)}"
+        })
         raise HTTPException(400, f"Failed to parse pickle file: {str(e)}")
 
     conn = get_db_connection()
@@ -336,15 +366,14 @@ async def import_pickle_data(
 
             # Update progress
             percent = int((ious_created / total_ious) * 100) if total_ious > 0 else 100
-            with _import_progress_lock:
-                _import_progress[task_id].update({
-                    "current": ious_created,
-                    "percent": percent,
-                    "items_created": items_created,
-                    "payments_created": payments_created,
-                    "message": f"已导入 {ious_created}/{total_ious} 条欠条 ({percent}%)"
-                })
-            logger.info(f"Progress: {ious_created}/{total_ious} ({percent}%)")
+            _update_progress(task_id, {
+                "current": ious_created,
+                "percent": percent,
+                "items_created": items_created,
+                "payments_created": payments_created,
+                "message": f"已导入 {ious_created}/{total_ious} 条欠条 ({percent}%)"
+            })
+            progress_logger.info(f"Progress: {ious_created}/{total_ious} ({percent}%)")
 
         # Log
         cursor.execute("""
@@ -357,13 +386,12 @@ async def import_pickle_data(
         logger.info(f"Import complete: {ious_created} IOUs, {items_created} items, {payments_created} payments")
 
         # Final progress update
-        with _import_progress_lock:
-            _import_progress[task_id].update({
-                "status": "complete",
-                "current": ious_created,
-                "percent": 100,
-                "message": "导入完成！"
-            })
+        _update_progress(task_id, {
+            "status": "complete",
+            "current": ious_created,
+            "percent": 100,
+            "message": "导入完成！"
+        })
 
         return {
             "success": True,
@@ -377,17 +405,14 @@ async def import_pickle_data(
     except Exception as e:
         conn.rollback()
         logger.error(f"Import failed: {e}")
-        with _import_progress_lock:
-            _import_progress[task_id].update({
-                "status": "error",
-                "message": f"导入失败: {str(e)}"
-            })
+        _update_progress(task_id, {
+            "status": "error",
+            "message": f"导入失败: {str(e)}"
+        })
         raise HTTPException(500, f"Import failed: {str(e)}")
     finally:
         cursor.close()
         conn.close()
-        # Clean up progress after a delay (keep for 5 minutes)
-        # In production, you'd use a background task or Redis with TTL
 
 
 @router.get("/export")
@@ -648,8 +673,6 @@ async def clear_user_data(
     Requires password verification
     Automatically exports data before clearing as backup
     """
-    import bcrypt
-
     worker_id = user_id
 
     # Verify password
@@ -657,7 +680,7 @@ async def clear_user_data(
     if not password_hash:
         raise HTTPException(500, "Clear password not configured")
 
-    if not bcrypt.checkpw(request.password.encode(), password_hash.encode()):
+    if not await verify_password(request.password, password_hash):
         raise HTTPException(401, "密码错误")
 
     logger.info(f"Clear requested for worker {worker_id}, password verified")
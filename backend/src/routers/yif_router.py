@@ -8,18 +8,18 @@ from fastapi import APIRouter, HTTPException, Depends, Header, Request
 from pydantic import BaseModel
 import psycopg2
 from psycopg2.extras import RealDictCursor
-from passlib.context import CryptContext
 from jose import JWTError, jwt
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 from database import get_db_connection
+from auth_context import get_yif_user
+from crypto_pool import verify_password
 from rate_limiter import limiter
 import os
 
 router = APIRouter(prefix="/api/yif", tags=["yif"])
 
 # Security configuration
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 480  # 8 hours
 
@@ -39,14 +39,6 @@ class TokenResponse(BaseModel):
     token_type: str
     user: dict
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verify password using bcrypt"""
-    return pwd_context.verify(plain_password, hashed_password)
-
-def get_password_hash(password: str) -> str:
-    """Hash password using bcrypt"""
-    return pwd_context.hash(password)
-
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Create JWT access token"""
     to_encode = data.copy()
@@ -99,7 +91,7 @@ async def login(request: Request, login_data: LoginRequest):
         # Use a dummy hash to ensure constant time comparison
         dummy_hash = "$2b$12$K4A8Y5Y5Y5Y5Y5Y5Y5Y5YuJQ.8YcvGJYY5Y5Y5Y5Y5Y5Y5Y5Y5Y5K"
         hash_to_verify = user['password_hash'] if user else dummy_hash
-        password_valid = verify_password(login_data.password, hash_to_verify)
+        password_valid = await verify_password(login_data.password, hash_to_verify)
 
         if not user or not password_valid:
             raise HTTPException(status_code=401, detail="Invalid username or password")
@@ -130,33 +122,19 @@ async def verify_session(user_id: int = Depends(verify_token)):
     """
     Verify JWT token validity
     """
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-
-    try:
-        cursor.execute("""
-            SELECT id, username, role, is_active
-            FROM yif_workers
-            WHERE id = %s AND is_active = TRUE
-        """, (user_id,))
-
-        user = cursor.fetchone()
+    user = get_yif_user(None, user_id)
 
-        if not user:
-            raise HTTPException(status_code=401, detail="User not found or inactive")
+    if not user:
+        raise HTTPException(status_code=401, detail="User not found or inactive")
 
-        return {
-            "success": True,
-            "user": {
-                "id": user['id'],
-                "username": user['username'],
-                "role": user['role']
-            }
+    return {
+        "success": True,
+        "user": {
+            "id": user['id'],
+            "username": user['username'],
+            "role": user['role']
         }
-
-    finally:
-        cursor.close()
-        conn.close()
+    }
 
 @router.get("/me")
 async def get_current_user(user_id: int = Depends(verify_token)):
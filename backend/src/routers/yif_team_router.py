@@ -7,15 +7,14 @@ from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
 from typing import Optional, List
 from psycopg2.extras import RealDictCursor
-from passlib.context import CryptContext
 
 from database import get_db_connection
+from auth_context import get_yif_user, invalidate_yif_user
+from crypto_pool import hash_password
 from routers.yif_router import verify_token
 
 router = APIRouter(prefix="/api/yif/team", tags=["yif-team"])
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 
 # ========================
 # Pydantic Models
@@ -44,19 +43,9 @@ class PasswordChange(BaseModel):
 # Helper Functions
 # ========================
 
-def get_user_info(cursor, user_id: int):
-    """Get user info including role"""
-    cursor.execute("""
-        SELECT id, username, user_code, role, display_name
-        FROM yif_workers
-        WHERE id = %s AND is_active = TRUE
-    """, (user_id,))
-    return cursor.fetchone()
-
-
 def require_admin(cursor, user_id: int):
     """Check if user is admin, raise exception if not"""
-    user = get_user_info(cursor, user_id)
+    user = get_yif_user(cursor, user_id)
     if not user:
         raise HTTPException(401, "User not found")
     if user['role'] != 'admin':
@@ -70,7 +59,7 @@ def require_admin(cursor, user_id: int):
 
 def require_admin_or_manager(cursor, user_id: int):
     """Check if user is admin or manager, raise exception if not"""
-    user = get_user_info(cursor, user_id)
+    user = get_yif_user(cursor, user_id)
     if not user:
         raise HTTPException(401, "User not found")
     if user['role'] not in ('admin', 'manager'):
@@ -137,7 +126,7 @@ async def create_user(user_data: UserCreate, user_id: int = Depends(verify_token
             raise HTTPException(400, f"User code '{user_code}' already exists")
 
         # Hash password
-        password_hash = pwd_context.hash(user_data.password)
+        password_hash = await hash_password(user_data.password)
 
         # Insert user
         cursor.execute("""
@@ -224,6 +213,7 @@ async def update_user(target_user_id: int, user_data: UserUpdate, user_id: int =
 
         updated_user = cursor.fetchone()
         conn.commit()
+        invalidate_yif_user(target_user_id, cursor)
 
         return {
             "success": True,
@@ -261,7 +251,7 @@ async def change_password(target_user_id: int, pwd_data: PasswordChange, user_id
             raise HTTPException(400, "Password must be at least 6 characters")
 
         # Hash and update password
-        password_hash = pwd_context.hash(pwd_data.new_password)
+        password_hash = await hash_password(pwd_data.new_password)
 
         cursor.execute("""
             UPDATE yif_workers
@@ -314,6 +304,7 @@ async def delete_user(target_user_id: int, user_id: int = Depends(verify_token))
         """, (target_user_id,))
 
         conn.commit()
+        invalidate_yif_user(target_user_id, cursor)
 
         return {
             "success": True,
@@ -0,0 +1,319 @@
+"""
+In-process sampling profiler for the live server.
+
+A background thread wakes every interval (default 10 ms), reads every
+thread's current Python stack through sys._current_frames() and counts
+identical stacks. Nothing is hooked into the profiled code, so the cost is
+the sampling thread's own work (reported as overhead_ms), typically well
+under 1% of a core at 100 Hz.
+
+Two modes, both driven from routers/ops_router.py (YIF admin only):
+
+  process  Sample every thread for N seconds.
+  request  Arm a one-time token; the next request that carries it in an
+           X-Profile-Token header is sampled from the moment
+           ProfiledRequestMiddleware sees it until its response ends. On
+           the event loop thread only samples taken while that request's
+           task is running are kept; thread-pool threads (to_thread, sync
+           routes) are sampled whenever they are busy, so profile while the
+           server is otherwise quiet for a clean picture.
+
+Only stacks that are on a CPU show up: a coroutine waiting for Postgres is
+not on any thread's stack. Threads parked in a wait (idle pool workers, the
+event loop in select) are left out unless include_idle is set.
+
+Results come out as collapsed stacks (one "thread;outer;...;inner count"
+line per stack, for flamegraph.pl, inferno or speedscope) or as speedscope
+JSON with one sampled profile per thread. Only one profile runs at a time.
+
+Everything here is per process. A process profile covers only the worker
+that served the request, and armed tokens and their results live in the
+worker that armed them: with several uvicorn workers the profiled request
+and the result fetch must both land on that worker, which is not
+guaranteed. The ops endpoints report the worker's pid so a miss is visible;
+profile requests with WEB_CONCURRENCY=1 (see RENDER_DEPLOY.md).
+"""
+import asyncio
+import os
+import secrets
+import sys
+import threading
+import time
+from collections import Counter
+
+import orjson
+
+import memory_debug
+
+PROFILE_TOKEN_HEADER = b"x-profile-token"
+TOKEN_TTL = 300.0  # seconds an armed token or a captured result is kept
+_MAX_TOKENS = 16
+
+_SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+_BACKEND_DIR = os.path.dirname(_SRC_DIR)
+
+# Leaf frames of threads that are parked rather than working:
+# (file basename, qualname).
+_IDLE_LEAVES = {
+    ("threading.py", "Condition.wait"),
+    ("threading.py", "Event.wait"),
+    ("threading.py", "Thread._wait_for_tstate_lock"),
+    ("queue.py", "Queue.get"),
+    ("thread.py", "_worker"),            # concurrent.futures pool waiting for work
+    ("selectors.py", "EpollSelector.select"),
+    ("selectors.py", "PollSelector.select"),
+    ("selectors.py", "KqueueSelector.select"),
+    ("selectors.py", "SelectSelector.select"),
+    ("runners.py", "Runner.run"),        # uvloop's loop idling in C
+}
+
+_busy = threading.Lock()
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+def _short_path(path: str) -> str:
+    if path.startswith(_BACKEND_DIR + os.sep):
+        return os.path.relpath(path, _BACKEND_DIR)
+    for marker in ("site-packages" + os.sep, "lib" + os.sep + "python"):
+        index = path.rfind(marker)
+        if index != -1:
+            rest = path[index + len(marker):]
+            # lib/python3.11/asyncio/... -> asyncio/...
+            return rest.split(os.sep, 1)[1] if marker.startswith("lib") and os.sep in rest else rest
+    return path
+
+
+class Profile:
+    """Stack counts from one run: {(thread name, (frame, ...)): samples}."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.overhead = 0.0
+        self.started = time.time()
+        self.duration = 0.0
+        self._labels = {}
+
+    def frame_label(self, frame) -> str:
+        label = self._labels.get(frame)
+        if label is None:
+            qualname, filename, line = frame
+            label = f"{qualname} ({_short_path(filename)}:{line})"
+            self._labels[frame] = label
+        return label
+
+    def summary(self) -> dict:
+        return {
+            "samples": self.samples,
+            "stacks": sum(self.stacks.values()),
+            "duration_s": round(self.duration, 3),
+            "interval_ms": self.interval * 1000,
+            "overhead_ms": round(self.overhead * 1000, 1),
+        }
+
+    def collapsed(self) -> str:
+        lines = []
+        for (thread, stack), count in self.stacks.most_common():
+            frames = ";".join(self.frame_label(frame) for frame in stack)
+            lines.append(f"{thread};{frames} {count}")
+        return "\n".join(lines) + "\n"
+
+    def speedscope(self, name: str) -> bytes:
+        frames, frame_index = [], {}
+        by_thread = {}
+        for (thread, stack), count in self.stacks.items():
+            indices = []
+            for frame in stack:
+                if frame not in frame_index:
+                    frame_index[frame] = len(frames)
+                    qualname, filename, line = frame
+                    frames.append({"name": qualname, "file": _short_path(filename), "line": line})
+                indices.append(frame_index[frame])
+            samples, weights = by_thread.setdefault(thread, ([], []))
+            samples.append(indices)
+            weights.append(count * self.interval * 1000)
+        profiles = [
+            {
+                "type": "sampled",
+                "name": thread,
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": samples,
+                "weights": weights,
+            }
+            for thread, (samples, weights) in sorted(by_thread.items())
+        ]
+        return orjson.dumps({
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {"frames": frames},
+            "profiles": profiles,
+            "name": name,
+            "exporter": "hoshipu sampling_profiler",
+        })
+
+
+class Sampler(threading.Thread):
+    """Samples thread stacks into a Profile until stop() is called.
+
+    keep(thread_ident) -> bool can drop samples per thread (request mode).
+    """
+
+    def __init__(self, interval: float, include_idle: bool = False, keep=None):
+        super().__init__(name="sampling-profiler", daemon=True)
+        self.profile = Profile(interval)
+        self.include_idle = include_idle
+        self.keep = keep
+        self._stop_event = threading.Event()
+
+    def stop(self) -> Profile:
+        self._stop_event.set()
+        self.join()
+        return self.profile
+
+    def run(self):
+        profile = self.profile
+        me = threading.get_ident()
+        names = {}
+        names_at = 0.0
+        start = time.perf_counter()
+        while not self._stop_event.wait(profile.interval):
+            tick = time.perf_counter()
+            if tick - names_at > 1.0:
+                names = {t.ident: t.name for t in threading.enumerate()}
+                names_at = tick
+            for ident, frame in sys._current_frames().items():
+                if ident == me or (self.keep is not None and not self.keep(ident)):
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append((code.co_qualname, code.co_filename, code.co_firstlineno))
+                    frame = frame.f_back
+                if not self.include_idle and (os.path.basename(stack[0][1]), stack[0][0]) in _IDLE_LEAVES:
+                    continue
+                stack.reverse()
+                profile.stacks[(names.get(ident, str(ident)), tuple(stack))] += 1
+            profile.samples += 1
+            profile.overhead += time.perf_counter() - tick
+        profile.duration = time.perf_counter() - start
+
+
+def _start(interval: float, include_idle: bool, keep=None) -> Sampler:
+    if not _busy.acquire(blocking=False):
+        raise ProfilerBusy()
+    try:
+        sampler = Sampler(interval, include_idle, keep)
+        sampler.start()
+    except BaseException:
+        _busy.release()
+        raise
+    return sampler
+
+
+def _finish(sampler: Sampler) -> Profile:
+    try:
+        return sampler.stop()
+    finally:
+        _busy.release()
+
+
+async def profile_process(seconds: float, interval: float, include_idle: bool = False) -> Profile:
+    """Sample every thread for seconds. Raises ProfilerBusy if one is running."""
+    sampler = _start(interval, include_idle)
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        profile = await asyncio.to_thread(_finish, sampler)
+    return profile
+
+
+# ------------------------------------------------------------------
+# Request mode
+# ------------------------------------------------------------------
+
+# token -> {"interval", "include_idle", "expires", "profile", "path", "error"}
+_tokens = {}
+_tokens_lock = threading.Lock()
+memory_debug.register_cache("sampling_profiler.tokens", lambda: _tokens)
+
+
+def _prune_tokens(now: float):
+    for token in [t for t, entry in _tokens.items() if entry["expires"] < now]:
+        del _tokens[token]
+
+
+def arm_request(interval: float, include_idle: bool = False) -> str:
+    """One-time token; the next request sending it is profiled."""
+    now = time.monotonic()
+    with _tokens_lock:
+        _prune_tokens(now)
+        if len(_tokens) >= _MAX_TOKENS:
+            raise ProfilerBusy()
+        token = secrets.token_urlsafe(16)
+        _tokens[token] = {"interval": interval, "include_idle": include_idle,
+                          "expires": now + TOKEN_TTL, "armed": True,
+                          "profile": None, "path": None, "error": None}
+    return token
+
+
+def request_result(token: str):
+    """The token's entry, or None if unknown or expired."""
+    with _tokens_lock:
+        _prune_tokens(time.monotonic())
+        return _tokens.get(token)
+
+
+def _claim(token: str):
+    with _tokens_lock:
+        entry = _tokens.get(token)
+        if entry is None or not entry["armed"] or entry["expires"] < time.monotonic():
+            return None
+        entry["armed"] = False
+        return entry
+
+
+class ProfiledRequestMiddleware:
+    """Pure ASGI: profiles a request that carries an armed X-Profile-Token."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        token = None
+        if scope["type"] == "http" and _tokens:
+            for name, value in scope.get("headers", ()):
+                if name == PROFILE_TOKEN_HEADER:
+                    token = value.decode("latin-1")
+                    break
+        entry = _claim(token) if token else None
+        if entry is None:
+            await self.app(scope, receive, send)
+            return
+
+        loop = asyncio.get_running_loop()
+        task = asyncio.current_task()
+        loop_thread = threading.get_ident()
+
+        def keep(ident):
+            # On the loop thread, only while this request's task runs.
+            return ident != loop_thread or asyncio.current_task(loop) is task
+
+        entry["path"] = f"{scope['method']} {scope['path']}"
+        try:
+            sampler = _start(entry["interval"], entry["include_idle"], keep)
+        except ProfilerBusy:
+            entry["error"] = "another profile was running"
+            await self.app(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            profile = await asyncio.to_thread(_finish, sampler)
+            with _tokens_lock:
+                entry["profile"] = profile
+                entry["expires"] = time.monotonic() + TOKEN_TTL
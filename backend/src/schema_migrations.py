@@ -0,0 +1,415 @@
+"""
+Versioned schema migrations, applied on backend boot.
+
+Boot used to probe pg_trigger and re-run every embodybench CREATE TABLE /
+CREATE INDEX statement on each start. Now the applied versions are recorded
+in schema_migrations, and a normal start is a single SELECT on that table;
+DDL only runs for versions the database has not seen yet.
+
+To change the schema, append a new (version, name, statements) entry to
+MIGRATIONS. Never edit or renumber an entry that has already shipped.
+Every migration runs in its own transaction together with the INSERT that
+records it, under an advisory lock so concurrent workers do not race.
+"""
+import logging
+import time
+
+import psycopg2
+import psycopg2.errors
+
+from database import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+# Arbitrary constant shared by every process that runs migrations.
+_MIGRATION_LOCK_KEY = 7_420_001
+
+_CREATE_VERSION_TABLE = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version     INT PRIMARY KEY,
+        name        VARCHAR(200) NOT NULL,
+        applied_at  TIMESTAMPTZ DEFAULT NOW()
+    )
+"""
+
+
+# ========================
+# Migrations
+# ========================
+
+_YIF_IOU_STATUS_TRIGGERS = [
+    """
+    CREATE OR REPLACE FUNCTION update_iou_status_trigger()
+    RETURNS TRIGGER AS $$
+    DECLARE
+        target_id INTEGER;
+    BEGIN
+        target_id := COALESCE(NEW.ious_id, OLD.ious_id);
+
+        UPDATE yif_ious SET status = (
+            SELECT CASE
+                WHEN i.total_amount < 0 THEN 3
+                WHEN i.total_amount - COALESCE(SUM(p.amount), 0) = 0 THEN 2
+                WHEN i.total_amount - COALESCE(SUM(p.amount), 0) < 0 THEN 4
+                WHEN COUNT(p.id) > 0 THEN 1
+                ELSE 0
+            END
+            FROM yif_ious i
+            LEFT JOIN yif_payments p ON p.ious_id = i.id
+            WHERE i.id = target_id
+            GROUP BY i.id
+        )
+        WHERE id = target_id;
+
+        RETURN COALESCE(NEW, OLD);
+    END;
+    $$ LANGUAGE plpgsql;
+    """,
+] + [
+    stmt
+    for op in ("INSERT", "UPDATE", "DELETE")
+    for stmt in (
+        f"DROP TRIGGER IF EXISTS trigger_update_iou_status_{op.lower()} ON yif_payments;",
+        f"""
+        CREATE TRIGGER trigger_update_iou_status_{op.lower()}
+        AFTER {op} ON yif_payments
+        FOR EACH ROW EXECUTE FUNCTION update_iou_status_trigger();
+        """,
+    )
+]
+
+_EMBODYBENCH_TABLES = [
+    # gen_random_uuid() comes from pgcrypto on older Postgres; on Render's
+    # managed Postgres 14+ it's a built-in, but enable the extension defensively.
+    "CREATE EXTENSION IF NOT EXISTS pgcrypto;",
+
+    # 1. Users — separate from yif_workers so payment system stays isolated.
+    """
+    CREATE TABLE IF NOT EXISTS embodybench_users (
+        id            SERIAL PRIMARY KEY,
+        email         VARCHAR(200) UNIQUE NOT NULL,
+        password_hash VARCHAR(255) NOT NULL,
+        display_name  VARCHAR(200),
+        role          VARCHAR(50) DEFAULT 'user',
+        is_active     BOOLEAN DEFAULT TRUE,
+        created_at    TIMESTAMPTZ DEFAULT NOW(),
+        updated_at    TIMESTAMPTZ DEFAULT NOW()
+    );
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_embodybench_users_email ON embodybench_users(email);",
+
+    # 2. Workers — Slurm/SSH-launched compute nodes.
+    """
+    CREATE TABLE IF NOT EXISTS embodybench_workers (
+        id              UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+        hostname        VARCHAR(200) NOT NULL,
+        region          VARCHAR(50) NOT NULL,
+        cluster_kind    VARCHAR(50),
+        capabilities    JSONB NOT NULL,
+        state           VARCHAR(50) DEFAULT 'active',
+        max_concurrent  INT DEFAULT 1,
+        registered_at   TIMESTAMPTZ DEFAULT NOW(),
+        last_heartbeat  TIMESTAMPTZ DEFAULT NOW()
+    );
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_embodybench_workers_state_hb ON embodybench_workers(state, last_heartbeat);",
+
+    # 3. Runs — the user-facing submission.
+    """
+    CREATE TABLE IF NOT EXISTS embodybench_runs (
+        id                UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+        user_id           INT NOT NULL REFERENCES embodybench_users(id),
+        benchmark         VARCHAR(50) NOT NULL,
+        benchmark_version VARCHAR(50),
+        config            JSONB NOT NULL,
+        eval_mode         VARCHAR(50) NOT NULL,
+        api_endpoint_url  VARCHAR(500),
+        api_auth          JSONB,
+        state             VARCHAR(50) DEFAULT 'queued',
+        submitted_at      TIMESTAMPTZ DEFAULT NOW(),
+        started_at        TIMESTAMPTZ,
+        finished_at       TIMESTAMPTZ,
+        notes             TEXT
+    );
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_embodybench_runs_user_submitted ON embodybench_runs(user_id, submitted_at DESC);",
+    "CREATE INDEX IF NOT EXISTS idx_embodybench_runs_state ON embodybench_runs(state);",
+
+    # 4. Jobs — the unit of work workers claim (one invocation of eval_policy.py).
+    """
+    CREATE TABLE IF NOT EXISTS embodybench_jobs (
+        id              UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+        run_id          UUID NOT NULL REFERENCES embodybench_runs(id) ON DELETE CASCADE,
+        task_name       VARCHAR(200) NOT NULL,
+        task_config     VARCHAR(200) NOT NULL,
+        seed_offset     INT NOT NULL,
+        n_episodes      INT NOT NULL,
+        worker_id       UUID REFERENCES embodybench_workers(id),
+        state           VARCHAR(50) DEFAULT 'queued',
+        attempt_count   INT DEFAULT 0,
+        claimed_at      TIMESTAMPTZ,
+        started_at      TIMESTAMPTZ,
+        finished_at     TIMESTAMPTZ,
+        progress        JSONB,
+        failure_reason  VARCHAR(200),
+        requires_caps   JSONB,
+        UNIQUE (run_id, task_name, seed_offset)
+    );
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_embodybench_jobs_state_run ON embodybench_jobs(state, run_id);",
+    "CREATE INDEX IF NOT EXISTS idx_embodybench_jobs_queued ON embodybench_jobs(state) WHERE state = 'queued';",
+
+    # 5. Episodes — per-rollout results. Written by workers as each ep completes; never claimed.
+    """
+    CREATE TABLE IF NOT EXISTS embodybench_episodes (
+        id                  UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+        job_id              UUID NOT NULL REFERENCES embodybench_jobs(id) ON DELETE CASCADE,
+        run_id              UUID NOT NULL REFERENCES embodybench_runs(id) ON DELETE CASCADE,
+        task_name           VARCHAR(200) NOT NULL,
+        seed_used           BIGINT NOT NULL,
+        episode_idx         INT NOT NULL,
+        outcome             JSONB NOT NULL,
+        trajectory_pointer  VARCHAR(500),
+        recorded_at         TIMESTAMPTZ DEFAULT NOW()
+    );
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_embodybench_episodes_run_task ON embodybench_episodes(run_id, task_name);",
+    "CREATE INDEX IF NOT EXISTS idx_embodybench_episodes_job ON embodybench_episodes(job_id);",
+]
+
+_SLOW_QUERY_LOG = [
+    """
+    CREATE TABLE IF NOT EXISTS slow_query_log (
+        id           BIGSERIAL PRIMARY KEY,
+        captured_at  TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+        route        TEXT,
+        duration_ms  DOUBLE PRECISION NOT NULL,
+        query        TEXT NOT NULL,
+        params       TEXT,
+        error        TEXT,
+        plan         TEXT
+    );
+    """,
+]
+
+# Shared slowapi counters (rate_limit_storage.py). UNLOGGED: losing them on a
+# crash only resets the current rate-limit windows.
+_RATE_LIMIT_COUNTERS = [
+    """
+    CREATE UNLOGGED TABLE IF NOT EXISTS rate_limit_counters (
+        key         TEXT PRIMARY KEY,
+        count       INT NOT NULL,
+        expires_at  DOUBLE PRECISION NOT NULL
+    );
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_rate_limit_counters_expires ON rate_limit_counters(expires_at);",
+]
+
+# Per-resource data version stamps for ETag / 304 responses (conditional_get.py).
+# Triggers bump a row in the writer's transaction, so a new
+# version only becomes visible together with the data it describes. A
+# resource is only seeded (and triggered) when all of its tables exist;
+# conditional_get skips ETags for resources without a row.
+_DATA_VERSION_RESOURCES = {
+    "yif": ["yif_ious", "yif_payments", "yif_iou_items"],
+    "embodybench_runs": ["embodybench_runs", "embodybench_jobs"],
+    "collection": ["collection_items", "collection_media"],
+    "qff_airlines": ["qff_travel_airlines"],
+    "qff_airports": ["qff_travel_airports"],
+}
+
+
+# Row-level constraint triggers, deferred to commit: a version is bumped only
+# when rows actually changed, once per transaction (flagged with a
+# transaction-local setting), and the data_versions row lock is held only
+# for the commit itself, not from the first write. Statement-level triggers
+# locked it at the first write, so writers of one resource queued behind each
+# other, and a sync writer on the event loop could block on an async
+# transaction that needed that same loop to commit. TRUNCATE has no row
+# triggers and keeps a statement trigger.
+_DATA_VERSION_TRIGGER = """
+            DROP TRIGGER IF EXISTS trigger_data_version ON {table};
+            CREATE CONSTRAINT TRIGGER trigger_data_version
+                AFTER INSERT OR UPDATE OR DELETE ON {table}
+                DEFERRABLE INITIALLY DEFERRED
+                FOR EACH ROW EXECUTE FUNCTION bump_data_version('{resource}');
+            DROP TRIGGER IF EXISTS trigger_data_version_truncate ON {table};
+            CREATE TRIGGER trigger_data_version_truncate
+                AFTER TRUNCATE ON {table}
+                FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version('{resource}');"""
+
+
+def _data_version_triggers(resource, tables):
+    exists = " AND ".join(f"to_regclass('{table}') IS NOT NULL" for table in tables)
+    triggers = "".join(_DATA_VERSION_TRIGGER.format(table=table, resource=resource) for table in tables)
+    return f"""
+    DO $$
+    BEGIN
+        IF {exists} THEN
+            INSERT INTO data_versions (resource) VALUES ('{resource}')
+                ON CONFLICT (resource) DO NOTHING;{triggers}
+        END IF;
+    END
+    $$;
+    """
+
+_DATA_VERSIONS = [
+    """
+    CREATE TABLE IF NOT EXISTS data_versions (
+        resource    VARCHAR(100) PRIMARY KEY,
+        version     BIGINT NOT NULL DEFAULT 1,
+        updated_at  TIMESTAMPTZ DEFAULT NOW()
+    );
+    """,
+    # SECURITY DEFINER, so writers need no UPDATE grant on data_versions; the
+    # pinned search_path keeps callers from shadowing data_versions.
+    """
+    CREATE OR REPLACE FUNCTION bump_data_version()
+    RETURNS TRIGGER AS $$
+    BEGIN
+        IF current_setting('data_versions.' || TG_ARGV[0], true) = 'bumped' THEN
+            RETURN NULL;
+        END IF;
+        PERFORM set_config('data_versions.' || TG_ARGV[0], 'bumped', true);
+        UPDATE data_versions
+           SET version = version + 1, updated_at = NOW()
+         WHERE resource = TG_ARGV[0];
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public, pg_temp;
+    """,
+] + [_data_version_triggers(resource, tables)
+      for resource, tables in _DATA_VERSION_RESOURCES.items()]
+
+# Primary WAL position after each session's latest write, so replica.py can
+# keep that session's reads on the primary until the replica has replayed it.
+# Only ever read on the primary; UNLOGGED since losing it on a crash is fine.
+_DB_SESSION_WRITES = [
+    """
+    CREATE UNLOGGED TABLE IF NOT EXISTS db_session_writes (
+        session     TEXT PRIMARY KEY,
+        lsn         PG_LSN NOT NULL,
+        written_at  TIMESTAMPTZ NOT NULL DEFAULT NOW()
+    );
+    """,
+]
+
+# State of the YIF data upload (yif_data_router) and of pickle imports
+# (yif_migration_router), so whichever worker gets a follow-up request sees
+# it. Both used to live in one process's memory. UNLOGGED: as before, the
+# contents are disposable and a crash only means uploading again. Documents
+# that are only ever returned whole are JSON, which keeps their key order.
+_YIF_UPLOAD_STATE = [
+    """
+    CREATE UNLOGGED TABLE IF NOT EXISTS yif_data_upload (
+        id           BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+        summary      JSON NOT NULL,
+        uploaded_at  TIMESTAMPTZ NOT NULL DEFAULT NOW()
+    );
+    """,
+    """
+    CREATE UNLOGGED TABLE IF NOT EXISTS yif_data_businesses (
+        seq          INT PRIMARY KEY,
+        ious_id      TEXT,
+        client       TEXT,
+        status       TEXT,
+        total_money  DOUBLE PRECISION NOT NULL,
+        paid         DOUBLE PRECISION NOT NULL,
+        rest         DOUBLE PRECISION NOT NULL,
+        business     JSON NOT NULL,
+        payments     JSON NOT NULL
+    );
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_yif_data_businesses_ious_id ON yif_data_businesses(ious_id, seq);",
+    "CREATE INDEX IF NOT EXISTS idx_yif_data_businesses_status ON yif_data_businesses(status, seq);",
+    """
+    CREATE UNLOGGED TABLE IF NOT EXISTS yif_import_progress (
+        task_id     TEXT PRIMARY KEY,
+        progress    JSONB NOT NULL,
+        updated_at  TIMESTAMPTZ NOT NULL DEFAULT NOW()
+    );
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_yif_import_progress_updated ON yif_import_progress(updated_at);",
+]
+
+# (version, name, statements). Written to be safe on databases that were set
+# up before this table existed, hence IF NOT EXISTS / DROP ... IF EXISTS.
+MIGRATIONS = [
+    (1, "yif_iou_status_triggers", _YIF_IOU_STATUS_TRIGGERS),
+    (2, "embodybench_tables", _EMBODYBENCH_TABLES),
+    (3, "slow_query_log", _SLOW_QUERY_LOG),
+    (4, "rate_limit_counters", _RATE_LIMIT_COUNTERS),
+    (5, "data_versions", _DATA_VERSIONS),
+    (6, "db_session_writes", _DB_SESSION_WRITES),
+    (7, "yif_upload_state", _YIF_UPLOAD_STATE),
+]
+
+
+# ========================
+# Runner
+# ========================
+
+def _applied_versions(cursor):
+    """Versions already recorded, or None if schema_migrations does not exist yet."""
+    try:
+        cursor.execute("SELECT version FROM schema_migrations")
+        return {row[0] for row in cursor.fetchall()}
+    except psycopg2.errors.UndefinedTable:
+        cursor.connection.rollback()
+        return None
+
+
+def pending_migrations(applied):
+    return [m for m in MIGRATIONS if m[0] not in applied]
+
+
+def run_migrations():
+    """Apply pending migrations. A failed migration is rolled back, logged and
+    retried on the next boot; later migrations still run."""
+    start = time.perf_counter()
+    try:
+        conn = get_db_connection()
+    except RuntimeError as e:
+        logger.warning(f"Migrations skipped - database connection error: {e}")
+        return
+
+    cursor = conn.cursor()
+    try:
+        applied = _applied_versions(cursor)
+        if applied is not None and not pending_migrations(applied):
+            conn.commit()
+            logger.info(f"Schema up to date (v{max(applied, default=0)}, "
+                        f"{(time.perf_counter() - start) * 1000:.0f}ms)")
+            return
+
+        cursor.execute("SELECT pg_advisory_lock(%s)", (_MIGRATION_LOCK_KEY,))
+        try:
+            cursor.execute(_CREATE_VERSION_TABLE)
+            conn.commit()
+            # Re-read under the lock: another worker may have just applied them.
+            applied = _applied_versions(cursor) or set()
+            for version, name, statements in pending_migrations(applied):
+                try:
+                    for stmt in statements:
+                        cursor.execute(stmt)
+                    cursor.execute(
+                        "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                        (version, name),
+                    )
+                    conn.commit()
+                    logger.info(f"Applied migration {version}: {name}")
+                except Exception as e:
+                    conn.rollback()
+                    logger.error(f"Migration {version} ({name}) failed: {e}")
+        finally:
+            conn.rollback()
+            cursor.execute("SELECT pg_advisory_unlock(%s)", (_MIGRATION_LOCK_KEY,))
+            conn.commit()
+        logger.info(f"Migrations finished in {(time.perf_counter() - start) * 1000:.0f}ms")
+    except psycopg2.OperationalError as e:
+        logger.error(f"Migrations failed - database connection error: {e}")
+    except Exception as e:
+        logger.error(f"Migrations skipped: {e}")
+    finally:
+        cursor.close()
+        conn.close()
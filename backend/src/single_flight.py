@@ -0,0 +1,185 @@
+"""
+Request coalescing ("single flight") for identical concurrent reads.
+
+When the frontend double-fires a query, or a page polls while the previous
+poll is still running, the same heavy SQL would run several times in
+parallel. For the GET routes in COALESCED_ROUTES, SingleFlightMiddleware
+keys each request on
+
+    (route, caller, path, normalized query string, If-None-Match)
+
+where caller is a hash of the Authorization header, so nobody ever receives
+a response computed for someone else. The first request with a given key
+runs normally (the leader). Identical requests arriving while it runs
+(followers) wait for it and get a copy of its status, headers and body,
+without touching the handler, the admission slots or the database. The
+query string is normalized by sorting its parameters, so ?a=1&b=2 and
+?b=2&a=1 coalesce.
+
+Followers fall back to running the request themselves when the leader
+produced no reusable response:
+  - it raised;
+  - it ended with 499 because its own client went away (see query_guard.py);
+  - its body was larger than SINGLE_FLIGHT_MAX_BODY_BYTES.
+
+A follower may get data read when the leader started, up to its duration
+earlier, which these routes already tolerate through their replica lag
+budgets. To keep read-your-writes within a process, a write
+(POST/PUT/PATCH/DELETE) by a caller detaches that caller's in-flight reads,
+so later reads start a fresh computation.
+
+Coalescing is per process. Leader, coalesced and fallback counts per route
+are on /metrics (single_flight_requests_total).
+"""
+import asyncio
+import hashlib
+import os
+import re
+import threading
+from collections import Counter
+from urllib.parse import parse_qsl, urlencode
+
+ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+MAX_BODY_BYTES = int(os.getenv("SINGLE_FLIGHT_MAX_BODY_BYTES", str(8 * 1024 * 1024)))
+
+# (path regex, name), GET only. A route belongs here only if its response
+# depends on nothing but the path, the query string and the caller.
+COALESCED_ROUTES = [
+    (r"^/api/yif/stats/dashboard$", "yif.dashboard"),
+    (r"^/api/yif/ious$", "yif.ious"),
+    (r"^/api/yif/payments$", "yif.payments"),
+    (r"^/api/bench/runs/[^/]+$", "bench.run"),
+]
+_COALESCED_ROUTES = [(re.compile(pattern), name) for pattern, name in COALESCED_ROUTES]
+
+_WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+_BYPASS_HEADERS = {b"x-profile-token"}
+
+_inflight = {}  # key -> asyncio.Future resolved with (start message, body) or None
+_counts = Counter()
+_counts_lock = threading.Lock()
+
+
+def _route_name(path: str):
+    for pattern, name in _COALESCED_ROUTES:
+        if pattern.match(path):
+            return name
+    return None
+
+
+def _caller(authorization) -> str:
+    return hashlib.sha256(authorization).hexdigest()[:32] if authorization else ""
+
+
+def _count(name: str, role: str):
+    with _counts_lock:
+        _counts[(name, role)] += 1
+
+
+def _detach(caller: str):
+    for key in [k for k in _inflight if k[1] == caller]:
+        del _inflight[key]
+
+
+class SingleFlightMiddleware:
+    """Pure ASGI: shares one response between identical concurrent GETs (see module doc).
+
+    Added outside AdmissionMiddleware so followers never take a slot.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        if method in _WRITE_METHODS:
+            await self._write(scope, receive, send)
+            return
+        name = _route_name(scope["path"]) if method == "GET" else None
+        if name is None:
+            await self.app(scope, receive, send)
+            return
+
+        authorization = if_none_match = None
+        for header, value in scope.get("headers", ()):
+            if header == b"authorization":
+                authorization = value
+            elif header == b"if-none-match":
+                if_none_match = value
+            elif header in _BYPASS_HEADERS:
+                await self.app(scope, receive, send)
+                return
+        query = urlencode(sorted(parse_qsl(scope.get("query_string", b"").decode("latin-1"),
+                                           keep_blank_values=True)))
+        key = (name, _caller(authorization), scope["path"], query, if_none_match)
+
+        flight = _inflight.get(key)
+        if flight is not None:
+            result = await asyncio.shield(flight)
+            if result is not None:
+                _count(name, "coalesced")
+                start, body = result
+                await send({"type": "http.response.start", "status": start["status"],
+                            "headers": list(start.get("headers", ()))})
+                await send({"type": "http.response.body", "body": body})
+                return
+            _count(name, "fallback")
+            await self.app(scope, receive, send)
+            return
+
+        flight = _inflight[key] = asyncio.get_running_loop().create_future()
+        _count(name, "leader")
+        response = {"start": None, "chunks": [], "size": 0, "complete": False}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                response["start"] = message
+            elif message["type"] == "http.response.body" and response["chunks"] is not None:
+                body = message.get("body", b"")
+                response["size"] += len(body)
+                if response["size"] > MAX_BODY_BYTES:
+                    response["chunks"] = None
+                else:
+                    response["chunks"].append(body)
+                    response["complete"] = not message.get("more_body", False)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if _inflight.get(key) is flight:
+                del _inflight[key]
+            start = response["start"]
+            if start is not None and response["complete"] and start["status"] != 499:
+                flight.set_result((start, b"".join(response["chunks"])))
+            else:
+                flight.set_result(None)
+
+    async def _write(self, scope, receive, send):
+        caller = None
+        for header, value in scope.get("headers", ()):
+            if header == b"authorization":
+                caller = _caller(value)
+                break
+        if caller is None:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message):
+            # Committed by the time the response starts; reads the client
+            # sends after seeing it must not join older computations.
+            if message["type"] == "http.response.start":
+                _detach(caller)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+
+def stats() -> dict:
+    """Requests per (route, role): leader, coalesced or fallback."""
+    with _counts_lock:
+        return dict(_counts)
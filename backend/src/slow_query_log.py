@@ -0,0 +1,266 @@
+"""
+Slow-query log with sampled EXPLAIN (ANALYZE, BUFFERS) capture.
+
+Registered as a db_pool.query_listeners hook, so it sees every statement run
+through the psycopg2 pool, the SQLAlchemy engine and async_db. Any statement
+slower than SLOW_QUERY_MS is logged with its normalized text and stored in
+the slow_query_log table (created by schema_migrations). For a
+SLOW_QUERY_EXPLAIN_SAMPLE fraction of slow SELECTs, the statement is re-run
+under EXPLAIN (ANALYZE, BUFFERS) with the same parameters and RLS settings,
+and the plan is saved with the row.
+
+Bind parameters carry password hashes, encrypted API keys and personal
+fields, and the table is served back by /api/ops/slow-queries. So the log
+line never includes them, and the stored row is redacted: only numbers,
+booleans and NULLs are kept in params (everything else becomes "?"),
+string literals in the plan become '?', and errors keep their first line
+(no DETAIL). SLOW_QUERY_LOG_RAW_PARAMS=true stores them unredacted, for
+debugging on a non-production database.
+
+The request thread only enqueues; the EXPLAIN and the INSERT happen on a
+background thread with their own pooled connection. The EXPLAIN transaction
+is always rolled back. Rows are read back through GET /api/ops/slow-queries.
+"""
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from decimal import Decimal
+
+import db_pool
+import memory_debug
+import metrics
+from database import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "500"))
+EXPLAIN_SAMPLE = float(os.getenv("SLOW_QUERY_EXPLAIN_SAMPLE", "0.1"))
+EXPLAIN_TIMEOUT_MS = int(os.getenv("SLOW_QUERY_EXPLAIN_TIMEOUT_MS", "30000"))
+MAX_ROWS = int(os.getenv("SLOW_QUERY_LOG_MAX_ROWS", "5000"))
+RAW_PARAMS = os.getenv("SLOW_QUERY_LOG_RAW_PARAMS", "false").lower() == "true"
+
+# Re-explaining the same statement over and over adds load exactly when the
+# database is already struggling, so each normalized statement is explained
+# at most once per cooldown.
+_EXPLAIN_COOLDOWN = 300.0
+_MAX_PARAMS_CHARS = 2000
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"(?<![\w$])-?\d+(?:\.\d+)?\b")
+_WHITESPACE = re.compile(r"\s+")
+_UNSAFE_TO_EXPLAIN = re.compile(
+    r"\b(insert|update|delete|merge|truncate|for\s+update|for\s+share|for\s+no\s+key\s+update"
+    r"|for\s+key\s+share|pg_advisory\w*|nextval|setval|set_config)\b",
+    re.IGNORECASE,
+)
+
+_queue = queue.Queue(maxsize=1000)
+_worker_thread = None
+_worker_lock = threading.Lock()
+_worker_local = threading.local()
+_last_explained = {}
+_last_explained_lock = threading.Lock()
+memory_debug.register_cache("slow_query_log.last_explained", lambda: _last_explained)
+
+
+def normalize_query(query: str) -> str:
+    """Collapse whitespace and replace inline literals with ?."""
+    text = _STRING_LITERAL.sub("?", query)
+    text = _NUMBER_LITERAL.sub("?", text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def query_text(cursor, query) -> str:
+    if isinstance(query, bytes):
+        return query.decode("utf-8", "replace")
+    if isinstance(query, str):
+        return query
+    try:
+        return query.as_string(cursor.connection)
+    except Exception:
+        return str(query)
+
+
+def _redact(value):
+    if value is None or isinstance(value, (bool, int, float, Decimal)):
+        return value
+    if isinstance(value, dict):
+        return {key: _redact(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_redact(item) for item in value]
+    return "?"
+
+
+def _format_params(vars) -> str:
+    if vars is None:
+        return None
+    if not RAW_PARAMS:
+        vars = _redact(vars)
+    try:
+        text = json.dumps(vars, default=str, ensure_ascii=False)
+    except Exception:
+        text = repr(vars)
+    if len(text) > _MAX_PARAMS_CHARS:
+        text = text[:_MAX_PARAMS_CHARS] + "...(truncated)"
+    return text
+
+
+def _explainable(text: str) -> bool:
+    head = text.lstrip().lower()
+    if not (head.startswith("select") or head.startswith("with")):
+        return False
+    return not _UNSAFE_TO_EXPLAIN.search(text)
+
+
+def _claim_explain(normalized: str) -> bool:
+    """True if normalized was not explained within the cooldown (and claim it)."""
+    now = time.monotonic()
+    with _last_explained_lock:
+        if now - _last_explained.get(normalized, -_EXPLAIN_COOLDOWN) < _EXPLAIN_COOLDOWN:
+            return False
+        if len(_last_explained) > 1000:
+            _last_explained.clear()
+        _last_explained[normalized] = now
+        return True
+
+
+def _on_query(cursor, query, vars, elapsed, error):
+    if getattr(_worker_local, "active", False):
+        return
+    duration_ms = elapsed * 1000.0
+    if duration_ms < SLOW_QUERY_MS:
+        return
+
+    text = query_text(cursor, query)
+    normalized = normalize_query(text)
+    route = metrics.current_route()
+    logger.warning(
+        f"Slow query {duration_ms:.0f}ms"
+        + (f" [{route}]" if route else "")
+        + f": {normalized}"
+    )
+
+    explain = None
+    if (error is None and EXPLAIN_SAMPLE > 0 and random.random() < EXPLAIN_SAMPLE
+            and _explainable(text) and _claim_explain(normalized)):
+        local_settings = getattr(cursor.connection, "_local_settings", None)
+        # Callers often keep appending to their params list (count query,
+        # then LIMIT/OFFSET), so snapshot it before it changes.
+        if isinstance(vars, list):
+            vars = list(vars)
+        elif isinstance(vars, dict):
+            vars = dict(vars)
+        explain = (text, vars, dict(local_settings) if local_settings else None)
+
+    if error is not None:
+        error = str(error) if RAW_PARAMS else str(error).split("\n", 1)[0]
+    entry = {
+        "captured_at": datetime.now(timezone.utc),
+        "route": route,
+        "duration_ms": round(duration_ms, 2),
+        "query": normalized,
+        "params": _format_params(vars),
+        "error": error[:500] if error is not None else None,
+        "explain": explain,
+    }
+    try:
+        _queue.put_nowait(entry)
+    except queue.Full:
+        return
+    _ensure_worker()
+
+
+# ------------------------------------------------------------------
+# Background writer
+# ------------------------------------------------------------------
+
+def _ensure_worker():
+    global _worker_thread
+    if _worker_thread is not None and _worker_thread.is_alive():
+        return
+    with _worker_lock:
+        if _worker_thread is None or not _worker_thread.is_alive():
+            _worker_thread = threading.Thread(target=_worker, name="slow-query-log", daemon=True)
+            _worker_thread.start()
+
+
+def _worker():
+    _worker_local.active = True
+    inserted = 0
+    while True:
+        entry = _queue.get()
+        try:
+            _store(entry)
+            inserted += 1
+            if MAX_ROWS > 0 and inserted % 100 == 0:
+                _prune()
+        except Exception as e:
+            logger.warning(f"Slow query log write failed: {e}")
+
+
+def _run_explain(conn, query, vars, local_settings) -> str:
+    cursor = conn.cursor()
+    try:
+        if local_settings:
+            sql, params = db_pool.local_settings_sql(local_settings)
+            cursor.execute(sql, params)
+        cursor.execute("SET LOCAL statement_timeout = %s", (EXPLAIN_TIMEOUT_MS,))
+        cursor.execute("EXPLAIN (ANALYZE, BUFFERS) " + query, vars)
+        plan = "\n".join(row[0] for row in cursor.fetchall())
+        # The parameters are inlined into filter conditions.
+        return plan if RAW_PARAMS else _STRING_LITERAL.sub("'?'", plan)
+    except Exception as e:
+        return f"EXPLAIN failed: {e}"
+    finally:
+        cursor.close()
+        conn.rollback()
+
+
+def _store(entry):
+    conn = get_db_connection()
+    try:
+        plan = None
+        if entry["explain"] is not None:
+            plan = _run_explain(conn, *entry["explain"])
+        cursor = conn.cursor()
+        try:
+            cursor.execute("""
+                INSERT INTO slow_query_log (captured_at, route, duration_ms, query, params, error, plan)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+            """, (entry["captured_at"], entry["route"], entry["duration_ms"], entry["query"],
+                  entry["params"], entry["error"], plan))
+            conn.commit()
+        finally:
+            cursor.close()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def _prune():
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            DELETE FROM slow_query_log
+             WHERE id <= (SELECT MAX(id) FROM slow_query_log) - %s
+        """, (MAX_ROWS,))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+
+if SLOW_QUERY_MS > 0:
+    db_pool.query_listeners.append(_on_query)
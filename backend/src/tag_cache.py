@@ -0,0 +1,256 @@
+"""
+In-process cache for near-static catalogs, invalidated by tag.
+
+Endpoints that re-read the same small tables on every call (QFF airlines,
+airports and templates, PDF filename templates, accounting categories) load
+them through
+
+    airlines = catalog_cache.get_or_load("qff.airlines", ("qff.airlines",), load_airlines)
+
+and the endpoints that create, update or delete those rows drop every entry
+carrying the tag, in this process and, through pg_notify on CHANNEL, in the
+other worker processes:
+
+    # async handlers: NOTIFY inside the write transaction, local drop after commit
+    async with get_async_connection() as conn:
+        ...
+        await tag_cache.notify_async(cursor, "accounting.categories")
+    tag_cache.invalidate_local("accounting.categories")
+
+    # sync handlers (threadpool) without a cursor of their own, after commit
+    tag_cache.invalidate("qff.airlines")
+
+A NOTIFY sent in the writer's transaction is delivered only if it commits.
+invalidate() borrows a psycopg2 connection, so it must not run on the
+event loop. Other in-process caches can ride on the same channel:
+subscribe(callback) has callback(tags) called with every other process's
+invalidation (None after a listener reconnect: drop everything), and
+broadcast() sends tags without touching the catalog cache.
+
+Each process runs listen_for_invalidations() (started from
+main.py), which holds a LISTEN connection and reconnects every
+TAG_CACHE_RETRY_INTERVAL seconds if it drops. Notifications sent while it
+was disconnected are lost, so a (re)connect clears the whole cache.
+
+Entries also expire after TAG_CACHE_TTL seconds (default 300), which bounds
+staleness from writers that bypass the API (scripts, psql), and the cache
+holds at most TAG_CACHE_MAX_ENTRIES entries, dropping the least recently
+used. TAG_CACHE_TTL=0 turns caching off.
+
+Cached values are shared between requests: treat them as read-only.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from psycopg import AsyncConnection
+
+import memory_debug
+from database import DATABASE_URL, get_db_connection
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "tag_cache_invalidate"
+TTL = float(os.getenv("TAG_CACHE_TTL", "300"))
+MAX_ENTRIES = int(os.getenv("TAG_CACHE_MAX_ENTRIES", "256"))
+RETRY_INTERVAL = float(os.getenv("TAG_CACHE_RETRY_INTERVAL", "5"))
+
+_MISSING = object()
+
+
+class TagCache:
+    """Thread-safe key -> value cache with TTL, an LRU size bound and tags."""
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires_at, tags, value)
+        # Bumped by every invalidation. A load that started before one must
+        # not store its (possibly stale) result.
+        self._generation = 0
+        self._stats = {"hits": 0, "misses": 0, "invalidations": 0, "evictions": 0}
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return entry[2], self._generation
+            if entry is not None:
+                del self._entries[key]
+            self._stats["misses"] += 1
+            return _MISSING, self._generation
+
+    def _put(self, key, tags, value, generation):
+        if self.ttl <= 0 or value is None:
+            return
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, frozenset(tags), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def get_or_load(self, key, tags, loader):
+        """Cached value for key, else loader() stored under tags. None is not cached."""
+        value, generation = self._get(key)
+        if value is _MISSING:
+            value = loader()
+            self._put(key, tags, value, generation)
+        return value
+
+    async def get_or_load_async(self, key, tags, loader):
+        """get_or_load() with an async loader."""
+        value, generation = self._get(key)
+        if value is _MISSING:
+            value = await loader()
+            self._put(key, tags, value, generation)
+        return value
+
+    def invalidate_local(self, tags=None):
+        """Drop entries carrying any of tags (every entry when tags is None)."""
+        with self._lock:
+            self._generation += 1
+            self._stats["invalidations"] += 1
+            if tags is None:
+                self._entries.clear()
+                return
+            tags = set(tags)
+            for key in [k for k, entry in self._entries.items() if entry[1] & tags]:
+                del self._entries[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "ttl": self.ttl, **self._stats}
+
+
+catalog_cache = TagCache(TTL, MAX_ENTRIES)
+memory_debug.register_cache("tag_cache.catalog", lambda: catalog_cache._entries)
+
+_listener = {"connected": False, "received": 0}
+
+
+_NOTIFY_SQL = "SELECT pg_notify(%s, %s)"
+
+
+def _payload(tags) -> str:
+    return f"{os.getpid()}:{','.join(tags)}"
+
+
+async def notify_async(cursor, *tags: str):
+    """Queue the other processes' invalidation of tags on cursor's transaction.
+
+    Sent when that transaction commits, and not at all if it rolls back. Call
+    invalidate_local(*tags) after the commit.
+    """
+    await cursor.execute(_NOTIFY_SQL, (CHANNEL, _payload(tags)))
+
+
+def invalidate_local(*tags: str):
+    """Drop tags in this process only."""
+    catalog_cache.invalidate_local(tags)
+
+
+def broadcast(*tags: str, cursor=None):
+    """NOTIFY every other process to drop tags. Call after commit.
+
+    Sent in a transaction of its own, on cursor's psycopg2 connection when
+    given, else on a borrowed one. Blocking: sync code only.
+    """
+    own = cursor is None
+    conn = get_db_connection() if own else cursor.connection
+    notify = conn.cursor()
+    try:
+        notify.execute(_NOTIFY_SQL, (CHANNEL, _payload(tags)))
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        # Other processes catch up when their entries expire.
+        logger.warning(f"Could not broadcast cache invalidation {tags}: {e}")
+    finally:
+        notify.close()
+        if own:
+            conn.close()
+
+
+def invalidate(*tags: str):
+    """Drop tags here now and in every other process via NOTIFY. Call after commit.
+
+    Blocking (own psycopg2 connection): for sync handlers only.
+    """
+    catalog_cache.invalidate_local(tags)
+    broadcast(*tags)
+
+
+_subscribers = []
+
+
+def subscribe(callback):
+    """Call callback(tags) for other processes' invalidations (None: everything)."""
+    _subscribers.append(callback)
+
+
+def _drop_remote(tags):
+    catalog_cache.invalidate_local(tags)
+    for callback in _subscribers:
+        try:
+            callback(tags)
+        except Exception as e:
+            logger.warning(f"Cache invalidation subscriber failed for {tags}: {e}")
+
+
+def _apply(payload: str):
+    pid, _, tags = payload.partition(":")
+    if pid == str(os.getpid()):
+        return  # already dropped locally by invalidate()
+    _listener["received"] += 1
+    _drop_remote([tag for tag in tags.split(",") if tag])
+
+
+async def listen_for_invalidations():
+    """Apply other processes' invalidations until cancelled (one per process)."""
+    while True:
+        conn = None
+        try:
+            conn = await AsyncConnection.connect(
+                DATABASE_URL,
+                autocommit=True,
+                application_name=f"tag-cache-{os.getpid()}",
+                keepalives=1,
+                keepalives_idle=30,
+                keepalives_interval=10,
+                keepalives_count=3,
+            )
+            await conn.execute(f"LISTEN {CHANNEL}")
+            # Anything sent while we were not listening is lost.
+            _drop_remote(None)
+            _listener["connected"] = True
+            async for notify in conn.notifies():
+                _apply(notify.payload)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if _listener["connected"]:
+                logger.warning(f"Cache invalidation listener disconnected: {e}")
+            else:
+                logger.warning(f"Cache invalidation listener could not connect: {e}")
+        finally:
+            _listener["connected"] = False
+            if conn is not None:
+                try:
+                    await conn.close()
+                except Exception:
+                    pass
+        await asyncio.sleep(RETRY_INTERVAL)
+
+
+def stats() -> dict:
+    return {**catalog_cache.stats(), "listening": _listener["connected"],
+            "remote_invalidations": _listener["received"]}
@@ -0,0 +1,257 @@
+"""
+Optional OpenTelemetry tracing.
+
+With TRACING_ENABLED=true and the opentelemetry packages installed (see
+requirements.txt), every request gets a root span from TracingMiddleware,
+named after its route template, and these child spans:
+
+  db            every statement on the psycopg2 pool, SQLAlchemy and
+                async_db (via db_pool.query_listeners), plus one span per
+                async_db pipeline sync
+  r2.*          R2Storage uploads, deletes and listings
+  anthropic.*   the EmbodyBench setup validator's model call
+  resend.*      the contact form email
+  cpu.*         export workbook building and openpyxl saves, xlrd parsing
+                of IOU imports, pdfplumber text extraction
+
+Child spans made on worker threads (asyncio.to_thread, the sync-route
+threadpool) still land under the right request, because those threads
+inherit the request's context. A W3C traceparent header on the request
+(e.g. from an EmbodyBench worker) becomes the parent of the root span.
+
+Spans are batched and exported off the request path:
+
+  - to OTEL_EXPORTER_OTLP_ENDPOINT (OTLP over HTTP) when that is set,
+  - otherwise to TRACE_FILE (default traces.otlp.jsonl), one OTLP/JSON
+    export request per line. That works offline; an OpenTelemetry Collector
+    can replay it with its otlpjsonfile receiver.
+
+The standard OTEL_SERVICE_NAME and OTEL_TRACES_SAMPLER(_ARG) variables
+apply. Without the packages, or with tracing off, span() is a shared no-op
+context manager and nothing else is installed.
+
+Usage:
+    with tracing.span("cpu.openpyxl_save", rows=len(rows)):
+        wb.save(output)
+
+    @tracing.traced("r2.upload")
+    def upload_file(...): ...
+"""
+import base64
+import functools
+import logging
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+import orjson
+
+import db_pool
+from log_config import request_id_var
+from slow_query_log import normalize_query, query_text
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv("TRACING_ENABLED", "false").lower() == "true"
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.otlp.jsonl")
+SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "hoshipu-backend")
+
+_MAX_STATEMENT_CHARS = 2000
+
+_tracer = None
+_provider = None
+_NOOP = nullcontext()
+
+
+def enabled() -> bool:
+    return _tracer is not None
+
+
+def _hex_ids(obj: dict):
+    # protobuf's JSON mapping writes bytes as base64; OTLP/JSON wants hex ids.
+    for key in ("traceId", "spanId", "parentSpanId"):
+        if obj.get(key):
+            obj[key] = base64.b64decode(obj[key]).hex()
+
+
+class OTLPJsonFileExporter:
+    """SpanExporter appending OTLP/JSON export requests to a file, one per line."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans):
+        from google.protobuf.json_format import MessageToDict
+        from opentelemetry.exporter.otlp.proto.common.trace_encoder import encode_spans
+        from opentelemetry.sdk.trace.export import SpanExportResult
+
+        try:
+            request = MessageToDict(encode_spans(spans))
+            for resource_spans in request.get("resourceSpans", ()):
+                for scope_spans in resource_spans.get("scopeSpans", ()):
+                    for span_ in scope_spans.get("spans", ()):
+                        _hex_ids(span_)
+                        for link in span_.get("links", ()):
+                            _hex_ids(link)
+            with self._lock, open(self.path, "ab") as f:
+                f.write(orjson.dumps(request) + b"\n")
+            return SpanExportResult.SUCCESS
+        except Exception as e:
+            logger.warning(f"Could not write {len(spans)} spans to {self.path}: {e}")
+            return SpanExportResult.FAILURE
+
+    def shutdown(self):
+        pass
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return True
+
+
+def setup_tracing() -> bool:
+    """Install the tracer provider and DB hooks (idempotent). True if tracing is on."""
+    global _tracer, _provider
+    if _tracer is not None or not ENABLED:
+        return _tracer is not None
+    try:
+        from opentelemetry import trace
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    except ImportError:
+        logger.warning("TRACING_ENABLED is set but opentelemetry-sdk is not installed; tracing is off")
+        return False
+
+    if os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT") or os.getenv("OTEL_EXPORTER_OTLP_TRACES_ENDPOINT"):
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        exporter = OTLPSpanExporter()
+        target = "OTLP endpoint"
+    else:
+        exporter = OTLPJsonFileExporter(TRACE_FILE)
+        target = TRACE_FILE
+
+    _provider = TracerProvider(resource=Resource.create({"service.name": SERVICE_NAME}))
+    _provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(_provider)
+    _tracer = trace.get_tracer("hoshipu")
+    db_pool.query_listeners.append(_on_query)
+    db_pool.round_trip_listeners.append(_on_round_trips)
+    logger.info(f"Tracing on, exporting to {target}")
+    return True
+
+
+def shutdown():
+    """Flush buffered spans (called on app shutdown)."""
+    if _provider is not None:
+        _provider.shutdown()
+
+
+def span(name: str, **attributes):
+    """Context manager for a child span of the current one (no-op when off)."""
+    if _tracer is None:
+        return _NOOP
+    return _tracer.start_as_current_span(name, attributes=attributes or None)
+
+
+def traced(name: str):
+    """Decorator running a sync function inside span(name)."""
+
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return fn(*args, **kwargs)
+            with _tracer.start_as_current_span(name):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+def _statement_text(cursor, query) -> str:
+    return normalize_query(query_text(cursor, query))[:_MAX_STATEMENT_CHARS]
+
+
+def _on_query(cursor, query, vars, elapsed, error):
+    # Runs after the statement; rebuild its span from the measured time.
+    # Statements outside a request (background loops, slow-query EXPLAINs)
+    # would each become a trace of their own, so they are skipped.
+    from opentelemetry.trace import SpanKind, Status, StatusCode, get_current_span
+
+    if not get_current_span().is_recording():
+        return
+    end = time.time_ns()
+    statement = _statement_text(cursor, query)
+    # An empty statement is the pool's connection check.
+    operation = statement.split(" ", 1)[0].upper() or "ping"
+    span_ = _tracer.start_span(
+        f"db {operation}",
+        kind=SpanKind.CLIENT,
+        start_time=end - int(elapsed * 1e9),
+        attributes={"db.system": "postgresql", "db.statement": statement},
+    )
+    if error is not None:
+        span_.record_exception(error)
+        span_.set_status(Status(StatusCode.ERROR, type(error).__name__))
+    span_.end(end_time=end)
+
+
+def _on_round_trips(count, elapsed):
+    # Only async_db pipelines report elapsed time: that is when their
+    # queued statements actually run.
+    from opentelemetry.trace import SpanKind, get_current_span
+
+    if not elapsed or not get_current_span().is_recording():
+        return
+    end = time.time_ns()
+    span_ = _tracer.start_span(
+        "db pipeline", kind=SpanKind.CLIENT, start_time=end - int(elapsed * 1e9),
+        attributes={"db.system": "postgresql"},
+    )
+    span_.end(end_time=end)
+
+
+class TracingMiddleware:
+    """Pure ASGI: one server span per HTTP request (see module doc)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or _tracer is None:
+            await self.app(scope, receive, send)
+            return
+
+        from opentelemetry import propagate
+        from opentelemetry.trace import SpanKind, Status, StatusCode
+
+        carrier = {name.decode("latin-1"): value.decode("latin-1") for name, value in scope.get("headers", ())}
+        status_holder = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_holder[0] = message["status"]
+            await send(message)
+
+        method = scope["method"]
+        with _tracer.start_as_current_span(
+            f"{method} {scope['path']}",
+            context=propagate.extract(carrier),
+            kind=SpanKind.SERVER,
+            attributes={"http.request.method": method, "url.path": scope["path"],
+                        "request_id": request_id_var.get()},
+        ) as root:
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                # The router stores the matched route in scope; name the span
+                # after its template so spans group per endpoint.
+                route = getattr(scope.get("route"), "path", None)
+                if route:
+                    root.update_name(f"{method} {route}")
+                    root.set_attribute("http.route", route)
+                root.set_attribute("http.response.status_code", status_holder[0])
+                if status_holder[0] >= 500:
+                    root.set_status(Status(StatusCode.ERROR))
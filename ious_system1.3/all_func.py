@@ -1,6 +1,8 @@
-import xlrd,time,pickle,openpyxl,copy
+import xlrd,time,pickle,openpyxl,copy,logging
 import business as bs
 
+logger = logging.getLogger(__name__)
+
 #用于判断输入金额是否有效，可以float处理
 def isnumber(st):
     if type(st) == int or type(st) == float:
@@ -231,7 +233,7 @@ def read_bsp(filename,sheetname,user):     #指定文件,表格名读取ious
     list_ious = []
     for num in list_ious_idx:
         if isnumber(num) == False:
-            print('id',num,type(num))
+            logger.debug('invalid ious id %r (%s)', num, type(num).__name__)
             return [], False
         num = int(float(str(num)))
         if num not in range(1,100):
@@ -291,7 +293,6 @@ def payment_to_business(payment):
                 copy[date] = []
             if not find:
                 if id == list_business[idx].ious.id:
-                    print('test?')
                     temp = list_business[idx]
                     temp = temp.addpayment(payment)
                     copy[date].append(temp)
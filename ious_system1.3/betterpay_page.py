@@ -471,9 +471,6 @@ class better_pay():
             if checkbox.isChecked():
                 self.sel.append(business)
         
-        #测试
-        for busi in self.sel:
-            print(busi.ious.id)
         self.update_val()
         
 
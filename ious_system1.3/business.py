@@ -1,3 +1,8 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+
 def sum_payment(list_payment):
     re = 0
     for payment in list_payment:
@@ -81,7 +86,7 @@ class business:
 
     def addpayment(self, payment):
         self.list_payment.append(payment)
-        print('add pay')
+        logger.debug('add pay')
         self.update()
         return self
     
\ No newline at end of file
@@ -1,4 +1,4 @@
-import xlrd,time,pickle,openpyxl,copy
+import xlrd,time,pickle,openpyxl,copy,logging
 from openpyxl.styles import *
 
 #每个business格式为：
@@ -116,7 +116,6 @@ def read_table(filename,sheetname = 'marklihoshipu'):
     re = []
     #读取business
     rowct = 0
-    print()
     while sheet.cell(rowct+1, 0).value != 'END':
         rowct += 1
         re.append([ str(sheet.cell(rowct, 0).value).strip(),  #name
@@ -158,7 +157,6 @@ def read_table_zh(filename,sheetname = 'marklihoshipu',translate={}):
     re = []
     #读取business
     rowct = 0
-    print()
     while sheet.cell(rowct+1, 0).value != 'END':
         rowct += 1
         client = str(sheet.cell(rowct, 1).value).strip()
@@ -317,7 +315,7 @@ def write_table0(dest, sheetname, list_of_business):
 
 
     wb.save(dest+'.xlsx')
-    print('zhuijia')
+    logging.getLogger(__name__).debug('appended to %s', dest)
 
 def write_table1(dest, sheetname, list_of_business):
     
@@ -370,7 +368,7 @@ def write_table1(dest, sheetname, list_of_business):
             sh.cell(row,1).font = font;sh.cell(row,2).font = font;sh.cell(row,3).font = font
 
     wb.save(dest+'.xlsx')
-    print('zhuijia')
+    logging.getLogger(__name__).debug('appended to %s', dest)
 
 def write_table2(dest, sheetname, list_of_business):
     
@@ -421,7 +419,7 @@ def write_table2(dest, sheetname, list_of_business):
     sh.cell(row,1).font = font;sh.cell(row,2).font = font;sh.cell(row,3).font = font
     sh.cell(row,1).fill = pattern_fill;sh.cell(row,2).fill = pattern_fill;sh.cell(row,3).fill = pattern_fill
     wb.save(dest+'.xlsx')
-    print('zhuijia')
+    logging.getLogger(__name__).debug('appended to %s', dest)
 
 def write_table3(dest, sheetname, list_of_business):
     
@@ -473,7 +471,7 @@ def write_table3(dest, sheetname, list_of_business):
             sh.cell(row,1).font = font;sh.cell(row,2).font = font;sh.cell(row,3).font = font
 
     wb.save(dest+'.xlsx')
-    print('zhuijia')
+    logging.getLogger(__name__).debug('appended to %s', dest)
 
 def write_table4(dest, sheetname, list_of_business):
     
@@ -522,7 +520,7 @@ def write_table4(dest, sheetname, list_of_business):
     sh.cell(row,1).font = font;sh.cell(row,2).font = font;sh.cell(row,3).font = font
     sh.cell(row,1).fill = pattern_fill;sh.cell(row,2).fill = pattern_fill;sh.cell(row,3).fill = pattern_fill
     wb.save(dest+'.xlsx')
-    print('zhuijia')
+    logging.getLogger(__name__).debug('appended to %s', dest)
 
 def write_table5(dest, sheetname, list_of_business):
     
@@ -588,7 +586,7 @@ def write_table5(dest, sheetname, list_of_business):
             
 
     wb.save(dest+'.xlsx')
-    print('zhuijia')
+    logging.getLogger(__name__).debug('appended to %s', dest)
 
 def write_table6(dest, sheetname, list_of_business):
     
@@ -658,7 +656,7 @@ def write_table6(dest, sheetname, list_of_business):
     sh.cell(row,1).fill = pattern_fill;sh.cell(row,2).fill = pattern_fill;sh.cell(row,3).fill = pattern_fill
 
     wb.save(dest+'.xlsx')
-    print('zhuijia')
+    logging.getLogger(__name__).debug('appended to %s', dest)
 
 def write_table7(dest, sheetname, list_of_business):
     
@@ -724,7 +722,7 @@ def write_table7(dest, sheetname, list_of_business):
             
 
     wb.save(dest+'.xlsx')
-    print('zhuijia')
+    logging.getLogger(__name__).debug('appended to %s', dest)
 
 '''
  # 导出类型: 仅人(0), 人--月份(1), 仅月份(2), 人--客户(3), 仅客户(4), 人--业务(5), 仅业务(6)